@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+SmartFarm Event Loop Benchmark
+Measures event-loop lag and throughput of concurrent analyze_excel_with_cache
+cache hits with Redis latency injected by a TCP proxy, comparing a pinned
+synchronous Redis client (blocks the loop on every round trip) with the
+shared redis.asyncio pool.
+
+Usage:
+    python scripts/benchmark-event-loop.py
+    python scripts/benchmark-event-loop.py --latency 5 --concurrency 50 --requests 500
+    python scripts/benchmark-event-loop.py --redis-host localhost --redis-port 6379 --output lag.json
+
+Without --redis-host an in-process fakeredis TCP server is used. Use a
+dedicated Redis database for real servers; keys are never flushed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOLS_DIR = os.path.join(SCRIPTS_DIR, '..', 'tools', 'excel')
+
+MODES = ("sync", "async")
+RESULT = {
+    "sql_query": "SELECT crop, AVG(yield_value) FROM farm GROUP BY crop",
+    "results": [{"crop": "maize", "avg_yield": 9.5}],
+    "results_markdown": "| crop | avg_yield |\n|---|---|\n| maize | 9.5 |",
+    "row_count": 1,
+    "table_name": "farm",
+}
+
+
+class LatencyProxy:
+    """TCP proxy that delays every chunk by half the round-trip latency in each direction"""
+
+    def __init__(self, target, latency):
+        self.target = target
+        self.delay = latency / 2
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+
+    def __enter__(self):
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(self.target)
+            for src, dst in ((client, upstream), (upstream, client)):
+                src.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                threading.Thread(target=self._pipe, args=(src, dst), daemon=True).start()
+
+    def _pipe(self, src, dst):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                time.sleep(self.delay)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (src, dst):
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+
+
+def start_fake_redis():
+    """fakeredis speaking the Redis protocol on a local port"""
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[:2]
+
+
+def build_tool(mode, host, port):
+    """sql_cache_tool whose cache lives behind the proxy; misses return a canned result"""
+    sys.path.insert(0, TOOLS_DIR)
+    import redis
+    from sql_cache_tool import Tools
+
+    os.environ["REDIS_HOST"], os.environ["REDIS_PORT"] = host, str(port)
+    tool = Tools.__new__(Tools)
+    tool.valves = Tools.Valves(ADAPTIVE_TTL=False)
+    tool._refresh_futures = set()
+    tool._redis_client = None
+    if mode == "sync":
+        tool.redis_client = redis.Redis(host=host, port=port, decode_responses=True)
+    tool._execute_sql_query = lambda file_path, query, model, timer=None, preview=None, frame=None: dict(RESULT)
+    return tool
+
+
+def lag_stats(lags):
+    values = np.array(lags or [0.0]) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+async def run_mode(tool, path, question, requests, concurrency, tick):
+    """Concurrent cache hits while a ticker measures how late the loop wakes it"""
+    await tool.analyze_excel_with_cache(path, question)  # prime the entry
+
+    lags, stop = [], asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(tick)
+            lags.append(time.perf_counter() - start - tick)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, hits = [], 0
+
+    async def request():
+        nonlocal hits
+        async with semaphore:
+            t0 = time.perf_counter()
+            output = await tool.analyze_excel_with_cache(path, question)
+            latencies.append(time.perf_counter() - t0)
+            hits += "HIT" in output
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(tick)
+    start = time.perf_counter()
+    await asyncio.gather(*[request() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker_task
+
+    values = np.array(latencies) * 1000
+    return {
+        "requests": requests,
+        "hits": hits,
+        "throughput": requests / elapsed if elapsed else 0.0,
+        "p50_ms": float(np.percentile(values, 50)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "loop_lag": lag_stats(lags),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-loop lag of the Redis cache path under injected latency")
+    parser.add_argument("--latency", type=float, default=2.0, help="Injected Redis round-trip latency in ms")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent requests in flight")
+    parser.add_argument("--requests", type=int, default=200, help="Cache hits per mode")
+    parser.add_argument("--tick", type=float, default=5.0, help="Ticker interval in ms")
+    parser.add_argument("--redis-host", default=None, help="Real Redis host (default: in-process fakeredis)")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    if args.redis_host:
+        server, target = None, (args.redis_host, args.redis_port)
+    else:
+        server, target = start_fake_redis()
+
+    print("🏎️  SmartFarm Event Loop Benchmark")
+    print("=" * 78)
+    print(f"Redis latency: {args.latency:.1f}ms | concurrency: {args.concurrency} | requests: {args.requests}")
+    print("-" * 78)
+    print(f"{'Mode':8s} {'ops/s':>9s} {'p50':>10s} {'p99':>10s} {'lag p50':>10s} {'lag p99':>10s} {'lag max':>10s}")
+
+    report = {"settings": vars(args), "modes": {}}
+    run_id = uuid.uuid4().hex[:8]
+    with tempfile.TemporaryDirectory() as tmp, LatencyProxy(target, args.latency / 1000) as proxy:
+        path = os.path.join(tmp, "farm.csv")
+        with open(path, "w") as f:
+            f.write("crop,yield_value\nmaize,9.5\n")
+
+        for mode in MODES:
+            tool = build_tool(mode, "127.0.0.1", proxy.port)
+            result = asyncio.run(run_mode(
+                tool, path, f"Which crop yields most? [{run_id}-{mode}]",
+                args.requests, args.concurrency, args.tick / 1000
+            ))
+            report["modes"][mode] = result
+            lag = result["loop_lag"]
+            print(f"{mode:8s} {result['throughput']:9.1f} {result['p50_ms']:8.1f}ms {result['p99_ms']:8.1f}ms "
+                  f"{lag['p50_ms']:8.1f}ms {lag['p99_ms']:8.1f}ms {lag['max_ms']:8.1f}ms")
+
+    print("-" * 78)
+    sync_lag, async_lag = report["modes"]["sync"]["loop_lag"], report["modes"]["async"]["loop_lag"]
+    if async_lag["p99_ms"]:
+        print(f"📉 Loop lag p99: {sync_lag['p99_ms']:.1f}ms sync vs {async_lag['p99_ms']:.1f}ms async "
+              f"({sync_lag['p99_ms'] / async_lag['p99_ms']:.1f}x)")
+
+    if server:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
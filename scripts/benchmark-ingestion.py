@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+SmartFarm Ingestion Memory Benchmark
+Compares peak RSS of plain pandas loads against dtype-optimized loads
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools', 'excel')
+
+# Reference datasets: (name, rows)
+DATASETS = [
+    ("crop_yields_100k", 100_000),
+    ("crop_yields_1m", 1_000_000),
+]
+
+
+def generate_dataset(path, rows, seed=42):
+    """Write a synthetic farm dataset with repetitive labels and small numbers"""
+    rng = np.random.default_rng(seed)
+    crops = np.array(["maize", "wheat", "soy", "barley", "potato", "alfalfa"])
+    units = np.array(["kg/ha", "t/ha"])
+    df = pd.DataFrame({
+        "date": pd.date_range("2021-01-01", periods=rows, freq="min").strftime("%Y-%m-%d"),
+        "field_code": np.char.add("F-", rng.integers(1, 120, rows).astype(str)),
+        "crop": crops[rng.integers(0, len(crops), rows)],
+        "unit": units[rng.integers(0, len(units), rows)],
+        "plot": rng.integers(1, 200, rows),
+        "irrigation_events": rng.integers(0, 30, rows),
+        "yield_value": rng.integers(0, 16000, rows) / 4,
+        "soil_moisture": rng.normal(30, 5, rows).round(3),
+    })
+    df.to_csv(path, index=False)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    # VmHWM resets on exec, unlike ru_maxrss which is inherited from the parent
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def measure(mode, path):
+    """Load the file in this process and print peak RSS and frame size"""
+    sys.path.insert(0, TOOLS_DIR)
+    from sql_cache_tool import _read_dataframe
+
+    df = _read_dataframe(path, optimize=(mode == "optimized"))
+    frame_mb = df.memory_usage(deep=True).sum() / 1024 / 1024
+    peak_mb = peak_rss_mb()
+    print(f"{peak_mb:.1f} {frame_mb:.1f}")
+
+
+def run_child(mode, path):
+    """Run one load in a fresh interpreter so peak RSS is not shared"""
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, path],
+        text=True
+    )
+    peak_mb, frame_mb = output.split()
+    return float(peak_mb), float(frame_mb)
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        measure(sys.argv[2], sys.argv[3])
+        return 0
+
+    print("🏎️  SmartFarm Ingestion Memory Benchmark")
+    print("=" * 70)
+    print(f"{'Dataset':20s} {'Mode':10s} {'Peak RSS':>12s} {'DataFrame':>12s}")
+    print("-" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, rows in DATASETS:
+            path = os.path.join(tmp, f"{name}.csv")
+            generate_dataset(path, rows)
+
+            results = {}
+            for mode in ("plain", "optimized"):
+                results[mode] = run_child(mode, path)
+                peak_mb, frame_mb = results[mode]
+                print(f"{name:20s} {mode:10s} {peak_mb:10.1f}MB {frame_mb:10.1f}MB")
+
+            peak_saved = 1 - results["optimized"][0] / results["plain"][0]
+            frame_saved = 1 - results["optimized"][1] / results["plain"][1]
+            print(f"{'':20s} {'saving':10s} {peak_saved * 100:11.1f}% {frame_saved * 100:11.1f}%")
+
+    print("-" * 70)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
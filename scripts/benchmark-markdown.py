@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+SmartFarm Markdown Rendering Benchmark
+Compares the vectorized result renderer against DataFrame.to_markdown()
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools', 'excel'))
+
+from sql_cache_tool import _render_markdown
+
+ROW_COUNTS = [1_000, 10_000, 100_000]
+
+
+def make_results(rows, seed=42):
+    """Synthetic query result resembling a per-field aggregation"""
+    rng = np.random.default_rng(seed)
+    crops = np.array(["maize", "wheat", "soy", "barley"])
+    return pd.DataFrame({
+        "field_code": np.char.add("F-", rng.integers(1, 500, rows).astype(str)),
+        "crop": crops[rng.integers(0, len(crops), rows)],
+        "total_yield": rng.normal(5000, 800, rows),
+        "avg_moisture": rng.normal(30, 5, rows),
+        "samples": rng.integers(1, 1000, rows),
+    })
+
+
+def timed(func, *args, **kwargs):
+    """Run func once and return (elapsed_ms, output)"""
+    start = time.perf_counter()
+    output = func(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, output
+
+
+def main():
+    print("🏎️  SmartFarm Markdown Rendering Benchmark")
+    print("=" * 78)
+    print(f"{'Rows':>8s} {'to_markdown':>14s} {'vectorized':>14s} {'budgeted':>14s} {'speedup':>10s}")
+    print("-" * 78)
+
+    for rows in ROW_COUNTS:
+        df = make_results(rows)
+
+        baseline_ms, baseline = timed(df.to_markdown)
+        # Unbounded render for a like-for-like comparison, then the default budgets
+        full_ms, full = timed(_render_markdown, df, max_rows=rows, max_bytes=len(baseline.encode()) * 2)
+        budget_ms, budgeted = timed(_render_markdown, df)
+
+        speedup = baseline_ms / full_ms if full_ms > 0 else 0
+        print(f"{rows:8d} {baseline_ms:12.1f}ms {full_ms:12.1f}ms {budget_ms:12.1f}ms {speedup:9.1f}x")
+        print(f"{'':8s} {len(baseline) / 1024:12.0f}KB {len(full) / 1024:12.0f}KB {len(budgeted) / 1024:12.0f}KB")
+
+    print("-" * 78)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+SmartFarm Parse Worker Benchmark
+Parses several uploads at once, in-process (threads sharing the GIL) and in
+the sql_cache_tool parse pool, and reports upload throughput plus how late
+a 10ms ticker thread - standing in for other requests - gets scheduled.
+
+Usage:
+    python scripts/benchmark-parse-workers.py
+    python scripts/benchmark-parse-workers.py --format xlsx --rows 50000 --uploads 8 --workers 0,2,4
+
+Throughput with workers scales with cores until the handoff dominates; on a
+single core the pool mostly buys ticker latency, not throughput.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools', 'excel')
+
+
+def generate_upload(path, rows, seed):
+    """Synthetic farm records as CSV or XLSX"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "date": pd.date_range("2021-01-01", periods=rows, freq="min").strftime("%Y-%m-%d"),
+        "field_code": np.char.add("F-", rng.integers(1, 120, rows).astype(str)),
+        "crop": np.array(["maize", "wheat", "soy", "barley"])[rng.integers(0, 4, rows)],
+        "plot": rng.integers(1, 200, rows),
+        "yield_value": rng.integers(0, 16000, rows) / 4,
+        "soil_moisture": rng.normal(30, 5, rows).round(3),
+    })
+    if path.endswith(".xlsx"):
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def run(tool, paths, concurrency):
+    """Parse every upload with `concurrency` request threads; returns seconds and ticker lag (ms)"""
+    lags, stop = [], threading.Event()
+
+    def ticker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            time.sleep(0.01)
+            lags.append((time.perf_counter() - start - 0.01) * 1000)
+
+    thread = threading.Thread(target=ticker, daemon=True)
+    thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(tool._parse_upload, paths))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    thread.join()
+    return elapsed, np.array(lags or [0.0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent upload parsing: in-process vs parse workers")
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows per upload")
+    parser.add_argument("--uploads", type=int, default=8, help="Uploads parsed per run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Request threads parsing at once")
+    parser.add_argument("--workers", default="0,2,4", help="PARSE_WORKERS values to compare (0 = in-process)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    sys.path.insert(0, TOOLS_DIR)
+    from sql_cache_tool import Tools
+
+    print("🧵 SmartFarm Parse Worker Benchmark")
+    print("=" * 80)
+    report = {"settings": vars(args), "cores": os.cpu_count(), "runs": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f"upload_{i}.{args.format}") for i in range(args.uploads)]
+        for seed, path in enumerate(paths):
+            generate_upload(path, args.rows, seed)
+        size_mb = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+        print(f"{args.uploads} {args.format.upper()} uploads × {args.rows:,} rows ({size_mb:.0f} MB), "
+              f"{args.concurrency} at a time, {os.cpu_count()} cores")
+        print("-" * 80)
+
+        for workers in (int(value) for value in args.workers.split(",")):
+            tool = Tools.__new__(Tools)
+            tool.valves = Tools.Valves(PARSE_WORKERS=workers, PARSE_MIN_BYTES=0)
+            tool.redis_client = None
+            if workers:
+                run(tool, paths[:workers], workers)  # start the worker processes
+
+            elapsed, lags = run(tool, paths, args.concurrency)
+            row = {
+                "workers": workers,
+                "seconds": elapsed,
+                "uploads_per_s": len(paths) / elapsed,
+                "ticker_lag_p99_ms": float(np.percentile(lags, 99)),
+                "ticker_lag_max_ms": float(lags.max()),
+            }
+            report["runs"].append(row)
+            label = f"{workers} workers" if workers else "in-process"
+            print(f"{label:12s} {row['uploads_per_s']:6.2f} uploads/s | {elapsed:6.2f}s | "
+                  f"ticker lag p99 {row['ticker_lag_p99_ms']:6.1f}ms, max {row['ticker_lag_max_ms']:6.1f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
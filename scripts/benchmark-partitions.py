@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+SmartFarm Partitioned Storage Benchmark
+Compares date-filtered queries on a monolithic DuckDB table against the
+month-partitioned Parquet storage mode, on a minute-resolution sensor
+dataset (default: 3 years x 10 sensors, ~15.8M rows).
+
+Usage:
+    python scripts/benchmark-partitions.py
+    python scripts/benchmark-partitions.py --years 1 --sensors 5 --order random
+    python scripts/benchmark-partitions.py --repeat 10 --output partitions.json
+
+--order random shuffles the rows (as merged exports often are), which
+defeats the monolithic table's per-row-group min/max skipping.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools', 'excel')
+
+START = pd.Timestamp("2021-01-01")
+
+
+def end_of(years):
+    return START + pd.Timedelta(days=int(years * 365))
+
+
+def generate_dataset(years, sensors, order, seed=42):
+    """Minute readings per sensor with a daily temperature cycle"""
+    rng = np.random.default_rng(seed)
+    minutes = pd.date_range(START, end_of(years), freq="min", inclusive="left")
+    rows = len(minutes) * sensors
+    hours = np.tile(minutes.hour.to_numpy(), sensors)
+    df = pd.DataFrame({
+        "ts": np.tile(minutes.to_numpy(), sensors),
+        "sensor": pd.Categorical(np.repeat([f"S{i:02d}" for i in range(sensors)], len(minutes))),
+        "temperature": (15 + 8 * np.sin(hours / 24 * 2 * np.pi) + rng.normal(0, 1, rows)).round(2),
+        "soil_moisture": rng.normal(30, 5, rows).round(2),
+    })
+    if order == "time":
+        df = df.sort_values("ts", kind="stable", ignore_index=True)
+    elif order == "random":
+        df = df.iloc[rng.permutation(rows)].reset_index(drop=True)
+    return df
+
+
+def queries(end):
+    """Date windows from one day to the full history, ending where the data ends"""
+    windows = [
+        ("1 day", pd.DateOffset(days=1)),
+        ("1 week", pd.DateOffset(weeks=1)),
+        ("1 month", pd.DateOffset(months=1)),
+        ("1 quarter", pd.DateOffset(months=3)),
+        ("1 year", pd.DateOffset(years=1)),
+    ]
+    sql = ("SELECT sensor, AVG(temperature) AS avg_temp, MAX(soil_moisture) AS max_moisture, COUNT(*) AS readings "
+           "FROM sensors {where}GROUP BY sensor ORDER BY sensor")
+    result = [
+        (name, sql.format(where=f"WHERE ts >= '{max(end - span, START).date()}' AND ts < '{end.date()}' "))
+        for name, span in windows
+    ]
+    result.append(("full history", sql.format(where="")))
+    return result
+
+
+def time_query(conn, sql, repeat):
+    conn.execute(sql).fetchall()  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1000
+
+
+def partition_bytes(directory, months):
+    """On-disk size of the month partitions a query reads"""
+    total = 0
+    for entry in months:
+        path = os.path.join(directory, entry)
+        total += sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Date-filtered queries: monolithic table vs month-partitioned Parquet")
+    parser.add_argument("--years", type=float, default=3, help="Years of minute readings")
+    parser.add_argument("--sensors", type=int, default=10, help="Number of sensors")
+    parser.add_argument("--order", choices=("time", "sensor", "random"), default="time",
+                        help="Row order of the upload (time-sorted, per sensor, or shuffled)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query (median reported)")
+    parser.add_argument("--threads", type=int, default=2, help="DuckDB threads (the tool's default)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    sys.path.insert(0, TOOLS_DIR)
+    from sql_cache_tool import (
+        _create_partition_views, _duckdb_connect, _duckdb_select_list, _prune_partitions, _write_partitioned
+    )
+
+    print("🏎️  SmartFarm Partitioned Storage Benchmark")
+    print("=" * 84)
+    start = time.perf_counter()
+    df = generate_dataset(args.years, args.sensors, args.order)
+    print(f"Dataset: {len(df):,} rows ({args.years:g} years x {args.sensors} sensors, minute resolution, "
+          f"{args.order} order) generated in {time.perf_counter() - start:.1f}s")
+
+    report = {"settings": vars(args), "rows": len(df), "load": {}, "queries": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        table_conn = _duckdb_connect(os.path.join(tmp, "table.duckdb"), threads=args.threads)
+        start = time.perf_counter()
+        table_conn.execute(f"CREATE TABLE sensors AS SELECT {_duckdb_select_list(df)} FROM df")
+        table_conn.execute("CHECKPOINT")
+        report["load"]["table"] = {
+            "seconds": time.perf_counter() - start,
+            "bytes": os.path.getsize(os.path.join(tmp, "table.duckdb")),
+        }
+
+        directory = os.path.join(tmp, "parquet", "sensors")
+        parquet_conn = _duckdb_connect(os.path.join(tmp, "parquet.duckdb"), threads=args.threads)
+        start = time.perf_counter()
+        os.makedirs(os.path.dirname(directory))
+        _write_partitioned(parquet_conn, df, directory, "ts")
+        _create_partition_views(parquet_conn, "sensors", directory)
+        months = sorted(entry for entry in os.listdir(directory) if entry.startswith("__month="))
+        report["load"]["parquet"] = {
+            "seconds": time.perf_counter() - start,
+            "bytes": partition_bytes(directory, months),
+            "partitions": len(months),
+        }
+        del df
+
+        load = report["load"]
+        print(f"Load: table {load['table']['seconds']:.1f}s ({load['table']['bytes'] / 1e6:.0f} MB) | "
+              f"parquet {load['parquet']['seconds']:.1f}s ({load['parquet']['bytes'] / 1e6:.0f} MB, "
+              f"{len(months)} month partitions)")
+        print("-" * 84)
+        print(f"{'Window':14s} {'table':>10s} {'parquet':>10s} {'speedup':>9s} {'partitions':>12s} {'bytes read':>14s}")
+
+        for name, sql in queries(end_of(args.years)):
+            pruned = _prune_partitions(parquet_conn, "sensors", sql, "ts")
+            if pruned:
+                low, high = pruned["months"]
+                read = [m for m in months if (low is None or m >= f"__month={low.date()}")
+                        and (high is None or m <= f"__month={high.date()}")]
+            else:
+                read = months
+
+            expected = table_conn.execute(sql).fetchdf()
+            actual = parquet_conn.execute(pruned["sql"] if pruned else sql).fetchdf()
+            # Parquet stores categoricals as plain strings; compare values only
+            pd.testing.assert_frame_equal(actual.astype(object), expected.astype(object), check_exact=False, rtol=1e-9)
+
+            table_ms = time_query(table_conn, sql, args.repeat)
+            parquet_ms = time_query(parquet_conn, pruned["sql"] if pruned else sql, args.repeat)
+            read_bytes = partition_bytes(directory, read)
+            report["queries"].append({
+                "window": name,
+                "sql": sql,
+                "table_ms": table_ms,
+                "parquet_ms": parquet_ms,
+                "partitions_read": len(read),
+                "partitions_total": len(months),
+                "bytes_read": read_bytes,
+            })
+            print(f"{name:14s} {table_ms:8.1f}ms {parquet_ms:8.1f}ms {table_ms / parquet_ms:8.1f}x "
+                  f"{len(read):5d} / {len(months):<4d} {read_bytes / 1e6:11.1f} MB")
+
+    print("-" * 84)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+SmartFarm Excel Pipeline Benchmark
+Offline end-to-end benchmark of the Excel analysis tools: drives
+analyze_excel_with_cache (cold misses and warm hits) and analyze_csv_file
+against the fake Groq server, Redis (fakeredis by default) and synthetic farm
+datasets, and writes throughput, latency percentiles and peak RSS as JSON.
+
+Usage:
+    python scripts/benchmark-pipeline.py --sizes 1MB,10MB,100MB --output results.json
+    python scripts/benchmark-pipeline.py --sizes 1GB --iterations 3 --llm-latency 0.5
+    python scripts/benchmark-pipeline.py --compare baseline.json --output results.json
+
+Every dataset runs in a fresh interpreter so peak RSS belongs to that dataset
+alone. Generated datasets are kept in --data-dir and reused across runs.
+Use a dedicated Redis database with --redis-url; keys are never flushed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(SCRIPTS_DIR, '..')
+TOOLS_DIR = os.path.join(REPO_DIR, 'tools', 'excel')
+
+QUESTION = "Which crop has the highest average yield?"
+CANNED_SQL = (
+    "SELECT crop, COUNT(*) AS records, AVG(yield_value) AS avg_yield "
+    "FROM {table} GROUP BY crop ORDER BY avg_yield DESC"
+)
+SCENARIOS = ("excel_miss", "excel_hit", "csv_analyze")
+
+
+def parse_size(text):
+    """'10MB' -> bytes"""
+    units = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+    text = text.strip().upper()
+    for unit, factor in units.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def farm_frame(rows, seed, start=0):
+    """Synthetic farm records with repetitive labels and small numbers"""
+    rng = np.random.default_rng(seed)
+    crops = np.array(["maize", "wheat", "soy", "barley", "potato", "alfalfa"])
+    units = np.array(["kg/ha", "t/ha"])
+    return pd.DataFrame({
+        "date": (pd.Timestamp("2021-01-01") + pd.to_timedelta(np.arange(start, start + rows) // 1440, unit="D")).strftime("%Y-%m-%d"),
+        "field_code": np.char.add("F-", rng.integers(1, 120, rows).astype(str)),
+        "crop": crops[rng.integers(0, len(crops), rows)],
+        "unit": units[rng.integers(0, len(units), rows)],
+        "plot": rng.integers(1, 200, rows),
+        "irrigation_events": rng.integers(0, 30, rows),
+        "yield_value": rng.integers(0, 16000, rows) / 4,
+        "soil_moisture": rng.normal(30, 5, rows).round(3),
+    })
+
+
+def generate_dataset(path, target_bytes, chunk_rows=500_000):
+    """Write a farm CSV of roughly target_bytes in bounded-memory chunks"""
+    bytes_per_row = len(farm_frame(1000, 0).to_csv(index=False)) / 1000
+    remaining = max(int(target_bytes / bytes_per_row), 10)
+    written = 0
+    with open(path, "w") as f:
+        while remaining > 0:
+            rows = min(chunk_rows, remaining)
+            farm_frame(rows, seed=written, start=written).to_csv(f, index=False, header=(written == 0))
+            written += rows
+            remaining -= rows
+    return written
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (ms) for one scenario"""
+    values = np.array(latencies) * 1000
+    return {
+        "ops": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def redis_client(url):
+    """Real Redis for --redis-url, fakeredis otherwise"""
+    if url:
+        import redis
+        return redis.Redis.from_url(url, decode_responses=True)
+
+    import fakeredis
+    client = fakeredis.FakeRedis(decode_responses=True)
+    client.info = lambda section=None: {}  # fakeredis has no INFO; the memory sweep stays idle
+    return client
+
+
+def build_tools(args, server_url, db_path):
+    """sql_cache_tool with text-to-SQL answered by the fake Groq server, plus csv_analyzer_tool"""
+    sys.path.insert(0, TOOLS_DIR)
+    import requests
+    from sql_cache_tool import Tools as SqlTools, _LLMHTTPError
+    from csv_analyzer_tool import Tools as CsvTools
+
+    class OfflineSqlTools(SqlTools):
+        def _generate_sql(self, conn, table_name, query, model):
+            prompt = f"Table '{table_name}' has columns: {conn.table(table_name).columns}\nQuestion: {query}\nSQLQuery:"
+            response = requests.post(
+                f"{self.valves.GROQ_API_BASE}/chat/completions",
+                json={"model": model, "messages": [{"role": "user", "content": prompt}]},
+                timeout=self.valves.LLM_TIMEOUT
+            )
+            if response.status_code != 200:
+                raise _LLMHTTPError(response.status_code, response.text)
+            text = response.json()["choices"][0]["message"]["content"]
+            return text.split("SQLQuery:", 1)[1].split("SQLResult:", 1)[0].strip()
+
+    sql_tool = OfflineSqlTools.__new__(OfflineSqlTools)
+    sql_tool.valves = SqlTools.Valves(
+        GROQ_API_KEY="offline",
+        OPENAI_API_KEY="offline",
+        GROQ_API_BASE=server_url,
+        DATABASE_PATH=db_path,
+    )
+    sql_tool.citation = False
+    sql_tool.redis_client = redis_client(args.redis_url)
+    sql_tool._refresh_futures = set()
+
+    csv_tool = CsvTools()
+    csv_tool.valves.GROQ_API_KEY = "offline"
+    csv_tool.valves.GROQ_API_BASE = server_url
+    csv_tool.valves.ENABLE_CACHE = False  # csv_analyze times the full read + completion path
+    return sql_tool, csv_tool
+
+
+def failed(output):
+    return output.lstrip().startswith(("❌", "Error"))
+
+
+async def run_scenario(call, iterations, warmup):
+    """Time `iterations` sequential calls after `warmup` untimed ones"""
+    for i in range(warmup):
+        await call(-1 - i)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        output = await call(i)
+        latencies.append(time.perf_counter() - t0)
+        errors += failed(output)
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def measure(path, args):
+    """Run every scenario against one dataset in this process"""
+    sys.path.insert(0, SCRIPTS_DIR)
+    from fake_groq_server import FakeGroqServer
+
+    run_id = uuid.uuid4().hex[:8]
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeGroqServer(latency=args.llm_latency, sql=CANNED_SQL) as server:
+        sql_tool, csv_tool = build_tools(args, server.url, os.path.join(tmp, "bench.duckdb"))
+
+        async def excel_miss(i):
+            # A distinct question per call forces the full pipeline
+            return await sql_tool.analyze_excel_with_cache(path, f"{QUESTION} [{run_id}-{i}]")
+
+        async def excel_hit(i):
+            return await sql_tool.analyze_excel_with_cache(path, f"{QUESTION} [{run_id}-hot]")
+
+        async def csv_analyze(i):
+            return await csv_tool.analyze_csv_file(path, QUESTION)
+
+        calls = {"excel_miss": excel_miss, "excel_hit": excel_hit, "csv_analyze": csv_analyze}
+        results = {}
+        for name in SCENARIOS:
+            warmup = max(args.warmup, 1) if name == "excel_hit" else args.warmup
+            iterations = args.hit_iterations if name == "excel_hit" else args.iterations
+            results[name] = asyncio.run(run_scenario(calls[name], iterations, warmup))
+            results[name]["peak_rss_mb"] = peak_rss_mb()
+
+        return {
+            "scenarios": results,
+            "llm_requests": server.counts["requests"],
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def run_child(path, args):
+    """Benchmark one dataset in a fresh interpreter so peak RSS is not shared"""
+    with tempfile.NamedTemporaryFile(suffix=".json") as out:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child", path, out.name,
+            "--iterations", str(args.iterations), "--hit-iterations", str(args.hit_iterations),
+            "--warmup", str(args.warmup), "--llm-latency", str(args.llm_latency),
+        ]
+        if args.redis_url:
+            command += ["--redis-url", args.redis_url]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(out.name) as f:
+            return json.load(f)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def compare(report, baseline_path):
+    """Print p50/p95/throughput changes against a previous report"""
+    with open(baseline_path) as f:
+        previous = json.load(f)
+    baseline = {d["dataset"]: d for d in previous["datasets"]}
+
+    print(f"\nvs {baseline_path} ({previous.get('commit') or 'unknown commit'})")
+    print(f"{'Dataset':12s} {'Scenario':12s} {'p50':>10s} {'p95':>10s} {'ops/s':>10s}")
+    for dataset in report["datasets"]:
+        old = baseline.get(dataset["dataset"])
+        if not old:
+            continue
+        for name in SCENARIOS:
+            new_s, old_s = dataset["scenarios"][name], old["scenarios"][name]
+            change = lambda key: (new_s[key] / old_s[key] - 1) * 100 if old_s[key] else 0.0
+            print(f"{dataset['dataset']:12s} {name:12s} {change('p50_ms'):+9.1f}% "
+                  f"{change('p95_ms'):+9.1f}% {change('throughput'):+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end Excel pipeline benchmark")
+    parser.add_argument("--sizes", default="1MB,10MB,100MB", help="Comma-separated dataset sizes, up to 1GB")
+    parser.add_argument("--iterations", type=int, default=5, help="Timed calls per miss/CSV scenario")
+    parser.add_argument("--hit-iterations", type=int, default=50, help="Timed calls for the cache-hit scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed calls before each scenario")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake Groq seconds per completion")
+    parser.add_argument("--redis-url", default=None, help="Redis URL (default: in-process fakeredis)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "smartfarm-bench"))
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    parser.add_argument("--compare", default=None, help="Previous JSON report to diff against")
+    parser.add_argument("--child", nargs=2, metavar=("DATASET", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, output = args.child
+        with open(output, "w") as f:
+            json.dump(measure(path, args), f)
+        return 0
+
+    print("🏎️  SmartFarm Excel Pipeline Benchmark")
+    print("=" * 86)
+    print(f"{'Dataset':12s} {'Scenario':12s} {'ops/s':>9s} {'p50':>10s} {'p95':>10s} {'p99':>10s} {'Errors':>7s} {'Peak RSS':>10s}")
+    print("-" * 86)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "iterations": args.iterations,
+            "hit_iterations": args.hit_iterations,
+            "warmup": args.warmup,
+            "llm_latency": args.llm_latency,
+            "redis": "redis" if args.redis_url else "fakeredis",
+        },
+        "datasets": [],
+    }
+
+    for size in args.sizes.split(","):
+        name = f"farm_{size.strip().lower()}"
+        path = os.path.join(args.data_dir, f"{name}.csv")
+        if not os.path.exists(path):
+            generate_dataset(path, parse_size(size))
+
+        result = run_child(path, args)
+        result.update({
+            "dataset": name,
+            "size_mb": os.path.getsize(path) / 1024 / 1024,
+        })
+        report["datasets"].append(result)
+
+        for scenario in SCENARIOS:
+            s = result["scenarios"][scenario]
+            print(f"{name:12s} {scenario:12s} {s['throughput']:9.1f} {s['p50_ms']:8.1f}ms "
+                  f"{s['p95_ms']:8.1f}ms {s['p99_ms']:8.1f}ms {s['errors']:7d} {s['peak_rss_mb']:8.1f}MB")
+
+    print("-" * 86)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+SmartFarm Streaming Profiler Benchmark
+Compares peak RSS and time of csv_analyzer_tool's streaming profile against
+loading the whole file and calling describe(), as file size grows
+
+Usage:
+    python scripts/benchmark-profiler.py
+    python scripts/benchmark-profiler.py --rows 1000000,5000000,20000000 --chunk-rows 50000
+
+20M rows is roughly a 2 GB CSV; the streaming peak should stay flat while the
+full load grows with the file.
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools', 'excel')
+
+
+def generate_dataset(path, rows, seed=42, batch=500_000):
+    """Append a synthetic farm dataset batch by batch so generation stays in bounded memory"""
+    rng = np.random.default_rng(seed)
+    crops = np.array(["maize", "wheat", "soy", "barley", "potato", "alfalfa"])
+    for start in range(0, rows, batch):
+        n = min(batch, rows - start)
+        df = pd.DataFrame({
+            "date": pd.date_range("2021-01-01", periods=n, freq="min").strftime("%Y-%m-%d"),
+            "field_code": np.char.add("F-", rng.integers(1, 120, n).astype(str)),
+            "crop": crops[rng.integers(0, len(crops), n)],
+            "plot": rng.integers(1, 200, n),
+            "yield_value": rng.integers(0, 16000, n) / 4,
+            "soil_moisture": rng.normal(30, 5, n).round(3),
+        })
+        df.to_csv(path, mode="a", index=False, header=(start == 0))
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def measure(mode, path, chunk_rows):
+    """Profile the file in this process and print peak RSS and seconds"""
+    sys.path.insert(0, TOOLS_DIR)
+    from csv_analyzer_tool import _profile_file
+    from sql_cache_tool import _read_dataframe
+
+    start = time.perf_counter()
+    if mode == "streaming":
+        _profile_file(path, chunk_rows=chunk_rows)
+    else:
+        _read_dataframe(path).describe()
+    print(f"{peak_rss_mb():.1f} {time.perf_counter() - start:.2f}")
+
+
+def run_child(mode, path, chunk_rows):
+    """Run one profile in a fresh interpreter so peak RSS is not shared"""
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, path, str(chunk_rows)],
+        text=True
+    )
+    peak_mb, seconds = output.split()
+    return float(peak_mb), float(seconds)
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        measure(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return 0
+
+    parser = argparse.ArgumentParser(description="Streaming profile vs full load: peak memory and time")
+    parser.add_argument("--rows", default="200000,1000000,5000000", help="Comma-separated file sizes in rows")
+    parser.add_argument("--chunk-rows", type=int, default=50_000, help="PROFILE_CHUNK_ROWS for the streaming run")
+    parser.add_argument("--skip-full", action="store_true", help="Only run the streaming profile (for files larger than RAM)")
+    args = parser.parse_args()
+
+    print("📏 SmartFarm Streaming Profiler Benchmark")
+    print("=" * 70)
+    print(f"{'Rows':>12s} {'File':>10s} {'Mode':10s} {'Peak RSS':>12s} {'Time':>10s}")
+    print("-" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in (int(value) for value in args.rows.split(",")):
+            path = os.path.join(tmp, f"farm_{rows}.csv")
+            generate_dataset(path, rows)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+
+            for mode in ("streaming",) if args.skip_full else ("streaming", "full"):
+                peak_mb, seconds = run_child(mode, path, args.chunk_rows)
+                print(f"{rows:12,d} {size_mb:8.0f}MB {mode:10s} {peak_mb:10.1f}MB {seconds:9.2f}s")
+            os.remove(path)
+
+    print("-" * 70)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
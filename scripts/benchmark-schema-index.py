@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+SmartFarm Schema Index Benchmark
+Compares text-to-SQL prompts that carry every table in the DuckDB catalog
+against prompts carrying only the tables the schema index selects: prompt
+tokens, LLM latency and whether the tables each question needs were kept.
+
+Usage:
+    python scripts/benchmark-schema-index.py
+    python scripts/benchmark-schema-index.py --tables 100 --top-k 3 --prefill 0.1
+    python scripts/benchmark-schema-index.py --api-base https://api.groq.com/openai/v1 --api-key $GROQ_API_KEY
+
+Without --api-base the fake Groq server answers, with --llm-latency seconds
+per call plus --prefill seconds per 1,000 prompt tokens.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOLS_DIR = os.path.join(SCRIPTS_DIR, '..', 'tools', 'excel')
+
+CORE_TABLES = {
+    "yields": "crop VARCHAR, field VARCHAR, yield_kg DOUBLE, harvest_date DATE",
+    "weather": "date DATE, station VARCHAR, rainfall_mm DOUBLE, temperature_c DOUBLE, humidity_pct DOUBLE",
+    "soil_samples": "field VARCHAR, ph DOUBLE, nitrogen_ppm DOUBLE, organic_matter DOUBLE, sample_date DATE",
+    "irrigation_log": "field VARCHAR, date DATE, water_liters DOUBLE, method VARCHAR",
+    "pest_scouting": "field VARCHAR, pest VARCHAR, severity INTEGER, date DATE",
+    "sales": "crop VARCHAR, buyer VARCHAR, price_per_ton DOUBLE, tons DOUBLE, sale_date DATE",
+    "equipment": "machine VARCHAR, hours DOUBLE, fuel_liters DOUBLE, service_date DATE",
+    "labor_hours": "worker VARCHAR, task VARCHAR, hours DOUBLE, date DATE",
+}
+
+# (uploaded table, question, other tables the SQL needs)
+QUESTIONS = [
+    ("yields", "How does rainfall affect maize yield per field?", ["weather"]),
+    ("yields", "Does soil pH explain yield differences between fields?", ["soil_samples"]),
+    ("yields", "What was the revenue from maize sales given the yield?", ["sales"]),
+    ("irrigation_log", "Water used per field vs aphid severity", ["pest_scouting"]),
+    ("labor_hours", "Fuel used by the tractor vs labor hours per task", ["equipment"]),
+    ("yields", "Average yield per crop", []),
+    ("weather", "Average temperature and humidity per station", []),
+    ("sales", "Total tons sold per buyer", []),
+]
+
+FILLER_WORDS = [
+    "greenhouse", "livestock", "feed", "milk", "vaccination", "drone", "ndvi", "seed", "inventory", "warehouse",
+    "contract", "insurance", "subsidy", "certification", "audit", "energy", "solar", "battery", "vehicle", "route",
+    "packaging", "export", "shipment", "invoice", "supplier", "budget", "grant", "training", "safety", "waste",
+]
+FILLER_COLUMNS = [
+    "id", "code", "name", "status", "owner", "region", "quantity", "amount", "cost", "score", "count", "level",
+    "reference", "batch", "lot", "notes", "created_at", "updated_at", "category", "priority",
+]
+
+
+def filler_tables(count, seed=7):
+    """Unrelated farm-office tables that pad the catalog"""
+    rng = np.random.default_rng(seed)
+    tables = {}
+    for i in range(count):
+        subject = "_".join(rng.choice(FILLER_WORDS, 2, replace=False))
+        columns = [f"{subject.split('_')[0]}_{c}" for c in rng.choice(FILLER_COLUMNS, rng.integers(6, 16), replace=False)]
+        types = rng.choice(["VARCHAR", "DOUBLE", "INTEGER", "DATE"], len(columns))
+        tables[f"{subject}_{i}"] = ", ".join(f"{c} {t}" for c, t in zip(columns, types))
+    return tables
+
+
+def prompt_for(conn, tables, question, schema_text):
+    """LlamaIndex-style text-to-SQL prompt over the given tables"""
+    schema = "\n\n".join(schema_text(conn, name) for name in tables)
+    return (
+        "Given an input question, first create a syntactically correct duckdb query to run, then look at the "
+        "results of the query and return the answer.\nOnly use tables listed below.\n"
+        f"{schema}\n\nQuestion: {question}\nSQLQuery:"
+    )
+
+
+def complete(api_base, api_key, model, prompt, timeout):
+    """One chat completion; returns (seconds, prompt tokens reported by the API)"""
+    import requests
+
+    start = time.perf_counter()
+    response = requests.post(
+        f"{api_base}/chat/completions",
+        json={"model": model, "temperature": 0.1, "messages": [{"role": "user", "content": prompt}]},
+        headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start, response.json().get("usage", {}).get("prompt_tokens", 0)
+
+
+def summarize(samples):
+    values = np.array(samples) * 1000
+    return {"mean_ms": float(values.mean()), "p95_ms": float(np.percentile(values, 95))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schema prompt size and LLM latency: whole catalog vs schema index")
+    parser.add_argument("--tables", type=int, default=40, help="Tables in the catalog (8 core + filler)")
+    parser.add_argument("--top-k", type=int, default=3, help="SCHEMA_TOP_K")
+    parser.add_argument("--provider", default="hashing", help="EMBEDDING_PROVIDER")
+    parser.add_argument("--repeat", type=int, default=3, help="Completions per question and prompt")
+    parser.add_argument("--api-base", default=None, help="Groq-compatible endpoint (default: fake server)")
+    parser.add_argument("--api-key", default=os.getenv("GROQ_API_KEY", ""))
+    parser.add_argument("--model", default="llama-3.3-70b-versatile")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake server seconds per call")
+    parser.add_argument("--prefill", type=float, default=0.05, help="Fake server seconds per 1,000 prompt tokens")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    sys.path.insert(0, TOOLS_DIR)
+    sys.path.insert(0, SCRIPTS_DIR)
+    import fakeredis
+    from fake_groq_server import FakeGroqServer
+    from sql_cache_tool import Tools, _duckdb_connect, _estimate_tokens, _table_schema_text
+
+    server = None
+    if not args.api_base:
+        server = FakeGroqServer(latency=args.llm_latency, prefill=args.prefill).start()
+    api_base = args.api_base or server.url
+
+    print("🗂️  SmartFarm Schema Index Benchmark")
+    print("=" * 96)
+    report = {"settings": {k: v for k, v in vars(args).items() if k != "api_key"}, "questions": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        tool = Tools.__new__(Tools)
+        tool.valves = Tools.Valves(
+            DATABASE_PATH=os.path.join(tmp, "catalog.duckdb"),
+            SCHEMA_TOP_K=args.top_k,
+            EMBEDDING_PROVIDER=args.provider,
+        )
+        tool.redis_client = fakeredis.FakeRedis(decode_responses=True)
+        conn = _duckdb_connect(tool.valves.DATABASE_PATH)
+
+        tables = dict(CORE_TABLES, **filler_tables(max(args.tables - len(CORE_TABLES), 0)))
+        for name, columns in tables.items():
+            conn.execute(f"CREATE TABLE {name} ({columns})")
+        catalog = sorted(tables)
+
+        start = time.perf_counter()
+        tool._select_tables(conn, "yields", "warm up")  # indexes the whole catalog once
+        print(f"Catalog: {len(catalog)} tables, indexed with '{args.provider}' embeddings in "
+              f"{(time.perf_counter() - start) * 1000:.0f}ms | LLM: {api_base}")
+        print("-" * 96)
+        print(f"{'Question':52s} {'tables':>8s} {'tokens':>15s} {'latency (mean)':>16s} {'kept':>5s}")
+
+        latencies = {"catalog": [], "index": []}
+        for table, question, needed in QUESTIONS:
+            start = time.perf_counter()
+            selected = tool._select_tables(conn, table, question)
+            retrieval_ms = (time.perf_counter() - start) * 1000
+
+            row = {"question": question, "table": table, "selected": selected, "retrieval_ms": retrieval_ms,
+                   "kept": all(name in selected for name in needed)}
+            for mode, names in (("catalog", catalog), ("index", selected)):
+                prompt = prompt_for(conn, names, question, _table_schema_text)
+                runs = [complete(api_base, args.api_key, args.model, prompt, 60) for _ in range(args.repeat)]
+                latencies[mode].extend(seconds for seconds, _ in runs)
+                row[mode] = dict(summarize([seconds for seconds, _ in runs]),
+                                 prompt_tokens=runs[-1][1] or _estimate_tokens(prompt))
+            report["questions"].append(row)
+            print(f"{question[:52]:52s} {len(selected):3d}/{len(catalog):<4d} "
+                  f"{row['catalog']['prompt_tokens']:6,d} → {row['index']['prompt_tokens']:<6,d} "
+                  f"{row['catalog']['mean_ms']:6.0f} → {row['index']['mean_ms']:<5.0f}ms "
+                  f"{'✅' if row['kept'] else '❌':>4s}")
+        conn.close()
+
+    if server:
+        server.stop()
+
+    report["catalog"] = summarize(latencies["catalog"])
+    report["index"] = summarize(latencies["index"])
+    report["catalog"]["prompt_tokens"] = float(np.mean([q["catalog"]["prompt_tokens"] for q in report["questions"]]))
+    report["index"]["prompt_tokens"] = float(np.mean([q["index"]["prompt_tokens"] for q in report["questions"]]))
+    report["recall"] = float(np.mean([q["kept"] for q in report["questions"]]))
+    print("-" * 96)
+    for mode, label in (("catalog", "Whole catalog"), ("index", f"Top-{args.top_k} index")):
+        print(f"{label:15s} ≈{report[mode]['prompt_tokens']:7,.0f} prompt tokens | "
+              f"latency mean {report[mode]['mean_ms']:.0f}ms, p95 {report[mode]['p95_ms']:.0f}ms")
+    print(f"Needed tables kept: {report['recall'] * 100:.0f}% of questions")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Report written to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
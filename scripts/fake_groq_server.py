@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Fake Groq Server
+Local OpenAI-compatible /chat/completions stand-in for load tests and benchmarks
+
+Usage:
+    python scripts/fake_groq_server.py --port 8099 --latency 0.5 --capacity 4 --error-rate 0.1
+
+Point a tool at it by setting its GROQ_API_BASE valve to http://127.0.0.1:8099/openai/v1.
+Text-to-SQL prompts (LlamaIndex) are answered with canned SQL against the
+first table named in the prompt; other prompts get a canned analysis.
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGroqServer:
+    """
+    Threaded fake Groq endpoint with tunable behaviour.
+
+    Attributes can be changed while the server runs:
+    - latency: seconds per completion, or before the first streamed chunk (plus up to `jitter` seconds)
+    - prefill: extra seconds per 1,000 prompt tokens (prompt processing)
+    - capacity: concurrent requests served before answering 429
+    - error_rate: fraction of requests answered with 503
+    - token_delay: seconds between streamed chunks (requests with "stream": true)
+    - sql: canned SQL template; `{table}` is replaced with the prompt's table
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.0,
+                 capacity=0, error_rate=0.0, sql="SELECT COUNT(*) AS row_count FROM {table}", prefill=0.0,
+                 token_delay=0.0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.prefill = prefill
+        self.jitter = jitter
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sql = sql
+
+        self.in_flight = 0
+        self.counts = {"requests": 0, "ok": 0, "throttled": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/openai/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def completion_text(self, messages):
+        """Canned answer for the last user prompt"""
+        prompt = messages[-1].get("content", "") if messages else ""
+        if "SQLQuery" in prompt:
+            match = re.search(r"Table '([^']+)'", prompt)
+            table = match.group(1) if match else "data"
+            return f"SQLQuery: {self.sql.format(table=table)}\nSQLResult:"
+        return "Fake analysis: the dataset looks healthy. Average yield is stable across fields."
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, text, model):
+                """Server-sent events: one chunk per word, then [DONE]"""
+                words = re.findall(r"\S+\s*", text)
+                events = [
+                    {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+                    for word in words
+                ]
+                events.append({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": model,
+                               "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                chunks = [f"data: {json.dumps(event)}\n\n".encode() for event in events] + [b"data: [DONE]\n\n"]
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Content-Length", str(sum(len(chunk) for chunk in chunks)))
+                self.end_headers()
+                for i, chunk in enumerate(chunks):
+                    if i and server.token_delay:
+                        time.sleep(server.token_delay)
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+
+                with server._lock:
+                    server.counts["requests"] += 1
+                    if server.capacity and server.in_flight >= server.capacity:
+                        server.counts["throttled"] += 1
+                        throttled = True
+                    else:
+                        server.in_flight += 1
+                        throttled = False
+
+                if throttled:
+                    self._send(429, {"error": {"message": "Rate limit reached"}}, {"Retry-After": "1"})
+                    return
+
+                messages = request.get("messages", [])
+                # ~4 characters per token, like the tool's own estimate
+                prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+                try:
+                    time.sleep(server.latency + server.prefill * prompt_tokens / 1000 + random.uniform(0, server.jitter))
+                    if random.random() < server.error_rate:
+                        with server._lock:
+                            server.counts["errors"] += 1
+                        self._send(503, {"error": {"message": "Service unavailable"}})
+                        return
+
+                    text = server.completion_text(messages)
+                    completion_tokens = len(text) // 4
+                    with server._lock:
+                        server.counts["ok"] += 1
+                    if request.get("stream"):
+                        self._stream(text, request.get("model", "fake"))
+                        return
+                    self._send(200, {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model", "fake"),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        },
+                    })
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--prefill", type=float, default=0.0, help="Extra seconds per 1,000 prompt tokens")
+    parser.add_argument("--capacity", type=int, default=0, help="Concurrent requests before 429 (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--sql", default="SELECT COUNT(*) AS row_count FROM {table}")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    args = parser.parse_args()
+
+    server = FakeGroqServer(args.host, args.port, args.latency, args.jitter,
+                            args.capacity, args.error_rate, args.sql, args.prefill, args.token_delay)
+    print(f"🤖 Fake Groq listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+SmartFarm LLM Gateway Load Test
+Drives concurrent Groq-style calls against the fake Groq server, with and
+without the shared LLM gateway (circuit breaker, backoff, AIMD concurrency)
+"""
+
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, '..', 'tools', 'excel'))
+
+from fake_groq_server import FakeGroqServer
+from csv_analyzer_tool import _LLMGateway, _LLMHTTPError
+
+PAYLOAD = {"model": "fake", "messages": [{"role": "user", "content": "Summarize yields"}]}
+
+
+def post(url, timeout=30):
+    """One completion request, raising on non-200 like the tools do"""
+    response = requests.post(f"{url}/chat/completions", json=PAYLOAD, timeout=timeout)
+    if response.status_code != 200:
+        retry_after = response.headers.get("retry-after")
+        raise _LLMHTTPError(response.status_code, response.text, float(retry_after) if retry_after else None)
+    return response
+
+
+def run(url, workers, requests_total, gateway=None):
+    """Fire requests from `workers` threads; return (ok, latencies, elapsed)"""
+    def one(_):
+        start = time.perf_counter()
+        try:
+            if gateway:
+                gateway.call(lambda: post(url))
+            else:
+                post(url)
+            return True, time.perf_counter() - start
+        except Exception:
+            return False, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(one, range(requests_total)))
+    elapsed = time.perf_counter() - start
+    return sum(ok for ok, _ in results), [lat for _, lat in results], elapsed
+
+
+def report(name, ok, latencies, elapsed, total):
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    print(f"{name:34s} {ok:4d}/{total:<4d} {statistics.mean(latencies):8.2f}s {p95:8.2f}s {ok / elapsed:8.1f}/s")
+
+
+def main():
+    print("🏎️  SmartFarm LLM Gateway Load Test")
+    print("=" * 78)
+    print(f"{'Scenario':34s} {'OK':>9s} {'Mean':>9s} {'p95':>9s} {'Goodput':>10s}")
+    print("-" * 78)
+
+    with FakeGroqServer(latency=0.2, capacity=4) as server:
+        # Phase 1: Groq throttles above 4 concurrent requests
+        total = 64
+        ok, lat, elapsed = run(server.url, 16, total)
+        report("Throttled, direct", ok, lat, elapsed, total)
+
+        gateway = _LLMGateway()
+        gateway.configure(max_concurrency=16, backoff_base=0.2, acquire_timeout=60)
+        ok, lat, elapsed = run(server.url, 16, total, gateway)
+        report("Throttled, gateway", ok, lat, elapsed, total)
+        print(f"{'':34s} final limit {gateway.stats()['limit']}, retries {gateway.stats()['retries']}")
+
+        # Phase 2: Groq outage - every request is slow and fails
+        server.capacity = 0
+        server.latency = 1.0
+        server.error_rate = 1.0
+        total = 32
+        ok, lat, elapsed = run(server.url, 8, total)
+        report("Outage, direct", ok, lat, elapsed, total)
+
+        gateway = _LLMGateway()
+        gateway.configure(max_concurrency=8, max_retries=1, backoff_base=0.1, reset_timeout=30)
+        ok, lat, elapsed = run(server.url, 8, total, gateway)
+        report("Outage, gateway (breaker)", ok, lat, elapsed, total)
+        stats = gateway.stats()
+        print(f"{'':34s} circuit {stats['state']}, rejected fast {stats['rejected']}")
+
+    print("-" * 78)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
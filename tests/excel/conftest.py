@@ -0,0 +1,87 @@
+"""
+Excel Tests: Shared Fixtures
+
+Factories for sql_cache_tool, csv_analyzer_tool and cache_admin_tool instances
+backed by fake Redis. Test modules customize only what they stub.
+
+Author: SmartFarm Team
+"""
+
+import pytest
+import sys
+import os
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+
+@pytest.fixture
+def fake_redis():
+    """Factory for fake Redis clients; fakeredis has no INFO, so `info` reports the given dict"""
+    fakeredis = pytest.importorskip("fakeredis")
+
+    def make(info=None):
+        client = fakeredis.FakeRedis(decode_responses=True)
+        client.info = lambda section=None: dict(info or {})
+        return client
+    return make
+
+
+def _write_upload(instance, tmp_path, upload):
+    instance.file_path = str(tmp_path / "farm.csv")
+    with open(instance.file_path, "w") as f:
+        f.write(upload)
+
+
+@pytest.fixture
+def make_sql_tool(tmp_path, fake_redis):
+    """Factory for sql_cache_tool.Tools without connecting to Redis.
+
+    DuckDB files live under tmp_path and GROQ_API_KEY is set; keyword
+    arguments override valves. `upload` is written as CSV to
+    `tool.file_path`, and `redis_info` is what INFO reports.
+    """
+    from sql_cache_tool import Tools
+
+    def make(upload=None, redis_info=None, **valves):
+        instance = Tools.__new__(Tools)
+        instance.valves = Tools.Valves(**{
+            "GROQ_API_KEY": "test",
+            "DATABASE_PATH": str(tmp_path / "test.duckdb"),
+            "DUCKDB_TEMP_DIRECTORY": str(tmp_path / "spill"),
+            **valves,
+        })
+        instance.redis_client = fake_redis(redis_info)
+        instance._refresh_futures = set()
+        if upload is not None:
+            _write_upload(instance, tmp_path, upload)
+        return instance
+    return make
+
+
+@pytest.fixture
+def make_analyzer(tmp_path, fake_redis):
+    """Factory for csv_analyzer_tool.Tools with fake Redis; keyword arguments override valves"""
+    from csv_analyzer_tool import Tools
+
+    def make(upload=None, **valves):
+        instance = Tools.__new__(Tools)
+        instance.valves = Tools.Valves(**valves)
+        instance.redis_client = fake_redis()
+        if upload is not None:
+            _write_upload(instance, tmp_path, upload)
+        return instance
+    return make
+
+
+@pytest.fixture
+def make_admin():
+    """Factory for cache_admin_tool.Tools reading the given Redis client"""
+    from cache_admin_tool import Tools
+
+    def make(redis_client):
+        instance = Tools.__new__(Tools)
+        instance.valves = Tools.Valves()
+        instance.redis_client = redis_client
+        return instance
+    return make
@@ -0,0 +1,101 @@
+"""
+Excel Tests: Adaptive Cache TTL
+
+Tests cost-aware TTL selection and GDSF eviction in the SQL cache.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _adaptive_ttl, _gdsf_priority
+
+
+@pytest.fixture
+def tool(make_sql_tool):
+    """Tool instance backed by an in-process fake Redis reporting a nearly full 1 MB instance"""
+    return make_sql_tool(redis_info={"maxmemory": 1024 * 1024, "used_memory": 1000 * 1024})
+
+
+class TestAdaptiveTtl:
+    """Test the TTL formula"""
+
+    def test_reference_value_gets_base_ttl(self):
+        """An entry worth exactly the reference keeps CACHE_TTL"""
+        assert _adaptive_ttl(3600, 0, 0.5, 1024, reference=0.5) == 3600
+
+    def test_expensive_entries_live_longer(self):
+        """Higher recompute cost earns a longer TTL"""
+        cheap = _adaptive_ttl(3600, 0, 0.1, 4096, reference=0.5)
+        costly = _adaptive_ttl(3600, 0, 12.0, 4096, reference=0.5)
+        assert costly > cheap
+
+    def test_hits_extend_ttl(self):
+        """More hits earn a longer TTL"""
+        assert _adaptive_ttl(3600, 5, 0.5, 4096, reference=0.5) > _adaptive_ttl(3600, 0, 0.5, 4096, reference=0.5)
+
+    def test_ttl_is_clamped(self):
+        """TTL stays within the configured factors"""
+        assert _adaptive_ttl(3600, 1000, 60.0, 100, reference=0.5, max_factor=24) == 3600 * 24
+        assert _adaptive_ttl(3600, 0, 0.0, 10 ** 6, reference=0.5, min_factor=0.25) == 900
+
+    def test_priority_grows_with_inflation(self):
+        """GDSF priority includes the inflation value"""
+        assert _gdsf_priority(10.0, 0, 1.0, 1024) == pytest.approx(11.0)
+
+
+class TestCacheEntries:
+    """Test adaptive TTL in the Redis-backed cache"""
+
+    def test_save_records_metadata(self, tool):
+        """Saved entries carry cost, size and hit metadata"""
+        tool.valves.SWEEP_THRESHOLD = 1.0
+        tool._save_to_cache("sql_cache:a", {"row_count": 1}, cost=12.0)
+
+        r = tool.redis_client
+        assert float(r.hget("excel:cache:cost", "sql_cache:a")) == 12.0
+        assert int(r.hget("excel:cache:hits", "sql_cache:a")) == 0
+        assert r.ttl("sql_cache:a") > tool.valves.CACHE_TTL
+
+    def test_hit_extends_ttl(self, tool):
+        """Cache hits increment the counter and never shorten TTL"""
+        tool.valves.SWEEP_THRESHOLD = 1.0
+        tool._save_to_cache("sql_cache:a", {"row_count": 1}, cost=0.1)
+        before = tool.redis_client.ttl("sql_cache:a")
+
+        asyncio.run(tool._aget_from_cache("sql_cache:a"))
+        asyncio.run(tool._aget_from_cache("sql_cache:a"))
+
+        assert int(tool.redis_client.hget("excel:cache:hits", "sql_cache:a")) == 2
+        assert tool.redis_client.ttl("sql_cache:a") >= before
+
+    def test_sweep_evicts_low_value_first(self, tool):
+        """Cheap entries are evicted before expensive ones"""
+        tool.valves.SWEEP_THRESHOLD = 1.0
+        tool._save_to_cache("sql_cache:cheap", {"data": "x" * 4096}, cost=0.01)
+        tool._save_to_cache("sql_cache:costly", {"data": "x" * 4096}, cost=12.0)
+
+        # Need to free ~1 KB: one entry is enough
+        tool.valves.SWEEP_TARGET = 999 / 1024
+        stats = tool._sweep_cache(force=True)
+
+        assert stats["evicted"] == 1
+        assert tool.redis_client.exists("sql_cache:costly")
+        assert not tool.redis_client.exists("sql_cache:cheap")
+
+    def test_sweep_prunes_expired_metadata(self, tool):
+        """Metadata of expired entries is cleaned up"""
+        tool.valves.SWEEP_THRESHOLD = 1.0
+        tool._save_to_cache("sql_cache:gone", {"row_count": 1}, cost=1.0)
+        tool.redis_client.delete("sql_cache:gone")
+
+        stats = tool._sweep_cache()
+
+        assert stats["pruned"] == 1
+        assert tool.redis_client.hget("excel:cache:cost", "sql_cache:gone") is None
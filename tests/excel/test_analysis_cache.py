@@ -0,0 +1,143 @@
+"""
+Excel Tests: Analysis Cache
+
+Tests caching csv_analyzer_tool answers by file, question, model and temperature.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+# Add excel tools and scripts to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../scripts'))
+
+from csv_analyzer_tool import _canonical_query
+from fake_groq_server import FakeGroqServer
+
+
+@pytest.fixture
+def server():
+    """Fake Groq endpoint"""
+    with FakeGroqServer(latency=0) as instance:
+        yield instance
+
+
+@pytest.fixture
+def tool(make_analyzer, server):
+    """Analyzer with fake Redis pointed at the fake Groq server"""
+    return make_analyzer(upload="crop,yield\nmaize,10\nwheat,12\n", GROQ_API_KEY="test", GROQ_API_BASE=server.url)
+
+
+def ask(tool, query):
+    return asyncio.run(tool.analyze_csv_file(tool.file_path, query))
+
+
+class TestCanonicalQuery:
+    """Test the question text behind cache keys"""
+
+    def test_case_spacing_and_punctuation_ignored(self):
+        """Rephrasings that differ only in layout share a key"""
+        assert _canonical_query("Which crop  yields MOST?") == _canonical_query(" which crop yields most ")
+
+    def test_words_kept(self):
+        """Different questions stay apart"""
+        assert _canonical_query("Which crop yields most?") != _canonical_query("Which crop yields least?")
+
+
+class TestAnalysisCache:
+    """Test analyze_csv_file with the Redis cache"""
+
+    def test_repeat_question_skips_llm(self, tool, server):
+        """The same question on the same file is answered from cache"""
+        first = ask(tool, "Which crop yields most?")
+        second = ask(tool, "which crop yields most")
+
+        assert "Cache: MISS" in first and "Cache: HIT" in second
+        assert "Fake analysis" in second and "- Rows: 2" in second
+        assert server.counts["requests"] == 1
+        usage = tool.redis_client.hgetall("excel:analysis")
+        assert (usage["misses"], usage["stored"], usage["hits"]) == ("1", "1", "1")
+        assert float(usage["saved_seconds"]) > 0
+
+    def test_hits_leave_payload_untouched(self, tool):
+        """Hits are counted in side hashes; the cached payload is written once"""
+        ask(tool, "Summary?")
+        key = tool.redis_client.keys("csv_analysis:*")[0]
+        payload = tool.redis_client.get(key)
+        tool.redis_client.expire(key, 10)
+
+        ask(tool, "Summary?")
+        ask(tool, "Summary?")
+
+        assert tool.redis_client.get(key) == payload and "hits" not in payload
+        assert tool.redis_client.hget("excel:analysis:hits", key) == "2"
+        assert int(tool.redis_client.hget("excel:analysis:accessed", key)) > 0
+        assert tool.redis_client.ttl(key) > 10
+
+    def test_key_parts_miss(self, tool, server):
+        """New file content, model or temperature each need a new completion"""
+        ask(tool, "Summary?")
+        with open(tool.file_path, "a") as f:
+            f.write("soy,8\n")
+        ask(tool, "Summary?")
+        tool.valves.GROQ_MODEL = "llama-3.1-8b-instant"
+        ask(tool, "Summary?")
+        tool.valves.LLM_TEMPERATURE = 0.0
+        ask(tool, "Summary?")
+
+        assert server.counts["requests"] == 4
+        assert len(tool.redis_client.keys("csv_analysis:*")) == 4
+
+    def test_failures_not_cached(self, tool, server):
+        """A failed completion is retried by the next question"""
+        tool.valves.LLM_MAX_RETRIES = 0
+        tool.valves.BREAKER_FAILURE_THRESHOLD = 100
+        server.capacity = -1  # Throttle everything
+        assert "429" in ask(tool, "Summary?")
+
+        server.capacity = 0
+        assert "Cache: MISS" in ask(tool, "Summary?")
+
+    def test_ttl_policy(self, tool):
+        """Entries get the GDSF TTL, or CACHE_TTL when ADAPTIVE_TTL is off"""
+        ask(tool, "Summary?")
+        ttl = tool.redis_client.ttl(tool.redis_client.keys("csv_analysis:*")[0])
+        assert tool.valves.CACHE_TTL * tool.valves.MIN_TTL_FACTOR <= ttl <= tool.valves.CACHE_TTL * tool.valves.MAX_TTL_FACTOR
+
+        tool.valves.ADAPTIVE_TTL = False
+        ask(tool, "Trend?")
+        ttls = sorted(tool.redis_client.ttl(key) for key in tool.redis_client.keys("csv_analysis:*"))
+        assert tool.valves.CACHE_TTL in ttls
+
+    def test_cache_disabled(self, tool, server):
+        """ENABLE_CACHE=False calls the LLM every time"""
+        tool.valves.ENABLE_CACHE = False
+        ask(tool, "Summary?")
+        ask(tool, "Summary?")
+        assert server.counts["requests"] == 2
+        assert tool.redis_client.keys("csv_*") == []
+
+
+class TestAdminVisibility:
+    """Test the analysis cache in cache_admin_tool"""
+
+    def test_dashboard_shows_hits_and_misses(self, tool, make_admin):
+        """cache_dashboard reports analysis entries and hit rate"""
+        ask(tool, "Summary?")
+        ask(tool, "Summary?")
+
+        output = asyncio.run(make_admin(tool.redis_client).cache_dashboard())
+        assert "**CSV Analyses:** 1 cached · 1 hits / 1 misses (50.0% hit rate" in output
+
+    def test_clear_all_cache_removes_analyses(self, tool, make_admin):
+        """clear_all_cache drops cached analyses and their counters"""
+        ask(tool, "Summary?")
+        output = asyncio.run(make_admin(tool.redis_client).clear_all_cache(confirm="YES"))
+
+        assert "- Deleted 2 cached CSV analyses and profiles" in output
+        assert tool.redis_client.keys("csv_analysis:*") == []
+        assert not tool.redis_client.exists("excel:analysis", "excel:analysis:hits", "excel:analysis:accessed")
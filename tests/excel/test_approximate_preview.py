@@ -0,0 +1,123 @@
+"""
+Excel Tests: Approximate Preview
+
+Tests sampled approximate answers shown before the exact result on large tables.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _approximate_answer
+
+GROUPED_SQL = "SELECT crop, SUM(yield) AS total, AVG(yield) AS mean, COUNT(*) AS n FROM farm GROUP BY crop ORDER BY crop"
+
+
+def farm(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "crop": rng.choice(["maize", "soy", "wheat"], rows),
+        "yield": rng.normal(100, 10, rows).round(2),
+    })
+
+
+@pytest.fixture
+def table(tmp_path):
+    """200k-row farm table in DuckDB"""
+    df = farm(200_000)
+    conn = duckdb.connect(str(tmp_path / "test.duckdb"))
+    conn.execute("CREATE TABLE farm AS SELECT * FROM df")
+    return conn, df
+
+
+@pytest.fixture
+def tool(make_sql_tool, tmp_path):
+    """Tool with fake Redis, a low preview threshold and canned SQL"""
+    instance = make_sql_tool(APPROX_MIN_ROWS=10_000, APPROX_SAMPLE_ROWS=2_000, ADAPTIVE_TTL=False)
+    instance._generate_sql = lambda conn, table_name, query, model: GROUPED_SQL
+    instance.file_path = str(tmp_path / "farm.csv")
+    farm(20_000, seed=1).to_csv(instance.file_path, index=False)
+    return instance
+
+
+def analyze(tool, query="Total yield per crop?"):
+    events = []
+
+    async def emitter(event):
+        events.append(event)
+
+    output = asyncio.run(tool.analyze_excel_with_cache(tool.file_path, query, __event_emitter__=emitter))
+    return output, [e["data"]["content"] for e in events if e["type"] == "replace"]
+
+
+class TestApproximateAnswer:
+    """Test estimates from a sample"""
+
+    def test_scales_sums_and_counts_only(self, table):
+        """SUM/COUNT are scaled to the population; AVG is not"""
+        conn, df = table
+        estimate = _approximate_answer(conn, "farm", df.sample(20_000, random_state=0), len(df), GROUPED_SQL)
+        exact = conn.execute(GROUPED_SQL).fetchdf()
+
+        assert sorted(estimate["scaled_columns"]) == ["n", "total"]
+        for col in ("total", "mean", "n"):
+            np.testing.assert_allclose(estimate["result"][col], exact[col], rtol=0.05)
+
+    def test_error_estimate(self, table):
+        """The reported error is small but non-zero for a 10% sample"""
+        conn, df = table
+        estimate = _approximate_answer(conn, "farm", df.sample(20_000, random_state=0), len(df), GROUPED_SQL)
+        assert 0 < estimate["error"] < 0.05
+
+    def test_real_table_untouched(self, table):
+        """The sample shadows the table only on its own cursor"""
+        conn, df = table
+        _approximate_answer(conn, "farm", df.sample(1_000, random_state=0), len(df), GROUPED_SQL)
+        assert conn.execute("SELECT COUNT(*) FROM farm").fetchone()[0] == 200_000
+
+    def test_row_queries_not_estimated(self, table):
+        """Queries without aggregates get no preview"""
+        conn, df = table
+        assert _approximate_answer(conn, "farm", df.head(100), len(df), "SELECT * FROM farm LIMIT 5") is None
+
+
+class TestProgressivePreview:
+    """Test the preview in analyze_excel_with_cache"""
+
+    def test_preview_then_exact(self, tool):
+        """An approximate answer is shown first and replaced by the exact one"""
+        output, contents = analyze(tool)
+
+        assert len(contents) == 2
+        assert "VISTA PREVIA" in contents[0]
+        assert "2,000 de 20,000 filas" in contents[0]
+        assert contents[1] == output
+        assert "[NEW QUERY]" in output
+
+    def test_exact_result_cached(self, tool):
+        """The cache holds the exact result, never the estimate"""
+        analyze(tool)
+        cached = asyncio.run(tool._aget_from_cache(tool.redis_client.keys("sql_cache:*")[0]))
+        assert sum(row["n"] for row in cached["results"]) == 20_000
+
+    def test_small_tables_skip_preview(self, tool):
+        """Below APPROX_MIN_ROWS the exact answer comes straight away"""
+        tool.valves.APPROX_MIN_ROWS = 50_000
+        output, contents = analyze(tool)
+        assert contents == []
+        assert "[NEW QUERY]" in output
+
+    def test_disabled(self, tool):
+        """APPROX_PREVIEW=False turns the preview off"""
+        tool.valves.APPROX_PREVIEW = False
+        assert analyze(tool)[1] == []
@@ -0,0 +1,120 @@
+"""
+Excel Tests: Cache Load Test
+
+Tests the concurrent, statistically summarized test_cache_performance mode.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+import time
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _latency_stats
+
+
+@pytest.fixture
+def tool(make_sql_tool):
+    """Tool instance with fake Redis and a slow counting fake query executor"""
+    instance = make_sql_tool(upload="crop,yield\nmaize,1\n", ADAPTIVE_TTL=False)
+    instance.calls = 0
+
+    def fake_execute(file_path, query, model, timer=None, preview=None, frame=None):
+        instance.calls += 1
+        time.sleep(0.02)
+        return {
+            "sql_query": "SELECT 1",
+            "results": [],
+            "results_markdown": "No results",
+            "row_count": 0,
+            "table_name": "farm",
+        }
+
+    instance._execute_sql_query = fake_execute
+    return instance
+
+
+def load_test(tool, **kwargs):
+    return asyncio.run(tool.test_cache_performance(tool.file_path, "yield?", **kwargs))
+
+
+class TestLatencyStats:
+    """Test the latency summary"""
+
+    def test_confidence_interval(self):
+        """The 95% half-width uses Student t for small samples"""
+        stats = _latency_stats([1.0, 2.0, 3.0])
+        assert stats["mean"] == pytest.approx(2.0)
+        assert stats["ci95"] == pytest.approx(4.303 * 1.0 / 3 ** 0.5)
+
+    def test_single_sample_has_no_interval(self):
+        """One sample gives a zero-width interval"""
+        assert _latency_stats([0.5])["ci95"] == 0.0
+
+    def test_empty(self):
+        """No samples gives an empty summary"""
+        assert _latency_stats([]) == {"n": 0}
+
+
+class TestLoadTest:
+    """Test test_cache_performance in load-test mode"""
+
+    def test_every_miss_recomputes(self, tool):
+        """Warm-up plus each cold miss reaches the pipeline; hits do not"""
+        load_test(tool, warmup=1, miss_iterations=3, iterations=5, concurrency=2)
+        assert tool.calls == 4
+
+    def test_cold_misses_reach_llm_with_templates(self, tool):
+        """With the real pipeline, evicting an entry also drops its SQL template"""
+        del tool._execute_sql_query
+        llm_calls = []
+
+        def fake_llm(conn, table_name, query, model):
+            llm_calls.append(query)
+            return f"SELECT crop, SUM(yield) AS total FROM {table_name} WHERE crop = 'maize' GROUP BY crop"
+
+        tool._generate_sql = fake_llm
+        asyncio.run(tool.test_cache_performance(
+            tool.file_path, "total yield of maize", warmup=1, miss_iterations=3, iterations=2, concurrency=1
+        ))
+
+        assert len(llm_calls) == 4
+        assert tool.redis_client.hget("excel:templates", "hits") is None
+
+    def test_hits_under_concurrency(self, tool):
+        """Load doubles up to the concurrency and every request is a hit"""
+        load_test(tool, warmup=0, miss_iterations=1, iterations=4, concurrency=4)
+        run = json.loads(tool.redis_client.get("excel:benchmark:last"))
+
+        assert [point["users"] for point in run["curve"]] == [1, 2, 4]
+        assert run["hit"]["n"] == 4
+        assert run["hit_loaded"]["n"] == 16
+        assert run["non_hits"] == 0
+        assert run["speedup"] > 1
+
+    def test_report_has_intervals(self, tool):
+        """The report shows miss and hit distributions with confidence intervals"""
+        output = load_test(tool, warmup=0, miss_iterations=2, iterations=3, concurrency=1)
+        assert "Miss (cold) | 2 |" in output
+        assert "±" in output
+        assert "Peak throughput" in output
+
+
+class TestDashboard:
+    """Test the last benchmark run on the admin dashboard"""
+
+    def test_dashboard_shows_last_run(self, tool, make_admin):
+        """cache_dashboard renders the stored benchmark"""
+        load_test(tool, warmup=0, miss_iterations=2, iterations=3, concurrency=2)
+
+        output = asyncio.run(make_admin(tool.redis_client).cache_dashboard())
+
+        assert "## 🧪 Last Benchmark" in output
+        assert "Hit (2 users)" in output
+        assert "Peak Throughput" in output
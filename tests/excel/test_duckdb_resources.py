@@ -0,0 +1,128 @@
+"""
+Excel Tests: DuckDB Resources
+
+Tests memory/thread limits, spill-to-disk metrics and query timeouts.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _DuckDBWatchdog, _classify_error, _duckdb_connect
+
+HEAVY_SQL = "SELECT s, count(*) FROM heavy GROUP BY s ORDER BY s"
+
+
+@pytest.fixture
+def tool(make_sql_tool):
+    """Tool with fake Redis, a tight DuckDB budget and canned SQL"""
+    instance = make_sql_tool(
+        upload="crop,yield\nmaize,1\nmaize,2\nwheat,3\n",
+        DUCKDB_MEMORY_LIMIT="64MB",
+        DUCKDB_THREADS=1,
+    )
+    instance.sql = "SELECT crop, SUM(yield) AS total FROM farm GROUP BY crop ORDER BY crop"
+    instance._generate_sql = lambda conn, table_name, query, model: instance.sql
+    return instance
+
+
+def heavy_table(conn, rows=1_000_000):
+    conn.execute(f"CREATE TABLE heavy AS SELECT md5(i::VARCHAR) AS s FROM range({rows}) r(i)")
+
+
+class TestConnectionSettings:
+    """Test that valves reach every DuckDB connection"""
+
+    def test_limits_applied(self, tmp_path):
+        """Memory, threads and spill settings are set on the connection"""
+        conn = _duckdb_connect(
+            str(tmp_path / "db.duckdb"), memory_limit="128MB", threads=1,
+            temp_directory=str(tmp_path / "spill"), max_temp_directory_size="1GB"
+        )
+        threads, temp_directory = conn.execute(
+            "SELECT current_setting('threads'), current_setting('temp_directory')"
+        ).fetchone()
+        memory_limit = conn.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+
+        assert threads == 1
+        assert temp_directory == str(tmp_path / "spill")
+        assert memory_limit.startswith("122")  # 128MB reported in MiB
+
+    def test_empty_settings_keep_defaults(self, tmp_path):
+        """Blank valves leave DuckDB's own defaults"""
+        conn = _duckdb_connect(str(tmp_path / "db.duckdb"))
+        assert conn.execute("SELECT current_setting('preserve_insertion_order')").fetchone()[0] is True
+
+
+class TestWatchdog:
+    """Test timeouts and spill sampling"""
+
+    def test_timeout_interrupts_query(self, tmp_path):
+        """A statement past the deadline is interrupted and reported as a timeout"""
+        conn = _duckdb_connect(str(tmp_path / "db.duckdb"))
+        heavy_table(conn, rows=200_000)
+
+        with pytest.raises(TimeoutError) as excinfo:
+            with _DuckDBWatchdog(conn, timeout=0.1, poll_interval=0.02):
+                conn.execute("SELECT count(*) FROM heavy a, heavy b WHERE a.s < b.s").fetchall()
+
+        assert _classify_error(excinfo.value) == "transient"
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+
+    def test_fast_query_not_timed_out(self, tmp_path):
+        """Statements within the deadline run normally"""
+        conn = _duckdb_connect(str(tmp_path / "db.duckdb"))
+        with _DuckDBWatchdog(conn, timeout=5) as watchdog:
+            assert conn.execute("SELECT 42").fetchone() == (42,)
+        assert watchdog.timed_out is False
+
+    def test_heavy_query_spills_instead_of_failing(self, tmp_path):
+        """Over the memory limit the aggregation spills to disk and completes"""
+        conn = _duckdb_connect(
+            str(tmp_path / "db.duckdb"), memory_limit="32MB", threads=1,
+            temp_directory=str(tmp_path / "spill")
+        )
+        heavy_table(conn)
+
+        with _DuckDBWatchdog(conn, poll_interval=0.01) as watchdog:
+            rows = conn.execute(HEAVY_SQL).fetchall()
+
+        assert len(rows) == 1_000_000
+        assert watchdog.spill_bytes > 0
+
+
+class TestUsageMetrics:
+    """Test DuckDB metrics recorded by the tool"""
+
+    def test_statements_counted(self, tool):
+        """Import and execute are both counted"""
+        result = tool._execute_sql_query(tool.file_path, "total yield per crop?")
+
+        assert result["results"] == [{"crop": "maize", "total": 3}, {"crop": "wheat", "total": 3}]
+        assert tool.redis_client.hget("excel:duckdb", "statements") == "2"
+
+    def test_spill_recorded(self, tool):
+        """Spilled bytes and the peak are stored in Redis"""
+        tool._record_duckdb_usage(2048, False)
+        tool._record_duckdb_usage(1024, True)
+
+        usage = tool.redis_client.hgetall("excel:duckdb")
+        assert usage["spilled_statements"] == "2"
+        assert usage["spilled_bytes"] == "3072"
+        assert usage["timeouts"] == "1"
+        assert tool.redis_client.zscore("excel:duckdb:peak", "spill_bytes") == 2048
+
+    def test_stats_show_resources(self, tool):
+        """get_cache_stats reports limits, spills and timeouts"""
+        tool._record_duckdb_usage(5 * 1024 * 1024, False)
+        output = asyncio.run(tool.get_cache_stats())
+
+        assert "**DuckDB Resources:**" in output
+        assert "64MB memory, 1 threads" in output
+        assert "Spilled Statements: 1 / 1 (5.0 MB total, peak 5.0 MB)" in output
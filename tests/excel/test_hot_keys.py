@@ -0,0 +1,151 @@
+"""
+Excel Tests: Hot Keys
+
+Tests per-entry lookup counting, the hot-queries report and the in-process hot tier.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+
+
+def result(sql):
+    return {"sql_query": sql, "results": [], "results_markdown": "No results", "row_count": 0, "table_name": "farm"}
+
+
+@pytest.fixture
+def tool(make_sql_tool):
+    """Tool instance with fake Redis and two cached entries"""
+    instance = make_sql_tool(ADAPTIVE_TTL=False, HOT_TIER_REFRESH=3600)
+    instance._save_to_cache("sql_cache:cold", result("SELECT 1"))
+    instance._save_to_cache("sql_cache:hot", result("SELECT 2"))
+    return instance
+
+
+def lookup(tool, key, times=1):
+    async def run():
+        return [await tool._aget_from_cache(key) for _ in range(times)]
+    return asyncio.run(run())
+
+
+class TestLookupCounts:
+    """Test access tracking in the lookup pipeline"""
+
+    def test_lookups_counted(self, tool):
+        """Every lookup bumps the entry's score"""
+        lookup(tool, "sql_cache:hot", times=4)
+        assert tool.redis_client.zscore("excel:cache:hot", "sql_cache:hot") == 4
+
+    def test_hot_queries_ranked(self, tool):
+        """The report lists cached entries by lookups and skips expired ones"""
+        lookup(tool, "sql_cache:hot", times=3)
+        lookup(tool, "sql_cache:cold")
+        lookup(tool, "sql_cache:gone", times=5)
+
+        async def report():
+            return await tool._ahot_queries(await tool._aredis(), limit=5)
+
+        hot = asyncio.run(report())
+        assert [row["key"] for row in hot] == ["sql_cache:hot", "sql_cache:cold"]
+        assert hot[0]["lookups"] == 3
+        assert hot[0]["sql_query"] == "SELECT 2"
+
+    def test_sweep_forgets_uncached_keys(self, tool):
+        """Counts for questions that are no longer cached are pruned"""
+        lookup(tool, "sql_cache:gone")
+        lookup(tool, "sql_cache:hot")
+        tool._sweep_cache()
+        assert tool.redis_client.zrange("excel:cache:hot", 0, -1) == ["sql_cache:hot"]
+
+
+class TestHotTier:
+    """Test pinning the hottest entries in process memory"""
+
+    def test_hot_entry_served_in_process(self, tool):
+        """Once pinned, the hottest entry is answered without touching Redis"""
+        tool.valves.HOT_TIER_SIZE = 1
+        lookup(tool, "sql_cache:hot", times=2)
+        tool._hot_tier().refreshed_at = None
+        lookup(tool, "sql_cache:hot")  # refresh pins it
+
+        tool._redis_client.pipeline = lambda *args, **kwargs: pytest.fail("network hop on a hot hit")
+        hit = lookup(tool, "sql_cache:hot")[0]
+
+        assert hit["sql_query"] == "SELECT 2"
+        assert tool._hot_tier().stats() == {"size": 1, "hits": 2, "refreshes": 2}
+
+    def test_buffered_hits_flushed_on_refresh(self, tool):
+        """In-process hits reach the ranking and hit metrics on the next refresh"""
+        tool.valves.HOT_TIER_SIZE = 1
+        lookup(tool, "sql_cache:hot")
+        tool._hot_tier().refreshed_at = None
+        lookup(tool, "sql_cache:hot", times=3)
+        tool._hot_tier().refreshed_at = None
+        lookup(tool, "sql_cache:cold")
+
+        assert tool.redis_client.zscore("excel:cache:hot", "sql_cache:hot") == 4
+        assert tool.redis_client.get("excel:queries:hot_tier_hit") == "3"
+
+    def test_buffered_hits_touch_entries(self, tool):
+        """With ADAPTIVE_TTL, flushed in-process hits raise hit counts, priority and TTL like Redis-path hits"""
+        tool.valves.ADAPTIVE_TTL = True
+        tool.valves.HOT_TIER_SIZE = 1
+        tool._save_to_cache("sql_cache:hot", result("SELECT 2"), cost=5.0)
+        lookup(tool, "sql_cache:hot")
+        tool._hot_tier().refreshed_at = None
+        lookup(tool, "sql_cache:hot")  # refresh pins it
+        ttl = tool.redis_client.ttl("sql_cache:hot")
+        priority = tool.redis_client.zscore("excel:cache:priority", "sql_cache:hot")
+
+        lookup(tool, "sql_cache:hot", times=20)
+        tool._hot_tier().refreshed_at = None
+        lookup(tool, "sql_cache:cold")
+
+        assert tool.redis_client.hget("excel:cache:hits", "sql_cache:hot") == "22"
+        assert tool.redis_client.zscore("excel:cache:priority", "sql_cache:hot") > priority
+        assert tool.redis_client.ttl("sql_cache:hot") > ttl
+
+    def test_stale_entries_not_pinned(self, tool):
+        """Entries past their soft TTL stay on the Redis path to be refreshed"""
+        tool.valves.HOT_TIER_SIZE = 1
+        lookup(tool, "sql_cache:hot")
+        tool.redis_client.expire("sql_cache:hot", 10)
+        tool._hot_tier().refreshed_at = None
+
+        assert lookup(tool, "sql_cache:hot")[0]["stale"] is True
+        assert tool._hot_tier().stats()["size"] == 0
+
+    def test_clear_cache_drops_tier(self, tool):
+        """clear_cache empties the in-process tier too"""
+        tool.valves.HOT_TIER_SIZE = 1
+        lookup(tool, "sql_cache:hot")
+        tool._hot_tier().refreshed_at = None
+        lookup(tool, "sql_cache:hot")
+        asyncio.run(tool.clear_cache())
+
+        assert tool._hot_tier().stats()["size"] == 0
+        assert not tool.redis_client.exists("excel:cache:hot")
+
+
+class TestReports:
+    """Test hot-key reporting in stats and the admin tool"""
+
+    def test_stats_list_hot_queries(self, tool):
+        """get_cache_stats shows the hottest entries"""
+        lookup(tool, "sql_cache:hot", times=2)
+        output = asyncio.run(tool.get_cache_stats())
+
+        assert "**Hot Queries:**" in output
+        assert "1. `...ache:hot` 2 lookups" in output
+        assert "Hot Tier: off" in output
+
+    def test_view_cached_queries_hottest_first(self, tool, make_admin):
+        """view_cached_queries ranks entries by lookups, not TTL"""
+        tool.redis_client.expire("sql_cache:hot", 60)
+        lookup(tool, "sql_cache:hot", times=2)
+
+        output = asyncio.run(make_admin(tool.redis_client).view_cached_queries())
+
+        assert output.index("SELECT 2") < output.index("SELECT 1")
+        assert "**Lookups:** 2" in output
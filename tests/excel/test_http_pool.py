@@ -0,0 +1,182 @@
+"""
+Excel Tests: HTTP Pool
+
+Tests the shared keep-alive HTTP client behind csv_analyzer_tool's Groq calls.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+# Add excel tools and scripts to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../scripts'))
+
+import csv_analyzer_tool
+from csv_analyzer_tool import Tools, _HTTPClients, _LLMGateway, _LLMHTTPError
+from fake_groq_server import FakeGroqServer
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """Fresh client registry so counters start at zero"""
+    registry = _HTTPClients()
+    monkeypatch.setattr(csv_analyzer_tool, "_HTTP_CLIENTS", registry)
+    return registry
+
+
+@pytest.fixture
+def server():
+    """Fake Groq endpoint with keep-alive"""
+    with FakeGroqServer(latency=0) as instance:
+        yield instance
+
+
+@pytest.fixture
+def upload(tmp_path):
+    """Small farm CSV"""
+    path = tmp_path / "farm.csv"
+    path.write_text("crop,yield\nmaize,10\nwheat,12\n")
+    return str(path)
+
+
+def analyzer(server):
+    tool = Tools()
+    tool.valves.GROQ_API_KEY = "test"
+    tool.valves.GROQ_API_BASE = server.url
+    return tool
+
+
+class TestConnectionReuse:
+    """Test keep-alive reuse across tool invocations"""
+
+    def test_second_question_reuses_connection(self, clients, server, upload):
+        """Two questions open one connection; the second pays no connect time"""
+        async def ask_twice():
+            tool = analyzer(server)
+            first = await tool.analyze_csv_file(upload, "Which crop yields most?")
+            second = await tool.analyze_csv_file(upload, "Any trend?")
+            return first, second
+
+        first, second = asyncio.run(ask_twice())
+
+        assert "Fake analysis" in first and "Fake analysis" in second
+        assert clients.counters["requests"] == 2 and clients.counters["connections"] == 1
+        assert clients.connect_times[0] > 0 and clients.connect_times[1] == 0
+
+    def test_client_shared_across_instances(self, clients):
+        """Tool instances on one event loop get the same client"""
+        async def build():
+            return clients.client(), clients.client(), clients.client(max_connections=5)
+
+        first, second, other = asyncio.run(build())
+        assert first is second and first is not other
+
+    def test_limits_and_timeouts_from_valves(self, clients, server, upload):
+        """Valves set the pool size, keep-alive expiry and connect timeout"""
+        async def run():
+            tool = analyzer(server)
+            tool.valves.HTTP_MAX_CONNECTIONS = 3
+            tool.valves.HTTP_KEEPALIVE_EXPIRY = 12.0
+            tool.valves.LLM_CONNECT_TIMEOUT = 2.0
+            await tool.analyze_csv_file(upload, "Summary?")
+            return clients.client(max_connections=3, keepalive_expiry=12.0, connect_timeout=2.0,
+                                  timeout=tool.valves.LLM_TIMEOUT)
+
+        client = asyncio.run(run())
+        pool = client._transport._pool
+        assert pool._max_connections == 3 and pool._keepalive_expiry == 12.0
+        assert client.timeout.connect == 2.0 and client.timeout.read == 30
+        assert clients.counters["requests"] == 1
+
+
+class TestAsyncGateway:
+    """Test acall, the gateway path the pooled client runs through"""
+
+    def test_retries_then_raises(self):
+        """Retryable failures are retried max_retries times without blocking the loop"""
+        gateway = _LLMGateway()
+        gateway.configure(backoff_base=0, max_retries=2, failure_threshold=10)
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            raise _LLMHTTPError(503, "boom")
+
+        with pytest.raises(_LLMHTTPError):
+            asyncio.run(gateway.acall(fail))
+        assert len(calls) == 3 and gateway.stats()["retries"] == 2
+
+    def test_cancelled_calls_free_their_slots(self):
+        """Cancelling running and waiting calls returns in_flight to 0 and later calls still run"""
+        gateway = _LLMGateway()
+        gateway.configure(max_concurrency=2, acquire_timeout=1.0)
+
+        async def hang():
+            await asyncio.sleep(60)
+
+        async def ok():
+            return "done"
+
+        async def run():
+            tasks = [asyncio.create_task(gateway.acall(hang)) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            assert gateway.stats()["in_flight"] == 2  # Third call is waiting for a slot
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            assert gateway.stats()["in_flight"] == 0 and gateway._waiters == []
+            return await asyncio.gather(gateway.acall(ok), gateway.acall(ok))
+
+        assert asyncio.run(run()) == ["done", "done"]
+        stats = gateway.stats()
+        assert stats["in_flight"] == 0 and stats["state"] == "closed" and stats["failures"] == 0
+
+    def test_waiter_woken_by_release(self):
+        """A call waiting for a slot starts as soon as one frees up"""
+        gateway = _LLMGateway()
+        gateway.configure(max_concurrency=1, acquire_timeout=5.0)
+        order = []
+
+        async def work(name):
+            order.append(name)
+            await asyncio.sleep(0.05)
+
+        async def run():
+            start = asyncio.get_running_loop().time()
+            await asyncio.gather(gateway.acall(lambda: work("a")), gateway.acall(lambda: work("b")))
+            return asyncio.get_running_loop().time() - start
+
+        assert asyncio.run(run()) < 1.0
+        assert order == ["a", "b"] and gateway.stats()["in_flight"] == 0
+
+    def test_unreachable_endpoint_reported(self, clients, upload):
+        """Connection errors are retried and then reported"""
+        tool = Tools()
+        tool.valves.GROQ_API_KEY = "test"
+        tool.valves.GROQ_API_BASE = "http://127.0.0.1:9/openai/v1"
+        tool.valves.LLM_MAX_RETRIES = 1
+        tool.valves.BREAKER_FAILURE_THRESHOLD = 100
+
+        output = asyncio.run(tool.analyze_csv_file(upload, "Summary?"))
+        assert output.startswith("Error calling Groq API:")
+        assert tool._gateway().stats()["retries"] >= 1
+
+
+class TestConnectionStats:
+    """Test get_llm_connection_stats"""
+
+    def test_reports_reuse_and_connect_time(self, clients, server, upload):
+        """Stats show requests per connection and connect-time percentiles"""
+        async def run():
+            tool = analyzer(server)
+            for question in ("Summary?", "Trend?", "Outliers?"):
+                await tool.analyze_csv_file(upload, question)
+            return await tool.get_llm_connection_stats()
+
+        output = asyncio.run(run())
+        assert "- Requests: 3 over 1 new connections (66.7% reused)" in output
+        assert "ms p95 per request" in output
@@ -0,0 +1,122 @@
+"""
+Excel Tests: Ingestion Profiler
+
+Tests dtype profiling and narrowing applied when loading CSV/Excel files.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _profile_dtypes, _downcast_numeric, _read_dataframe, _duckdb_select_list
+
+
+@pytest.fixture
+def farm_csv(tmp_path):
+    """Small farm dataset with repetitive labels, dates and small numbers"""
+    df = pd.DataFrame({
+        'date': [f"2024-03-{day:02d}" for day in range(1, 31)] * 2,
+        'crop': ['maize', 'wheat', 'soy'] * 20,
+        'field_code': [f"F-{i}" for i in range(60)],
+        'plot': list(range(60)),
+        'yield_t': [i * 0.5 for i in range(60)],
+        'moisture': [i * 0.1 for i in range(60)],
+    })
+    path = tmp_path / "farm.csv"
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+class TestProfileDtypes:
+    """Test dtype selection from a sample"""
+
+    def test_repetitive_labels_become_categories(self, farm_csv):
+        """Low-cardinality text columns should be categorical"""
+        plan = _profile_dtypes(pd.read_csv(farm_csv))
+        assert plan['dtype'] == {'crop': 'category'}
+
+    def test_unique_labels_stay_text(self, farm_csv):
+        """High-cardinality text columns should not be categorical"""
+        plan = _profile_dtypes(pd.read_csv(farm_csv))
+        assert 'field_code' not in plan['dtype']
+
+    def test_dates_are_detected(self, farm_csv):
+        """Columns of date strings should be parsed"""
+        plan = _profile_dtypes(pd.read_csv(farm_csv))
+        assert plan['parse_dates'] == ['date']
+
+
+class TestDowncastNumeric:
+    """Test numeric narrowing"""
+
+    def test_integers_use_narrowest_type(self):
+        """Small non-negative integers should fit uint8"""
+        df = _downcast_numeric(pd.DataFrame({'n': [0, 10, 255]}))
+        assert str(df['n'].dtype) == 'uint8'
+
+    def test_negative_integers_stay_signed(self):
+        """Negative values should keep a signed type"""
+        df = _downcast_numeric(pd.DataFrame({'n': [-5, 10, 100]}))
+        assert str(df['n'].dtype) == 'int8'
+
+    def test_exact_floats_are_narrowed(self):
+        """Floats representable in float32 should be narrowed"""
+        df = _downcast_numeric(pd.DataFrame({'x': [0.5, 1.25, 3.0]}))
+        assert str(df['x'].dtype) == 'float32'
+
+    def test_lossy_floats_are_kept(self):
+        """Floats that would lose precision should stay float64"""
+        df = _downcast_numeric(pd.DataFrame({'x': [0.1, 0.2, 0.3]}))
+        assert str(df['x'].dtype) == 'float64'
+
+
+class TestReadDataframe:
+    """Test full optimized loads"""
+
+    def test_optimized_load_preserves_values(self, farm_csv):
+        """Optimized and plain loads should hold the same data"""
+        plain = _read_dataframe(farm_csv, optimize=False)
+        optimized = _read_dataframe(farm_csv)
+
+        assert optimized['crop'].astype(str).tolist() == plain['crop'].tolist()
+        assert optimized['plot'].tolist() == plain['plot'].tolist()
+        assert optimized['moisture'].tolist() == plain['moisture'].tolist()
+
+    def test_optimized_load_uses_less_memory(self, farm_csv):
+        """Optimized load should shrink the in-memory frame"""
+        plain = _read_dataframe(farm_csv, optimize=False)
+        optimized = _read_dataframe(farm_csv)
+
+        assert optimized.memory_usage(deep=True).sum() < plain.memory_usage(deep=True).sum()
+
+    def test_unsupported_extension(self, tmp_path):
+        """Non CSV/Excel files should be rejected"""
+        with pytest.raises(ValueError):
+            _read_dataframe(str(tmp_path / "data.json"))
+
+    def test_duckdb_columns_are_widened(self, farm_csv):
+        """Narrow numeric columns should be widened for DuckDB import"""
+        select_list = _duckdb_select_list(_read_dataframe(farm_csv))
+        assert 'CAST("plot" AS BIGINT)' in select_list
+        assert 'CAST("yield_t" AS DOUBLE)' in select_list
+
+
+class TestCachedDates:
+    """Test that parsed dates survive the cache round trip"""
+
+    def test_timestamps_are_cacheable(self, farm_csv, make_sql_tool):
+        """Results with parsed date columns can be written to Redis"""
+        tool = make_sql_tool(SWEEP_THRESHOLD=1.0)
+
+        records = _read_dataframe(farm_csv).head(2).to_dict('records')
+        tool._save_to_cache("sql_cache:dates", {"results": records}, cost=1.0)
+
+        assert asyncio.run(tool._aget_from_cache("sql_cache:dates"))["results"][0]["date"].startswith("2024-03-01")
@@ -0,0 +1,195 @@
+"""
+Excel Tests: LLM Gateway
+
+Tests the circuit breaker, retries and adaptive concurrency in front of Groq.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+import threading
+import time
+
+# Add excel tools and scripts to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../scripts'))
+
+import sql_cache_tool
+from csv_analyzer_tool import Tools, LLMUnavailable, _LLMGateway, _LLMHTTPError, _is_retryable
+from fake_groq_server import FakeGroqServer
+
+
+@pytest.fixture
+def gateway():
+    """Gateway with instant backoff"""
+    instance = _LLMGateway()
+    instance.configure(backoff_base=0, max_retries=2, failure_threshold=3, reset_timeout=60)
+    return instance
+
+
+def failing(status, calls):
+    def fn():
+        calls.append(status)
+        raise _LLMHTTPError(status, "boom")
+    return fn
+
+
+class TestRetryable:
+    """Test retry classification"""
+
+    def test_overload_statuses(self):
+        """429 and 5xx should be retried"""
+        assert _is_retryable(_LLMHTTPError(429, ""))
+        assert _is_retryable(_LLMHTTPError(503, ""))
+
+    def test_client_errors_not_retried(self):
+        """4xx and local errors should not be retried"""
+        assert not _is_retryable(_LLMHTTPError(400, ""))
+        assert not _is_retryable(ValueError("bad prompt"))
+
+    def test_timeouts_retried(self):
+        """Timeouts should be retried"""
+        assert _is_retryable(TimeoutError())
+
+
+class TestGateway:
+    """Test retries, breaker and AIMD"""
+
+    def test_success_passes_through(self, gateway):
+        """Successful calls return their result"""
+        assert gateway.call(lambda: "ok") == "ok"
+
+    def test_retries_then_raises(self, gateway):
+        """Retryable failures are retried max_retries times"""
+        calls = []
+        with pytest.raises(_LLMHTTPError):
+            gateway.call(failing(503, calls))
+        assert len(calls) == 3
+        assert gateway.stats()["retries"] == 2
+
+    def test_client_error_not_retried(self, gateway):
+        """Non-retryable failures are raised at once"""
+        calls = []
+        with pytest.raises(_LLMHTTPError):
+            gateway.call(failing(400, calls))
+        assert len(calls) == 1
+
+    def test_breaker_opens_and_fails_fast(self, gateway):
+        """Consecutive failures open the circuit; later calls never reach Groq"""
+        calls = []
+        with pytest.raises(_LLMHTTPError):
+            gateway.call(failing(503, calls))
+        assert gateway.stats()["state"] == "open"
+
+        with pytest.raises(LLMUnavailable):
+            gateway.call(failing(503, calls))
+        assert len(calls) == 3
+
+    def test_half_open_trial_closes_breaker(self, gateway):
+        """A successful trial call after the reset timeout closes the circuit"""
+        with pytest.raises(_LLMHTTPError):
+            gateway.call(failing(503, []))
+        gateway.configure(reset_timeout=0)
+
+        assert gateway.call(lambda: "ok") == "ok"
+        assert gateway.stats()["state"] == "closed"
+
+    @pytest.mark.parametrize("gateway_class, mode", [
+        (_LLMGateway, "call"),
+        (_LLMGateway, "acall"),
+        (sql_cache_tool._LLMGateway, "call"),
+    ], ids=["csv-call", "csv-acall", "sql-call"])
+    def test_half_open_admits_one_trial(self, gateway_class, mode):
+        """Callers racing into a half-open breaker get one trial call; the rest are rejected"""
+        gateway = gateway_class()
+        gateway.configure(backoff_base=0, max_retries=0, reset_timeout=0)
+        gateway.state, gateway.opened_at = "open", time.monotonic()
+
+        # Hold every caller at the slot acquire, so all of them have passed the old breaker check
+        racers = 4
+        barrier = threading.Barrier(racers)
+        acquire = gateway._aacquire if mode == "acall" else gateway._acquire
+
+        def held_acquire():
+            barrier.wait()
+            return acquire()
+        setattr(gateway, "_aacquire" if mode == "acall" else "_acquire", held_acquire)
+
+        trials, rejected = [], []
+
+        def trial():
+            trials.append(1)
+            time.sleep(0.1)
+
+        async def atrial():
+            trial()
+
+        def race():
+            try:
+                if mode == "acall":
+                    asyncio.run(gateway.acall(atrial))
+                else:
+                    gateway.call(trial)
+            except Exception as e:
+                rejected.append(type(e).__name__)
+
+        threads = [threading.Thread(target=race) for _ in range(racers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(trials) == 1
+        assert rejected == ["LLMUnavailable"] * (racers - 1)
+        assert gateway.stats()["state"] == "closed"
+
+    def test_overload_halves_limit(self, gateway):
+        """429s multiplicatively decrease the concurrency limit"""
+        gateway.configure(max_concurrency=8, failure_threshold=100)
+        with pytest.raises(_LLMHTTPError):
+            gateway.call(failing(429, []))
+        assert gateway.stats()["limit"] == 1.0
+
+    def test_success_grows_limit(self, gateway):
+        """Successes additively increase the limit up to the maximum"""
+        gateway.configure(max_concurrency=8)
+        gateway.limit = 2.0
+        for _ in range(4):
+            gateway.call(lambda: "ok")
+        assert 3.0 <= gateway.stats()["limit"] <= 8
+
+
+class TestCsvAnalyzerWithFakeGroq:
+    """End-to-end through the fake Groq server"""
+
+    def test_analysis_via_fake_groq(self, tmp_path):
+        """analyze_csv_file works against the fake server"""
+        path = tmp_path / "farm.csv"
+        path.write_text("crop,yield\nmaize,10\nwheat,12\n")
+
+        with FakeGroqServer(latency=0) as server:
+            tool = Tools()
+            tool.valves.GROQ_API_KEY = "test"
+            tool.valves.GROQ_API_BASE = server.url
+            output = asyncio.run(tool.analyze_csv_file(str(path), "Which crop yields most?"))
+
+        assert "Fake analysis" in output
+
+    def test_throttling_is_retried(self, tmp_path):
+        """429s are retried before the error is reported"""
+        path = tmp_path / "farm.csv"
+        path.write_text("crop,yield\nmaize,10\n")
+
+        with FakeGroqServer(latency=0, capacity=1) as server:
+            server.capacity = -1  # Throttle everything at first
+            tool = Tools()
+            tool.valves.GROQ_API_KEY = "test"
+            tool.valves.GROQ_API_BASE = server.url
+            tool.valves.BREAKER_FAILURE_THRESHOLD = 100
+            output = asyncio.run(tool.analyze_csv_file(str(path), "Summary?"))
+
+        assert "429" in output
+        assert server.counts["throttled"] == tool.valves.LLM_MAX_RETRIES + 1
@@ -0,0 +1,69 @@
+"""
+Excel Tests: Markdown Renderer
+
+Tests the budgeted markdown table renderer used for query results.
+
+Author: SmartFarm Team
+"""
+
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _render_markdown
+
+
+class TestRenderMarkdown:
+    """Test markdown table rendering"""
+
+    def test_empty_result(self):
+        """Empty results should render a placeholder"""
+        assert _render_markdown(pd.DataFrame()) == "No results"
+
+    def test_table_structure(self):
+        """Header, separator and one line per row"""
+        df = pd.DataFrame({'crop': ['maize', 'wheat'], 'tons': [10, 20]})
+        lines = _render_markdown(df).split("\n")
+
+        assert lines[0] == "| crop  | tons |"
+        assert lines[1] == "|-------|-----:|"
+        assert lines[2] == "| maize |   10 |"
+        assert len(lines) == 4
+
+    def test_pipes_and_newlines_escaped(self):
+        """Cell content must not break the table layout"""
+        df = pd.DataFrame({'note': ['a|b', 'line1\nline2']})
+        output = _render_markdown(df)
+
+        assert "a\\|b" in output
+        assert "line1 line2" in output
+
+    def test_nulls_render_blank(self):
+        """Missing values should render as empty cells"""
+        df = pd.DataFrame({'crop': ['maize', None], 'tons': [1.5, np.nan]})
+        output = _render_markdown(df)
+
+        assert "nan" not in output
+        assert "None" not in output
+
+    def test_row_budget_footer(self):
+        """Rows beyond the budget should be summarized in a footer"""
+        df = pd.DataFrame({'n': range(50)})
+        output = _render_markdown(df, max_rows=10)
+
+        assert output.count("\n|") == 11  # separator + 10 rows
+        assert output.endswith("_… 40 more rows_")
+
+    def test_byte_budget(self):
+        """Output should stay within the byte budget plus footer"""
+        df = pd.DataFrame({'field': [f"F-{i:05d}" for i in range(1000)]})
+        output = _render_markdown(df, max_rows=1000, max_bytes=2048)
+        table = output.split("\n\n")[0]
+
+        assert len(table.encode()) <= 2048
+        assert "more rows_" in output
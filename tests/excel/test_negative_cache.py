@@ -0,0 +1,102 @@
+"""
+Excel Tests: Negative Cache
+
+Tests short-lived caching of deterministic analysis failures.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+import duckdb
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _classify_error
+
+
+@pytest.fixture
+def tool(make_sql_tool):
+    """Tool instance with fake Redis and a failing fake query executor"""
+    instance = make_sql_tool(upload="crop,yield\nmaize,1\n")
+    instance.calls = 0
+    instance.failure = duckdb.BinderException('Referenced column "yeild" not found')
+
+    def fake_execute(file_path, query, model, timer=None, preview=None, frame=None):
+        instance.calls += 1
+        raise instance.failure
+
+    instance._execute_sql_query = fake_execute
+    return instance
+
+
+def ask(tool, times=1):
+    async def run():
+        return [await tool.analyze_excel_with_cache(tool.file_path, "yield?") for _ in range(times)]
+    return asyncio.run(run())
+
+
+class TestClassifyError:
+    """Test failure classification"""
+
+    def test_sql_errors(self):
+        assert _classify_error(duckdb.BinderException("missing column")) == "invalid_sql"
+        assert _classify_error(duckdb.ParserException("syntax error")) == "invalid_sql"
+
+    def test_file_errors(self):
+        assert _classify_error(pd.errors.ParserError("bad csv")) == "invalid_file"
+        assert _classify_error(ValueError("File must be CSV or Excel format")) == "invalid_file"
+
+    def test_configuration_errors(self):
+        assert _classify_error(ValueError("GROQ_API_KEY not configured")) == "configuration"
+
+    def test_unknown_errors_are_transient(self):
+        assert _classify_error(TimeoutError("Groq timed out")) == "transient"
+        assert _classify_error(ConnectionError("reset")) == "transient"
+
+    def test_other_value_errors_not_cached(self):
+        """Only the file-format ValueErrors are invalid_file; the rest stay retryable"""
+        assert _classify_error(ValueError("could not convert string to float: 'n/a'")) == "transient"
+        assert _classify_error(ValueError("Excel file format cannot be determined, you must specify an engine manually.")) == "invalid_file"
+
+
+class TestNegativeCache:
+    """Test negative caching in analyze_excel_with_cache"""
+
+    def test_repeated_failure_served_from_cache(self, tool):
+        """The pipeline runs once for a deterministic failure"""
+        first, second, third = ask(tool, times=3)
+
+        assert tool.calls == 1
+        assert "yeild" in first
+        assert "Cached invalid_sql failure" in second
+        assert third == second
+
+    def test_negative_entry_has_short_ttl(self, tool):
+        """Failures live under their own namespace with the negative TTL"""
+        ask(tool)
+        keys = tool.redis_client.keys("sql_cache_neg:*")
+
+        assert len(keys) == 1
+        assert tool.redis_client.ttl(keys[0]) <= tool.valves.NEGATIVE_CACHE_TTL
+        assert tool.redis_client.keys("sql_cache:*") == []
+
+    def test_transient_failure_stays_retryable(self, tool):
+        """Timeouts are not cached"""
+        tool.failure = TimeoutError("Groq timed out")
+        ask(tool, times=2)
+
+        assert tool.calls == 2
+        assert tool.redis_client.keys("sql_cache_neg:*") == []
+
+    def test_disabled_with_zero_ttl(self, tool):
+        """NEGATIVE_CACHE_TTL=0 turns negative caching off"""
+        tool.valves.NEGATIVE_CACHE_TTL = 0
+        ask(tool, times=2)
+
+        assert tool.calls == 2
@@ -0,0 +1,169 @@
+"""
+Excel Tests: Parse Workers
+
+Tests parsing uploads in recycled worker processes with a DuckDB-file handoff.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+import sql_cache_tool
+from sql_cache_tool import _ParsePool, _get_parse_pool, _parse_to_duckdb, _read_dataframe, _read_parsed_frame
+
+
+@pytest.fixture
+def upload(tmp_path):
+    """Farm CSV with labels, dates, small integers and missing values"""
+    rng = np.random.default_rng(0)
+    rows = 5000
+    df = pd.DataFrame({
+        "date": pd.date_range("2023-01-01", periods=rows, freq="h").strftime("%Y-%m-%d %H:%M:%S"),
+        "crop": rng.choice(["maize", "soy", "wheat"], rows),
+        "field code": rng.choice(["F1", "F2"], rows),
+        "plot": rng.integers(1, 200, rows),
+        "yield_kg": rng.normal(1000, 50, rows).round(1),
+    })
+    df.loc[3, "yield_kg"] = np.nan
+    path = str(tmp_path / "yields.csv")
+    df.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def tool(make_sql_tool, tmp_path):
+    """Tool with fake Redis that sends every upload to the parse workers"""
+    instance = make_sql_tool(
+        PARSE_WORKERS=1,
+        PARSE_MIN_BYTES=0,
+        PARSE_HANDOFF_DIRECTORY=str(tmp_path / "handoff"),
+    )
+    os.makedirs(instance.valves.PARSE_HANDOFF_DIRECTORY)
+    return instance
+
+
+class TestHandoff:
+    """Test the DuckDB file a worker hands a parsed upload back in"""
+
+    def test_round_trip_keeps_dtypes(self, upload, tmp_path):
+        """Categoricals, dates and downcast numbers survive the handoff"""
+        path = str(tmp_path / "parsed.duckdb")
+        expected = _read_dataframe(upload)
+
+        pd.testing.assert_frame_equal(_read_parsed_frame(path, _parse_to_duckdb(upload, True, 10000, path)), expected)
+        assert isinstance(expected["crop"].dtype, pd.CategoricalDtype)
+
+
+class TestParsePool:
+    """Test _parse_upload and the worker pool"""
+
+    def test_worker_parse_matches_inline(self, tool, upload):
+        """A worker parse gives the same frame as parsing in-process and cleans up its file"""
+        df = tool._parse_upload(upload)
+
+        expected = _read_dataframe(upload)
+        expected.columns = [col.replace(' ', '_') for col in expected.columns]
+        df.columns = [col.replace(' ', '_') for col in df.columns]
+        pd.testing.assert_frame_equal(df, expected)
+
+        usage = tool.redis_client.hgetall("excel:parse")
+        assert usage["pooled"] == "1" and int(usage["handoff_bytes"]) > 0
+        assert os.listdir(tool.valves.PARSE_HANDOFF_DIRECTORY) == []
+
+    def test_small_uploads_stay_in_process(self, tool, upload):
+        """Below PARSE_MIN_BYTES the handoff is skipped"""
+        tool.valves.PARSE_MIN_BYTES = 10 * 1024 * 1024
+        tool._parse_upload(upload)
+        assert tool.redis_client.hgetall("excel:parse") == {"inline": "1"}
+
+    def test_handoff_falls_back_to_temp_directory(self, tool, upload, monkeypatch):
+        """An unset handoff directory, or one short of space, uses the temp directory"""
+        directories = []
+        parse = _ParsePool.parse
+
+        def recording_parse(self, file_path, optimize, sample_rows, directory, cancelled=None):
+            directories.append(directory)
+            return parse(self, file_path, optimize, sample_rows, directory, cancelled)
+
+        monkeypatch.setattr(_ParsePool, "parse", recording_parse)
+        configured = tool.valves.PARSE_HANDOFF_DIRECTORY
+        tool.valves.PARSE_HANDOFF_DIRECTORY = ""
+        assert tool._parse_upload(upload) is not None
+
+        tool.valves.PARSE_HANDOFF_DIRECTORY = configured
+        monkeypatch.setattr(sql_cache_tool, "_has_room", lambda directory, upload_bytes: False)
+        assert tool._parse_upload(upload) is not None
+
+        assert directories == [sql_cache_tool.tempfile.gettempdir()] * 2
+
+    def test_workers_recycled(self):
+        """PARSE_WORKER_MAX_JOBS replaces a worker after that many jobs"""
+        pool = _get_parse_pool(1, 1)
+        pids = [pool.executor.submit(os.getpid).result() for _ in range(2)]
+        assert pids[0] != pids[1]
+
+    def test_parse_errors_surface(self, tool, tmp_path):
+        """A file the worker cannot parse fails the upload as it would in-process"""
+        path = str(tmp_path / "notes.txt")
+        with open(path, "w") as f:
+            f.write("not a table")
+        with pytest.raises(ValueError, match="CSV or Excel"):
+            tool._parse_upload(path)
+
+    def test_crashed_pool_falls_back(self, tool, upload, monkeypatch):
+        """A broken pool is dropped and the upload parsed in-process"""
+        pool = _get_parse_pool(1, tool.valves.PARSE_WORKER_MAX_JOBS)
+
+        def crash(*args, **kwargs):
+            raise sql_cache_tool.BrokenProcessPool("worker killed")
+
+        monkeypatch.setattr(pool, "parse", crash)
+        assert len(tool._parse_upload(upload)) == 5000
+        assert tool.redis_client.hgetall("excel:parse") == {"fallbacks": "1", "inline": "1"}
+        assert sql_cache_tool._PARSE_POOL is None
+
+    def test_module_rebuilt_from_source(self, upload, tmp_path, monkeypatch):
+        """When the tool is not importable (Open WebUI), workers exec its source"""
+        monkeypatch.setattr(sql_cache_tool, "_importable", lambda name: False)
+        pool = _ParsePool(1, 0)
+        try:
+            df, size = pool.parse(upload, True, 10000, str(tmp_path))
+        finally:
+            pool.shutdown()
+        assert len(df) == 5000 and size > 0
+
+    def test_stats_report_parsing(self, tool, upload):
+        """get_cache_stats shows worker settings and where uploads were parsed"""
+        tool._parse_upload(upload)
+        output = asyncio.run(tool.get_cache_stats())
+
+        assert "- Workers: 1 processes, recycled every 50 parses" in output
+        assert "- Parsed: 1 in workers (" in output
+
+
+class TestSpeculativeRead:
+    """Test the speculative read of analyze_excel_with_cache with parse workers"""
+
+    def test_hit_takes_no_worker(self, tool, upload, monkeypatch):
+        """A worker parse starts only after the lookup missed; a hit submits nothing"""
+        submitted = []
+        parse = _ParsePool.parse
+        monkeypatch.setattr(_ParsePool, "parse", lambda self, *args: submitted.append(1) or parse(self, *args))
+        tool._generate_sql = lambda conn, table_name, query, model: f"SELECT COUNT(*) AS n FROM {table_name}"
+
+        first = asyncio.run(tool.analyze_excel_with_cache(upload, "How many rows?"))
+        second = asyncio.run(tool.analyze_excel_with_cache(upload, "How many rows?"))
+
+        assert "Cache: MISS" in first and "Cache: HIT" in second
+        assert len(submitted) == 1
+        assert tool.redis_client.hget("excel:parse", "pooled") == "1"
+        assert tool.redis_client.hget("excel:pipeline", "wasted") == "1"
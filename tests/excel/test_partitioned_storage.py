@@ -0,0 +1,182 @@
+"""
+Excel Tests: Partitioned Storage
+
+Tests the month-partitioned Parquet storage mode and date-predicate pruning.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _create_partition_views, _month_bounds, _prune_partitions, _write_partitioned
+
+MONTHLY_SQL = "SELECT sensor, AVG(temp) AS avg_temp, COUNT(*) AS n FROM sensors WHERE ts >= '2023-03-10' AND ts < '2023-05-01' GROUP BY sensor ORDER BY sensor"
+
+
+def sensors(days=365, seed=0):
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range("2023-01-01", periods=days * 24, freq="h")
+    return pd.DataFrame({
+        "ts": ts.repeat(2),
+        "sensor": np.tile(["S1", "S2"], len(ts)),
+        "temp": rng.normal(20, 3, len(ts) * 2).round(2),
+    })
+
+
+def where_of(conn, sql):
+    tree = json.loads(conn.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0])
+    return tree["statements"][0]["node"]["where_clause"]
+
+
+@pytest.fixture
+def partitioned(tmp_path):
+    """A year of hourly readings written as month partitions"""
+    df = sensors()
+    conn = duckdb.connect()
+    directory = str(tmp_path / "sensors")
+    _write_partitioned(conn, df, directory, "ts")
+    _create_partition_views(conn, "sensors", directory)
+    return conn, df, directory
+
+
+@pytest.fixture
+def tool(make_sql_tool, tmp_path):
+    """Tool in parquet storage mode with fake Redis and canned SQL"""
+    instance = make_sql_tool(
+        STORAGE_MODE="parquet",
+        PARQUET_DIRECTORY=str(tmp_path / "parquet"),
+        ENABLE_SQL_TEMPLATES=False,
+        ENABLE_ROLLUPS=False,
+    )
+    instance.sql = MONTHLY_SQL
+    instance._generate_sql = lambda conn, table_name, query, model: instance.sql
+    instance.file_path = str(tmp_path / "sensors.csv")
+    sensors().to_csv(instance.file_path, index=False)
+    return instance
+
+
+def versions(tool):
+    return os.listdir(os.path.join(tool.valves.PARQUET_DIRECTORY, "sensors"))
+
+
+class TestMonthBounds:
+    """Test deriving partition bounds from date predicates"""
+
+    def test_range(self):
+        """>= and < give the first and last month touched"""
+        conn = duckdb.connect()
+        low, high = _month_bounds(where_of(conn, MONTHLY_SQL), "ts")
+        assert (low, high) == (pd.Timestamp("2023-03-01"), pd.Timestamp("2023-05-01"))
+
+    def test_between_year_and_reversed(self):
+        """BETWEEN, year(ts) = N and literal-first comparisons all bound the scan"""
+        conn = duckdb.connect()
+        assert _month_bounds(where_of(conn, "SELECT 1 FROM t WHERE ts BETWEEN '2023-02-03' AND DATE '2023-04-09'"), "ts") == \
+            (pd.Timestamp("2023-02-01"), pd.Timestamp("2023-04-01"))
+        assert _month_bounds(where_of(conn, "SELECT 1 FROM t WHERE year(ts) = 2022"), "ts") == \
+            (pd.Timestamp("2022-01-01"), pd.Timestamp("2022-12-01"))
+        assert _month_bounds(where_of(conn, "SELECT 1 FROM t WHERE '2023-06-15' <= ts"), "ts") == \
+            (pd.Timestamp("2023-06-01"), None)
+
+    def test_disjunctions_ignored(self):
+        """Predicates under OR do not bound the scan"""
+        conn = duckdb.connect()
+        where = where_of(conn, "SELECT 1 FROM t WHERE ts >= '2023-06-01' OR sensor = 'S1'")
+        assert _month_bounds(where, "ts") == (None, None)
+
+
+class TestPruning:
+    """Test rewriting queries onto the partitions they need"""
+
+    def test_pruned_query_matches_full_scan(self, partitioned):
+        """Pruning changes which files are read, not the answer"""
+        conn, df, _ = partitioned
+        pruned = _prune_partitions(conn, "sensors", MONTHLY_SQL, "ts")
+
+        assert "FROM sensors__partitions WHERE" in pruned["sql"]
+        pd.testing.assert_frame_equal(conn.execute(pruned["sql"]).fetchdf(), conn.execute(MONTHLY_SQL).fetchdf())
+
+    def test_files_skipped(self, partitioned):
+        """Only the matching month files are opened"""
+        conn, df, _ = partitioned
+        plan = conn.execute(f"EXPLAIN ANALYZE {_prune_partitions(conn, 'sensors', MONTHLY_SQL, 'ts')['sql']}").fetchall()[0][1]
+        assert "Total Files Read: 3" in plan
+
+    def test_no_date_predicate(self, partitioned):
+        """Queries without a date bound are left alone"""
+        conn, df, _ = partitioned
+        assert _prune_partitions(conn, "sensors", "SELECT COUNT(*) FROM sensors WHERE sensor = 'S1'", "ts") is None
+
+    def test_views_hide_partition_column(self, partitioned):
+        """SQL sees the original columns; `__month` lives only on the partitions view"""
+        conn, df, directory = partitioned
+        assert [row[0] for row in conn.execute("DESCRIBE sensors").fetchall()] == ["ts", "sensor", "temp"]
+        assert len(os.listdir(directory)) == 12
+
+
+class TestParquetStorageMode:
+    """Test STORAGE_MODE='parquet' in _execute_sql_query"""
+
+    def test_query_over_partitions(self, tool):
+        """Time-series uploads are answered from pruned Parquet partitions"""
+        result = tool._execute_sql_query(tool.file_path, "average temperature in spring?")
+
+        tool.valves.STORAGE_MODE = "table"
+        expected = tool._execute_sql_query(tool.file_path, "average temperature in spring?")
+
+        pd.testing.assert_frame_equal(pd.DataFrame(result["results"]), pd.DataFrame(expected["results"]), rtol=1e-9)
+        assert tool.redis_client.hgetall("excel:parquet") == {
+            "queries": "1", "pruned": "1", "partitions_read": "3", "partitions_total": "12"
+        }
+
+    def test_partitions_written_once_per_version(self, tool):
+        """Later misses reuse the files; a changed upload replaces them"""
+        tool._execute_sql_query(tool.file_path, "q1")
+        first = versions(tool)
+        tool._execute_sql_query(tool.file_path, "q2")
+        assert versions(tool) == first
+        assert tool.redis_client.hget("excel:duckdb", "statements") == "3"  # write + 2 queries, no second import
+
+        sensors(days=30, seed=1).to_csv(tool.file_path, index=False)
+        tool.sql = "SELECT COUNT(*) AS n FROM sensors"
+        result = tool._execute_sql_query(tool.file_path, "q3")
+        assert len(versions(tool)) == 1 and versions(tool) != first
+        assert result["results"] == [{"n": 30 * 24 * 2}]
+
+    def test_non_time_series_stays_a_table(self, tool):
+        """Uploads without a date column are imported as before"""
+        with open(tool.file_path, "w") as f:
+            f.write("sensor,temp\nS1,20\nS2,22\n")
+        tool.sql = "SELECT COUNT(*) AS n FROM sensors"
+
+        assert tool._execute_sql_query(tool.file_path, "how many?")["results"] == [{"n": 2}]
+        assert not os.path.exists(tool.valves.PARQUET_DIRECTORY)
+
+    def test_switching_modes(self, tool):
+        """A table can be replaced by the partitioned view and back"""
+        tool.valves.STORAGE_MODE = "table"
+        tool._execute_sql_query(tool.file_path, "q1")
+        tool.valves.STORAGE_MODE = "parquet"
+        tool._execute_sql_query(tool.file_path, "q1")
+        tool.valves.STORAGE_MODE = "table"
+        assert tool._execute_sql_query(tool.file_path, "q1")["row_count"] == 2
+
+    def test_stats_report_storage(self, tool):
+        """get_cache_stats shows the storage mode and partitions read"""
+        tool._execute_sql_query(tool.file_path, "average temperature in spring?")
+        output = asyncio.run(tool.get_cache_stats())
+
+        assert "- Mode: parquet (month-partitioned Parquet in" in output
+        assert "Pruned Queries: 1 / 1 on partitioned tables" in output
+        assert "Partitions Read: 3 of 12 (25.0%)" in output
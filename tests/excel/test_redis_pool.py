@@ -0,0 +1,188 @@
+"""
+Excel Tests: Redis Pool
+
+Tests the shared, self-healing Redis connection pool used by the Excel tools.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+import sql_cache_tool
+from sql_cache_tool import Tools, _RedisPool
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def server():
+    """Fake Redis server that can be taken down and brought back"""
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def pool(server):
+    """Pool on the fake server with instant reconnects"""
+    instance = _RedisPool(
+        "fake-redis", 6379, server=server,
+        connection_class=fakeredis.FakeConnection,
+        async_connection_class=fakeredis.aioredis.FakeConnection
+    )
+    instance.configure(backoff_base=0, health_check_interval=0)
+    return instance
+
+
+@pytest.fixture
+def tool(pool, monkeypatch, tmp_path):
+    """Tool whose Redis comes from the shared pool registry"""
+    monkeypatch.setenv("REDIS_HOST", "fake-redis")
+    monkeypatch.setenv("REDIS_PORT", "6379")
+    monkeypatch.setitem(sql_cache_tool._REDIS_POOLS, ("fake-redis", 6379, 0), pool)
+
+    instance = Tools()
+    instance.valves.ADAPTIVE_TTL = False
+    instance.valves.REDIS_HEALTH_CHECK_INTERVAL = 0
+    instance.calls = 0
+
+    def fake_execute(file_path, query, model, timer=None, preview=None, frame=None):
+        instance.calls += 1
+        return {"sql_query": "SELECT 1", "results": [], "results_markdown": "No results",
+                "row_count": 0, "table_name": "farm"}
+
+    instance._execute_sql_query = fake_execute
+    instance.file_path = str(tmp_path / "farm.csv")
+    with open(instance.file_path, "w") as f:
+        f.write("crop,yield\nmaize,1\n")
+    return instance
+
+
+def ask(tool):
+    return asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "yield?"))
+
+
+class TestRedisPool:
+    """Test health checks, backoff and metrics"""
+
+    def test_client_when_healthy(self, pool):
+        """A reachable server yields a working client"""
+        client = pool.client()
+        assert client.ping()
+        assert pool.stats()["state"] == "up"
+        assert pool.stats()["connects"] == 1
+
+    def test_outage_returns_none(self, pool, server):
+        """While Redis is down callers get None instead of a dead client"""
+        pool.client()
+        server.connected = False
+        assert pool.client() is None
+        assert pool.stats()["state"] == "down"
+        assert pool.stats()["failures"] == 1
+
+    def test_reconnects_after_outage(self, pool, server):
+        """The pool heals on its own once Redis is back"""
+        pool.client()
+        server.connected = False
+        pool.client()
+        server.connected = True
+
+        assert pool.client() is not None
+        assert pool.stats()["reconnects"] == 1
+
+    def test_reconnect_waits_for_backoff(self, pool, server):
+        """No reconnect is attempted before the backoff delay"""
+        pool.configure(backoff_base=60, backoff_cap=60)
+        server.connected = False
+        pool.client()
+        server.connected = True
+
+        assert pool.client() is None
+        pool.next_attempt = 0
+        assert pool.client() is not None
+
+    def test_usage_metrics(self, pool):
+        """Created connections are reported as idle once released"""
+        pool.client().set("k", "v")
+        stats = pool.stats()
+        assert stats["created"] >= 1
+        assert stats["in_use"] == 0
+        assert stats["idle"] == stats["created"]
+
+
+class TestToolRecovery:
+    """Test that caching comes back after a Redis restart"""
+
+    def test_cache_resumes_after_restart(self, tool, server):
+        """Queries run uncached during the outage and are cached again afterwards"""
+        server.connected = False
+        assert "MISS" in ask(tool)
+        assert "MISS" in ask(tool)
+        assert tool.calls == 2
+
+        server.connected = True
+        ask(tool)
+        assert "HIT" in ask(tool)
+        assert tool.calls == 3
+
+
+class TestAsyncPool:
+    """Test the redis.asyncio side of the pool"""
+
+    def test_async_client_per_loop(self, pool):
+        """Each event loop gets its own redis.asyncio client on the same server"""
+        async def roundtrip():
+            client = await pool.aclient()
+            await client.set("k", "v")
+            return client, await client.get("k")
+
+        first, value = asyncio.run(roundtrip())
+        second, _ = asyncio.run(roundtrip())
+
+        assert value in ("v", b"v")
+        assert first is not second
+        assert pool.client().get("k") in ("v", b"v")
+
+    def test_async_outage_returns_none(self, pool, server):
+        """Async callers also get None while Redis is down"""
+        server.connected = False
+        assert asyncio.run(pool.aclient()) is None
+        assert pool.stats()["state"] == "down"
+
+    def test_async_path_does_not_use_sync_pool(self, tool, pool):
+        """analyze_excel_with_cache talks to Redis through redis.asyncio"""
+        ask(tool)
+        sync_created = pool.stats()["created"]
+        assert "HIT" in ask(tool)
+        assert pool.stats()["created"] == sync_created
+
+    def test_loop_client_closed(self, pool):
+        """aclose_loop_client closes the running loop's client and forgets it"""
+        async def use_and_close():
+            client = await pool.aclient()
+            await client.set("k", "v")
+            await pool.aclose_loop_client()
+            return client, pool.stats()["async_pools"]
+
+        client, remaining = asyncio.run(use_and_close())
+        assert remaining == 0
+        assert not any(conn.is_connected for conn in client.connection_pool._available_connections)
+
+    def test_virtual_users_close_their_clients(self, tool, pool, monkeypatch):
+        """Every virtual user's event loop closes its async client before it ends"""
+        closed = []
+        close = pool.aclose_loop_client
+
+        async def counting_close():
+            closed.append(asyncio.get_running_loop())
+            await close()
+
+        monkeypatch.setattr(pool, "aclose_loop_client", counting_close)
+        tool._run_virtual_users(tool.file_path, "yield?", "model", users=3, requests_per_user=2)
+
+        assert len(set(closed)) == 3
+        assert pool.stats()["async_pools"] == 0
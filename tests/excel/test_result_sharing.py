@@ -0,0 +1,176 @@
+"""
+Excel Tests: Result Sharing
+
+Tests the SQL-level result layer shared by questions, models and phrasings.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _normalize_sql
+
+SQL = "SELECT crop, AVG(yield) AS avg_yield FROM farm GROUP BY crop"
+
+
+def result(sql=SQL, rows=50):
+    records = [{"crop": f"crop{i}", "avg_yield": i * 1.5} for i in range(rows)]
+    return {"sql_query": sql, "results": records, "results_markdown": "| crop | avg_yield |", "row_count": rows,
+            "table_name": "farm"}
+
+
+@pytest.fixture
+def tool(make_sql_tool):
+    """Tool with fake Redis and an executor whose SQL differs only in layout per model"""
+    instance = make_sql_tool(upload="crop,yield\nmaize,10\n", HOT_TIER_REFRESH=3600)
+    instance.executions = 0
+
+    def execute(file_path, query, model, timer=None, preview=None, frame=None):
+        instance.executions += 1
+        return result(SQL if model == "llama-3.3-70b-versatile" else SQL.lower().replace(" from", "\nFROM") + ";")
+
+    instance._execute_sql_query = execute
+    return instance
+
+
+def keys(tool, pattern):
+    return sorted(tool.redis_client.keys(pattern))
+
+
+class TestNormalizeSql:
+    """Test the canonical SQL text behind result keys"""
+
+    def test_layout_and_keyword_case_ignored(self):
+        """Whitespace, keyword case and a trailing semicolon do not matter"""
+        assert _normalize_sql(SQL) == _normalize_sql("select crop,  avg(yield) as avg_yield\nfrom farm group by crop;")
+
+    def test_aliases_and_literals_kept(self):
+        """Output names and values still tell queries apart"""
+        assert _normalize_sql(SQL) != _normalize_sql(SQL.replace("avg_yield", "Avg_Yield"))
+        assert _normalize_sql("SELECT * FROM farm WHERE crop = 'Maize'") != _normalize_sql("SELECT * FROM farm WHERE crop = 'maize'")
+
+    def test_unparseable_sql_collapsed(self):
+        """SQL DuckDB rejects falls back to collapsed whitespace"""
+        assert _normalize_sql("SELEC  broken\n(( ;") == "SELEC broken (("
+
+
+class TestSharedEntries:
+    """Test pointer entries and the shared result layer"""
+
+    def test_identical_sql_stored_once(self, tool):
+        """Two questions with the same SQL write one result body"""
+        tool._save_to_cache("sql_cache:a", result(), cost=1.0, data_hash="d1")
+        tool._save_to_cache("sql_cache:b", result(SQL.lower()), cost=1.0, data_hash="d1")
+
+        assert len(keys(tool, "sql_result:*")) == 1
+        assert tool.redis_client.strlen("sql_cache:b") < tool.redis_client.strlen(keys(tool, "sql_result:*")[0]) / 5
+        assert tool.redis_client.hgetall("excel:results")["shared"] == "1"
+        assert int(tool.redis_client.hget("excel:results", "bytes_saved")) > 1000
+
+    def test_lookup_merges_result(self, tool):
+        """A hit returns the shared body with the question's own SQL"""
+        tool._save_to_cache("sql_cache:a", result(), cost=1.0, data_hash="d1")
+        tool._save_to_cache("sql_cache:b", result(SQL.lower()), cost=1.0, data_hash="d1")
+
+        cached = asyncio.run(tool._aget_from_cache("sql_cache:b"))
+        assert cached["sql_query"] == SQL.lower()
+        assert cached["row_count"] == 50 and len(cached["results"]) == 50
+
+    def test_other_data_not_shared(self, tool):
+        """The same SQL over another file version gets its own result"""
+        tool._save_to_cache("sql_cache:a", result(), cost=1.0, data_hash="d1")
+        tool._save_to_cache("sql_cache:b", result(), cost=1.0, data_hash="d2")
+        assert len(keys(tool, "sql_result:*")) == 2
+
+    def test_dangling_pointer_is_miss(self, tool):
+        """A pointer whose result is gone counts as a miss"""
+        tool._save_to_cache("sql_cache:a", result(), cost=1.0, data_hash="d1")
+        tool.redis_client.delete(*keys(tool, "sql_result:*"))
+        assert asyncio.run(tool._aget_from_cache("sql_cache:a")) is None
+        assert tool.redis_client.get("excel:queries:cache_miss") == "1"
+
+    def test_without_data_hash_stored_inline(self, tool):
+        """Entries saved without a data hash keep the whole body"""
+        tool._save_to_cache("sql_cache:a", result(), cost=1.0)
+        assert keys(tool, "sql_result:*") == []
+        assert asyncio.run(tool._aget_from_cache("sql_cache:a"))["row_count"] == 50
+
+    def test_result_outlives_pointers(self, tool):
+        """Hits extend the shared result's TTL along with the entry's"""
+        tool._save_to_cache("sql_cache:a", result(), cost=30.0, data_hash="d1")
+        for _ in range(5):
+            asyncio.run(tool._aget_from_cache("sql_cache:a"))
+        assert tool.redis_client.ttl(keys(tool, "sql_result:*")[0]) >= tool.redis_client.ttl("sql_cache:a")
+
+    def test_sweep_releases_unshared_results(self, tool):
+        """A result is deleted only after the last entry pointing at it"""
+        tool._save_to_cache("sql_cache:a", result(), cost=1.0, data_hash="d1")
+        tool._save_to_cache("sql_cache:b", result(SQL.lower()), cost=1.0, data_hash="d1")
+
+        tool.redis_client.delete("sql_cache:a")  # expired
+        tool._sweep_cache()
+        assert len(keys(tool, "sql_result:*")) == 1
+
+        tool.redis_client.delete("sql_cache:b")
+        assert tool._sweep_cache()["pruned"] == 1
+        assert keys(tool, "sql_result:*") == []
+
+    def test_eviction_frees_result_bytes(self, tool):
+        """Forced eviction counts the shared body once it is released"""
+        tool._save_to_cache("sql_cache:a", result(), cost=1.0, data_hash="d1")
+        tool._save_to_cache("sql_cache:b", result(SQL.lower()), cost=1.0, data_hash="d1")
+        size = tool.redis_client.strlen(keys(tool, "sql_result:*")[0])
+        tool.redis_client.info = lambda section=None: {"maxmemory": 1024 * 1024, "used_memory": 1024 * 1024}
+
+        stats = tool._sweep_cache(force=True)
+        assert stats["evicted"] == 2 and stats["freed_bytes"] == size
+        assert keys(tool, "sql_result:*") == []
+
+
+class TestCrossModelSharing:
+    """Test result sharing in analyze_excel_with_cache"""
+
+    def test_models_share_result(self, tool):
+        """The same question to two models caches twice but stores one result"""
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "Average yield per crop?"))
+        output = asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "Average yield per crop?", model="llama-3.1-8b-instant"))
+
+        assert "[NEW QUERY]" in output
+        assert len(keys(tool, "sql_cache:*")) == 2 and len(keys(tool, "sql_result:*")) == 1
+
+        output = asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "Average yield per crop?", model="llama-3.1-8b-instant"))
+        assert "Cache: HIT" in output and "select crop" in output
+        assert tool.executions == 2
+
+    def test_hot_tier_pins_merged_entry(self, tool):
+        """Pinned pointer entries are served with their result body"""
+        tool.valves.HOT_TIER_SIZE = 5
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "Average yield per crop?"))
+        tool._hot_tier().refreshed_at = None
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "Average yield per crop?"))
+
+        pinned = tool._hot_tier().get(keys(tool, "sql_cache:*")[0])
+        assert pinned["row_count"] == 50 and len(pinned["results"]) == 50
+
+    def test_stats_and_dashboard_report_dedupe(self, tool, make_admin):
+        """get_cache_stats and cache_dashboard show the dedupe ratio"""
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "Average yield per crop?"))
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "Mean yield by crop", model="llama-3.1-8b-instant"))
+
+        output = asyncio.run(tool.get_cache_stats())
+        assert "- Shared Results: 1 stored · dedupe ratio 2.00x (1 of 2 writes reused an identical SQL result" in output
+
+        assert "**Dedupe Ratio:** 2.00x" in asyncio.run(make_admin(tool.redis_client).cache_dashboard())
+
+    def test_clear_removes_results(self, tool):
+        """clear_cache('all') drops shared results and their bookkeeping"""
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "Average yield per crop?"))
+        asyncio.run(tool.clear_cache())
+        assert keys(tool, "sql_result:*") == []
+        assert not tool.redis_client.exists("excel:cache:result", "excel:results")
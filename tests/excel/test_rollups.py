@@ -0,0 +1,200 @@
+"""
+Excel Tests: Rollups
+
+Tests ingest-time rollup tables and routing eligible SQL onto them.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _build_rollups, _duckdb_select_list, _rewrite_for_rollup
+
+ROUTABLE = [
+    "SELECT crop, SUM(yield_value) AS total, AVG(yield_value), COUNT(*) FROM farm GROUP BY crop ORDER BY crop",
+    "SELECT field, crop, date_trunc('week', ts) AS wk, MAX(moisture), COUNT(moisture) FROM farm "
+    "WHERE crop IN ('maize', 'soy') GROUP BY ALL ORDER BY ALL",
+    "SELECT month(ts) AS m, AVG(moisture) FROM farm WHERE ts >= '2023-03-01' AND ts < DATE '2023-06-01' GROUP BY m ORDER BY m",
+    "SELECT f.field, ROUND(AVG(f.yield_value), 2) AS avg_y FROM farm f GROUP BY f.field HAVING COUNT(*) > 10 ORDER BY avg_y DESC",
+    "SELECT COUNT(DISTINCT field), MIN(crop) FROM farm",
+    "SELECT COUNT(*) FROM farm WHERE crop = 'none'",
+]
+
+NOT_ROUTABLE = [
+    "SELECT crop, SUM(yield_value) FROM farm WHERE ts > '2023-03-01' GROUP BY crop",
+    "SELECT hour(ts), COUNT(*) FROM farm GROUP BY 1",
+    "SELECT crop, MEDIAN(yield_value) FROM farm GROUP BY crop",
+    "SELECT crop, SUM(yield_value) FROM farm WHERE moisture > 50 GROUP BY crop",
+    "SELECT crop, SUM(yield_value * 2) FROM farm GROUP BY crop",
+    "SELECT reading_id, SUM(yield_value) FROM farm GROUP BY reading_id",
+    "SELECT * FROM farm LIMIT 5",
+]
+
+
+def farm(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "ts": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, rows), unit="m"),
+        "field": pd.Categorical(rng.choice([f"F{i}" for i in range(10)], rows)),
+        "crop": pd.Categorical(rng.choice(["maize", "soy", "wheat"], rows)),
+        "reading_id": np.arange(rows).astype(str),
+        "yield_value": rng.normal(100, 10, rows).round(2),
+        "moisture": rng.integers(0, 100, rows),
+    })
+
+
+@pytest.fixture
+def table():
+    """200k-row sensor table in DuckDB with its rollups"""
+    df = farm(200_000)
+    conn = duckdb.connect()
+    conn.execute(f"CREATE TABLE farm AS SELECT {_duckdb_select_list(df)} FROM df")
+    return conn, df, _build_rollups(conn, "farm", df, max_ratio=0.2)
+
+
+def route(conn, sql, rollups):
+    for rollup in sorted(rollups, key=lambda r: r["rows"]):
+        rewritten = _rewrite_for_rollup(conn, "farm", sql, rollup)
+        if rewritten:
+            return rewritten
+    return None
+
+
+@pytest.fixture
+def tool(make_sql_tool, tmp_path):
+    """Tool with fake Redis, low rollup thresholds and canned SQL"""
+    instance = make_sql_tool(
+        ROLLUP_MIN_ROWS=10_000,
+        ROLLUP_MAX_RATIO=0.2,
+        ENABLE_SQL_TEMPLATES=False,
+        APPROX_PREVIEW=False,
+    )
+    instance.sql = ROUTABLE[0]
+    instance._generate_sql = lambda conn, table_name, query, model: instance.sql
+    instance.file_path = str(tmp_path / "farm.csv")
+    farm(20_000).to_csv(instance.file_path, index=False)
+    return instance
+
+
+class TestRollupBuild:
+    """Test detecting dimensions and materializing rollups"""
+
+    def test_dimensions_and_measures(self, table):
+        """Labels become dimensions, numbers measures, the date column is bucketed"""
+        conn, df, rollups = table
+        day = next(r for r in rollups if r["grain"] == "day")
+
+        assert sorted(day["dimensions"]) == ["crop", "field"]
+        assert day["measures"] == ["yield_value", "moisture"]
+        assert day["date_column"] == "ts"
+        assert day["rows"] == conn.execute(f"SELECT COUNT(*) FROM {day['table']}").fetchone()[0]
+        assert conn.execute(f"SELECT SUM(__rows) FROM {day['table']}").fetchone()[0] == len(df)
+
+    def test_week_rollup_smaller(self, table):
+        """The week rollup is built and tried first"""
+        conn, df, rollups = table
+        assert [r["grain"] for r in rollups] == ["week", "day"]
+        assert rollups[0]["rows"] * 2 <= rollups[1]["rows"]
+
+    def test_widest_dimension_dropped(self, table):
+        """A rollup over the size limit loses its highest-cardinality dimension"""
+        conn, df, _ = table
+        rollups = _build_rollups(conn, "farm", df, max_ratio=0.04)
+        assert rollups[-1]["dimensions"] == ["crop"]
+        assert rollups[-1]["rows"] <= len(df) * 0.04
+
+    def test_no_compact_rollup(self, table):
+        """No rollup is kept when none fits the limit"""
+        conn, df, _ = table
+        assert _build_rollups(conn, "farm", df, max_ratio=0.001) == []
+
+
+class TestRouter:
+    """Test rewriting SQL onto rollups"""
+
+    def test_routed_answers_match_raw(self, table):
+        """Every eligible query returns exactly what the raw table does"""
+        conn, df, rollups = table
+        for sql in ROUTABLE:
+            rewritten = route(conn, sql, rollups)
+            assert rewritten and "__rollup_" in rewritten, sql
+
+            expected = conn.execute(sql).fetchdf()
+            actual = conn.execute(rewritten).fetchdf()
+            actual.columns = expected.columns
+            pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-9)
+
+    def test_ineligible_queries_stay_raw(self, table):
+        """Finer-than-bucket dates, measures outside aggregates and row listings are not routed"""
+        conn, df, rollups = table
+        for sql in NOT_ROUTABLE:
+            assert route(conn, sql, rollups) is None, sql
+
+    def test_other_tables_not_routed(self, table):
+        """Joins and other tables go to the raw data"""
+        conn, df, rollups = table
+        assert route(conn, "SELECT crop, COUNT(*) FROM farm JOIN farm USING (crop) GROUP BY crop", rollups) is None
+        assert route(conn, "SELECT COUNT(*) FROM other", rollups) is None
+
+
+class TestToolRouting:
+    """Test rollups in _execute_sql_query"""
+
+    def test_query_served_from_rollup(self, tool):
+        """Eligible SQL reads the rollup and keeps the raw column names"""
+        result = tool._execute_sql_query(tool.file_path, "yield per crop?")
+
+        tool.valves.ENABLE_ROLLUPS = False
+        raw = tool._execute_sql_query(tool.file_path, "yield per crop?")
+
+        assert list(result["results"][0]) == ["crop", "total", "avg(yield_value)", "count_star()"]
+        pd.testing.assert_frame_equal(pd.DataFrame(result["results"]), pd.DataFrame(raw["results"]), rtol=1e-9)
+        assert result["sql_query"] == raw["sql_query"] == ROUTABLE[0]
+
+        usage = tool.redis_client.hgetall("excel:rollups")
+        assert usage["routed"] == "1"
+        assert int(usage["scanned_rows"]) * 5 <= int(usage["table_rows"]) == 20_000
+
+    def test_ineligible_query_scans_table(self, tool):
+        """Queries a rollup cannot answer run on the raw table"""
+        tool.sql = NOT_ROUTABLE[2]
+        result = tool._execute_sql_query(tool.file_path, "median yield per crop?")
+        assert result["row_count"] == 3
+        assert tool.redis_client.hgetall("excel:rollups") == {"builds": "1", "unrouted": "1"}
+
+    def test_rollups_built_once_per_file_version(self, tool):
+        """Later misses reuse the rollups until the file changes"""
+        tool._execute_sql_query(tool.file_path, "yield per crop?")
+        tool._execute_sql_query(tool.file_path, "yield per crop again?")
+        assert tool.redis_client.hget("excel:rollups", "builds") == "1"
+
+        farm(20_000, seed=1).to_csv(tool.file_path, index=False)
+        os.utime(tool.file_path, ns=(0, 0))
+        result = tool._execute_sql_query(tool.file_path, "yield per crop?")
+        assert tool.redis_client.hget("excel:rollups", "builds") == "2"
+        assert sum(row["count_star()"] for row in result["results"]) == 20_000
+
+    def test_small_tables_skip_rollups(self, tool):
+        """Below ROLLUP_MIN_ROWS nothing is built or routed"""
+        tool.valves.ROLLUP_MIN_ROWS = 50_000
+        tool._execute_sql_query(tool.file_path, "yield per crop?")
+        assert tool.redis_client.hgetall("excel:rollups") == {}
+
+    def test_stats_report_rollups(self, tool):
+        """get_cache_stats shows routed queries and rows scanned"""
+        tool._execute_sql_query(tool.file_path, "yield per crop?")
+        output = asyncio.run(tool.get_cache_stats())
+
+        assert "**Rollups:**" in output
+        assert "Routed: 1 / 1 queries on rollup tables (100.0%)" in output
+        assert "instead of 20,000" in output
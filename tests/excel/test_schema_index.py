@@ -0,0 +1,208 @@
+"""
+Excel Tests: Schema Index
+
+Tests the persisted table-description index and top-k schema retrieval for SQL generation.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _HashingEmbedding, _residual_question, _table_description
+
+UPLOADS = {
+    "yields": "crop,field,yield_kg,harvest_date\nmaize,F1,1200,2023-03-01\nsoy,F2,800,2023-03-02\n",
+    "weather": "date,station,rainfall_mm,temperature_c\n2023-03-01,north,12.5,21.0\n2023-03-02,south,0.0,24.5\n",
+    "pest_scouting": "field,pest,severity,date\nF1,aphid,2,2023-03-01\nF2,borer,1,2023-03-02\n",
+    "equipment": "machine,hours,fuel_liters\ntractor,10,55.0\nharvester,4,80.0\n",
+}
+
+
+@pytest.fixture
+def tool(make_sql_tool, tmp_path):
+    """Tool with fake Redis whose canned SQL generation records the tables it was given"""
+    instance = make_sql_tool(ENABLE_SQL_TEMPLATES=False)
+    instance.selected = []
+
+    def generate_sql(conn, table_name, query, model):
+        instance.selected.append(instance._select_tables(conn, table_name, query))
+        return f"SELECT COUNT(*) AS n FROM {table_name}"
+
+    instance._generate_sql = generate_sql
+    instance.paths = {}
+    for name, content in UPLOADS.items():
+        instance.paths[name] = str(tmp_path / f"{name}.csv")
+        with open(instance.paths[name], "w") as f:
+            f.write(content)
+    return instance
+
+
+def upload_all(tool):
+    for name in UPLOADS:
+        tool._execute_sql_query(tool.paths[name], f"how many {name} rows?")
+    tool.selected.clear()
+
+
+def index_rows(tool):
+    conn = duckdb.connect(tool.valves.DATABASE_PATH)
+    try:
+        return dict(conn.execute("SELECT table_name, version FROM _smartfarm_schema_index").fetchall())
+    finally:
+        conn.close()
+
+
+class TestHashingEmbedding:
+    """Test the deterministic offline embedding"""
+
+    def test_deterministic_and_normalized(self):
+        """Same text, same unit vector, in any process"""
+        first, second = _HashingEmbedding().embed(["rainfall per station", "rainfall per station"])
+        assert first == second
+        assert np.linalg.norm(first) == pytest.approx(1.0)
+
+    def test_shared_vocabulary_ranks_higher(self):
+        """A question is closer to the table whose columns it names"""
+        weather, equipment, question = (np.array(v) for v in _HashingEmbedding().embed(
+            ["weather\ndate station rainfall_mm temperature_c", "equipment\nmachine hours fuel_liters", "total rainfall"]
+        ))
+        assert weather @ question > equipment @ question + 0.1
+
+
+class TestResidualQuestion:
+    """Test which words of a question point beyond the uploaded table"""
+
+    def test_covered_words_dropped(self):
+        """Columns, labels and their plurals are covered; stopwords never count"""
+        conn = duckdb.connect()
+        df = pd.DataFrame({"crop": ["maize"], "field": ["F1"], "yield_kg": [1.0]})
+        conn.execute("CREATE TABLE yields AS SELECT * FROM df")
+        description = _table_description(conn, "yields", df)
+
+        assert _residual_question("How does rainfall affect maize yield per field?", description) == "rainfall affect"
+        assert _residual_question("Average yields of the fields", description) == "average"
+
+
+class TestSchemaRetrieval:
+    """Test the index in _execute_sql_query and table selection for the LLM"""
+
+    def test_index_built_once_per_version(self, tool):
+        """Each upload is described and embedded on its first miss only"""
+        upload_all(tool)
+        tool._execute_sql_query(tool.paths["yields"], "again?")
+        assert sorted(index_rows(tool)) == sorted(UPLOADS)
+        assert tool.redis_client.hget("excel:schema", "builds") == str(len(UPLOADS))
+
+        with open(tool.paths["yields"], "a") as f:
+            f.write("wheat,F3,950,2023-03-03\n")
+        before = index_rows(tool)["yields"]
+        tool._execute_sql_query(tool.paths["yields"], "again?")
+        assert index_rows(tool)["yields"] != before
+        assert tool.redis_client.hget("excel:schema", "builds") == str(len(UPLOADS) + 1)
+
+    def test_related_tables_selected(self, tool):
+        """Tables named by the rest of the question join the uploaded one"""
+        upload_all(tool)
+        tool._execute_sql_query(tool.paths["yields"], "How does rainfall affect maize yield per field?")
+        tool._execute_sql_query(tool.paths["pest_scouting"], "Fuel used by the tractor vs aphid severity")
+        assert tool.selected == [["yields", "weather"], ["pest_scouting", "equipment"]]
+
+    def test_question_about_upload_only(self, tool):
+        """When the uploaded table covers the question, only its schema is sent"""
+        upload_all(tool)
+        tool._execute_sql_query(tool.paths["weather"], "average temperature per station")
+        assert tool.selected == [["weather"]]
+
+    def test_top_k_caps_selection(self, tool):
+        """At most SCHEMA_TOP_K tables, the uploaded one first"""
+        upload_all(tool)
+        tool.valves.SCHEMA_TOP_K = 2
+        tool._execute_sql_query(tool.paths["yields"], "rainfall, aphid severity and tractor fuel")
+        assert len(tool.selected[0]) == 2 and tool.selected[0][0] == "yields"
+
+    def test_internal_tables_never_sent(self, tool):
+        """Rollups and bookkeeping tables are not part of the catalog"""
+        upload_all(tool)
+        tool.valves.SCHEMA_TOP_K = 10
+        tool._execute_sql_query(tool.paths["yields"], "rollup rollups smartfarm schema index rainfall")
+        assert all(not name.startswith("_") and "__" not in name for name in tool.selected[0])
+        assert "weather" in tool.selected[0]
+
+    def test_tables_imported_before_index(self, tool):
+        """Tables with no index entry are described from the catalog when first seen"""
+        conn = duckdb.connect(tool.valves.DATABASE_PATH)
+        conn.execute("CREATE TABLE weather AS SELECT * FROM read_csv_auto(?)", [tool.paths["weather"]])
+        conn.close()
+
+        tool._execute_sql_query(tool.paths["yields"], "How does rainfall affect yield?")
+        assert tool.selected == [["yields", "weather"]]
+        assert index_rows(tool)["weather"] == ""
+
+    def test_top_k_one_disables_index(self, tool):
+        """SCHEMA_TOP_K=1 sends only the uploaded table and builds nothing"""
+        tool.valves.SCHEMA_TOP_K = 1
+        upload_all(tool)
+        tool._execute_sql_query(tool.paths["yields"], "How does rainfall affect yield?")
+        assert tool.selected == [["yields"]]
+        assert tool.redis_client.hgetall("excel:schema") == {}
+
+    def test_openai_key_only_for_openai_provider(self, tool, monkeypatch):
+        """The hashing provider works offline; 'openai' still needs its key"""
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        tool.valves.EMBEDDING_PROVIDER = "openai"
+        with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+            tool._execute_sql_query(tool.paths["yields"], "q")
+
+    def test_stats_report_schema_tokens(self, tool):
+        """get_cache_stats shows tables and schema tokens sent vs the whole catalog"""
+        upload_all(tool)
+        tool.redis_client.delete("excel:schema")
+        tool._execute_sql_query(tool.paths["weather"], "average temperature per station")
+        usage = tool.redis_client.hgetall("excel:schema")
+        assert int(usage["tokens_sent"]) * 3 < int(usage["catalog_tokens"])
+
+        output = asyncio.run(tool.get_cache_stats())
+        assert "**Schema Context:**" in output
+        assert "- Tables Sent: 1.0 of 4.0 per question (1 questions)" in output
+        assert "for the whole catalog" in output
+
+
+class TestQueryEngine:
+    """Test building the NL-to-SQL engine itself, not a stubbed _generate_sql"""
+
+    @pytest.fixture
+    def database(self):
+        """llama_index SQLDatabase over an in-memory SQLite table"""
+        sqlalchemy = pytest.importorskip("sqlalchemy")
+        llama_core = pytest.importorskip("llama_index.core")
+        engine = sqlalchemy.create_engine("sqlite://")
+        with engine.begin() as connection:
+            connection.execute(sqlalchemy.text("CREATE TABLE yields (crop TEXT, yield_kg REAL)"))
+        return llama_core.SQLDatabase(engine)
+
+    def test_built_without_openai_key(self, tool, database, monkeypatch):
+        """The default hashing provider needs no OpenAI key to build the engine"""
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        query_engine = tool._sql_query_engine(database, ["yields"], "llama-3.3-70b-versatile")
+        assert query_engine.sql_retriever is not None
+
+    def test_llm_per_engine_not_global(self, tool, database):
+        """Concurrent engines keep their own model and leave Settings untouched"""
+        from concurrent.futures import ThreadPoolExecutor
+        from llama_index.core import Settings
+
+        models = ["llama-3.3-70b-versatile", "llama-3.1-8b-instant"] * 4
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            engines = list(pool.map(lambda model: tool._sql_query_engine(database, ["yields"], model), models))
+
+        assert [engine._sql_retriever._llm.model for engine in engines] == models
+        assert Settings._llm is None
@@ -0,0 +1,139 @@
+"""
+Excel Tests: Speculative Pipeline
+
+Tests reading uploads during the cache lookup and generating SQL while the import runs.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import threading
+import pytest
+import sys
+import os
+
+import duckdb
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _read_dataframe
+
+CSV = "crop,field,yield_kg\nmaize,F1,1200\nsoy,F2,800\nmaize,F3,950\n"
+
+
+@pytest.fixture
+def tool(make_sql_tool, tmp_path):
+    """Tool with fake Redis whose SQL generation waits for the import to start"""
+    instance = make_sql_tool(ENABLE_SQL_TEMPLATES=False)
+    instance.importing = threading.Event()
+    instance.seen = []
+
+    load_table = instance._load_table
+
+    def track_import(*args):
+        instance.importing.set()
+        return load_table(*args)
+
+    def generate_sql(conn, table_name, query, model):
+        instance.seen.append({
+            "during_import": instance.importing.wait(timeout=2),
+            "columns": [row[0] for row in conn.execute(f"DESCRIBE {table_name}").fetchall()],
+            "rows": conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0],
+        })
+        return f"SELECT crop, SUM(yield_kg) AS total FROM {table_name} GROUP BY crop ORDER BY crop"
+
+    instance._load_table = track_import
+    instance._generate_sql = generate_sql
+    instance.file_path = str(tmp_path / "yields.csv")
+    with open(instance.file_path, "w") as f:
+        f.write(CSV)
+    return instance
+
+
+class TestPipelinedMiss:
+    """Test SQL generation overlapping the DuckDB import in _execute_sql_query"""
+
+    def test_sql_generated_during_import(self, tool):
+        """The LLM starts before the rows are imported and its SQL runs on them"""
+        result = tool._execute_sql_query(tool.file_path, "total yield per crop?")
+
+        assert tool.seen[0]["during_import"] and tool.seen[0]["rows"] == 0
+        assert result["results"] == [{"crop": "maize", "total": 2150}, {"crop": "soy", "total": 800}]
+        assert tool.redis_client.hget("excel:pipeline", "overlapped") == "1"
+        assert float(tool.redis_client.hget("excel:pipeline", "saved")) >= 0
+
+    def test_llm_sees_new_schema(self, tool):
+        """A re-upload with other columns is described to the LLM, not the stale table"""
+        conn = duckdb.connect(tool.valves.DATABASE_PATH)
+        conn.execute("CREATE TABLE yields AS SELECT 'maize' AS crop, 1 AS old_column")
+        conn.close()
+
+        tool._execute_sql_query(tool.file_path, "total yield per crop?")
+        assert tool.seen[0]["columns"] == ["crop", "field", "yield_kg"]
+
+    def test_shadow_copy_not_persisted(self, tool):
+        """Only the imported table remains once the query is answered"""
+        tool._execute_sql_query(tool.file_path, "total yield per crop?")
+
+        conn = duckdb.connect(tool.valves.DATABASE_PATH)
+        assert conn.execute("SELECT COUNT(*) FROM yields").fetchone()[0] == 3
+        assert conn.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE temporary").fetchone()[0] == 0
+        conn.close()
+
+    def test_sequential_when_disabled(self, tool):
+        """SPECULATIVE_PIPELINE=False generates SQL after the import, with the same answer"""
+        tool.valves.SPECULATIVE_PIPELINE = False
+        result = tool._execute_sql_query(tool.file_path, "total yield per crop?")
+
+        assert tool.seen[0]["rows"] == 3
+        assert result["row_count"] == 2
+        assert tool.redis_client.hgetall("excel:pipeline") == {}
+
+    def test_llm_error_surfaces(self, tool):
+        """A failed generation fails the query once the import is done"""
+        def fail(conn, table_name, query, model):
+            raise RuntimeError("model overloaded")
+
+        tool._generate_sql = fail
+        with pytest.raises(RuntimeError, match="model overloaded"):
+            tool._execute_sql_query(tool.file_path, "total yield per crop?")
+
+
+class TestSpeculativeRead:
+    """Test reading the upload while analyze_excel_with_cache checks the cache"""
+
+    def test_miss_uses_prefetched_frame(self, tool):
+        """On a miss the executor gets the frame read during the lookup"""
+        frames = []
+        tool._execute_sql_query = lambda file_path, query, model, timer=None, preview=None, frame=None: \
+            frames.append(frame) or {"sql_query": "SELECT 1", "results": [], "results_markdown": "", "row_count": 0,
+                                     "table_name": "yields"}
+
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "total yield per crop?"))
+        assert list(frames[0].columns) == ["crop", "field", "yield_kg"]
+        assert tool.redis_client.hget("excel:pipeline", "prefetched") == "1"
+
+    def test_hit_stops_read(self, tool):
+        """A hit cancels the speculative read and counts it as wasted"""
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "total yield per crop?"))
+        output = asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "total yield per crop?"))
+
+        assert "Cache: HIT" in output
+        assert tool.redis_client.hgetall("excel:pipeline")["wasted"] == "1"
+
+    def test_cancelled_read_skips_full_read(self, tool):
+        """Once cancelled, only the profiling sample is read"""
+        cancelled = threading.Event()
+        cancelled.set()
+        assert _read_dataframe(tool.file_path, cancelled=cancelled) is None
+
+    def test_stats_report_pipeline(self, tool):
+        """get_cache_stats shows speculative reads and overlapped misses"""
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "total yield per crop?"))
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "total yield per crop?"))
+        output = asyncio.run(tool.get_cache_stats())
+
+        assert "**Miss Pipeline:**" in output
+        assert "- Speculative Reads: 1 used on misses, 1 stopped by hits" in output
+        assert "- SQL Generated During Import: 1 misses" in output
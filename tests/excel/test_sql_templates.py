@@ -0,0 +1,152 @@
+"""
+Excel Tests: SQL Templates
+
+Tests reusing generated SQL for questions that differ only in literals.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _bind_sql_template, _literal_vocabulary, _question_skeleton, _sql_template
+
+VOCABULARY = {"maize": "Maize", "winter wheat": "Winter Wheat"}
+
+
+@pytest.fixture
+def tool(make_sql_tool):
+    """Tool with fake Redis and a fake LLM that writes SQL for the asked crop and year"""
+    instance = make_sql_tool(
+        upload="crop,year,yield\nMaize,2023,1\nMaize,2024,2\nWinter Wheat,2023,3\nWinter Wheat,2024,4\n"
+    )
+    instance.llm_calls = []
+
+    def fake_llm(conn, table_name, query, model):
+        instance.llm_calls.append(query)
+        crop = "Winter Wheat" if "wheat" in query.lower() else "Maize"
+        year = "2024" if "2024" in query else "2023"
+        return f"SELECT SUM(yield) AS total FROM {table_name} WHERE crop = '{crop}' AND year = {year}"
+
+    instance._generate_sql = fake_llm
+    return instance
+
+
+def ask(tool, query):
+    return tool._execute_sql_query(tool.file_path, query)
+
+
+class TestTemplateFunctions:
+    """Test skeleton extraction, parameterization and binding"""
+
+    def test_skeleton_replaces_literals(self):
+        """Known values, numbers and quoted strings become typed placeholders"""
+        skeleton, literals = _question_skeleton("Yield of winter wheat in 2024 for 'North'?", VOCABULARY)
+        assert skeleton == "yield of {text} in {num} for {text} ?"
+        assert literals == [("text", "Winter Wheat"), ("num", "2024"), ("text", "North")]
+
+    def test_same_shape_same_skeleton(self):
+        """Questions differing only in literals share a skeleton"""
+        assert _question_skeleton("yield of maize in 2023", VOCABULARY)[0] == \
+            _question_skeleton("Yield of Winter Wheat in 2024", VOCABULARY)[0]
+
+    def test_vocabulary_from_labels(self):
+        """Low-cardinality text columns feed the vocabulary; numbers do not"""
+        df = pd.DataFrame({"crop": pd.Categorical(["Maize", "Soy"]), "plot": [1, 2]})
+        assert _literal_vocabulary(df) == {"maize": "Maize", "soy": "Soy"}
+
+    def test_template_round_trip(self):
+        """Binding new literals rewrites only the parameterized literals"""
+        literals = [("text", "Maize"), ("num", "2023")]
+        segments = _sql_template("SELECT * FROM farm WHERE crop ILIKE '%Maize%' AND year = 2023 LIMIT 10", literals)
+        sql = _bind_sql_template(segments, [("text", "O'Hara"), ("num", "2024")])
+        assert sql == "SELECT * FROM farm WHERE crop ILIKE '%O''Hara%' AND year = 2024 LIMIT 10"
+
+    def test_unbindable_literal_rejected(self):
+        """No template when a question literal does not appear in the SQL"""
+        assert _sql_template("SELECT * FROM farm WHERE crop = 'Soy'", [("text", "Maize")]) is None
+
+    def test_literals_match_whole_words(self):
+        """A number only binds to a whole number inside a string literal"""
+        assert _sql_template("SELECT * FROM farm WHERE field = 'F-12'", [("num", "1")]) is None
+
+    def test_ordinals_never_bound(self):
+        """GROUP BY/ORDER BY ordinals stay fixed when the question has an equal number"""
+        sql = "SELECT region, SUM(sales) AS total FROM farm WHERE month = 3 GROUP BY 1 ORDER BY 2 DESC LIMIT 2"
+        segments = _sql_template(sql, [("num", "2"), ("num", "3")])
+        assert _bind_sql_template(segments, [("num", "1"), ("num", "7")]) == \
+            "SELECT region, SUM(sales) AS total FROM farm WHERE month = 7 GROUP BY 1 ORDER BY 2 DESC LIMIT 1"
+
+        listed = "SELECT crop, year, SUM(yield) FROM farm WHERE year = 2 GROUP BY crop, 2 ORDER BY total DESC, 2"
+        assert _bind_sql_template(_sql_template(listed, [("num", "2")]), [("num", "5")]).endswith(
+            "WHERE year = 5 GROUP BY crop, 2 ORDER BY total DESC, 2"
+        )
+
+    def test_ambiguous_literal_rejected(self):
+        """No template when a question literal matches more than one SQL literal, or the reverse"""
+        assert _sql_template("SELECT * FROM farm WHERE year = 2023 OR planted = 2023", [("num", "2023")]) is None
+        assert _sql_template("SELECT * FROM farm LIMIT 5", [("num", "5"), ("num", "5")]) is None
+
+
+class TestTemplateCache:
+    """Test the template layer in _execute_sql_query"""
+
+    def test_other_literals_skip_llm(self, tool):
+        """A second question with other literals reuses the SQL without the LLM"""
+        ask(tool, "Total yield of maize in 2023")
+        result = ask(tool, "total yield of winter wheat in 2024")
+
+        assert len(tool.llm_calls) == 1
+        assert result["sql_query"].endswith("crop = 'Winter Wheat' AND year = 2024")
+        assert result["results"] == [{"total": 4}]
+        assert tool.redis_client.hgetall("excel:templates") == {"misses": "1", "stored": "1", "hits": "1"}
+
+    def test_different_shape_asks_llm(self, tool):
+        """Questions with another skeleton still go to the LLM"""
+        ask(tool, "Total yield of maize in 2023")
+        ask(tool, "Average yield of maize in 2023")
+        assert len(tool.llm_calls) == 2
+
+    def test_failing_bind_falls_back(self, tool):
+        """A template whose SQL fails is dropped and the LLM answers"""
+        ask(tool, "Total yield of maize in 2023")
+        key = tool.redis_client.keys("excel:sqltpl:*")[0]
+        tool.redis_client.set(key, '{"segments": ["SELECT nope FROM missing"]}')
+
+        result = ask(tool, "Total yield of maize in 2024")
+        assert len(tool.llm_calls) == 2
+        assert result["results"] == [{"total": 2}]
+        assert tool.redis_client.hget("excel:templates", "rejected") == "1"
+
+    def test_disabled(self, tool):
+        """ENABLE_SQL_TEMPLATES=False always asks the LLM"""
+        tool.valves.ENABLE_SQL_TEMPLATES = False
+        ask(tool, "Total yield of maize in 2023")
+        ask(tool, "Total yield of maize in 2024")
+        assert len(tool.llm_calls) == 2
+
+
+class TestTemplateReporting:
+    """Test template hit rate reporting"""
+
+    def test_stats_report_template_rate(self, tool):
+        """get_cache_stats shows the template hit rate separately"""
+        ask(tool, "Total yield of maize in 2023")
+        ask(tool, "Total yield of maize in 2024")
+        output = asyncio.run(tool.get_cache_stats())
+        assert "Template Hit Rate: 50.0% (1 of 2 SQL generations skipped the LLM)" in output
+
+    def test_dashboard_reports_template_hits(self, tool, make_admin):
+        """cache_dashboard lists template hits next to the query statistics"""
+        ask(tool, "Total yield of maize in 2023")
+        ask(tool, "Total yield of maize in 2024")
+
+        output = asyncio.run(make_admin(tool.redis_client).cache_dashboard())
+        assert "| SQL Template Hits (LLM skipped on a miss) | 1 | 50.0% of SQL generations |" in output
@@ -0,0 +1,90 @@
+"""
+Excel Tests: Stage Timings
+
+Tests per-stage latency recording for Excel analyses.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+from sql_cache_tool import _StageTimer, _stage_summary
+
+
+@pytest.fixture
+def tool(make_sql_tool):
+    """Tool instance with fake Redis and a fake executor that reports stages"""
+    instance = make_sql_tool(upload="crop,yield\nmaize,1\n", SWEEP_THRESHOLD=1.0)
+
+    def fake_execute(file_path, query, model, timer=None, preview=None, frame=None):
+        for stage in ("read", "import", "llm_sql", "execute", "render"):
+            with timer.stage(stage):
+                pass
+        timer.timings["llm_sql"] += 2.0  # Pretend Groq was slow
+        return {"sql_query": "SELECT 1", "results": [], "results_markdown": "No results",
+                "row_count": 0, "table_name": "farm"}
+
+    instance._execute_sql_query = fake_execute
+    return instance
+
+
+class TestStageTimer:
+    """Test the span timer"""
+
+    def test_stages_accumulate(self):
+        timer = _StageTimer()
+        with timer.stage("read"):
+            pass
+        with timer.stage("read"):
+            pass
+        assert list(timer.timings) == ["read"]
+        assert timer.timings["read"] >= 0
+
+    def test_stage_recorded_on_error(self):
+        """Failed stages still report their duration"""
+        timer = _StageTimer()
+        with pytest.raises(RuntimeError):
+            with timer.stage("llm_sql"):
+                raise RuntimeError("Groq down")
+        assert "llm_sql" in timer.timings
+
+
+class TestStageRecording:
+    """Test stage histograms and output"""
+
+    def test_miss_records_all_stages(self, tool):
+        """A cache miss records every pipeline stage"""
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "yield?"))
+        stages = {row["stage"] for row in _stage_summary(tool.redis_client)}
+
+        assert stages == {"hash", "cache_lookup", "read", "import", "llm_sql", "execute", "render", "cache_write"}
+
+    def test_top_stage_first(self, tool):
+        """The summary is ordered by total cost"""
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "yield?"))
+        top = _stage_summary(tool.redis_client)[0]
+
+        assert top["stage"] == "llm_sql"
+        assert top["p95"] == 2.5
+
+    def test_events_streamed(self, tool):
+        """Stage timings are emitted as status events"""
+        events = []
+
+        async def emitter(event):
+            events.append(event["data"]["description"])
+
+        asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "yield?", __event_emitter__=emitter))
+        assert any("LLM SQL generation" in e for e in events)
+
+    def test_debug_footer(self, tool):
+        """Debug mode appends the breakdown to the response"""
+        tool.valves.DEBUG_TIMINGS = True
+        output = asyncio.run(tool.analyze_excel_with_cache(tool.file_path, "yield?"))
+        assert "LLM SQL generation" in output.splitlines()[-1]
@@ -0,0 +1,99 @@
+"""
+Excel Tests: Stale-While-Revalidate
+
+Tests serving stale cache entries while refreshing them in the background.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+
+
+RESULT = {
+    "sql_query": "SELECT 1",
+    "results": [],
+    "results_markdown": "No results",
+    "row_count": 0,
+    "table_name": "farm",
+}
+
+
+@pytest.fixture
+def tool(make_sql_tool):
+    """Tool instance with fake Redis and a counting fake query executor"""
+    instance = make_sql_tool(upload="crop,yield\nmaize,1\n", ADAPTIVE_TTL=False)
+    instance.calls = 0
+
+    def fake_execute(file_path, query, model, timer=None, preview=None, frame=None):
+        instance.calls += 1
+        return dict(RESULT)
+
+    instance._execute_sql_query = fake_execute
+    return instance
+
+
+def cache_key(tool):
+    return tool._generate_cache_key(tool._get_file_hash(tool.file_path), "yield?", "llama-3.3-70b-versatile")
+
+
+class TestStaleWhileRevalidate:
+    """Test soft and hard TTL handling"""
+
+    def test_hard_ttl_includes_grace(self, tool):
+        """Redis expiry is the soft TTL plus the grace window"""
+        tool._save_to_cache("sql_cache:a", RESULT)
+        ttl = tool.redis_client.ttl("sql_cache:a")
+        assert ttl > tool.valves.CACHE_TTL
+        assert ttl <= tool.valves.CACHE_TTL + tool.valves.STALE_GRACE
+
+    def test_fresh_entry_not_stale(self, tool):
+        """Entries within the soft TTL are fresh"""
+        tool._save_to_cache("sql_cache:a", RESULT)
+        assert asyncio.run(tool._aget_from_cache("sql_cache:a"))["stale"] is False
+
+    def test_expired_soft_ttl_is_stale(self, tool):
+        """Entries in the grace window are served as stale"""
+        tool._save_to_cache("sql_cache:a", RESULT)
+        tool.redis_client.expire("sql_cache:a", tool.valves.STALE_GRACE - 10)
+        assert asyncio.run(tool._aget_from_cache("sql_cache:a"))["stale"] is True
+
+    def test_stale_hit_served_and_refreshed(self, tool):
+        """A stale hit answers from cache and refreshes in the background"""
+        key = cache_key(tool)
+        tool._save_to_cache(key, RESULT)
+        tool.redis_client.expire(key, 5)
+
+        async def run():
+            output = await tool.analyze_excel_with_cache(tool.file_path, "yield?")
+            await asyncio.gather(*tool._refresh_futures)
+            return output
+
+        output = asyncio.run(run())
+
+        assert "STALE" in output
+        assert tool.calls == 1
+        assert tool.redis_client.ttl(key) > tool.valves.STALE_GRACE
+        assert not tool.redis_client.exists(f"excel:lock:{key}")
+
+    def test_single_flight_refresh(self, tool):
+        """Concurrent stale hits trigger only one recomputation"""
+        key = cache_key(tool)
+        tool._save_to_cache(key, RESULT)
+        tool.redis_client.expire(key, 5)
+
+        async def run():
+            await asyncio.gather(*[
+                tool.analyze_excel_with_cache(tool.file_path, "yield?") for _ in range(5)
+            ])
+            await asyncio.gather(*tool._refresh_futures)
+
+        asyncio.run(run())
+        assert tool.calls == 1
+
+    def test_disabled_mode_never_stale(self, tool):
+        """Without stale-while-revalidate entries are never flagged"""
+        tool.valves.STALE_WHILE_REVALIDATE = False
+        tool._save_to_cache("sql_cache:a", RESULT)
+        assert tool.redis_client.ttl("sql_cache:a") <= tool.valves.CACHE_TTL
+        assert asyncio.run(tool._aget_from_cache("sql_cache:a"))["stale"] is False
@@ -0,0 +1,169 @@
+"""
+Excel Tests: Streaming Profiler
+
+Tests the one-pass, bounded-memory file profile behind csv_analyzer_tool.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import tracemalloc
+import pytest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add excel tools to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+
+import csv_analyzer_tool
+from csv_analyzer_tool import _HyperLogLog, _KLLSketch, _profile_file
+from sql_cache_tool import _read_dataframe
+
+
+def farm_frame(rows):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "date": pd.date_range("2023-01-01", periods=rows, freq="h").strftime("%Y-%m-%d %H:%M:%S"),
+        "crop": rng.choice(["maize", "soy", "wheat"], rows),
+        "plot": rng.integers(1, 200, rows),
+        "yield_kg": rng.normal(1000, 50, rows).round(1),
+    })
+    df.loc[::50, "yield_kg"] = np.nan
+    return df
+
+
+@pytest.fixture
+def farm_csv(tmp_path):
+    """Farm CSV spanning several profiling chunks"""
+    path = str(tmp_path / "farm.csv")
+    farm_frame(20000).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def tool(make_analyzer):
+    """Analyzer with fake Redis"""
+    return make_analyzer(PROFILE_CHUNK_ROWS=5000)
+
+
+class TestSketches:
+    """Test the quantile and distinct-count sketches"""
+
+    def test_small_inputs_exact(self):
+        """Below the sketch size quantiles match pandas exactly"""
+        values = np.array([3.0, 1.0, 4.0, 1.5, 9.0])
+        sketch = _KLLSketch(200)
+        sketch.update(values)
+        assert sketch.quantiles([0.25, 0.5, 0.75]) == list(pd.Series(values).quantile([0.25, 0.5, 0.75]))
+
+    def test_quantiles_within_rank_error(self):
+        """Large streams keep quantiles within a few tenths of a percent in rank"""
+        values = np.random.default_rng(1).normal(size=500_000)
+        sketch = _KLLSketch(200)
+        for chunk in np.array_split(values, 25):
+            sketch.update(chunk)
+
+        for q, estimate in zip([0.1, 0.5, 0.9], sketch.quantiles([0.1, 0.5, 0.9])):
+            assert abs((values < estimate).mean() - q) < 0.02
+        assert sum(len(level) for level in sketch.levels) <= 3 * 200
+
+    def test_distinct_counts(self):
+        """HyperLogLog is exact-ish for labels and within a few percent for many values"""
+        small = _HyperLogLog()
+        small.update(pd.Series(["maize", "soy", "maize", "wheat"]))
+        assert small.count() == 3
+
+        large = _HyperLogLog()
+        for chunk in np.array_split(np.arange(100_000), 10):
+            large.update(pd.Series(chunk))
+        assert abs(large.count() - 100_000) < 5000
+
+
+class TestProfileFile:
+    """Test _profile_file against a full pandas load"""
+
+    def test_matches_full_read(self, farm_csv):
+        """Counts, nulls, moments and dtypes match; quantiles are close"""
+        profile = _profile_file(farm_csv, chunk_rows=3000)
+        df = _read_dataframe(farm_csv)
+        expected = df.select_dtypes(include=['number']).describe()
+
+        assert profile["rows"] == 20000 and profile["chunks"] == 7
+        assert profile["dtypes"] == df.dtypes.astype(str).to_dict()
+        assert profile["nulls"] == df.isnull().sum().to_dict()
+        assert profile["distinct"]["crop"] == 3
+        stats = pd.DataFrame(profile["stats"])
+        for field in ("count", "mean", "std", "min", "max"):
+            np.testing.assert_allclose(stats.loc[field], expected.loc[field])
+        # Quantiles are approximate: within a few percent of a standard deviation
+        assert ((stats.loc["50%"] - expected.loc["50%"]).abs() < 0.05 * expected.loc["std"]).all()
+        assert profile["sample"][0]["crop"] == df["crop"].iloc[0]
+
+    def test_xlsx_streamed(self, tmp_path):
+        """Excel files are read row batch by row batch with the same results"""
+        path = str(tmp_path / "farm.xlsx")
+        farm_frame(300).to_excel(path, index=False)
+        csv_path = str(tmp_path / "farm.csv")
+        farm_frame(300).to_csv(csv_path, index=False)
+
+        profile = _profile_file(path, chunk_rows=100)
+        expected = _profile_file(csv_path, chunk_rows=100)
+        assert profile["chunks"] == 3
+        assert {key: profile[key] for key in ("rows", "nulls", "distinct", "stats")} == \
+            {key: expected[key] for key in ("rows", "nulls", "distinct", "stats")}
+
+    def test_memory_bounded_by_chunk(self, tmp_path):
+        """Peak memory follows the chunk size, not the file size"""
+        path = str(tmp_path / "big.csv")
+        farm_frame(200_000).to_csv(path, index=False)
+
+        def peak(fn):
+            tracemalloc.start()
+            try:
+                fn()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        streamed = peak(lambda: _profile_file(path, chunk_rows=5000))
+        loaded = peak(lambda: _read_dataframe(path).describe())
+        assert streamed < loaded / 4
+
+
+class TestCachedProfile:
+    """Test profile caching and the tool methods that use it"""
+
+    def test_summary_profiles_once(self, tool, farm_csv, monkeypatch):
+        """get_data_summary reuses the profile cached for the file's fingerprint"""
+        calls = []
+        profile_file = csv_analyzer_tool._profile_file
+        monkeypatch.setattr(csv_analyzer_tool, "_profile_file", lambda *args, **kwargs: calls.append(1) or profile_file(*args, **kwargs))
+
+        first = asyncio.run(tool.get_data_summary(farm_csv))
+        second = asyncio.run(tool.get_data_summary(farm_csv))
+
+        assert first == second and len(calls) == 1
+        assert "**Shape**: 20000 rows × 4 columns" in first
+        assert "- `yield_kg` (float64) - 400 nulls" in first and "- `crop` (category) - 0 nulls, ~3 distinct" in first
+        assert tool.redis_client.hgetall("excel:profile") == {"hits": "1", "misses": "1", "rows_streamed": "20000"}
+
+    def test_changed_file_reprofiled(self, tool, farm_csv):
+        """A new file version gets its own profile"""
+        asyncio.run(tool.get_data_summary(farm_csv))
+        with open(farm_csv, "a") as f:
+            f.write("2030-01-01 00:00:00,soy,5,900.0\n")
+        assert "**Shape**: 20001 rows" in asyncio.run(tool.get_data_summary(farm_csv))
+        assert len(tool.redis_client.keys("csv_profile:*")) == 2
+
+    def test_dashboard_and_clear(self, tool, farm_csv, make_admin):
+        """cache_dashboard shows profile reuse and clear_all_cache drops profiles"""
+        asyncio.run(tool.get_data_summary(farm_csv))
+        asyncio.run(tool.get_data_summary(farm_csv))
+        admin = make_admin(tool.redis_client)
+
+        assert "**CSV Profiles:** 1 cached · 1 reused / 1 streamed (20,000 rows read)" in asyncio.run(admin.cache_dashboard())
+        asyncio.run(admin.clear_all_cache(confirm="YES"))
+        assert tool.redis_client.keys("csv_profile:*") == [] and not tool.redis_client.exists("excel:profile")
@@ -0,0 +1,133 @@
+"""
+Excel Tests: Streaming Responses
+
+Tests streaming csv_analyzer_tool answers into the chat and timing the first token.
+
+Author: SmartFarm Team
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+
+import httpx
+
+# Add excel tools and scripts to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../tools/excel'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../scripts'))
+
+import csv_analyzer_tool
+from fake_groq_server import FakeGroqServer
+
+ANSWER = "Fake analysis: the dataset looks healthy. Average yield is stable across fields."
+
+
+@pytest.fixture
+def server():
+    """Fake Groq endpoint that streams a word every 20ms"""
+    with FakeGroqServer(latency=0, token_delay=0.02) as instance:
+        yield instance
+
+
+@pytest.fixture
+def tool(make_analyzer, server):
+    """Analyzer with fake Redis pointed at the fake Groq server"""
+    return make_analyzer(upload="crop,yield\nmaize,10\nwheat,12\n", GROQ_API_KEY="test", GROQ_API_BASE=server.url)
+
+
+def ask(tool, query="Which crop yields most?"):
+    """Run analyze_csv_file and collect its events"""
+    events = []
+
+    async def emit(event):
+        events.append(event)
+
+    output = asyncio.run(tool.analyze_csv_file(tool.file_path, query, __event_emitter__=emit))
+    return output, events
+
+
+def of_type(events, kind):
+    return [event["data"] for event in events if event["type"] == kind]
+
+
+class TestStreaming:
+    """Test relaying the Groq stream through __event_emitter__"""
+
+    def test_deltas_forwarded_then_replaced(self, tool):
+        """Chunks arrive as message events in order, then the formatted answer replaces them"""
+        output, events = ask(tool)
+
+        messages = of_type(events, "message")
+        assert len(messages) > 5
+        assert "".join(message["content"] for message in messages) == ANSWER
+        assert of_type(events, "replace") == [{"content": output}]
+        assert ANSWER in output
+
+    def test_first_token_timed_apart_from_total(self, tool):
+        """Time to first token is reported, recorded and well below the total"""
+        output, events = ask(tool)
+
+        assert any(status["description"].startswith("First token after") for status in of_type(events, "status"))
+        assert "| ⚡ First token: " in output
+        first_token = float(tool.redis_client.lrange("excel:analysis:first_token", 0, -1)[0])
+        total = float(tool.redis_client.lrange("excel:analysis:latency", 0, -1)[0])
+        assert first_token < total / 2 and total >= 0.2
+
+    def test_assembled_answer_cached(self, tool, server):
+        """The streamed answer is cached whole; a hit streams nothing"""
+        ask(tool)
+        output, events = ask(tool)
+
+        assert "Cache: HIT" in output and ANSWER in output
+        assert of_type(events, "message") == [] and server.counts["requests"] == 1
+
+    def test_streaming_disabled(self, tool):
+        """STREAM_RESPONSES=False waits for the full completion"""
+        tool.valves.STREAM_RESPONSES = False
+        output, events = ask(tool)
+
+        assert ANSWER in output and "| ⚡ First token: " in output
+        assert of_type(events, "message") == [] and of_type(events, "replace") == []
+
+    def test_empty_stream(self, tool, monkeypatch):
+        """A stream with no content deltas reports total latency as the first token"""
+        async def empty(response):
+            return
+            yield
+
+        monkeypatch.setattr(csv_analyzer_tool, "_stream_deltas", empty)
+        output, events = ask(tool)
+
+        assert "Cache: MISS" in output and "Error" not in output
+        assert of_type(events, "message") == []
+        first_token = tool.redis_client.lrange("excel:analysis:first_token", 0, -1)
+        assert first_token == tool.redis_client.lrange("excel:analysis:latency", 0, -1)
+
+    def test_interrupted_stream_not_retried(self, tool, server, monkeypatch):
+        """Once content reached the chat, a broken stream fails instead of repeating it"""
+        async def broken(response):
+            yield "Fake "
+            raise httpx.ReadError("connection reset")
+
+        monkeypatch.setattr(csv_analyzer_tool, "_stream_deltas", broken)
+        output, events = ask(tool)
+
+        assert "Groq stream interrupted after 1 chunks" in output
+        assert server.counts["requests"] == 1
+        assert tool.redis_client.keys("csv_analysis:*") == []
+
+
+class TestLatencyVisibility:
+    """Test first-token and total latency in cache_admin_tool"""
+
+    def test_dashboard_and_clear(self, tool, make_admin):
+        """cache_dashboard shows both latencies; clear_all_cache resets them"""
+        ask(tool)
+        admin = make_admin(tool.redis_client)
+
+        output = asyncio.run(admin.cache_dashboard())
+        assert "- **CSV Analysis Latency:** first token " in output and "(1 LLM answers)" in output
+
+        asyncio.run(admin.clear_all_cache(confirm="YES"))
+        assert not tool.redis_client.exists("excel:analysis:first_token", "excel:analysis:latency")
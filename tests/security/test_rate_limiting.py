@@ -364,6 +364,81 @@ class TestRedisBackend:
         # This is a safety feature to prevent service disruption
 
 
+class TestSharedRedisPool:
+    """Test the Redis backend on the shared, self-healing pool"""
+
+    @pytest.fixture
+    def pooled_limiter(self, monkeypatch):
+        """Limiter on a pool backed by a fake Redis server"""
+        fakeredis = pytest.importorskip("fakeredis")
+        import rate_limiter
+
+        server = fakeredis.FakeServer()
+        pool = rate_limiter._RedisPool(
+            "fake-redis", 6379, connection_class=fakeredis.FakeConnection,
+            async_connection_class=fakeredis.aioredis.FakeConnection, server=server
+        )
+        pool.configure(backoff_base=0, health_check_interval=0)
+        monkeypatch.setenv("REDIS_HOST", "fake-redis")
+        monkeypatch.setitem(rate_limiter._REDIS_POOLS, ("fake-redis", 6379, 0), pool)
+        return RateLimiter(backend='redis'), server
+
+    @pytest.fixture
+    def async_limiter(self, pooled_limiter):
+        """AsyncRateLimiter on the same fake Redis pool"""
+        from rate_limiter import AsyncRateLimiter
+        return AsyncRateLimiter(backend='redis'), pooled_limiter[1]
+
+    def test_pool_used_without_client(self, pooled_limiter):
+        """backend='redis' without a client uses the shared pool"""
+        limiter, server = pooled_limiter
+        for i in range(10):
+            limiter.check_limit('pooled_user', 'user')
+        with pytest.raises(RateLimitExceeded):
+            limiter.check_limit('pooled_user', 'user')
+        assert limiter.get_stats()['redis_pool']['state'] == 'up'
+
+    def test_outage_fails_open_then_recovers(self, pooled_limiter):
+        """Limits fail open while Redis is down and apply again once it returns"""
+        limiter, server = pooled_limiter
+        server.connected = False
+        assert limiter.check_limit('outage_user', 'anonymous') is True
+
+        server.connected = True
+        for i in range(5):
+            limiter.check_limit('outage_user', 'anonymous')
+        with pytest.raises(RateLimitExceeded):
+            limiter.check_limit('outage_user', 'anonymous')
+
+    def test_async_limiter_enforces_limits(self, async_limiter):
+        """AsyncRateLimiter applies the same quotas through redis.asyncio"""
+        import asyncio
+        limiter, server = async_limiter
+
+        async def run():
+            for i in range(5):
+                await limiter.check_limit('async_user', 'anonymous')
+            with pytest.raises(RateLimitExceeded):
+                await limiter.check_limit('async_user', 'anonymous')
+            remaining = await limiter.get_remaining('async_user', 'anonymous')
+            stats = await limiter.get_stats()
+            await limiter.reset('async_user')
+            return remaining, stats, await limiter.get_remaining('async_user', 'anonymous')
+
+        remaining, stats, after_reset = asyncio.run(run())
+        assert remaining['remaining'] == 0
+        assert stats['total_actions_tracked'] == 5
+        assert stats['redis_pool']['async_pools'] >= 1
+        assert after_reset['remaining'] == 5
+
+    def test_async_limiter_fails_open(self, async_limiter):
+        """AsyncRateLimiter allows requests while Redis is down"""
+        import asyncio
+        limiter, server = async_limiter
+        server.connected = False
+        assert asyncio.run(limiter.check_limit('async_outage', 'anonymous')) is True
+
+
 # Run tests
 if __name__ == '__main__':
     pytest.main([__file__, '-v', '--tb=short'])
@@ -10,10 +10,280 @@ licence: MIT
 
 import os
 import json
-from typing import Optional, Dict, List
+import asyncio
+import random
+import threading
+import time
+import weakref
+from typing import Optional, Dict, List, Any
 from datetime import datetime
 from pydantic import BaseModel, Field
 import redis
+from redis import asyncio as aioredis
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+
+
+# Pipeline stages in execution order, with display labels
+STAGES = {
+    "hash": "File hashing",
+    "cache_lookup": "Cache lookup",
+    "read": "pandas read",
+    "import": "DuckDB import",
+    "rollup": "Rollup build",
+    "schema_index": "Schema index",
+    "llm_sql": "LLM SQL generation",
+    "approx": "Approximate preview",
+    "execute": "SQL execution",
+    "render": "Markdown rendering",
+    "cache_write": "Redis write",
+}
+
+# Histogram bucket upper bounds in seconds
+STAGE_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+async def _astage_summary(redis_client) -> List[Dict[str, Any]]:
+    """Per-stage count, mean, p95 and share of total time from Redis histograms"""
+    pipe = redis_client.pipeline()
+    for stage in STAGES:
+        pipe.hgetall(f"excel:stages:{stage}")
+    return _summarize_stages(await pipe.execute())
+
+
+def _summarize_stages(hists: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Stage rows from histogram hashes given in STAGES order"""
+    summary = []
+    for stage, hist in zip(STAGES, hists):
+        count = int(hist.get("count", 0))
+        if not count:
+            continue
+
+        # p95 is the upper bound of the bucket holding the 95th percentile
+        p95 = float("inf")
+        seen = 0
+        for bound in STAGE_BUCKETS:
+            seen += int(hist.get(f"le_{bound}", 0))
+            if seen >= 0.95 * count:
+                p95 = bound
+                break
+
+        total = float(hist.get("sum", 0))
+        summary.append({"stage": stage, "label": STAGES[stage], "count": count,
+                        "total": total, "mean": total / count, "p95": p95})
+
+    grand_total = sum(row["total"] for row in summary) or 1
+    for row in summary:
+        row["share"] = row["total"] / grand_total * 100
+    return sorted(summary, key=lambda row: row["total"], reverse=True)
+
+
+class _RedisPool:
+    """
+    Shared, self-healing Redis connection pool.
+
+    - One bounded BlockingConnectionPool per server, shared by every tool
+      instance, plus a redis.asyncio pool per event loop for async callers
+    - Idle connections are health-checked before reuse, and the server is
+      pinged every `health_check_interval` seconds
+    - While Redis is unreachable client()/aclient() return None (callers run
+      uncached) and reconnects are attempted lazily with jittered exponential backoff
+    """
+
+    def __init__(self, host: str, port: int, db: int = 0, **connection_kwargs):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.max_connections = 20
+        self.pool_timeout = 2.0
+        self.socket_timeout = 2.0
+        self.health_check_interval = 5.0
+        self.backoff_base = 0.5
+        self.backoff_cap = 5.0
+
+        self.healthy = False
+        self.consecutive_failures = 0
+        self.next_attempt = 0.0
+        self.last_check = 0.0
+        self.counters = {"connects": 0, "reconnects": 0, "failures": 0}
+        self._async_connection_class = connection_kwargs.pop("async_connection_class", None)
+        self._connection_kwargs = connection_kwargs
+        self._pool = None
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> redis.asyncio client
+        self._lock = threading.Lock()
+
+    def configure(self, **settings):
+        """Apply valve settings; pool size and timeouts take effect when a pool is built"""
+        with self._lock:
+            for name, value in settings.items():
+                setattr(self, name, value)
+
+    def _pool_kwargs(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "db": self.db,
+            "max_connections": self.max_connections,
+            "timeout": self.pool_timeout,
+            "health_check_interval": self.health_check_interval,
+            "socket_connect_timeout": self.socket_timeout,
+            "socket_timeout": self.socket_timeout,
+            "decode_responses": True,
+        }
+
+    def _build(self):
+        self._pool = redis.BlockingConnectionPool(
+            retry=Retry(ExponentialBackoff(cap=0.5, base=0.05), 1),
+            **self._pool_kwargs(),
+            **self._connection_kwargs
+        )
+        self._client = redis.Redis(connection_pool=self._pool)
+
+    def _build_async(self):
+        kwargs = dict(self._connection_kwargs)
+        if self._async_connection_class:
+            kwargs["connection_class"] = self._async_connection_class
+        pool = aioredis.BlockingConnectionPool(
+            retry=AsyncRetry(ExponentialBackoff(cap=0.5, base=0.05), 1),
+            **self._pool_kwargs(),
+            **kwargs
+        )
+        return aioredis.Redis(connection_pool=pool)
+
+    def _check_due(self, now: float) -> Optional[bool]:
+        """True if the last check still holds, False while backing off, None if a check is due"""
+        if self.healthy and now - self.last_check < self.health_check_interval:
+            return True
+        if not self.healthy and now < self.next_attempt:
+            return False
+        return None
+
+    def _mark_up(self, now: float):
+        if not self.healthy:
+            self.counters["reconnects" if self.counters["connects"] else "connects"] += 1
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_check = now
+
+    def _mark_down(self, now: float, error: Exception):
+        if self.healthy or not self.consecutive_failures:
+            print(f"Warning: Redis unavailable ({error}), running without cache")
+        self.healthy = False
+        self.consecutive_failures += 1
+        self.counters["failures"] += 1
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** (self.consecutive_failures - 1))
+        self.next_attempt = now + random.uniform(delay / 2, delay)
+
+    def client(self) -> Optional[redis.Redis]:
+        """Pooled client, or None while Redis is down and the next reconnect is not due"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._check_due(now)
+            if state is not None:
+                return self._client if state else None
+
+            try:
+                if self._pool is None:
+                    self._build()
+                self._client.ping()
+            except Exception as e:
+                self._mark_down(now, e)
+                if self._pool is not None:
+                    self._pool.disconnect()  # Drop dead sockets so the next attempt dials fresh
+                return None
+
+            self._mark_up(now)
+            return self._client
+
+    async def aclient(self) -> Optional[aioredis.Redis]:
+        """Async client for the running event loop, or None while Redis is down"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            now = time.monotonic()
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = self._async_clients[loop] = self._build_async()
+            state = self._check_due(now)
+            if state is not None:
+                return client if state else None
+            # One probe at a time; concurrent callers keep the current state
+            if self.healthy:
+                self.last_check = now
+            else:
+                self.next_attempt = now + self.socket_timeout
+
+        try:
+            await client.ping()
+        except Exception as e:
+            with self._lock:
+                self._mark_down(time.monotonic(), e)
+            await client.connection_pool.disconnect()
+            return None
+
+        with self._lock:
+            self._mark_up(time.monotonic())
+        return client
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool usage and connection health"""
+        with self._lock:
+            pool = self._pool
+            created = len(getattr(pool, "_connections", [])) if pool else 0
+            idle = sum(1 for conn in pool.pool.queue if conn is not None) if pool else 0
+            return {
+                "state": "up" if self.healthy else "down",
+                "max_connections": self.max_connections,
+                "created": created,
+                "in_use": created - idle,
+                "idle": idle,
+                "async_pools": len(self._async_clients),
+                "retry_in": max(0.0, self.next_attempt - time.monotonic()) if not self.healthy else 0.0,
+                **self.counters,
+            }
+
+
+_REDIS_POOLS: Dict[tuple, _RedisPool] = {}
+_REDIS_POOLS_LOCK = threading.Lock()
+
+
+def _get_redis_pool(host: str, port: int, db: int = 0, **settings) -> _RedisPool:
+    """Process-wide Redis pool per server, shared by every tool instance"""
+    with _REDIS_POOLS_LOCK:
+        pool = _REDIS_POOLS.setdefault((host, port, db), _RedisPool(host, port, db))
+    pool.configure(**settings)
+    return pool
+
+
+class _AwaitablePipeline:
+    """Pipeline of a synchronous client with an awaitable execute()"""
+
+    def __init__(self, pipe):
+        self._pipe = pipe
+
+    def __getattr__(self, name):
+        return getattr(self._pipe, name)
+
+    async def execute(self):
+        return self._pipe.execute()
+
+
+class _AwaitableRedis:
+    """Awaitable view of a synchronous client, so pinned clients (scripts, tests) work on the async path"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def pipeline(self, *args, **kwargs):
+        return _AwaitablePipeline(self._client.pipeline(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
 
 
 class Tools:
@@ -21,28 +291,55 @@ class Tools:
         self.valves = self.Valves()
         self.citation = False
 
-        # Initialize Redis connection
-        self.redis_client = None
-        try:
-            redis_host = os.getenv("REDIS_HOST", "redis")
-            redis_port = int(os.getenv("REDIS_PORT", 6379))
-            self.redis_client = redis.Redis(
-                host=redis_host,
-                port=redis_port,
-                decode_responses=True,
-                socket_connect_timeout=2,
-                socket_timeout=2
-            )
-            self.redis_client.ping()
-        except Exception as e:
-            print(f"Warning: Redis unavailable ({e})")
-            self.redis_client = None
+        # Redis comes from the shared pool (reconnects on its own after an outage)
+        self._redis_client = None
+        self.redis_client  # Connect eagerly so an unreachable Redis is reported at startup
+
+    @property
+    def redis_client(self) -> Optional[redis.Redis]:
+        """Pooled Redis client, or None while Redis is unreachable"""
+        if getattr(self, "_redis_client", None) is not None:
+            return self._redis_client
+        return self._redis_pool().client()
+
+    @redis_client.setter
+    def redis_client(self, client):
+        """Pin an explicit client (scripts and tests) instead of the shared pool"""
+        self._redis_client = client
+
+    async def _aredis(self):
+        """redis.asyncio client for the running loop, or None while Redis is unreachable"""
+        if getattr(self, "_redis_client", None) is not None:
+            return _AwaitableRedis(self._redis_client)
+        return await self._redis_pool().aclient()
 
     class Valves(BaseModel):
         ADMIN_ONLY: bool = Field(
             default=True,
             description="Restrict tool to admin users only"
         )
+        REDIS_MAX_CONNECTIONS: int = Field(
+            default=20,
+            description="Connections in the shared Redis pool (callers wait when all are busy)"
+        )
+        REDIS_HEALTH_CHECK_INTERVAL: float = Field(
+            default=5.0,
+            description="Seconds between Redis health checks on the shared pool"
+        )
+        REDIS_RECONNECT_BACKOFF_MAX: float = Field(
+            default=5.0,
+            description="Maximum seconds between reconnect attempts while Redis is down"
+        )
+
+    def _redis_pool(self) -> _RedisPool:
+        """Shared Redis pool for the configured server"""
+        return _get_redis_pool(
+            os.getenv("REDIS_HOST", "redis"),
+            int(os.getenv("REDIS_PORT", 6379)),
+            max_connections=self.valves.REDIS_MAX_CONNECTIONS,
+            health_check_interval=self.valves.REDIS_HEALTH_CHECK_INTERVAL,
+            backoff_cap=self.valves.REDIS_RECONNECT_BACKOFF_MAX
+        )
 
     async def cache_dashboard(
         self,
@@ -55,49 +352,123 @@ class Tools:
         :return: Formatted dashboard with cache statistics
         """
 
-        if not self.redis_client:
+        client = await self._aredis()
+        if not client:
             return "❌ Redis is not available."
 
         try:
             # Get all metrics
-            total = int(self.redis_client.get("excel:queries:total") or 0)
-            hits = int(self.redis_client.get("excel:queries:cache_hit") or 0)
-            misses = int(self.redis_client.get("excel:queries:cache_miss") or 0)
-            errors = int(self.redis_client.get("excel:queries:error") or 0)
+            total = int(await client.get("excel:queries:total") or 0)
+            hits = int(await client.get("excel:queries:cache_hit") or 0)
+            misses = int(await client.get("excel:queries:cache_miss") or 0)
+            errors = int(await client.get("excel:queries:error") or 0)
+            stale_hits = int(await client.get("excel:queries:cache_stale") or 0)
+            negative_hits = int(await client.get("excel:queries:negative_hit") or 0)
+            negative_entries = len(await client.keys("sql_cache_neg:*"))
+            templates = await client.hgetall("excel:templates")
+            template_hits = int(templates.get("hits", 0))
+            template_lookups = template_hits + int(templates.get("misses", 0))
+            template_rate = (template_hits / template_lookups * 100) if template_lookups else 0
 
             hit_rate = (hits / total * 100) if total > 0 else 0
 
             # Response times
-            response_times = [float(t) for t in self.redis_client.lrange("excel:response_times", 0, -1)]
+            response_times = [float(t) for t in await client.lrange("excel:response_times", 0, -1)]
             avg_response = sum(response_times) / len(response_times) if response_times else 0
             min_response = min(response_times) if response_times else 0
             max_response = max(response_times) if response_times else 0
 
             # Cache info
-            cache_keys = self.redis_client.keys("sql_cache:*")
+            cache_keys = await client.keys("sql_cache:*")
             cache_size = len(cache_keys)
+            stored_results = len(await client.keys("sql_result:*"))
+            sharing = await client.hgetall("excel:results")
+            results_written = int(sharing.get("stored", 0))
+            results_shared = int(sharing.get("shared", 0))
+            dedupe_ratio = (results_written + results_shared) / results_written if results_written else 0
+            saved_kb = int(sharing.get("bytes_saved", 0)) / 1024
+            analysis = await client.hgetall("excel:analysis")
+            analysis_entries = len(await client.keys("csv_analysis:*"))
+            analysis_hits = int(analysis.get("hits", 0))
+            analysis_lookups = analysis_hits + int(analysis.get("misses", 0))
+            analysis_rate = (analysis_hits / analysis_lookups * 100) if analysis_lookups else 0
+            analysis_saved = float(analysis.get("saved_seconds", 0))
+            profiles = await client.hgetall("excel:profile")
+            profile_entries = len(await client.keys("csv_profile:*"))
+            profile_hits = int(profiles.get("hits", 0))
+            profile_misses = int(profiles.get("misses", 0))
+            rows_streamed = int(profiles.get("rows_streamed", 0))
+            first_tokens = sorted(float(t) for t in await client.lrange("excel:analysis:first_token", 0, -1))
+            latencies = sorted(float(t) for t in await client.lrange("excel:analysis:latency", 0, -1))
+            if latencies:
+                analysis_latency = (
+                    f"first token {sum(first_tokens) / len(first_tokens):.2f}s mean / "
+                    f"{first_tokens[int(0.95 * (len(first_tokens) - 1))]:.2f}s p95 · "
+                    f"full answer {sum(latencies) / len(latencies):.2f}s mean / "
+                    f"{latencies[int(0.95 * (len(latencies) - 1))]:.2f}s p95 ({len(latencies)} LLM answers)"
+                )
+            else:
+                analysis_latency = "no LLM answers recorded yet"
 
             # Redis info
-            info = self.redis_client.info("memory")
+            info = await client.info("memory")
             used_memory_mb = info.get("used_memory", 0) / 1024 / 1024
             max_memory_mb = info.get("maxmemory", 256 * 1024 * 1024) / 1024 / 1024
             memory_pct = (used_memory_mb / max_memory_mb * 100) if max_memory_mb > 0 else 0
 
-            stats_info = self.redis_client.info("stats")
+            stats_info = await client.info("stats")
             evicted_keys = stats_info.get("evicted_keys", 0)
+            cost_evicted = int(await client.get("excel:cache:evicted") or 0)
 
             # Server info
-            server_info = self.redis_client.info("server")
+            server_info = await client.info("server")
             redis_version = server_info.get("redis_version", "unknown")
             uptime_days = server_info.get("uptime_in_days", 0)
+            pool = self._redis_pool().stats()
 
             # Last query
-            last_query = self.redis_client.get("excel:last_query")
+            last_query = await client.get("excel:last_query")
             if last_query:
                 last_query_str = datetime.fromtimestamp(int(last_query)).strftime("%Y-%m-%d %H:%M:%S")
             else:
                 last_query_str = "Never"
 
+            # Pipeline stage breakdown
+            stages = await _astage_summary(client)
+            if stages:
+                stage_rows = "\n".join(
+                    f"| {row['label']} | {row['count']} | {row['mean'] * 1000:.0f}ms | ≤ {row['p95'] * 1000:.0f}ms | {row['share']:.1f}% |"
+                    for row in stages
+                )
+                stage_section = f"""**Top Stage by Cost:** {stages[0]['label']} ({stages[0]['share']:.0f}% of pipeline time)
+
+| Stage | Samples | Mean | p95 | Share |
+|-------|---------|------|-----|-------|
+{stage_rows}"""
+            else:
+                stage_section = "No stage timings recorded yet."
+
+            # Most recent test_cache_performance run
+            benchmark = await client.get("excel:benchmark:last")
+            if benchmark:
+                run = json.loads(benchmark)
+                run_at = datetime.fromtimestamp(run["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+                bench_rows = "\n".join(
+                    f"| {name} | {stats['n']} | {stats['mean'] * 1000:.1f}ms ± {stats['ci95'] * 1000:.1f}ms | {stats['p95'] * 1000:.1f}ms |"
+                    for name, stats in (("Miss (cold)", run["miss"]), ("Hit (1 user)", run["hit"]),
+                                        (f"Hit ({run['curve'][-1]['users']} users)", run["hit_loaded"]))
+                    if stats["n"]
+                )
+                benchmark_section = f"""**Run:** {run_at} · `{run['file']}` · up to {run['concurrency']} virtual users
+
+| Path | Samples | Mean ± 95% CI | p95 |
+|------|---------|---------------|-----|
+{bench_rows}
+
+**Peak Throughput:** {run['peak_throughput']:.1f} req/s at {run['peak_users']} user(s) · **Speedup:** {run['speedup']:.1f}x"""
+            else:
+                benchmark_section = "No benchmark run yet. Run `test_cache_performance()` in the Excel analyzer."
+
             # Performance indicator
             if hit_rate >= 90:
                 perf_indicator = "🟢 EXCELLENT"
@@ -122,8 +493,11 @@ class Tools:
 |--------|-------|------------|
 | Total Queries | {total} | 100% |
 | Cache Hits | {hits} | {(hits/total*100) if total > 0 else 0:.1f}% |
+| Stale Hits (refreshed in background) | {stale_hits} | {(stale_hits/total*100) if total > 0 else 0:.1f}% |
 | Cache Misses | {misses} | {(misses/total*100) if total > 0 else 0:.1f}% |
 | Errors | {errors} | {(errors/total*100) if total > 0 else 0:.1f}% |
+| Failures Served from Negative Cache | {negative_hits} | {(negative_hits/total*100) if total > 0 else 0:.1f}% |
+| SQL Template Hits (LLM skipped on a miss) | {template_hits} | {template_rate:.1f}% of SQL generations |
 
 ---
 
@@ -135,10 +509,26 @@ class Tools:
 
 ---
 
+## ⏱️ Pipeline Stages
+{stage_section}
+
+---
+
+## 🧪 Last Benchmark
+{benchmark_section}
+
+---
+
 ## 💾 Cache Status
 - **Cached Queries:** {cache_size} entries
+- **Shared Results:** {stored_results} stored · **Dedupe Ratio:** {dedupe_ratio:.2f}x ({results_shared} of {results_written + results_shared} writes reused an identical SQL result, {saved_kb:.1f} KB not duplicated)
+- **CSV Analyses:** {analysis_entries} cached · {analysis_hits} hits / {analysis_lookups - analysis_hits} misses ({analysis_rate:.1f}% hit rate, {analysis_saved:.1f}s of LLM time saved)
+- **CSV Analysis Latency:** {analysis_latency}
+- **CSV Profiles:** {profile_entries} cached · {profile_hits} reused / {profile_misses} streamed ({rows_streamed:,} rows read)
+- **Cached Failures:** {negative_entries} entries (short TTL)
 - **Memory Used:** {used_memory_mb:.2f} MB / {max_memory_mb:.0f} MB ({memory_pct:.1f}%)
 - **Evicted Keys:** {evicted_keys} (LRU evictions)
+- **Cost-Aware Evictions:** {cost_evicted} (low-value entries swept first)
 - **Eviction Policy:** allkeys-lru
 
 ---
@@ -146,6 +536,7 @@ class Tools:
 ## 🔧 Redis Server
 - **Version:** {redis_version}
 - **Uptime:** {uptime_days} days
+- **Connection Pool:** {pool['in_use']} in use, {pool['idle']} idle / {pool['max_connections']} max ({pool['reconnects']} reconnects)
 - **Last Query:** {last_query_str}
 
 ---
@@ -167,6 +558,8 @@ class Tools:
 
             if avg_response > 5:
                 recommendations.append("⚠️ **Slow responses:** Check network latency and API performance")
+                if stages:
+                    recommendations.append(f"🔍 **Slowest stage:** {stages[0]['label']} - start optimizing there")
 
             if not recommendations:
                 recommendations.append("✅ **All systems optimal!** Cache is performing well.")
@@ -185,8 +578,11 @@ class Tools:
 |--------|-------|------------|
 | Total Queries | {total} | 100% |
 | Cache Hits | {hits} | {(hits/total*100) if total > 0 else 0:.1f}% |
+| Stale Hits (refreshed in background) | {stale_hits} | {(stale_hits/total*100) if total > 0 else 0:.1f}% |
 | Cache Misses | {misses} | {(misses/total*100) if total > 0 else 0:.1f}% |
 | Errors | {errors} | {(errors/total*100) if total > 0 else 0:.1f}% |
+| Failures Served from Negative Cache | {negative_hits} | {(negative_hits/total*100) if total > 0 else 0:.1f}% |
+| SQL Template Hits (LLM skipped on a miss) | {template_hits} | {template_rate:.1f}% of SQL generations |
 
 ---
 
@@ -198,10 +594,26 @@ class Tools:
 
 ---
 
+## ⏱️ Pipeline Stages
+{stage_section}
+
+---
+
+## 🧪 Last Benchmark
+{benchmark_section}
+
+---
+
 ## 💾 Cache Status
 - **Cached Queries:** {cache_size} entries
+- **Shared Results:** {stored_results} stored · **Dedupe Ratio:** {dedupe_ratio:.2f}x ({results_shared} of {results_written + results_shared} writes reused an identical SQL result, {saved_kb:.1f} KB not duplicated)
+- **CSV Analyses:** {analysis_entries} cached · {analysis_hits} hits / {analysis_lookups - analysis_hits} misses ({analysis_rate:.1f}% hit rate, {analysis_saved:.1f}s of LLM time saved)
+- **CSV Analysis Latency:** {analysis_latency}
+- **CSV Profiles:** {profile_entries} cached · {profile_hits} reused / {profile_misses} streamed ({rows_streamed:,} rows read)
+- **Cached Failures:** {negative_entries} entries (short TTL)
 - **Memory Used:** {used_memory_mb:.2f} MB / {max_memory_mb:.0f} MB ({memory_pct:.1f}%)
 - **Evicted Keys:** {evicted_keys} (LRU evictions)
+- **Cost-Aware Evictions:** {cost_evicted} (low-value entries swept first)
 - **Eviction Policy:** allkeys-lru
 
 ---
@@ -209,6 +621,7 @@ class Tools:
 ## 🔧 Redis Server
 - **Version:** {redis_version}
 - **Uptime:** {uptime_days} days
+- **Connection Pool:** {pool['in_use']} in use, {pool['idle']} idle / {pool['max_connections']} max ({pool['reconnects']} reconnects)
 - **Last Query:** {last_query_str}
 
 ---
@@ -235,34 +648,48 @@ class Tools:
         __event_emitter__=None,
     ) -> str:
         """
-        List all cached queries with their details.
+        List cached queries, hottest first.
 
         :param limit: Maximum number of queries to display (default: 20)
-        :return: List of cached queries
+        :return: List of cached queries ranked by lookup count
         """
 
-        if not self.redis_client:
+        client = await self._aredis()
+        if not client:
             return "❌ Redis is not available."
 
         try:
-            cache_keys = self.redis_client.keys("sql_cache:*")
+            cache_keys = await client.keys("sql_cache:*")
 
             if not cache_keys:
                 return "📭 No cached queries found."
 
             output = f"# 📋 Cached Queries ({len(cache_keys)} total)\n\n"
 
-            # Sort keys by TTL (remaining time)
-            key_info = []
-            for key in cache_keys[:limit]:
-                ttl = self.redis_client.ttl(key)
-                data = json.loads(self.redis_client.get(key))
-                key_info.append((key, ttl, data))
-
-            # Sort by TTL descending (most time remaining first)
-            key_info.sort(key=lambda x: x[1], reverse=True)
-
-            for i, (key, ttl, data) in enumerate(key_info, 1):
+            # Rank every entry by lookups, then TTL, before loading the top ones
+            pipe = client.pipeline()
+            for key in cache_keys:
+                pipe.zscore("excel:cache:hot", key)
+                pipe.ttl(key)
+            ranks = await pipe.execute()
+            ranked = sorted(
+                zip(cache_keys, ranks[::2], ranks[1::2]),
+                key=lambda x: (x[1] or 0, x[2]),
+                reverse=True
+            )[:limit]
+
+            pipe = client.pipeline()
+            for key, _, _ in ranked:
+                pipe.get(key)
+            payloads = await pipe.execute()
+
+            key_info = [
+                (key, int(lookups or 0), ttl, json.loads(payload))
+                for (key, lookups, ttl), payload in zip(ranked, payloads)
+                if payload
+            ]
+
+            for i, (key, lookups, ttl, data) in enumerate(key_info, 1):
                 sql_query = data.get("sql_query", "N/A")[:100]  # Truncate long queries
                 row_count = data.get("row_count", 0)
                 table_name = data.get("table_name", "unknown")
@@ -271,7 +698,8 @@ class Tools:
                 ttl_sec = ttl % 60
 
                 output += f"""
-## {i}. Query: `{key[-8:]...}`
+## {i}. Query: `...{key[-8:]}`
+- **Lookups:** {lookups}
 - **Table:** {table_name}
 - **SQL:** `{sql_query}...`
 - **Rows:** {row_count}
@@ -308,30 +736,57 @@ To confirm, call this function again with:
 `clear_all_cache(confirm="YES")`
 """
 
-        if not self.redis_client:
+        client = await self._aredis()
+        if not client:
             return "❌ Redis is not available."
 
         try:
             # Get count before clearing
-            cache_keys = self.redis_client.keys("sql_cache:*")
+            cache_keys = await client.keys("sql_cache:*")
             count = len(cache_keys)
 
             # Clear cache
             if cache_keys:
-                self.redis_client.delete(*cache_keys)
+                await client.delete(*cache_keys)
+            result_keys = await client.keys("sql_result:*")
+            if result_keys:
+                await client.delete(*result_keys)
+            analysis_keys = await client.keys("csv_analysis:*") + await client.keys("csv_profile:*")
+            if analysis_keys:
+                await client.delete(*analysis_keys)
 
             # Reset metrics
-            self.redis_client.delete("excel:queries:total")
-            self.redis_client.delete("excel:queries:cache_hit")
-            self.redis_client.delete("excel:queries:cache_miss")
-            self.redis_client.delete("excel:queries:error")
-            self.redis_client.delete("excel:response_times")
-            self.redis_client.delete("excel:last_query")
+            await client.delete("excel:queries:total")
+            await client.delete("excel:queries:cache_hit")
+            await client.delete("excel:queries:cache_miss")
+            await client.delete("excel:queries:error")
+            await client.delete("excel:queries:cache_stale")
+            await client.delete("excel:queries:cache_refresh")
+            await client.delete("excel:queries:negative_hit")
+            negative_keys = await client.keys("sql_cache_neg:*")
+            if negative_keys:
+                await client.delete(*negative_keys)
+            await client.delete("excel:response_times")
+            await client.delete(*[f"excel:stages:{stage}" for stage in STAGES])
+            await client.delete("excel:last_query")
+            await client.delete(
+                "excel:cache:cost", "excel:cache:size", "excel:cache:hits",
+                "excel:cache:priority", "excel:cache:inflation", "excel:cache:evicted",
+                "excel:cache:hot", "excel:queries:hot_tier_hit", "excel:cache:result", "excel:cache:template", "excel:results"
+            )
+            await client.delete("excel:duckdb", "excel:duckdb:peak", "excel:rollups", "excel:parquet", "excel:schema", "excel:pipeline", "excel:parse")
+            await client.delete(
+                "excel:analysis", "excel:analysis:hits", "excel:analysis:accessed", "excel:profile",
+                "excel:analysis:first_token", "excel:analysis:latency"
+            )
+            template_keys = await client.keys("excel:sqltpl:*")
+            await client.delete("excel:templates", *template_keys)
 
             return f"""
 ✅ **Cache cleared successfully!**
 
 - Deleted {count} cached queries
+- Deleted {len(analysis_keys)} cached CSV analyses and profiles
 - Reset all metrics
 - Cache is now empty
 
@@ -354,15 +809,16 @@ Next queries will be cache misses and will rebuild the cache.
         :return: TTL information and instructions
         """
 
-        if not self.redis_client:
+        client = await self._aredis()
+        if not client:
             return "❌ Redis is not available."
 
         # Get current TTL from a sample key
-        cache_keys = self.redis_client.keys("sql_cache:*")
+        cache_keys = await client.keys("sql_cache:*")
         current_ttl = "N/A"
 
         if cache_keys:
-            sample_ttl = self.redis_client.ttl(cache_keys[0])
+            sample_ttl = await client.ttl(cache_keys[0])
             current_ttl = f"{sample_ttl}s ({sample_ttl // 60}m)"
 
         return f"""
@@ -407,12 +863,15 @@ Next queries will be cache misses and will rebuild the cache.
         :return: Health check report
         """
 
-        if not self.redis_client:
-            return """
+        client = await self._aredis()
+        if not client:
+            pool = self._redis_pool().stats()
+            return f"""
 ❌ **Redis Health Check: FAILED**
 
 **Status:** Connection failed
 **Issue:** Redis server is not reachable
+**Reconnect:** automatic, next attempt in {pool['retry_in']:.1f}s ({pool['failures']} failed checks)
 
 **Troubleshooting:**
 1. Check if Redis container is running: `docker ps | grep redis`
@@ -427,7 +886,7 @@ Next queries will be cache misses and will rebuild the cache.
 
             # 1. Ping test
             try:
-                self.redis_client.ping()
+                await client.ping()
                 tests.append(("Connection", "✅ OK", "Successfully connected to Redis"))
             except Exception as e:
                 tests.append(("Connection", "❌ FAILED", str(e)))
@@ -435,14 +894,14 @@ Next queries will be cache misses and will rebuild the cache.
             # 2. Write test
             try:
                 test_key = "health_check_test"
-                self.redis_client.set(test_key, "test", ex=10)
+                await client.set(test_key, "test", ex=10)
                 tests.append(("Write", "✅ OK", "Can write to Redis"))
             except Exception as e:
                 tests.append(("Write", "❌ FAILED", str(e)))
 
             # 3. Read test
             try:
-                value = self.redis_client.get(test_key)
+                value = await client.get(test_key)
                 if value == "test":
                     tests.append(("Read", "✅ OK", "Can read from Redis"))
                 else:
@@ -452,14 +911,14 @@ Next queries will be cache misses and will rebuild the cache.
 
             # 4. Delete test
             try:
-                self.redis_client.delete(test_key)
+                await client.delete(test_key)
                 tests.append(("Delete", "✅ OK", "Can delete from Redis"))
             except Exception as e:
                 tests.append(("Delete", "❌ FAILED", str(e)))
 
             # 5. Memory check
             try:
-                info = self.redis_client.info("memory")
+                info = await client.info("memory")
                 used_mb = info.get("used_memory", 0) / 1024 / 1024
                 max_mb = info.get("maxmemory", 0) / 1024 / 1024
                 if max_mb > 0:
@@ -475,7 +934,7 @@ Next queries will be cache misses and will rebuild the cache.
 
             # 6. Persistence check
             try:
-                info = self.redis_client.info("persistence")
+                info = await client.info("persistence")
                 rdb_last_save = info.get("rdb_last_save_time", 0)
                 if rdb_last_save > 0:
                     last_save = datetime.fromtimestamp(rdb_last_save).strftime("%Y-%m-%d %H:%M:%S")
@@ -485,6 +944,15 @@ Next queries will be cache misses and will rebuild the cache.
             except Exception as e:
                 tests.append(("Persistence", "❌ FAILED", str(e)))
 
+            # 7. Connection pool usage
+            pool = self._redis_pool().stats()
+            pool_details = (f"{pool['in_use']} in use, {pool['idle']} idle / {pool['max_connections']} max, "
+                            f"{pool['reconnects']} reconnects")
+            if pool['in_use'] >= pool['max_connections']:
+                tests.append(("Pool", "⚠️ WARNING", f"Exhausted: {pool_details}"))
+            else:
+                tests.append(("Pool", "✅ OK", pool_details))
+
             # Format results
             output = "# 🏥 Redis Health Check\n\n"
 
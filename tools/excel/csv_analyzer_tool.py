@@ -3,17 +3,883 @@ title: CSV/Excel Analyzer for SmartFarm
 author: SmartFarm Team
 description: Analyze CSV and Excel files using pandas and natural language queries with Groq API
 required_open_webui_version: 0.5.0
-requirements: pandas, openpyxl, requests
+requirements: pandas, openpyxl, httpx, redis
 version: 1.0.0
 licence: MIT
 """
 
+import numpy as np
 import pandas as pd
+import asyncio
+import functools
+import hashlib
+import importlib.util
+import itertools
 import json
 import os
-from typing import Optional, Dict, Any
+import time
+import random
+import threading
+import warnings
+import weakref
+from collections import deque
+from typing import Optional, Dict, Any, AsyncIterator, Callable, Awaitable, Iterator, List, Tuple
 from pydantic import BaseModel, Field
-import requests
+import httpx
+import redis
+from redis import asyncio as aioredis
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+
+
+class LLMUnavailable(Exception):
+    """Raised when the LLM gateway fails fast (circuit open or no free slot)"""
+    pass
+
+
+class _LLMHTTPError(Exception):
+    """Non-200 response from a Groq-compatible endpoint"""
+
+    def __init__(self, status_code: int, text: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status_code} - {text}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _is_retryable(error: Exception) -> bool:
+    """429, 5xx, timeouts and connection failures are worth retrying"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(error).__name__
+    return (
+        isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError))
+        or "Timeout" in name
+        or "Connection" in name
+    )
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Server-requested delay from a Retry-After header, if any"""
+    if getattr(error, "retry_after", None) is not None:
+        return error.retry_after
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class _LLMGateway:
+    """
+    Shared gate in front of Groq calls.
+
+    - AIMD adaptive concurrency: the in-flight limit grows by ~1 per window
+      of successes and halves on overload (429/5xx/timeouts/slow calls)
+    - Retries with full-jitter exponential backoff, honouring Retry-After
+    - Circuit breaker: after consecutive failures calls fail fast until a
+      half-open trial call succeeds
+    """
+
+    def __init__(self):
+        self.max_concurrency = 8
+        self.min_concurrency = 1
+        self.max_retries = 3
+        self.backoff_base = 0.5
+        self.backoff_cap = 8.0
+        self.slow_call_seconds = 10.0
+        self.acquire_timeout = 10.0
+        self.failure_threshold = 5
+        self.reset_timeout = 30.0
+
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.counters = {"calls": 0, "retries": 0, "rejected": 0, "failures": 0, "trips": 0}
+        self._cond = threading.Condition()
+        # Async waiters for a slot: (loop, future) pairs woken from whichever thread frees one
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def configure(self, **settings):
+        """Apply valve settings (called on every use so valve edits take effect)"""
+        with self._cond:
+            for name, value in settings.items():
+                setattr(self, name, value)
+            self.limit = min(max(self.limit, self.min_concurrency), self.max_concurrency)
+            self._notify()
+
+    def _notify(self):
+        """Wake sync and async slot waiters (caller holds _cond)"""
+        self._cond.notify_all()
+        for loop, waiter in self._waiters:
+            try:
+                loop.call_soon_threadsafe(_wake_waiter, waiter)
+            except RuntimeError:
+                pass  # Loop already closed
+
+    def _check_breaker(self):
+        """Fail fast while open; let a single trial call through when half-open.
+
+        The caller holds _cond and takes its slot in the same critical
+        section, so concurrent callers cannot all pass as the trial.
+        """
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.counters["rejected"] += 1
+                raise LLMUnavailable("LLM circuit breaker is open; Groq is failing, try again shortly")
+            self.state = "half_open"
+        if self.state == "half_open" and self.in_flight > 0:
+            self.counters["rejected"] += 1
+            raise LLMUnavailable("LLM circuit breaker is half-open; a trial call is in progress")
+
+    def _acquire(self):
+        with self._cond:
+            deadline = time.monotonic() + self.acquire_timeout
+            self._check_breaker()
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["rejected"] += 1
+                    raise LLMUnavailable(f"LLM concurrency limit reached ({int(self.limit)} in flight)")
+                self._cond.wait(remaining)
+                self._check_breaker()
+            self.in_flight += 1
+            self.counters["calls"] += 1
+
+    async def _aacquire(self):
+        """Async _acquire(): waits on a future, so a cancelled waiter never holds a slot"""
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                self._check_breaker()
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    self.counters["calls"] += 1
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["rejected"] += 1
+                    raise LLMUnavailable(f"LLM concurrency limit reached ({int(self.limit)} in flight)")
+                entry = (loop, loop.create_future())
+                self._waiters.append(entry)
+            try:
+                await asyncio.wait_for(entry[1], remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self._waiters.remove(entry)
+
+    def _release(self, ok: bool, overloaded: bool, latency: float):
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded or latency > self.slow_call_seconds:
+                # Multiplicative decrease
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            elif ok:
+                # Additive increase: +1 per `limit` successes
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            if ok:
+                self.consecutive_failures = 0
+                self.state = "closed"
+            elif overloaded:
+                self.consecutive_failures += 1
+                self.counters["failures"] += 1
+                if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                    if self.state != "open":
+                        self.counters["trips"] += 1
+                    self.state = "open"
+                    self.opened_at = time.monotonic()
+            self._notify()
+
+    def _failed(self, error: Exception, attempt: int, start: float) -> float:
+        """Release a failed call's slot; returns the backoff before the next attempt, or raises"""
+        retryable = _is_retryable(error)
+        self._release(ok=False, overloaded=retryable, latency=time.monotonic() - start)
+        if not retryable or attempt == self.max_retries:
+            raise error
+        self.counters["retries"] += 1
+        delay = _retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        return min(delay, self.backoff_cap)
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        """Run fn under the gateway's breaker, concurrency limit and retry policy"""
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                time.sleep(self._failed(e, attempt, start))
+                continue
+            self._release(ok=True, overloaded=False, latency=time.monotonic() - start)
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async call(): awaits fn, and waits for a slot or a backoff without blocking the event loop"""
+        for attempt in range(self.max_retries + 1):
+            await self._aacquire()
+            start = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                await asyncio.sleep(self._failed(e, attempt, start))
+                continue
+            except BaseException:
+                # Cancelled (client disconnect, timeout): free the slot without counting a failure
+                self._release(ok=False, overloaded=False, latency=time.monotonic() - start)
+                raise
+            self._release(ok=True, overloaded=False, latency=time.monotonic() - start)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of breaker state, concurrency and counters"""
+        with self._cond:
+            return {
+                "state": self.state,
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                **self.counters,
+            }
+
+
+def _wake_waiter(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_GATEWAYS: Dict[str, _LLMGateway] = {}
+_GATEWAYS_LOCK = threading.Lock()
+
+
+def _get_gateway(api_base: str, **settings) -> _LLMGateway:
+    """Process-wide gateway per LLM endpoint, shared by every tool instance"""
+    with _GATEWAYS_LOCK:
+        gateway = _GATEWAYS.setdefault(api_base, _LLMGateway())
+    gateway.configure(**settings)
+    return gateway
+
+
+class _RedisPool:
+    """
+    Shared, self-healing Redis connection pool.
+
+    - One bounded BlockingConnectionPool per server, shared by every tool
+      instance, plus a redis.asyncio pool per event loop for async callers
+    - Idle connections are health-checked before reuse, and the server is
+      pinged every `health_check_interval` seconds
+    - While Redis is unreachable client()/aclient() return None (callers run
+      uncached) and reconnects are attempted lazily with jittered exponential backoff
+    """
+
+    def __init__(self, host: str, port: int, db: int = 0, **connection_kwargs):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.max_connections = 20
+        self.pool_timeout = 2.0
+        self.socket_timeout = 2.0
+        self.health_check_interval = 5.0
+        self.backoff_base = 0.5
+        self.backoff_cap = 5.0
+
+        self.healthy = False
+        self.consecutive_failures = 0
+        self.next_attempt = 0.0
+        self.last_check = 0.0
+        self.counters = {"connects": 0, "reconnects": 0, "failures": 0}
+        self._async_connection_class = connection_kwargs.pop("async_connection_class", None)
+        self._connection_kwargs = connection_kwargs
+        self._pool = None
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> redis.asyncio client
+        self._lock = threading.Lock()
+
+    def configure(self, **settings):
+        """Apply valve settings; pool size and timeouts take effect when a pool is built"""
+        with self._lock:
+            for name, value in settings.items():
+                setattr(self, name, value)
+
+    def _pool_kwargs(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "db": self.db,
+            "max_connections": self.max_connections,
+            "timeout": self.pool_timeout,
+            "health_check_interval": self.health_check_interval,
+            "socket_connect_timeout": self.socket_timeout,
+            "socket_timeout": self.socket_timeout,
+            "decode_responses": True,
+        }
+
+    def _build(self):
+        self._pool = redis.BlockingConnectionPool(
+            retry=Retry(ExponentialBackoff(cap=0.5, base=0.05), 1),
+            **self._pool_kwargs(),
+            **self._connection_kwargs
+        )
+        self._client = redis.Redis(connection_pool=self._pool)
+
+    def _build_async(self):
+        kwargs = dict(self._connection_kwargs)
+        if self._async_connection_class:
+            kwargs["connection_class"] = self._async_connection_class
+        pool = aioredis.BlockingConnectionPool(
+            retry=AsyncRetry(ExponentialBackoff(cap=0.5, base=0.05), 1),
+            **self._pool_kwargs(),
+            **kwargs
+        )
+        return aioredis.Redis(connection_pool=pool)
+
+    def _check_due(self, now: float) -> Optional[bool]:
+        """True if the last check still holds, False while backing off, None if a check is due"""
+        if self.healthy and now - self.last_check < self.health_check_interval:
+            return True
+        if not self.healthy and now < self.next_attempt:
+            return False
+        return None
+
+    def _mark_up(self, now: float):
+        if not self.healthy:
+            self.counters["reconnects" if self.counters["connects"] else "connects"] += 1
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_check = now
+
+    def _mark_down(self, now: float, error: Exception):
+        if self.healthy or not self.consecutive_failures:
+            print(f"Warning: Redis unavailable ({error}), running without cache")
+        self.healthy = False
+        self.consecutive_failures += 1
+        self.counters["failures"] += 1
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** (self.consecutive_failures - 1))
+        self.next_attempt = now + random.uniform(delay / 2, delay)
+
+    def client(self) -> Optional[redis.Redis]:
+        """Pooled client, or None while Redis is down and the next reconnect is not due"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._check_due(now)
+            if state is not None:
+                return self._client if state else None
+
+            try:
+                if self._pool is None:
+                    self._build()
+                self._client.ping()
+            except Exception as e:
+                self._mark_down(now, e)
+                if self._pool is not None:
+                    self._pool.disconnect()  # Drop dead sockets so the next attempt dials fresh
+                return None
+
+            self._mark_up(now)
+            return self._client
+
+    async def aclient(self) -> Optional[aioredis.Redis]:
+        """Async client for the running event loop, or None while Redis is down"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            now = time.monotonic()
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = self._async_clients[loop] = self._build_async()
+            state = self._check_due(now)
+            if state is not None:
+                return client if state else None
+            # One probe at a time; concurrent callers keep the current state
+            if self.healthy:
+                self.last_check = now
+            else:
+                self.next_attempt = now + self.socket_timeout
+
+        try:
+            await client.ping()
+        except Exception as e:
+            with self._lock:
+                self._mark_down(time.monotonic(), e)
+            await client.connection_pool.disconnect()
+            return None
+
+        with self._lock:
+            self._mark_up(time.monotonic())
+        return client
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool usage and connection health"""
+        with self._lock:
+            pool = self._pool
+            created = len(getattr(pool, "_connections", [])) if pool else 0
+            idle = sum(1 for conn in pool.pool.queue if conn is not None) if pool else 0
+            return {
+                "state": "up" if self.healthy else "down",
+                "max_connections": self.max_connections,
+                "created": created,
+                "in_use": created - idle,
+                "idle": idle,
+                "async_pools": len(self._async_clients),
+                "retry_in": max(0.0, self.next_attempt - time.monotonic()) if not self.healthy else 0.0,
+                **self.counters,
+            }
+
+
+_REDIS_POOLS: Dict[tuple, _RedisPool] = {}
+_REDIS_POOLS_LOCK = threading.Lock()
+
+
+def _get_redis_pool(host: str, port: int, db: int = 0, **settings) -> _RedisPool:
+    """Process-wide Redis pool per server, shared by every tool instance"""
+    with _REDIS_POOLS_LOCK:
+        pool = _REDIS_POOLS.setdefault((host, port, db), _RedisPool(host, port, db))
+    pool.configure(**settings)
+    return pool
+
+
+class _AwaitablePipeline:
+    """Pipeline of a synchronous client with an awaitable execute()"""
+
+    def __init__(self, pipe):
+        self._pipe = pipe
+
+    def __getattr__(self, name):
+        return getattr(self._pipe, name)
+
+    async def execute(self):
+        return self._pipe.execute()
+
+
+class _AwaitableRedis:
+    """Awaitable view of a synchronous client, so pinned clients (scripts, tests) work on the async path"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def pipeline(self, *args, **kwargs):
+        return _AwaitablePipeline(self._client.pipeline(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+def _file_fingerprint(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of the file content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _canonical_query(query: str) -> str:
+    """Question text with case, spacing and trailing punctuation ignored"""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+def _adaptive_ttl(
+    base_ttl: int,
+    hits: int,
+    cost: float,
+    size: int,
+    reference: float,
+    min_factor: float = 0.25,
+    max_factor: float = 24.0
+) -> int:
+    """GreedyDual-Size-Frequency style TTL for a cache entry (same policy as sql_cache_tool).
+
+    The entry's value is frequency × recompute cost (seconds) / size (KB);
+    an entry worth exactly `reference` gets `base_ttl`.
+    """
+    value = (1 + hits) * cost / max(size / 1024, 1.0)
+    factor = min(max(value / reference, min_factor), max_factor)
+    return max(int(base_ttl * factor), 1)
+
+
+class _HTTPClients:
+    """
+    Shared keep-alive HTTP clients for LLM calls.
+
+    - One httpx.AsyncClient per event loop and endpoint settings, reused
+      across tool invocations, with a bounded connection pool
+    - HTTP/2 when the `h2` package is installed
+    - Connect time (TCP + TLS) is traced per request; reused connections
+      cost none
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> {settings: client}
+        self._lock = threading.Lock()
+        self.connect_times = deque(maxlen=1000)
+        self.counters = {"requests": 0, "connections": 0, "connect_seconds": 0.0}
+
+    def client(
+        self,
+        max_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        timeout: float = 30.0,
+        http2: bool = True
+    ) -> httpx.AsyncClient:
+        """Client for the running event loop with these settings"""
+        settings = (max_connections, keepalive_expiry, connect_timeout, timeout, http2 and _HTTP2_AVAILABLE)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._clients.setdefault(loop, {})
+            if settings not in clients:
+                clients[settings] = httpx.AsyncClient(
+                    http2=settings[-1],
+                    limits=httpx.Limits(
+                        max_connections=max_connections,
+                        max_keepalive_connections=max_connections,
+                        keepalive_expiry=keepalive_expiry
+                    ),
+                    timeout=httpx.Timeout(timeout, connect=connect_timeout),
+                )
+            return clients[settings]
+
+    async def post(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        stream: bool = False,
+        **kwargs
+    ) -> Tuple[httpx.Response, float]:
+        """POST through `client`; returns the response (unread when streaming; aclose() it) and the seconds spent connecting"""
+        started: Dict[str, float] = {}
+        connect = [0.0, False]
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            step, _, phase = event_name.rpartition(".")
+            if step not in ("connection.connect_tcp", "connection.start_tls"):
+                return
+            if phase == "started":
+                started[step] = time.perf_counter()
+            elif phase == "complete" and step in started:
+                connect[0] += time.perf_counter() - started[step]
+                connect[1] = True
+
+        request = client.build_request("POST", url, extensions={"trace": trace}, **kwargs)
+        response = await client.send(request, stream=stream)
+        with self._lock:
+            self.counters["requests"] += 1
+            if connect[1]:
+                self.counters["connections"] += 1
+                self.counters["connect_seconds"] += connect[0]
+            self.connect_times.append(connect[0])
+        return response, connect[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests, connections opened and connect-time percentiles (ms)"""
+        with self._lock:
+            samples = sorted(self.connect_times)
+            open_clients = sum(len(clients) for clients in self._clients.values())
+            counters = dict(self.counters)
+        requests = counters["requests"]
+        return {
+            **counters,
+            "clients": open_clients,
+            "http2": _HTTP2_AVAILABLE,
+            "reuse_rate": (1 - counters["connections"] / requests) * 100 if requests else 0.0,
+            "connect_mean_ms": sum(samples) / len(samples) * 1000 if samples else 0.0,
+            "connect_p95_ms": samples[int(0.95 * (len(samples) - 1))] * 1000 if samples else 0.0,
+        }
+
+
+async def _stream_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """Content deltas from an OpenAI-compatible server-sent event stream"""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            continue  # Read to the end of the body so the connection goes back to the pool
+        choices = json.loads(data).get("choices") or [{}]
+        delta = choices[0].get("delta", {}).get("content")
+        if delta:
+            yield delta
+
+
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+_HTTP_CLIENTS = _HTTPClients()
+
+
+def _profile_dtypes(sample: pd.DataFrame, category_ratio: float = 0.5) -> Dict[str, Any]:
+    """Pick categorical and date columns from a sample of the file"""
+    plan = {"dtype": {}, "parse_dates": []}
+
+    for col in sample.columns:
+        series = sample[col]
+        if not pd.api.types.is_string_dtype(series):
+            continue
+
+        values = series.dropna()
+        if values.empty:
+            continue
+
+        # Dates: nearly every sampled value parses as a timestamp
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            parsed = pd.to_datetime(values, errors="coerce")
+        if parsed.notna().mean() >= 0.95:
+            plan["parse_dates"].append(col)
+            continue
+
+        # Repetitive labels (crop names, field codes, units) become categoricals
+        if values.nunique() / len(values) <= category_ratio:
+            plan["dtype"][col] = "category"
+
+    return plan
+
+
+class _KLLSketch:
+    """
+    KLL quantile sketch with bounded memory.
+
+    Items live in levels; a level-h item stands for 2**h inputs. A level
+    over its capacity is sorted and every other item (random offset) moves
+    up a level, so memory stays around 3k items whatever the input size and
+    rank error is roughly 1.7/k.
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.rng = random.Random(k)  # Seeded so the same file always profiles the same
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(self.k * (2 / 3) ** depth), 2)
+
+    def update(self, values: np.ndarray):
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values.astype("float64")])
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                odd = items[len(items) - len(items) % 2:]
+                promoted = items[self.rng.randint(0, 1):len(items) - len(odd):2]
+                self.levels[level] = odd
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantiles(self, qs: List[float]) -> List[float]:
+        if len(self.levels) == 1:
+            # Nothing compacted yet: exact, with pandas' linear interpolation
+            return [float(v) for v in np.quantile(self.levels[0], qs)] if self.n else [float("nan")] * len(qs)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items)
+        ranks = np.cumsum(weights[order])
+        positions = np.searchsorted(ranks, np.asarray(qs) * ranks[-1], side="left")
+        return [float(items[order][min(p, len(items) - 1)]) for p in positions]
+
+
+class _HyperLogLog:
+    """HyperLogLog distinct counter: 2**precision one-byte registers (4 KB, ~1.6% error at 12)"""
+
+    def __init__(self, precision: int = 12):
+        self.p = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, series: pd.Series):
+        hashes = pd.util.hash_pandas_object(series, index=False).to_numpy(dtype=np.uint64)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        # The remaining 64-p bits fit a float64 exactly, so frexp gives their bit length
+        rest = (hashes & np.uint64((1 << (64 - self.p)) - 1)).astype("float64")
+        rank = (64 - self.p + 1 - np.frexp(rest)[1]).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(2.0 ** -self.registers.astype("float64"))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # Linear counting for small cardinalities
+        return int(round(estimate))
+
+
+class _ColumnProfile:
+    """One-pass statistics for a column: nulls, Welford moments, quantiles and distinct values"""
+
+    def __init__(self, k: int):
+        self.dtype = None
+        self.nulls = 0
+        self.numeric = True
+        self.float32_exact = True
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.quantiles = _KLLSketch(k)
+        self.distinct = _HyperLogLog()
+
+    def update(self, series: pd.Series):
+        self.nulls += int(series.isna().sum())
+        self.dtype = series.dtype if self.dtype is None else self._promote(self.dtype, series.dtype)
+        values = series.dropna()
+        if values.empty:
+            return
+        self.distinct.update(values)
+
+        self.numeric = self.numeric and pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+        if not self.numeric:
+            return
+        array = values.to_numpy(dtype="float64")
+        if self.float32_exact and pd.api.types.is_float_dtype(values):
+            self.float32_exact = bool(np.array_equal(array.astype("float32").astype("float64"), array))
+
+        # Chan et al. merge of the chunk's moments into the running Welford state
+        n, mean = len(array), float(array.mean())
+        m2 = float(((array - mean) ** 2).sum())
+        delta, total = mean - self.mean, self.count + n
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, float(array.min()))
+        self.max = max(self.max, float(array.max()))
+        self.quantiles.update(array)
+
+    @staticmethod
+    def _promote(current, new):
+        if current == new:
+            return current
+        if isinstance(current, pd.CategoricalDtype) and isinstance(new, pd.CategoricalDtype):
+            return current
+        numeric = pd.api.types.is_numeric_dtype
+        if numeric(current) and numeric(new) and not pd.api.types.is_bool_dtype(current) and not pd.api.types.is_bool_dtype(new):
+            return np.result_type(current, new)
+        return np.dtype("object")
+
+    def dtype_name(self, optimize: bool) -> str:
+        """Column dtype as a full load would report it, narrowed to the smallest exact dtype when optimizing"""
+        if self.dtype is None:
+            return "object"
+        dtype = self.dtype
+        if optimize and self.numeric and self.count:
+            if pd.api.types.is_integer_dtype(dtype):
+                kind = "unsigned" if self.min >= 0 else "integer"
+                dtype = pd.to_numeric(pd.Series([self.min, self.max], dtype=dtype), downcast=kind).dtype
+            elif pd.api.types.is_float_dtype(dtype) and self.float32_exact:
+                dtype = np.dtype("float32")
+        return str(dtype)
+
+    def describe(self) -> Dict[str, float]:
+        """Same fields as DataFrame.describe() for a numeric column"""
+        q25, q50, q75 = self.quantiles.quantiles([0.25, 0.5, 0.75])
+        return {
+            "count": float(self.count),
+            "mean": self.mean,
+            "std": (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else float("nan"),
+            "min": self.min,
+            "25%": q25,
+            "50%": q50,
+            "75%": q75,
+            "max": self.max,
+        }
+
+
+def _iter_chunks(file_path: str, chunk_rows: int, plan: Optional[Dict[str, Any]] = None) -> Iterator[pd.DataFrame]:
+    """Read a CSV/Excel file `chunk_rows` rows at a time (.xls cannot be streamed and is sliced after a full read)"""
+    plan = plan or {"dtype": {}, "parse_dates": []}
+
+    def typed(chunk: pd.DataFrame) -> pd.DataFrame:
+        chunk = chunk.infer_objects()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for col in plan["parse_dates"]:
+                chunk[col] = pd.to_datetime(chunk[col], errors="coerce")
+        for col, dtype in plan["dtype"].items():
+            chunk[col] = chunk[col].astype(dtype)
+        return chunk
+
+    if file_path.endswith('.csv'):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            yield from pd.read_csv(
+                file_path, chunksize=chunk_rows,
+                dtype=plan["dtype"] or None, parse_dates=plan["parse_dates"] or None
+            )
+    elif file_path.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, ())
+            columns = [name if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+            while True:
+                batch = list(itertools.islice(rows, chunk_rows))
+                if not batch:
+                    break
+                yield typed(pd.DataFrame(batch, columns=columns))
+        finally:
+            workbook.close()
+    elif file_path.endswith('.xls'):
+        df = pd.read_excel(file_path)
+        for start in range(0, len(df), chunk_rows):
+            yield typed(df.iloc[start:start + chunk_rows])
+    else:
+        raise ValueError("File must be CSV or Excel format")
+
+
+def _profile_file(
+    file_path: str,
+    optimize: bool = True,
+    sample_rows: int = 10000,
+    chunk_rows: int = 50000,
+    k: int = 200
+) -> Dict[str, Any]:
+    """
+    Profile a CSV/Excel file in one streaming pass.
+
+    Memory is bounded by one chunk plus a fixed-size sketch per column, so the
+    file size does not matter. Row and null counts, mean, std, min and max are
+    exact; quantiles and distinct counts are approximate once a column outgrows
+    its sketch. Returns JSON-serializable results for caching.
+    """
+    plan = None
+    if optimize:
+        reader = pd.read_csv if file_path.endswith('.csv') else pd.read_excel
+        plan = _profile_dtypes(reader(file_path, nrows=sample_rows))
+
+    columns: Dict[str, _ColumnProfile] = {}
+    rows, chunks, sample = 0, 0, []
+    for chunk in _iter_chunks(file_path, chunk_rows, plan):
+        if not chunks:
+            columns = {str(col): _ColumnProfile(k) for col in chunk.columns}
+            sample = json.loads(json.dumps(chunk.head(5).to_dict('records'), default=str))
+        for name, col in zip(columns, chunk.columns):
+            columns[name].update(chunk[col])
+        rows += len(chunk)
+        chunks += 1
+
+    return {
+        "rows": rows,
+        "columns": list(columns),
+        "dtypes": {name: column.dtype_name(optimize) for name, column in columns.items()},
+        "nulls": {name: column.nulls for name, column in columns.items()},
+        "distinct": {name: column.distinct.count() for name, column in columns.items()},
+        "stats": {name: column.describe() for name, column in columns.items() if column.numeric and column.count},
+        "sample": sample,
+        "chunks": chunks,
+    }
 
 
 class Tools:
@@ -22,6 +888,28 @@ class Tools:
         self.citation = False
         self.uploaded_files = {}
 
+        # Redis comes from the pool shared with sql_cache_tool (runs uncached while Redis is down)
+        self._redis_client = None
+        self.redis_client  # Connect eagerly so an unreachable Redis is reported at startup
+
+    @property
+    def redis_client(self) -> Optional[redis.Redis]:
+        """Pooled Redis client, or None while Redis is unreachable"""
+        if getattr(self, "_redis_client", None) is not None:
+            return self._redis_client
+        return self._redis_pool().client()
+
+    @redis_client.setter
+    def redis_client(self, client):
+        """Pin an explicit client (scripts and tests) instead of the shared pool"""
+        self._redis_client = client
+
+    async def _aredis(self):
+        """redis.asyncio client for the running loop, or None while Redis is unreachable"""
+        if getattr(self, "_redis_client", None) is not None:
+            return _AwaitableRedis(self._redis_client)
+        return await self._redis_pool().aclient()
+
     class Valves(BaseModel):
         GROQ_API_KEY: str = Field(
             default="",
@@ -35,6 +923,309 @@ class Tools:
             default="llama-3.3-70b-versatile",
             description="Groq model for analysis"
         )
+        OPTIMIZE_DTYPES: bool = Field(
+            default=True,
+            description="Profile a sample and load with categorical/narrow dtypes to cut memory"
+        )
+        PROFILE_SAMPLE_ROWS: int = Field(
+            default=10000,
+            description="Rows sampled to choose column dtypes before profiling"
+        )
+        PROFILE_CHUNK_ROWS: int = Field(
+            default=50000,
+            description="Rows held in memory at a time while profiling a file"
+        )
+        PROFILE_SKETCH_SIZE: int = Field(
+            default=200,
+            description="KLL sketch size per numeric column (quantile rank error about 1.7/size)"
+        )
+        LLM_TIMEOUT: float = Field(
+            default=30.0,
+            description="Seconds to wait for a single Groq call"
+        )
+        LLM_MAX_CONCURRENCY: int = Field(
+            default=8,
+            description="Upper bound for concurrent Groq calls (adapted down under overload)"
+        )
+        LLM_MAX_RETRIES: int = Field(
+            default=3,
+            description="Retries with jittered backoff on 429/5xx/timeouts"
+        )
+        BREAKER_FAILURE_THRESHOLD: int = Field(
+            default=5,
+            description="Consecutive Groq failures that open the circuit breaker"
+        )
+        BREAKER_RESET_TIMEOUT: int = Field(
+            default=30,
+            description="Seconds the circuit stays open before a trial call"
+        )
+        LLM_CONNECT_TIMEOUT: float = Field(
+            default=5.0,
+            description="Seconds to wait for a new connection to Groq (TCP + TLS)"
+        )
+        HTTP_MAX_CONNECTIONS: int = Field(
+            default=20,
+            description="Connections kept open to the Groq endpoint per worker event loop"
+        )
+        HTTP_KEEPALIVE_EXPIRY: float = Field(
+            default=30.0,
+            description="Seconds an idle keep-alive connection is kept for reuse"
+        )
+        HTTP2: bool = Field(
+            default=True,
+            description="Use HTTP/2 when the h2 package is installed (one multiplexed connection)"
+        )
+        STREAM_RESPONSES: bool = Field(
+            default=True,
+            description="Stream the answer into the chat as it is generated instead of waiting for the full completion"
+        )
+        LLM_TEMPERATURE: float = Field(
+            default=0.3,
+            description="Sampling temperature for analyses (part of the cache key)"
+        )
+        ENABLE_CACHE: bool = Field(
+            default=True,
+            description="Cache analyses in Redis by file content, question, model and temperature"
+        )
+        CACHE_TTL: int = Field(
+            default=3600,
+            description="Cache TTL in seconds (default: 1 hour)"
+        )
+        ADAPTIVE_TTL: bool = Field(
+            default=True,
+            description="Scale each entry's TTL by its recompute cost, hit count and size (GDSF)"
+        )
+        ADAPTIVE_TTL_REFERENCE: float = Field(
+            default=0.5,
+            description="Recompute seconds per KB that earn exactly CACHE_TTL"
+        )
+        MIN_TTL_FACTOR: float = Field(
+            default=0.25,
+            description="Lower bound for adaptive TTL as a multiple of CACHE_TTL"
+        )
+        MAX_TTL_FACTOR: float = Field(
+            default=24.0,
+            description="Upper bound for adaptive TTL as a multiple of CACHE_TTL"
+        )
+        REDIS_MAX_CONNECTIONS: int = Field(
+            default=20,
+            description="Connections in the shared Redis pool (callers wait when all are busy)"
+        )
+        REDIS_HEALTH_CHECK_INTERVAL: float = Field(
+            default=5.0,
+            description="Seconds between Redis health checks on the shared pool"
+        )
+        REDIS_RECONNECT_BACKOFF_MAX: float = Field(
+            default=5.0,
+            description="Maximum seconds between reconnect attempts while Redis is down"
+        )
+
+    def _redis_pool(self) -> _RedisPool:
+        """Shared Redis pool for the configured server"""
+        return _get_redis_pool(
+            os.getenv("REDIS_HOST", "redis"),
+            int(os.getenv("REDIS_PORT", 6379)),
+            max_connections=self.valves.REDIS_MAX_CONNECTIONS,
+            health_check_interval=self.valves.REDIS_HEALTH_CHECK_INTERVAL,
+            backoff_cap=self.valves.REDIS_RECONNECT_BACKOFF_MAX
+        )
+
+    def _gateway(self) -> _LLMGateway:
+        """Shared LLM gateway for the configured Groq endpoint"""
+        return _get_gateway(
+            self.valves.GROQ_API_BASE,
+            max_concurrency=self.valves.LLM_MAX_CONCURRENCY,
+            max_retries=self.valves.LLM_MAX_RETRIES,
+            slow_call_seconds=self.valves.LLM_TIMEOUT / 2,
+            failure_threshold=self.valves.BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=self.valves.BREAKER_RESET_TIMEOUT
+        )
+
+    def _analysis_cache_key(self, fingerprint: str, query: str) -> str:
+        """Cache key from file fingerprint, canonical question, model and temperature"""
+        combined = f"{fingerprint}:{_canonical_query(query)}:{self.valves.GROQ_MODEL}:{self.valves.LLM_TEMPERATURE}"
+        return f"csv_analysis:{hashlib.sha256(combined.encode()).hexdigest()}"
+
+    def _entry_ttl(self, hits: int, cost: float, size: int) -> int:
+        """TTL for an analysis under the current valves (GDSF when ADAPTIVE_TTL is on)"""
+        if not self.valves.ADAPTIVE_TTL:
+            return self.valves.CACHE_TTL
+        return _adaptive_ttl(
+            self.valves.CACHE_TTL, hits, cost, size,
+            self.valves.ADAPTIVE_TTL_REFERENCE,
+            self.valves.MIN_TTL_FACTOR,
+            self.valves.MAX_TTL_FACTOR
+        )
+
+    async def _aget_analysis(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Cached analysis, or None on a miss; a hit is counted and extends the entry's TTL.
+
+        Hit counts and last access live in the excel:analysis:hits and
+        excel:analysis:accessed hashes, so the cached payload is only ever
+        written once.
+        """
+        if not self.valves.ENABLE_CACHE:
+            return None
+        client = await self._aredis()
+        if not client:
+            return None
+
+        try:
+            cached = await client.get(cache_key)
+            if cached is None:
+                pipe = client.pipeline()
+                pipe.hincrby("excel:analysis", "misses", 1)
+                # The entry expired: drop what is left of its metadata
+                pipe.hdel("excel:analysis:hits", cache_key)
+                pipe.hdel("excel:analysis:accessed", cache_key)
+                await pipe.execute()
+                return None
+
+            entry = json.loads(cached)
+            pipe = client.pipeline()
+            pipe.hincrby("excel:analysis:hits", cache_key, 1)
+            pipe.hset("excel:analysis:accessed", cache_key, int(time.time()))
+            pipe.hincrby("excel:analysis", "hits", 1)
+            pipe.hincrbyfloat("excel:analysis", "saved_seconds", entry["cost"])
+            entry["hits"] = (await pipe.execute())[0]
+            await client.expire(cache_key, self._entry_ttl(entry["hits"], entry["cost"], len(cached)))
+            return entry
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            return None
+
+    async def _asave_analysis(self, cache_key: str, entry: Dict[str, Any]):
+        """Store an analysis with a TTL scaled by what it cost to produce"""
+        if not self.valves.ENABLE_CACHE:
+            return
+        client = await self._aredis()
+        if not client:
+            return
+
+        try:
+            data = json.dumps(entry)
+            pipe = client.pipeline()
+            pipe.set(cache_key, data, ex=self._entry_ttl(0, entry["cost"], len(data)))
+            pipe.hset("excel:analysis:hits", cache_key, 0)
+            pipe.hset("excel:analysis:accessed", cache_key, int(time.time()))
+            pipe.hincrby("excel:analysis", "stored", 1)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Cache write error: {e}")
+
+    async def _aget_profile(self, file_path: str, fingerprint: str) -> Dict[str, Any]:
+        """Streaming profile of the file, cached in Redis by content fingerprint"""
+        client = await self._aredis() if self.valves.ENABLE_CACHE else None
+        cache_key = f"csv_profile:{fingerprint}:{int(self.valves.OPTIMIZE_DTYPES)}"
+        if client:
+            try:
+                cached = await client.get(cache_key)
+                if cached is not None:
+                    await client.hincrby("excel:profile", "hits", 1)
+                    return json.loads(cached)
+            except Exception as e:
+                print(f"Cache read error: {e}")
+
+        start = time.monotonic()
+        profile = await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(
+                _profile_file,
+                file_path,
+                optimize=self.valves.OPTIMIZE_DTYPES,
+                sample_rows=self.valves.PROFILE_SAMPLE_ROWS,
+                chunk_rows=self.valves.PROFILE_CHUNK_ROWS,
+                k=self.valves.PROFILE_SKETCH_SIZE
+            )
+        )
+        if client:
+            try:
+                data = json.dumps(profile)
+                pipe = client.pipeline()
+                pipe.set(cache_key, data, ex=self._entry_ttl(0, time.monotonic() - start, len(data)))
+                pipe.hincrby("excel:profile", "misses", 1)
+                pipe.hincrby("excel:profile", "rows_streamed", profile["rows"])
+                await pipe.execute()
+            except Exception as e:
+                print(f"Cache write error: {e}")
+        return profile
+
+    async def _relay_stream(
+        self,
+        response: httpx.Response,
+        start: float,
+        timing: Dict[str, float],
+        __event_emitter__=None
+    ) -> str:
+        """Forward streamed content to the chat as message events; returns the assembled answer"""
+        parts = []
+        try:
+            async for delta in _stream_deltas(response):
+                if not parts:
+                    timing["first_token"] = time.monotonic() - start
+                    if __event_emitter__:
+                        await __event_emitter__(
+                            {
+                                "type": "status",
+                                "data": {"description": f"First token after {timing['first_token']:.2f}s", "done": False},
+                            }
+                        )
+                parts.append(delta)
+                if __event_emitter__:
+                    await __event_emitter__({"type": "message", "data": {"content": delta}})
+        except Exception as e:
+            if parts:
+                # Part of the answer is already in the chat; a retry would repeat it
+                raise RuntimeError(f"Groq stream interrupted after {len(parts)} chunks: {e}") from e
+            raise
+        finally:
+            await response.aclose()
+        return "".join(parts)
+
+    async def _arecord_latency(self, first_token: float, total: float):
+        """Keep the last 1000 time-to-first-token and total latencies of answered misses"""
+        client = await self._aredis()
+        if not client:
+            return
+
+        try:
+            pipe = client.pipeline()
+            pipe.lpush("excel:analysis:first_token", first_token)
+            pipe.ltrim("excel:analysis:first_token", 0, 999)
+            pipe.lpush("excel:analysis:latency", total)
+            pipe.ltrim("excel:analysis:latency", 0, 999)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
+
+    def _render_analysis(
+        self,
+        entry: Dict[str, Any],
+        cache_status: str,
+        response_time: float,
+        first_token: Optional[float] = None
+    ) -> str:
+        """Formatted answer for a fresh or cached analysis"""
+        return f"""
+📊 **Dataset Overview**
+- Rows: {entry['rows']}
+- Columns: {entry['cols']}
+- File: {entry['file']}
+
+---
+
+🤖 **AI Analysis**
+
+{entry['analysis']}
+
+---
+
+💡 **Dataset Columns**: {', '.join(entry['columns'])}
+
+---
+💾 Cache: {cache_status} | ⏱️ {response_time:.2f}s""" + (
+            f" | ⚡ First token: {first_token:.2f}s\n" if first_token is not None else "\n"
+        )
 
     async def analyze_csv_file(
         self,
@@ -62,26 +1253,31 @@ class Tools:
                 )
 
             # Read file based on extension
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            elif file_path.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(file_path)
-            else:
+            if not file_path.endswith(('.csv', '.xlsx', '.xls')):
                 return "Error: File must be CSV or Excel format (.csv, .xlsx, .xls)"
 
-            # Get basic info about the dataset
-            rows, cols = df.shape
-            columns_info = list(df.columns)
-            data_types = df.dtypes.to_dict()
-
-            # Get sample data (first 5 rows)
-            sample_data = df.head(5).to_dict('records')
+            # Same file content, question, model and temperature: reuse the analysis
+            start = time.monotonic()
+            fingerprint = await asyncio.get_running_loop().run_in_executor(None, _file_fingerprint, file_path)
+            cache_key = self._analysis_cache_key(fingerprint, query)
+            cached = await self._aget_analysis(cache_key)
+            if cached:
+                if __event_emitter__:
+                    await __event_emitter__(
+                        {
+                            "type": "status",
+                            "data": {"description": "Analysis served from cache", "done": True},
+                        }
+                    )
+                return self._render_analysis(cached, "HIT", time.monotonic() - start)
 
-            # Get basic statistics
-            numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-            stats = {}
-            if numeric_cols:
-                stats = df[numeric_cols].describe().to_dict()
+            # One streaming pass (or the cached profile) instead of loading the whole file
+            profile = await self._aget_profile(file_path, fingerprint)
+            rows, cols = profile["rows"], len(profile["columns"])
+            columns_info = profile["columns"]
+            data_types = profile["dtypes"]
+            sample_data = profile["sample"]
+            stats = profile["stats"]
 
             # Emit status
             if __event_emitter__:
@@ -98,7 +1294,9 @@ Dataset Information:
 - Total rows: {rows}
 - Total columns: {cols}
 - Columns: {', '.join(columns_info)}
-- Data types: {json.dumps({k: str(v) for k, v in data_types.items()}, indent=2)}
+- Data types: {json.dumps(data_types, indent=2)}
+- Missing values: {json.dumps(profile["nulls"])}
+- Distinct values (approx.): {json.dumps(profile["distinct"])}
 
 Sample Data (first 5 rows):
 {json.dumps(sample_data, indent=2, default=str)}
@@ -134,25 +1332,71 @@ Please analyze this data and answer the user's query. Provide specific insights,
                         "content": context
                     }
                 ],
-                "temperature": 0.3,
-                "max_tokens": 2000
+                "temperature": self.valves.LLM_TEMPERATURE,
+                "max_tokens": 2000,
+                "stream": self.valves.STREAM_RESPONSES
             }
 
-            response = requests.post(
-                f"{self.valves.GROQ_API_BASE}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30
+            client = _HTTP_CLIENTS.client(
+                max_connections=self.valves.HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=self.valves.HTTP_KEEPALIVE_EXPIRY,
+                connect_timeout=self.valves.LLM_CONNECT_TIMEOUT,
+                timeout=self.valves.LLM_TIMEOUT,
+                http2=self.valves.HTTP2
             )
 
-            if response.status_code != 200:
-                return f"Error calling Groq API: {response.status_code} - {response.text}"
+            # Time to first token (seconds since the question arrived), apart from total latency
+            timing = {}
 
-            result = response.json()
-            analysis = result['choices'][0]['message']['content']
+            async def post_completion():
+                response, _ = await _HTTP_CLIENTS.post(
+                    client,
+                    f"{self.valves.GROQ_API_BASE}/chat/completions",
+                    stream=self.valves.STREAM_RESPONSES,
+                    headers=headers,
+                    json=payload
+                )
+                if response.status_code != 200:
+                    if self.valves.STREAM_RESPONSES:
+                        await response.aread()
+                        await response.aclose()
+                    retry_after = response.headers.get("retry-after")
+                    raise _LLMHTTPError(
+                        response.status_code,
+                        response.text,
+                        float(retry_after) if retry_after and retry_after.isdigit() else None
+                    )
+                if self.valves.STREAM_RESPONSES:
+                    return await self._relay_stream(response, start, timing, __event_emitter__)
+                timing["first_token"] = time.monotonic() - start  # The whole answer arrives at once
+                return response.json()['choices'][0]['message']['content']
+
+            # Shared gateway: circuit breaker, jittered retries, adaptive concurrency
+            try:
+                analysis = await self._gateway().acall(post_completion)
+            except (_LLMHTTPError, LLMUnavailable, httpx.TransportError) as e:
+                return f"Error calling Groq API: {e}"
+
+            entry = {
+                "file": os.path.basename(file_path),
+                "rows": rows,
+                "cols": cols,
+                "columns": columns_info,
+                "analysis": analysis,
+                "cost": time.monotonic() - start,
+            }
+            await self._asave_analysis(cache_key, entry)
+            response_time = time.monotonic() - start
+            # A stream without content deltas never set a first token; nothing came before the end
+            first_token = timing.get("first_token", response_time)
+            await self._arecord_latency(first_token, response_time)
+            response = self._render_analysis(entry, "MISS", response_time, first_token)
 
             # Emit done
             if __event_emitter__:
+                if self.valves.STREAM_RESPONSES:
+                    # The streamed text takes its place in the full formatted answer
+                    await __event_emitter__({"type": "replace", "data": {"content": response}})
                 await __event_emitter__(
                     {
                         "type": "status",
@@ -160,22 +1404,7 @@ Please analyze this data and answer the user's query. Provide specific insights,
                     }
                 )
 
-            return f"""
-📊 **Dataset Overview**
-- Rows: {rows}
-- Columns: {cols}
-- File: {os.path.basename(file_path)}
-
----
-
-🤖 **AI Analysis**
-
-{analysis}
-
----
-
-💡 **Dataset Columns**: {', '.join(columns_info)}
-"""
+            return response
 
         except FileNotFoundError:
             return f"Error: File not found at {file_path}"
@@ -197,34 +1426,58 @@ Please analyze this data and answer the user's query. Provide specific insights,
 
         try:
             # Read file
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            elif file_path.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(file_path)
-            else:
+            if not file_path.endswith(('.csv', '.xlsx', '.xls')):
                 return "Error: File must be CSV or Excel format"
+            fingerprint = await asyncio.get_running_loop().run_in_executor(None, _file_fingerprint, file_path)
+            profile = await self._aget_profile(file_path, fingerprint)
 
             # Generate summary
             summary = f"""
 📊 **Data Summary for {os.path.basename(file_path)}**
 
-**Shape**: {df.shape[0]} rows × {df.shape[1]} columns
+**Shape**: {profile['rows']} rows × {len(profile['columns'])} columns
 
 **Columns**:
 """
-            for col in df.columns:
-                dtype = df[col].dtype
-                null_count = df[col].isnull().sum()
-                summary += f"\n- `{col}` ({dtype}) - {null_count} nulls"
+            for col in profile["columns"]:
+                summary += (
+                    f"\n- `{col}` ({profile['dtypes'][col]}) - {profile['nulls'][col]} nulls, "
+                    f"~{profile['distinct'][col]} distinct"
+                )
 
             # Add statistics for numeric columns
-            numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-            if numeric_cols:
+            if profile["stats"]:
                 summary += "\n\n**Numeric Columns Statistics**:\n"
-                stats_df = df[numeric_cols].describe()
+                stats_df = pd.DataFrame(profile["stats"])
                 summary += "\n" + stats_df.to_string()
 
             return summary
 
         except Exception as e:
             return f"Error: {str(e)}"
+
+    async def get_llm_connection_stats(
+        self,
+        __user__: Optional[dict] = None,
+    ) -> str:
+        """
+        Show how LLM calls reuse pooled connections to Groq.
+
+        :return: Connection pool and gateway statistics
+        """
+        pool = _HTTP_CLIENTS.stats()
+        gateway = self._gateway().stats()
+        return f"""
+🔌 **LLM Connections**
+
+**Pool:**
+- Protocol: {"HTTP/2" if pool["http2"] and self.valves.HTTP2 else "HTTP/1.1 keep-alive"}
+- Limits: {self.valves.HTTP_MAX_CONNECTIONS} connections, idle for {self.valves.HTTP_KEEPALIVE_EXPIRY:.0f}s
+- Requests: {pool["requests"]} over {pool["connections"]} new connections ({pool["reuse_rate"]:.1f}% reused)
+- Connect Time: {pool["connect_mean_ms"]:.1f}ms mean, {pool["connect_p95_ms"]:.1f}ms p95 per request
+
+**Gateway:**
+- Circuit: {gateway["state"]}
+- Concurrency Limit: {gateway["limit"]:.1f}
+- Retries: {gateway["retries"]}
+"""
@@ -12,194 +12,3573 @@ import os
 import json
 import hashlib
 import time
-from typing import Optional, Dict, Any
+import random
+import re
+import shutil
+import asyncio
+import functools
+import importlib.util
+import multiprocessing
+import tempfile
+import threading
+import uuid
+import warnings
+import weakref
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Callable, Tuple
 from datetime import datetime
 from pydantic import BaseModel, Field
 
 import redis
+from redis import asyncio as aioredis
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
 import duckdb
+import numpy as np
 import pandas as pd
 
 
-class Tools:
+class LLMUnavailable(Exception):
+    """Raised when the LLM gateway fails fast (circuit open or no free slot)"""
+    pass
+
+
+class _LLMHTTPError(Exception):
+    """Non-200 response from a Groq-compatible endpoint"""
+
+    def __init__(self, status_code: int, text: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status_code} - {text}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _is_retryable(error: Exception) -> bool:
+    """429, 5xx, timeouts and connection failures are worth retrying"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(error).__name__
+    return isinstance(error, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Server-requested delay from a Retry-After header, if any"""
+    if getattr(error, "retry_after", None) is not None:
+        return error.retry_after
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class _LLMGateway:
+    """
+    Shared gate in front of Groq calls.
+
+    - AIMD adaptive concurrency: the in-flight limit grows by ~1 per window
+      of successes and halves on overload (429/5xx/timeouts/slow calls)
+    - Retries with full-jitter exponential backoff, honouring Retry-After
+    - Circuit breaker: after consecutive failures calls fail fast until a
+      half-open trial call succeeds
+    """
+
     def __init__(self):
-        self.valves = self.Valves()
-        self.citation = False
+        self.max_concurrency = 8
+        self.min_concurrency = 1
+        self.max_retries = 3
+        self.backoff_base = 0.5
+        self.backoff_cap = 8.0
+        self.slow_call_seconds = 10.0
+        self.acquire_timeout = 10.0
+        self.failure_threshold = 5
+        self.reset_timeout = 30.0
+
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.counters = {"calls": 0, "retries": 0, "rejected": 0, "failures": 0, "trips": 0}
+        self._cond = threading.Condition()
+
+    def configure(self, **settings):
+        """Apply valve settings (called on every use so valve edits take effect)"""
+        with self._cond:
+            for name, value in settings.items():
+                setattr(self, name, value)
+            self.limit = min(max(self.limit, self.min_concurrency), self.max_concurrency)
+            self._cond.notify_all()
+
+    def _check_breaker(self):
+        """Fail fast while open; let a single trial call through when half-open.
+
+        The caller holds _cond and takes its slot in the same critical
+        section, so concurrent callers cannot all pass as the trial.
+        """
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.counters["rejected"] += 1
+                raise LLMUnavailable("LLM circuit breaker is open; Groq is failing, try again shortly")
+            self.state = "half_open"
+        if self.state == "half_open" and self.in_flight > 0:
+            self.counters["rejected"] += 1
+            raise LLMUnavailable("LLM circuit breaker is half-open; a trial call is in progress")
+
+    def _acquire(self):
+        with self._cond:
+            deadline = time.monotonic() + self.acquire_timeout
+            self._check_breaker()
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["rejected"] += 1
+                    raise LLMUnavailable(f"LLM concurrency limit reached ({int(self.limit)} in flight)")
+                self._cond.wait(remaining)
+                self._check_breaker()
+            self.in_flight += 1
+            self.counters["calls"] += 1
+
+    def _release(self, ok: bool, overloaded: bool, latency: float):
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded or latency > self.slow_call_seconds:
+                # Multiplicative decrease
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            elif ok:
+                # Additive increase: +1 per `limit` successes
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            if ok:
+                self.consecutive_failures = 0
+                self.state = "closed"
+            elif overloaded:
+                self.consecutive_failures += 1
+                self.counters["failures"] += 1
+                if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                    if self.state != "open":
+                        self.counters["trips"] += 1
+                    self.state = "open"
+                    self.opened_at = time.monotonic()
+            self._cond.notify_all()
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        """Run fn under the gateway's breaker, concurrency limit and retry policy"""
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                retryable = _is_retryable(e)
+                self._release(ok=False, overloaded=retryable, latency=time.monotonic() - start)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                self.counters["retries"] += 1
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                time.sleep(min(delay, self.backoff_cap))
+                continue
+            self._release(ok=True, overloaded=False, latency=time.monotonic() - start)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of breaker state, concurrency and counters"""
+        with self._cond:
+            return {
+                "state": self.state,
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                **self.counters,
+            }
+
+
+_GATEWAYS: Dict[str, _LLMGateway] = {}
+_GATEWAYS_LOCK = threading.Lock()
+
+
+def _get_gateway(api_base: str, **settings) -> _LLMGateway:
+    """Process-wide gateway per LLM endpoint, shared by every tool instance"""
+    with _GATEWAYS_LOCK:
+        gateway = _GATEWAYS.setdefault(api_base, _LLMGateway())
+    gateway.configure(**settings)
+    return gateway
+
+
+class _RedisPool:
+    """
+    Shared, self-healing Redis connection pool.
+
+    - One bounded BlockingConnectionPool per server, shared by every tool
+      instance, plus a redis.asyncio pool per event loop for async callers
+    - Idle connections are health-checked before reuse, and the server is
+      pinged every `health_check_interval` seconds
+    - While Redis is unreachable client()/aclient() return None (callers run
+      uncached) and reconnects are attempted lazily with jittered exponential backoff
+    """
+
+    def __init__(self, host: str, port: int, db: int = 0, **connection_kwargs):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.max_connections = 20
+        self.pool_timeout = 2.0
+        self.socket_timeout = 2.0
+        self.health_check_interval = 5.0
+        self.backoff_base = 0.5
+        self.backoff_cap = 5.0
+
+        self.healthy = False
+        self.consecutive_failures = 0
+        self.next_attempt = 0.0
+        self.last_check = 0.0
+        self.counters = {"connects": 0, "reconnects": 0, "failures": 0}
+        self._async_connection_class = connection_kwargs.pop("async_connection_class", None)
+        self._connection_kwargs = connection_kwargs
+        self._pool = None
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> redis.asyncio client
+        self._lock = threading.Lock()
+
+    def configure(self, **settings):
+        """Apply valve settings; pool size and timeouts take effect when a pool is built"""
+        with self._lock:
+            for name, value in settings.items():
+                setattr(self, name, value)
+
+    def _pool_kwargs(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "db": self.db,
+            "max_connections": self.max_connections,
+            "timeout": self.pool_timeout,
+            "health_check_interval": self.health_check_interval,
+            "socket_connect_timeout": self.socket_timeout,
+            "socket_timeout": self.socket_timeout,
+            "decode_responses": True,
+        }
+
+    def _build(self):
+        self._pool = redis.BlockingConnectionPool(
+            retry=Retry(ExponentialBackoff(cap=0.5, base=0.05), 1),
+            **self._pool_kwargs(),
+            **self._connection_kwargs
+        )
+        self._client = redis.Redis(connection_pool=self._pool)
+
+    def _build_async(self):
+        kwargs = dict(self._connection_kwargs)
+        if self._async_connection_class:
+            kwargs["connection_class"] = self._async_connection_class
+        pool = aioredis.BlockingConnectionPool(
+            retry=AsyncRetry(ExponentialBackoff(cap=0.5, base=0.05), 1),
+            **self._pool_kwargs(),
+            **kwargs
+        )
+        return aioredis.Redis(connection_pool=pool)
+
+    def _check_due(self, now: float) -> Optional[bool]:
+        """True if the last check still holds, False while backing off, None if a check is due"""
+        if self.healthy and now - self.last_check < self.health_check_interval:
+            return True
+        if not self.healthy and now < self.next_attempt:
+            return False
+        return None
+
+    def _mark_up(self, now: float):
+        if not self.healthy:
+            self.counters["reconnects" if self.counters["connects"] else "connects"] += 1
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_check = now
+
+    def _mark_down(self, now: float, error: Exception):
+        if self.healthy or not self.consecutive_failures:
+            print(f"Warning: Redis unavailable ({error}), running without cache")
+        self.healthy = False
+        self.consecutive_failures += 1
+        self.counters["failures"] += 1
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** (self.consecutive_failures - 1))
+        self.next_attempt = now + random.uniform(delay / 2, delay)
+
+    def client(self) -> Optional[redis.Redis]:
+        """Pooled client, or None while Redis is down and the next reconnect is not due"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._check_due(now)
+            if state is not None:
+                return self._client if state else None
+
+            try:
+                if self._pool is None:
+                    self._build()
+                self._client.ping()
+            except Exception as e:
+                self._mark_down(now, e)
+                if self._pool is not None:
+                    self._pool.disconnect()  # Drop dead sockets so the next attempt dials fresh
+                return None
+
+            self._mark_up(now)
+            return self._client
+
+    async def aclient(self) -> Optional[aioredis.Redis]:
+        """Async client for the running event loop, or None while Redis is down"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            now = time.monotonic()
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = self._async_clients[loop] = self._build_async()
+            state = self._check_due(now)
+            if state is not None:
+                return client if state else None
+            # One probe at a time; concurrent callers keep the current state
+            if self.healthy:
+                self.last_check = now
+            else:
+                self.next_attempt = now + self.socket_timeout
+
+        try:
+            await client.ping()
+        except Exception as e:
+            with self._lock:
+                self._mark_down(time.monotonic(), e)
+            await client.connection_pool.disconnect()
+            return None
+
+        with self._lock:
+            self._mark_up(time.monotonic())
+        return client
+
+    async def aclose_loop_client(self):
+        """Close and forget the running loop's async client (call before a short-lived loop ends)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose(close_connection_pool=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool usage and connection health"""
+        with self._lock:
+            pool = self._pool
+            created = len(getattr(pool, "_connections", [])) if pool else 0
+            idle = sum(1 for conn in pool.pool.queue if conn is not None) if pool else 0
+            return {
+                "state": "up" if self.healthy else "down",
+                "max_connections": self.max_connections,
+                "created": created,
+                "in_use": created - idle,
+                "idle": idle,
+                "async_pools": len(self._async_clients),
+                "retry_in": max(0.0, self.next_attempt - time.monotonic()) if not self.healthy else 0.0,
+                **self.counters,
+            }
+
+
+_REDIS_POOLS: Dict[tuple, _RedisPool] = {}
+_REDIS_POOLS_LOCK = threading.Lock()
+
+
+def _get_redis_pool(host: str, port: int, db: int = 0, **settings) -> _RedisPool:
+    """Process-wide Redis pool per server, shared by every tool instance"""
+    with _REDIS_POOLS_LOCK:
+        pool = _REDIS_POOLS.setdefault((host, port, db), _RedisPool(host, port, db))
+    pool.configure(**settings)
+    return pool
+
+
+class _HotTier:
+    """In-process copy of the hottest cache entries.
+
+    Refreshed from the top of the `excel:cache:hot` lookup ranking every
+    HOT_TIER_REFRESH seconds. Hits served here cost no network hop: their
+    lookup counts and hit metrics are buffered and flushed on the next
+    refresh. An entry is never served past its soft TTL, and entries
+    evicted by another worker linger for at most one refresh interval.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries: Dict[str, tuple] = {}  # cache_key -> (payload, valid_until)
+        self.pending: Dict[str, int] = {}
+        self.refreshed_at: Optional[float] = None
+        self.counters = {"hits": 0, "refreshes": 0}
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.entries.get(cache_key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            self.pending[cache_key] = self.pending.get(cache_key, 0) + 1
+            self.counters["hits"] += 1
+        result = json.loads(entry[0])
+        result["stale"] = False
+        return result
+
+    def claim_refresh(self, interval: float) -> bool:
+        """True for the one caller that should refresh now"""
+        now = time.monotonic()
+        with self._lock:
+            if self.refreshed_at is not None and now - self.refreshed_at < interval:
+                return False
+            self.refreshed_at = now
+            return True
+
+    def drain(self) -> Dict[str, int]:
+        """Buffered lookup counts since the last refresh"""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            return pending
+
+    def replace(self, entries: Dict[str, tuple]):
+        with self._lock:
+            self.entries = entries
+            self.counters["refreshes"] += 1
+
+    def invalidate(self, cache_keys: Optional[List[str]] = None):
+        with self._lock:
+            if cache_keys is None:
+                self.entries = {}
+            for key in cache_keys or []:
+                self.entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self.entries), **self.counters}
+
+
+class _AwaitablePipeline:
+    """Pipeline of a synchronous client with an awaitable execute()"""
+
+    def __init__(self, pipe):
+        self._pipe = pipe
+
+    def __getattr__(self, name):
+        return getattr(self._pipe, name)
+
+    async def execute(self):
+        return self._pipe.execute()
+
+
+class _AwaitableRedis:
+    """Awaitable view of a synchronous client, so pinned clients (scripts, tests) work on the async path"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def pipeline(self, *args, **kwargs):
+        return _AwaitablePipeline(self._client.pipeline(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+def _profile_dtypes(sample: pd.DataFrame, category_ratio: float = 0.5) -> Dict[str, Any]:
+    """Pick categorical and date columns from a sample of the file"""
+    plan = {"dtype": {}, "parse_dates": []}
+
+    for col in sample.columns:
+        series = sample[col]
+        if not pd.api.types.is_string_dtype(series):
+            continue
+
+        values = series.dropna()
+        if values.empty:
+            continue
+
+        # Dates: nearly every sampled value parses as a timestamp
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            parsed = pd.to_datetime(values, errors="coerce")
+        if parsed.notna().mean() >= 0.95:
+            plan["parse_dates"].append(col)
+            continue
+
+        # Repetitive labels (crop names, field codes, units) become categoricals
+        if values.nunique() / len(values) <= category_ratio:
+            plan["dtype"][col] = "category"
+
+    return plan
+
+
+def _downcast_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """Narrow integer and float columns to the smallest exact dtype"""
+    for col in df.select_dtypes(include=["integer"]).columns:
+        kind = "unsigned" if df[col].min() >= 0 else "integer"
+        df[col] = pd.to_numeric(df[col], downcast=kind)
+
+    for col in df.select_dtypes(include=["floating"]).columns:
+        narrowed = df[col].astype("float32")
+        # Only keep float32 when every value survives the round trip
+        if narrowed.astype("float64").equals(df[col]):
+            df[col] = narrowed
+
+    return df
+
+
+def _read_dataframe(
+    file_path: str,
+    optimize: bool = True,
+    sample_rows: int = 10000,
+    cancelled: Optional[threading.Event] = None
+) -> Optional[pd.DataFrame]:
+    """Read a CSV/Excel file, applying dtypes profiled from a sample.
+
+    Returns None without the full read when `cancelled` is set once the
+    sample is profiled (a speculative read whose answer came from cache).
+    """
+    if file_path.endswith('.csv'):
+        reader = pd.read_csv
+    elif file_path.endswith(('.xlsx', '.xls')):
+        reader = pd.read_excel
+    else:
+        raise ValueError("File must be CSV or Excel format")
+
+    if not optimize:
+        return reader(file_path)
+
+    plan = _profile_dtypes(reader(file_path, nrows=sample_rows))
+    if cancelled is not None and cancelled.is_set():
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        df = reader(file_path, dtype=plan["dtype"] or None, parse_dates=plan["parse_dates"] or None)
+
+    return _downcast_numeric(df)
+
+
+def _duckdb_select_list(df: pd.DataFrame) -> str:
+    """Widen narrowed numeric columns back to BIGINT/DOUBLE for DuckDB.
+
+    DuckDB compresses its own storage, and narrow types overflow in
+    generated SQL arithmetic (e.g. UTINYINT + UTINYINT).
+    """
+    columns = []
+    for col in df.columns:
+        if pd.api.types.is_integer_dtype(df[col]):
+            columns.append(f'CAST("{col}" AS BIGINT) AS "{col}"')
+        elif pd.api.types.is_float_dtype(df[col]):
+            columns.append(f'CAST("{col}" AS DOUBLE) AS "{col}"')
+        else:
+            columns.append(f'"{col}"')
+    return ", ".join(columns)
+
+
+# Open WebUI execs tools from a temp file it deletes right after; parse
+# workers rebuild the module from this copy when it cannot be imported
+try:
+    with open(__file__, encoding="utf-8") as _source:
+        _MODULE_SOURCE: Optional[str] = _source.read()
+except (NameError, OSError):
+    _MODULE_SOURCE = None
+
+_WORKER_BOOTSTRAP = (
+    "import sys, types\n"
+    "module = types.ModuleType(name)\n"
+    "sys.modules[name] = module\n"
+    "exec(source, module.__dict__)\n"
+)
+
+
+def _importable(module_name: str) -> bool:
+    """Whether a spawned process can import `module_name` by itself"""
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except (ValueError, ImportError):
+        return False
+
+
+def _parse_to_duckdb(file_path: str, optimize: bool, sample_rows: int, output_path: str) -> Dict[str, str]:
+    """Parse worker: read the upload and leave it in a one-table DuckDB file at `output_path`.
+
+    DuckDB keeps categoricals as ENUMs, so the caller reads them back
+    without re-encoding strings. Returns the column dtypes to restore.
+    """
+    df = _read_dataframe(file_path, optimize=optimize, sample_rows=sample_rows)
+    conn = duckdb.connect(output_path)
+    try:
+        conn.execute("CREATE TABLE parsed AS SELECT * FROM df")
+    finally:
+        conn.close()
+    return {str(col): str(dtype) for col, dtype in df.dtypes.items()}
+
+
+def _read_parsed_frame(path: str, dtypes: Dict[str, str]) -> pd.DataFrame:
+    """Map a parse worker's DuckDB file back into a DataFrame with the worker's dtypes"""
+    conn = duckdb.connect(path, read_only=True)
+    try:
+        df = conn.execute("SELECT * FROM parsed").fetchdf()
+    finally:
+        conn.close()
+
+    for col, dtype in dtypes.items():
+        if dtype == "category" and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.as_unordered()  # ENUMs come back ordered
+        elif str(df[col].dtype) != dtype:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def _has_room(directory: str, upload_bytes: int) -> bool:
+    """Whether a handoff file for an upload this size fits (a DuckDB copy can outgrow compressed Excel)"""
+    try:
+        return shutil.disk_usage(directory).free >= 2 * upload_bytes
+    except OSError:
+        return False
+
+
+class _ParsePool:
+    """Worker processes that parse uploads off the GIL, each replaced after `max_jobs` parses.
+
+    A parse hands its frame back as a DuckDB file in `directory` (the temp
+    directory, or shared memory when PARSE_HANDOFF_DIRECTORY is /dev/shm)
+    plus a small dtype map, so no DataFrame is pickled between processes.
+    """
+
+    def __init__(self, workers: int, max_jobs: int):
+        kwargs = {}
+        if not _importable(__name__):
+            if not _MODULE_SOURCE:
+                raise RuntimeError("tool module is neither importable nor available as source")
+            kwargs = {"initializer": exec, "initargs": (_WORKER_BOOTSTRAP, {"name": __name__, "source": _MODULE_SOURCE})}
+
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            max_tasks_per_child=max_jobs or None,
+            **kwargs
+        )
+
+    def parse(
+        self,
+        file_path: str,
+        optimize: bool,
+        sample_rows: int,
+        directory: str,
+        cancelled: Optional[threading.Event] = None
+    ) -> Tuple[Optional[pd.DataFrame], int]:
+        """Parse in a worker; returns the frame (None once `cancelled`) and the handoff file's size"""
+        if cancelled is not None and cancelled.is_set():
+            return None, 0
+        output_path = os.path.join(directory, f"smartfarm-parse-{uuid.uuid4().hex}.duckdb")
+        try:
+            dtypes = self.executor.submit(_parse_to_duckdb, file_path, optimize, sample_rows, output_path).result()
+            size = os.path.getsize(output_path)
+            if cancelled is not None and cancelled.is_set():
+                return None, size
+            return _read_parsed_frame(output_path, dtypes), size
+        finally:
+            for path in (output_path, f"{output_path}.wal"):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_PARSE_POOL: Optional[_ParsePool] = None
+_PARSE_POOL_LOCK = threading.Lock()
+
+
+def _get_parse_pool(workers: int, max_jobs: int) -> _ParsePool:
+    """Process-wide parse pool, rebuilt when its size or recycling setting changes"""
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL and (_PARSE_POOL.workers, _PARSE_POOL.max_jobs) != (workers, max_jobs):
+            _PARSE_POOL.shutdown()
+            _PARSE_POOL = None
+        if _PARSE_POOL is None:
+            _PARSE_POOL = _ParsePool(workers, max_jobs)
+        return _PARSE_POOL
+
+
+def _reset_parse_pool(pool: _ParsePool):
+    """Drop a pool whose worker died so the next parse starts a fresh one"""
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is pool:
+            _PARSE_POOL = None
+    pool.shutdown()
+
+
+def _duckdb_connect(
+    database: str,
+    memory_limit: str = "",
+    threads: int = 0,
+    temp_directory: str = "",
+    max_temp_directory_size: str = ""
+) -> duckdb.DuckDBPyConnection:
+    """Open DuckDB with resource limits so heavy queries spill instead of taking the host down.
+
+    Empty/zero settings keep DuckDB's defaults (80% of RAM, every core).
+    """
+    conn = duckdb.connect(database)
+    settings = {
+        "memory_limit": memory_limit,
+        "threads": threads,
+        "temp_directory": temp_directory,
+        "max_temp_directory_size": max_temp_directory_size,
+    }
+    for name, value in settings.items():
+        if value:
+            conn.execute(f"SET {name} = '{value}'")
+    if settings["memory_limit"]:
+        # Let large aggregations and sorts stream to disk instead of buffering in order
+        conn.execute("SET preserve_insertion_order = false")
+    return conn
+
+
+class _DuckDBWatchdog:
+    """Interrupts a DuckDB statement after `timeout` seconds and samples how much it spills.
+
+    Spill is read from duckdb_temporary_files() on a second cursor while
+    the statement runs; `spill_bytes` is the peak observed.
+    """
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, timeout: float = 0, poll_interval: float = 0.1):
+        self.conn = conn
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.spill_bytes = 0
+        self.timed_out = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        # A deadline that fires as the statement finishes is not a timeout
+        self.timed_out = self.timed_out and isinstance(exc, duckdb.InterruptException)
+        if self.timed_out:
+            raise TimeoutError(f"DuckDB query exceeded {self.timeout:g}s (QUERY_TIMEOUT)") from exc
+        return False
+
+    def _watch(self):
+        deadline = time.monotonic() + self.timeout if self.timeout > 0 else None
+        try:
+            cursor = self.conn.cursor()
+        except duckdb.Error:
+            cursor = None
+
+        while not self._stop.wait(self.poll_interval):
+            if cursor is not None:
+                try:
+                    size = cursor.execute("SELECT coalesce(sum(size), 0) FROM duckdb_temporary_files()").fetchone()[0]
+                    self.spill_bytes = max(self.spill_bytes, int(size))
+                except duckdb.Error:
+                    cursor = None
+            if deadline is not None and time.monotonic() >= deadline:
+                self.timed_out = True
+                self.conn.interrupt()
+                break
+
+        if cursor is not None:
+            cursor.close()
+
+
+def _render_markdown(df: pd.DataFrame, max_rows: int = 200, max_bytes: int = 65536) -> str:
+    """Render a result DataFrame as a markdown table within row and byte budgets.
+
+    Columns are formatted and padded with vectorized string ops instead of
+    tabulate's per-cell loop, which dominates miss latency on large results.
+    """
+    if df.empty:
+        return "No results"
+
+    shown = df.iloc[:max(max_rows, 1)]
+    headers = [str(col).replace("|", "\\|") for col in shown.columns]
+    cells = []
+    right_align = []
+
+    for col in shown.columns:
+        series = shown[col]
+        numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        if pd.api.types.is_float_dtype(series):
+            text = pd.Series(np.char.mod("%g", series.to_numpy(dtype="float64")), index=series.index)
+        else:
+            text = series.astype(str)
+        text = text.where(series.notna(), "")
+        if not numeric:
+            text = (
+                text.str.replace("|", "\\|", regex=False)
+                .str.replace("\r", " ", regex=False)
+                .str.replace("\n", " ", regex=False)
+            )
+        cells.append(text)
+        right_align.append(numeric)
+
+    # Column widths from vectorized string lengths
+    widths = [
+        max(len(header), int(text.str.len().max() or 0), 3)
+        for header, text in zip(headers, cells)
+    ]
+
+    rows = None
+    for text, width, right in zip(cells, widths, right_align):
+        padded = text.str.rjust(width) if right else text.str.ljust(width)
+        rows = "| " + padded if rows is None else rows + " | " + padded
+    rows = rows + " |"
+
+    header_line = "| " + " | ".join(h.ljust(w) for h, w in zip(headers, widths)) + " |"
+    separator = "|" + "|".join(
+        "-" * (w + 1) + ":" if right else "-" * (w + 2)
+        for w, right in zip(widths, right_align)
+    ) + "|"
+
+    # Enforce the byte budget on whole lines
+    budget = max_bytes - len(header_line.encode()) - len(separator.encode()) - 2
+    line_bytes = rows.str.encode("utf-8").str.len() + 1
+    fits = int((line_bytes.cumsum() <= budget).sum())
+    lines = [header_line, separator] + rows.iloc[:fits].tolist()
+
+    remaining = len(df) - fits
+    if remaining > 0:
+        lines.append("")
+        lines.append(f"_… {remaining} more rows_")
+
+    return "\n".join(lines)
+
+
+# Pipeline stages in execution order, with display labels
+STAGES = {
+    "hash": "File hashing",
+    "cache_lookup": "Cache lookup",
+    "read": "pandas read",
+    "import": "DuckDB import",
+    "rollup": "Rollup build",
+    "schema_index": "Schema index",
+    "llm_sql": "LLM SQL generation",
+    "approx": "Approximate preview",
+    "execute": "SQL execution",
+    "render": "Markdown rendering",
+    "cache_write": "Redis write",
+}
+
+# Histogram bucket upper bounds in seconds
+STAGE_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+class _StageTimer:
+    """Span-style wall-clock timing of pipeline stages"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def footer(self) -> str:
+        """One-line breakdown for debug output"""
+        return " · ".join(f"{STAGES.get(name, name)} {seconds * 1000:.0f}ms" for name, seconds in self.timings.items())
+
+
+def _stage_summary(redis_client) -> List[Dict[str, Any]]:
+    """Per-stage count, mean, p95 and share of total time from Redis histograms"""
+    pipe = redis_client.pipeline()
+    for stage in STAGES:
+        pipe.hgetall(f"excel:stages:{stage}")
+    return _summarize_stages(pipe.execute())
+
+
+async def _astage_summary(redis_client) -> List[Dict[str, Any]]:
+    """Async _stage_summary for a redis.asyncio client"""
+    pipe = redis_client.pipeline()
+    for stage in STAGES:
+        pipe.hgetall(f"excel:stages:{stage}")
+    return _summarize_stages(await pipe.execute())
+
+
+def _summarize_stages(hists: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """Stage rows from histogram hashes given in STAGES order"""
+    summary = []
+    for stage, hist in zip(STAGES, hists):
+        count = int(hist.get("count", 0))
+        if not count:
+            continue
+
+        # p95 is the upper bound of the bucket holding the 95th percentile
+        p95 = float("inf")
+        seen = 0
+        for bound in STAGE_BUCKETS:
+            seen += int(hist.get(f"le_{bound}", 0))
+            if seen >= 0.95 * count:
+                p95 = bound
+                break
+
+        total = float(hist.get("sum", 0))
+        summary.append({"stage": stage, "label": STAGES[stage], "count": count,
+                        "total": total, "mean": total / count, "p95": p95})
+
+    grand_total = sum(row["total"] for row in summary) or 1
+    for row in summary:
+        row["share"] = row["total"] / grand_total * 100
+    return sorted(summary, key=lambda row: row["total"], reverse=True)
+
+
+# ValueErrors that mean the file itself cannot be read; any other ValueError may be
+# a passing bug or bad state and must not be negatively cached
+_FILE_FORMAT_ERRORS = (
+    "File must be CSV or Excel format",
+    "Excel file format cannot be determined",
+)
+
+
+def _classify_error(error: Exception) -> str:
+    """Classify a failed analysis.
+
+    `invalid_file` and `invalid_sql` are deterministic for a given file and
+    question and may be negatively cached; `configuration` and `transient`
+    failures must stay retryable.
+    """
+    if isinstance(error, ValueError) and "not configured" in str(error):
+        return "configuration"
+    if isinstance(error, (duckdb.ParserException, duckdb.BinderException, duckdb.CatalogException)):
+        return "invalid_sql"
+    if isinstance(error, (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError, zipfile.BadZipFile)):
+        return "invalid_file"
+    if isinstance(error, ValueError) and str(error).startswith(_FILE_FORMAT_ERRORS):
+        return "invalid_file"
+    return "transient"
+
+
+# Question tokens: quoted strings, ISO dates, numbers, words, punctuation
+_QUESTION_TOKEN = re.compile(r"""'[^']*'|"[^"]*"|\d{4}-\d{2}-\d{2}|\d+(?:\.\d+)?(?!\w)|\w+|[^\w\s]""")
+# SQL literals: single-quoted strings ('' escapes) and bare numbers outside identifiers
+_SQL_LITERAL = re.compile(r"""'((?:[^']|'')*)'|(?<![\w."])(\d+(?:\.\d+)?)(?![\w."])""")
+# Text right before a column ordinal: GROUP BY / ORDER BY and any earlier items of their list
+_SQL_ORDINAL_CONTEXT = re.compile(
+    r"""\b(?:GROUP|ORDER)\s+BY\s+(?:[^,;()']+?(?:\s+(?:ASC|DESC))?\s*,\s*)*$""", re.IGNORECASE
+)
+_TEMPLATE_MAX_WORDS = 4
+
+
+def _literal_vocabulary(df: pd.DataFrame, sample_rows: int = 10000, max_values: int = 5000) -> Dict[str, str]:
+    """Lower-cased values of low-cardinality text columns -> value as stored.
+
+    Categorical columns contribute all categories; other text columns
+    contribute the distinct values of a sample.
+    """
+    vocabulary = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            values = series.cat.categories
+        elif pd.api.types.is_string_dtype(series) or series.dtype == object:
+            values = series.head(sample_rows).dropna().unique()
+            if len(values) > max(50, sample_rows // 20):
+                continue  # Free text, not labels
+        else:
+            continue
+        for value in values:
+            if isinstance(value, str) and len(value.split()) <= _TEMPLATE_MAX_WORDS and any(c.isalpha() for c in value):
+                vocabulary.setdefault(value.lower().strip(), value)
+            if len(vocabulary) >= max_values:
+                return vocabulary
+    return vocabulary
+
+
+def _question_skeleton(question: str, vocabulary: Dict[str, str]) -> Tuple[str, List[Tuple[str, str]]]:
+    """Replace the literals of a question with typed placeholders.
+
+    Numbers become `{num}`; quoted strings, dates and known column values
+    become `{text}`. Returns the skeleton and the literals in order as
+    (kind, value).
+    """
+    tokens = _QUESTION_TOKEN.findall(question)
+    skeleton, literals = [], []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token[0] in "'\"":
+            skeleton.append("{text}")
+            literals.append(("text", token[1:-1]))
+        elif re.fullmatch(r"\d{4}-\d{2}-\d{2}", token):
+            skeleton.append("{text}")
+            literals.append(("text", token))
+        elif token[0].isdigit() and re.fullmatch(r"\d+(?:\.\d+)?", token):
+            skeleton.append("{num}")
+            literals.append(("num", token))
+        else:
+            # Longest run of words that is a known value
+            for width in range(min(_TEMPLATE_MAX_WORDS, len(tokens) - i), 0, -1):
+                phrase = " ".join(tokens[i:i + width]).lower()
+                if phrase in vocabulary:
+                    skeleton.append("{text}")
+                    literals.append(("text", vocabulary[phrase]))
+                    i += width
+                    break
+            else:
+                skeleton.append(token.lower())
+                i += 1
+            continue
+        i += 1
+    return " ".join(skeleton), literals
+
+
+def _sql_template(sql: str, literals: List[Tuple[str, str]]) -> Optional[List[Any]]:
+    """Parameterize generated SQL by the question's literals.
+
+    Returns segments: SQL text, or {"param": i, "quoted": bool} where the
+    i-th question literal goes. None when a question literal does not
+    appear in the SQL exactly once, or a SQL literal could be more than
+    one question literal, since the SQL then depends on it in a way that
+    cannot be rebound. Column ordinals (GROUP BY 1, ORDER BY 2) are never
+    parameters, even when the question has an equal number.
+    """
+    matches = []
+    for match in _SQL_LITERAL.finditer(sql):
+        text, number = match.group(1), match.group(2)
+        if text is not None:
+            value = text.replace("''", "'")
+            found = []
+            for i, (_, literal) in enumerate(literals):
+                hit = re.search(rf"(?<!\w){re.escape(literal)}(?!\w)", value, re.IGNORECASE) if literal else None
+                if hit:
+                    found.append((i, hit))
+        elif _SQL_ORDINAL_CONTEXT.search(sql[:match.start()]):
+            continue
+        else:
+            found = [(i, None) for i, (kind, literal) in enumerate(literals) if kind == "num" and float(literal) == float(number)]
+        if len(found) > 1:
+            return None
+        if found:
+            matches.append((match, value if text is not None else None, *found[0]))
+
+    params = [i for _, _, i, _ in matches]
+    if sorted(params) != list(range(len(literals))):
+        return None
+
+    segments, last = [], 0
+    for match, value, i, found in matches:
+        segments.append(sql[last:match.start()])
+        if value is not None:
+            segments += [
+                "'" + value[:found.start()].replace("'", "''"),
+                {"param": i, "quoted": True},
+                value[found.end():].replace("'", "''") + "'",
+            ]
+        else:
+            segments.append({"param": i, "quoted": False})
+        last = match.end()
+    segments.append(sql[last:])
+    return [segment for segment in segments if segment != ""]
+
+
+def _bind_sql_template(segments: List[Any], literals: List[Tuple[str, str]]) -> str:
+    """SQL for new literals from a template made by _sql_template"""
+    parts = []
+    for segment in segments:
+        if isinstance(segment, str):
+            parts.append(segment)
+        else:
+            value = literals[segment["param"]][1]
+            parts.append(value.replace("'", "''") if segment["quoted"] else value)
+    return "".join(parts)
+
+
+_SQL_PARSER = threading.local()
+
+
+def _normalize_sql(sql: str) -> str:
+    """Canonical text of a query, so SQL that differs only in layout or keyword case shares one result.
+
+    Round-trips through DuckDB's parser on a per-thread in-memory
+    connection; identifiers, aliases and literals keep their case. SQL the
+    parser rejects falls back to collapsed whitespace.
+    """
+    conn = getattr(_SQL_PARSER, "conn", None)
+    if conn is None:
+        conn = _SQL_PARSER.conn = duckdb.connect()
+    try:
+        tree = conn.execute("SELECT json_serialize_sql(?)", [sql.strip().rstrip(";")]).fetchone()[0]
+        if not json.loads(tree).get("error"):
+            return conn.execute("SELECT json_deserialize_sql(?::JSON)", [tree]).fetchone()[0]
+    except duckdb.Error:
+        pass
+    return " ".join(sql.split()).rstrip(";").rstrip()
+
+
+def _merge_shared_result(entry: Dict[str, Any], shared: str) -> Dict[str, Any]:
+    """A question entry with the shared result body it points at filled in"""
+    result = json.loads(shared)
+    result.update(entry)
+    return result
+
+
+_AGGREGATE = re.compile(r"\b(count|sum|avg|mean|min|max|median|stddev\w*|var\w*|quantile\w*)\s*\(", re.IGNORECASE)
+
+
+def _approximate_answer(
+    conn: duckdb.DuckDBPyConnection,
+    table_name: str,
+    sample: pd.DataFrame,
+    population: int,
+    sql_query: str
+) -> Optional[Dict[str, Any]]:
+    """Run generated SQL over a uniform sample of the table, scaled to the population.
+
+    The SQL runs unchanged on a separate cursor, where a TEMP table of the
+    same name holding the sample shadows the real one. Running it again on
+    two disjoint half-samples tells the two kinds of numeric column apart.
+    Columns like SUM/COUNT roughly halve, so they are scaled up by
+    population / sample. Columns like AVG/MIN/MAX stay about the same.
+    How much the halves disagree gives the error estimate: relative
+    |a - b| / (|a| + |b|) per aligned cell, reported as a 95% bound on the
+    median. Non-aggregate SQL returns None, since a sample of rows is not
+    an estimate of anything.
+    """
+    if not _AGGREGATE.search(sql_query) or len(sample) < 2:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        def run(part: pd.DataFrame) -> pd.DataFrame:
+            cursor.execute(f"CREATE OR REPLACE TEMP TABLE {table_name} AS SELECT {_duckdb_select_list(part)} FROM part")
+            return cursor.execute(sql_query).fetchdf()
+
+        estimate = run(sample)
+        half_a, half_b = run(sample.iloc[0::2]), run(sample.iloc[1::2])
+    finally:
+        cursor.close()
+
+    numeric = [col for col in estimate.columns if pd.api.types.is_numeric_dtype(estimate[col])]
+    keys = [col for col in estimate.columns if col not in numeric]
+
+    # Line the three results up row by row: by key columns, or by position for single-row answers
+    if keys:
+        aligned = estimate.merge(half_a, on=keys, how="left", suffixes=("", "_a")) \
+                          .merge(half_b.rename(columns={c: f"{c}_b" for c in numeric}), on=keys, how="left")
+    elif len(estimate) == len(half_a) == len(half_b):
+        aligned = pd.concat([
+            estimate.reset_index(drop=True),
+            half_a[numeric].add_suffix("_a").reset_index(drop=True),
+            half_b[numeric].add_suffix("_b").reset_index(drop=True),
+        ], axis=1)
+    else:
+        aligned = None
+
+    scale = population / len(sample)
+    scaled_columns, errors = [], []
+    for col in numeric:
+        if aligned is None or f"{col}_a" not in aligned or f"{col}_b" not in aligned:
+            continue
+        full = aligned[col].astype(float)
+        a, b = aligned[f"{col}_a"].astype(float), aligned[f"{col}_b"].astype(float)
+        ratio = ((a + b) / full.where(full != 0)).dropna()
+        if not ratio.empty and ratio.median() < 1.5:
+            estimate[col] = estimate[col].astype(float) * scale
+            scaled_columns.append(col)
+        spread = ((a - b).abs() / (a.abs() + b.abs()).where(lambda d: d != 0)).dropna()
+        errors.extend(spread.tolist())
+
+    return {
+        "result": estimate,
+        "sample_rows": len(sample),
+        "population": population,
+        "scaled_columns": scaled_columns,
+        "error": float(np.median(errors)) * 1.96 if errors else None,
+    }
+
+
+def _schema_fingerprint(table_name: str, df: pd.DataFrame) -> str:
+    """Table name, column names and types: what generated SQL depends on"""
+    schema = [table_name] + [f"{col}:{dtype}" for col, dtype in df.dtypes.items()]
+    return hashlib.sha256("|".join(schema).encode()).hexdigest()[:16]
+
+
+# Date functions each rollup grain still answers exactly (day buckets cannot answer hour-level questions)
+_GRAIN_TRUNC_PARTS = {
+    "day": {"day", "week", "month", "quarter", "year", "decade", "century", "millennium"},
+    "week": {"week"},
+}
+_GRAIN_DATE_FUNCTIONS = {
+    "day": {"year", "month", "quarter", "week", "weekofyear", "yearweek", "isoyear", "day", "dayofmonth",
+            "dayofweek", "isodow", "dayofyear", "dayname", "monthname", "last_day"},
+    "week": {"week", "weekofyear", "yearweek", "isoyear"},
+}
+# Comparisons against a midnight boundary split day buckets exactly: ts >= '2024-03-01', ts < '2024-04-01'
+_DAY_BOUNDARY_SIDES = {
+    "COMPARE_GREATERTHANOREQUALTO": ("left", "right"),
+    "COMPARE_LESSTHAN": ("left", "right"),
+    "COMPARE_LESSTHANOREQUALTO": ("right", "left"),
+    "COMPARE_GREATERTHAN": ("right", "left"),
+}
+_DATE_LITERAL = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_DATE_TYPES = {"DATE", "TIMESTAMP", "TIMESTAMP_S", "TIMESTAMP_MS", "TIMESTAMP_NS"}
+_AGGREGATE_FUNCTIONS: Optional[set] = None
+
+
+def _aggregate_functions(conn: duckdb.DuckDBPyConnection) -> set:
+    """Names of every DuckDB aggregate function (looked up once per process)"""
+    global _AGGREGATE_FUNCTIONS
+    if _AGGREGATE_FUNCTIONS is None:
+        rows = conn.execute("SELECT DISTINCT function_name FROM duckdb_functions() WHERE function_type = 'aggregate'").fetchall()
+        _AGGREGATE_FUNCTIONS = {name.lower() for name, in rows}
+    return _AGGREGATE_FUNCTIONS
+
+
+def _build_rollups(conn: duckdb.DuckDBPyConnection, table_name: str, df: pd.DataFrame, max_ratio: float = 0.1) -> List[Dict[str, Any]]:
+    """Materialize compact aggregate tables of `table_name` for the query router.
+
+    Dimensions are the low-cardinality label columns (field, crop, sensor),
+    measures the numeric ones, and the first date column is bucketed per day
+    and per week. Each measure keeps SUM, non-null COUNT, MIN and MAX, which
+    answers SUM/COUNT/AVG/MIN/MAX exactly; `__rows` answers COUNT(*). A
+    rollup over `max_ratio` of the table's rows saves too little, so the
+    widest dimension is dropped until it fits. The week rollup is built from
+    the day rollup and kept only when it halves it again.
+    """
+    rows = len(df)
+    types = {name: column_type for name, column_type, *_ in conn.execute(f"DESCRIBE {table_name}").fetchall()}
+    date_column = next((col for col in df.columns if types.get(col) in _DATE_TYPES), None)
+    measures = [
+        col for col in df.columns
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+    ]
+    labels = [col for col in df.columns if col not in measures and col != date_column and types.get(col) not in _DATE_TYPES]
+
+    profile = [f'approx_count_distinct("{col}")' for col in labels]
+    if date_column:
+        profile.append(f"""coalesce(bool_and("{date_column}" = date_trunc('day', "{date_column}")), true)""")
+    if not profile:
+        return []
+    stats = conn.execute(f"SELECT {', '.join(profile)} FROM {table_name}").fetchone()
+    distinct = dict(zip(labels, stats))
+    dimensions = sorted((col for col in labels if distinct[col] <= rows * max_ratio), key=distinct.get)
+    date_exact = bool(stats[-1]) if date_column else False
+    if not dimensions and not date_column:
+        return []
+
+    def bucket(grain: str, source: str) -> str:
+        return f"""CAST(date_trunc('{grain}', "{source}") AS {types[date_column]}) AS "{date_column}\""""
+
+    aggregates = ", ".join(
+        f'SUM("{m}") AS "{m}__sum", COUNT("{m}") AS "{m}__count", MIN("{m}") AS "{m}__min", MAX("{m}") AS "{m}__max"'
+        for m in measures
+    )
+    grain = "day" if date_column else None
+    base = f"{table_name}__rollup_{grain or 'all'}"
+    while True:
+        keys = [f'"{col}"' for col in dimensions] + ([bucket("day", date_column)] if date_column else [])
+        conn.execute(
+            f"CREATE OR REPLACE TABLE {base} AS SELECT {', '.join(keys)}, COUNT(*) AS __rows"
+            f"{', ' + aggregates if aggregates else ''} FROM {table_name} GROUP BY ALL"
+        )
+        size = conn.execute(f"SELECT COUNT(*) FROM {base}").fetchone()[0]
+        if size <= rows * max_ratio or not dimensions:
+            break
+        dimensions = dimensions[:-1]
+
+    if size > rows * max_ratio:
+        conn.execute(f"DROP TABLE {base}")
+        return []
+
+    spec = {
+        "table_rows": rows,
+        "columns": [col.lower() for col in df.columns],
+        "dimensions": dimensions,
+        "measures": measures,
+        "date_column": date_column,
+    }
+    rollups = [dict(spec, table=base, grain=grain, rows=size, date_exact=date_exact)]
+
+    if date_column:
+        week = f"{table_name}__rollup_week"
+        keys = [f'"{col}"' for col in dimensions] + [bucket("week", date_column)]
+        reaggregates = "".join(
+            f', SUM("{m}__sum") AS "{m}__sum", CAST(SUM("{m}__count") AS BIGINT) AS "{m}__count"'
+            f', MIN("{m}__min") AS "{m}__min", MAX("{m}__max") AS "{m}__max"'
+            for m in measures
+        )
+        conn.execute(
+            f"CREATE OR REPLACE TABLE {week} AS SELECT {', '.join(keys)}, "
+            f"CAST(SUM(__rows) AS BIGINT) AS __rows{reaggregates} FROM {base} GROUP BY ALL"
+        )
+        week_size = conn.execute(f"SELECT COUNT(*) FROM {week}").fetchone()[0]
+        if week_size * 2 <= size:
+            rollups.insert(0, dict(spec, table=week, grain="week", rows=week_size, date_exact=False))
+        else:
+            conn.execute(f"DROP TABLE {week}")
+
+    return rollups
+
+
+class _NotRoutable(Exception):
+    """A query a rollup cannot answer exactly"""
+
+
+class _RollupRewriter:
+    """Walks a serialized DuckDB query, mapping raw-table aggregates onto rollup columns.
+
+    Outside aggregates only rollup dimensions may appear, plus the date
+    column where the rollup's grain answers it exactly. Anything else
+    (measures in WHERE, subqueries, windows, MEDIAN...) raises _NotRoutable.
+    """
+
+    EXPRESSIONS = {"COLUMN_REF", "CONSTANT", "FUNCTION", "OPERATOR", "COMPARISON", "CONJUNCTION", "CAST", "CASE", "BETWEEN"}
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, rollup: Dict[str, Any]):
+        self.conn = conn
+        self.grain = rollup["grain"]
+        self.columns = set(rollup["columns"])
+        self.dimensions = {col.lower() for col in rollup["dimensions"]}
+        self.measures = {col.lower(): col for col in rollup["measures"]}
+        self.date = (rollup["date_column"] or "").lower()
+        self.date_exact = rollup["date_exact"]
+        self.aggregates = 0
+
+    def visit(self, value):
+        if isinstance(value, list):
+            return [self.visit(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if "class" not in value:
+            if value.get("type") == "ORDER_MODIFIER":
+                # ORDER BY ALL sorts by the output columns and names no table column
+                orders = [
+                    order if order["expression"]["class"] == "STAR" and order["expression"]["columns"] else self.visit(order)
+                    for order in value["orders"]
+                ]
+                return dict(value, orders=orders)
+            return {key: self.visit(item) for key, item in value.items()}
+
+        if value["class"] not in self.EXPRESSIONS:
+            raise _NotRoutable(value["class"])
+        if value["class"] == "COLUMN_REF":
+            return self.column(value)
+        if value["class"] == "FUNCTION" and value["function_name"].lower() in _aggregate_functions(self.conn):
+            return self.aggregate(value)
+        if self.date and not self.date_exact and self.date_bucket(value):
+            return value
+        return {key: self.visit(item) for key, item in value.items()}
+
+    def column(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        name = node["column_names"][-1].lower()
+        if name == self.date:
+            if not self.date_exact:
+                raise _NotRoutable(f"{name} below the {self.grain} grain")
+        elif name in self.columns and name not in self.dimensions:
+            raise _NotRoutable(f"{name} is not a rollup dimension")
+        return node
+
+    def is_date(self, node: Dict[str, Any]) -> bool:
+        return node["class"] == "COLUMN_REF" and node["column_names"][-1].lower() == self.date
+
+    def date_bucket(self, node: Dict[str, Any]) -> bool:
+        """True for date expressions constant within one rollup bucket"""
+        if node["class"] == "FUNCTION":
+            name, args = node["function_name"].lower(), node["children"]
+            if name in ("date_trunc", "datetrunc") and len(args) == 2 and self.is_date(args[1]):
+                return args[0]["class"] == "CONSTANT" and str(args[0]["value"]["value"]).lower() in _GRAIN_TRUNC_PARTS[self.grain]
+            return name in _GRAIN_DATE_FUNCTIONS[self.grain] and len(args) == 1 and self.is_date(args[0])
+        if node["class"] == "CAST":
+            return self.grain == "day" and node["cast_type"]["id"] == "DATE" and self.is_date(node["child"])
+        if node["class"] == "COMPARISON" and self.grain == "day" and node["type"] in _DAY_BOUNDARY_SIDES:
+            column, literal = _DAY_BOUNDARY_SIDES[node["type"]]
+            value = node[literal]
+            if value["class"] == "CAST" and value["cast_type"]["id"] == "DATE":
+                value = value["child"]
+            return (
+                self.is_date(node[column])
+                and value["class"] == "CONSTANT"
+                and _DATE_LITERAL.match(str(value["value"]["value"])) is not None
+            )
+        return False
+
+    def aggregate(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        name, args = node["function_name"].lower(), node["children"]
+        if node.get("filter") or node["order_bys"]["orders"]:
+            raise _NotRoutable("aggregate FILTER/ORDER BY")
+
+        count_rows = name == "count_star" or (
+            name == "count" and not node["distinct"] and len(args) == 1
+            and args[0]["class"] == "CONSTANT" and not args[0]["value"]["is_null"]
+        )
+        if count_rows:
+            expression = 'CAST(COALESCE(SUM("__rows"), 0) AS BIGINT)'
+        elif len(args) != 1 or args[0]["class"] != "COLUMN_REF":
+            raise _NotRoutable(f"{name} over an expression")
+        else:
+            column = args[0]["column_names"][-1].lower()
+            if column in self.measures and not node["distinct"]:
+                m = self.measures[column]
+                expression = {
+                    "sum": f'SUM("{m}__sum")',
+                    "count": f'CAST(COALESCE(SUM("{m}__count"), 0) AS BIGINT)',
+                    "avg": f'SUM("{m}__sum") / SUM("{m}__count")',
+                    "mean": f'SUM("{m}__sum") / SUM("{m}__count")',
+                    "min": f'MIN("{m}__min")',
+                    "max": f'MAX("{m}__max")',
+                }.get(name)
+                if expression is None:
+                    raise _NotRoutable(f"{name} has no rollup form")
+            elif (column in self.dimensions or (column == self.date and self.date_exact)) and (
+                name in ("min", "max") or (name == "count" and node["distinct"])
+            ):
+                # Rollups keep every distinct dimension value: MIN/MAX/COUNT(DISTINCT) run unchanged
+                self.aggregates += 1
+                return node
+            else:
+                raise _NotRoutable(f"{name}({column})")
+
+        self.aggregates += 1
+        tree = json.loads(self.conn.execute("SELECT json_serialize_sql(?)", [f"SELECT {expression}"]).fetchone()[0])
+        replacement = tree["statements"][0]["node"]["select_list"][0]
+        replacement["alias"] = node["alias"]
+        return replacement
+
+
+def _rewrite_for_rollup(conn: duckdb.DuckDBPyConnection, table_name: str, sql_query: str, rollup: Dict[str, Any]) -> Optional[str]:
+    """Rewrite an aggregate query over `table_name` to read `rollup`, or None when it cannot answer exactly.
+
+    Works on DuckDB's own parse tree (json_serialize_sql), so only single
+    SELECTs over the table qualify: no joins, CTEs, subqueries, samples or
+    row-level output. The rollup is aliased to the table's name so
+    qualified column references keep resolving.
+    """
+    tree = json.loads(conn.execute("SELECT json_serialize_sql(?)", [sql_query]).fetchone()[0])
+    if tree.get("error") or len(tree["statements"]) != 1:
+        return None
+
+    node = tree["statements"][0]["node"]
+    source = node.get("from_table") or {}
+    if (
+        node["type"] != "SELECT_NODE"
+        or node["cte_map"]["map"]
+        or node.get("sample")
+        or node.get("qualify")
+        or node["aggregate_handling"] not in ("STANDARD_HANDLING", "FORCE_AGGREGATES")
+        or source.get("type") != "BASE_TABLE"
+        or source["table_name"].lower() != table_name.lower()
+        or source.get("schema_name")
+        or source.get("sample")
+    ):
+        return None
+
+    rewriter = _RollupRewriter(conn, rollup)
+    try:
+        rewritten = {key: value if key == "from_table" else rewriter.visit(value) for key, value in node.items()}
+    except _NotRoutable:
+        return None
+
+    # Plain row listings read every raw row; only aggregated or distinct output can come from a rollup
+    distinct = any(modifier["type"] == "DISTINCT_MODIFIER" for modifier in node["modifiers"])
+    if not (rewriter.aggregates or node["group_expressions"] or distinct):
+        return None
+
+    rewritten["from_table"] = dict(source, table_name=rollup["table"], alias=source["alias"] or source["table_name"])
+    tree["statements"][0]["node"] = rewritten
+    return conn.execute("SELECT json_deserialize_sql(?::JSON)", [json.dumps(tree)]).fetchone()[0]
+
+
+def _partition_column(df: pd.DataFrame) -> Optional[str]:
+    """First timezone-naive datetime column: what makes a dataset a time series"""
+    return next((col for col in df.columns if pd.api.types.is_datetime64_dtype(df[col])), None)
+
+
+def _replace_relation(conn: duckdb.DuckDBPyConnection, name: str, kind: str):
+    """Drop `name` when it exists as the other kind (DuckDB will not replace a table with a view or back)"""
+    existing = conn.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?", [name]
+    ).fetchone()
+    if existing and existing[0] != kind:
+        conn.execute(f"DROP {'VIEW' if existing[0] == 'VIEW' else 'TABLE'} {name}")
+
+
+def _write_partitioned(conn: duckdb.DuckDBPyConnection, df: pd.DataFrame, directory: str, date_column: str):
+    """Write `df` as hive-partitioned Parquet, one `__month=YYYY-MM-01` directory per month.
+
+    Rows are sorted by date so row-group min/max statistics also skip
+    within a month. The write goes to a temporary directory that is renamed
+    into place, so readers never see a half-written dataset.
+    """
+    staging = f"{directory}.tmp-{os.getpid()}-{threading.get_ident()}"
+    conn.execute(
+        f"""COPY (SELECT {_duckdb_select_list(df)}, CAST(date_trunc('month', "{date_column}") AS DATE) AS __month """
+        f"""FROM df ORDER BY "{date_column}") TO '{staging}' (FORMAT PARQUET, PARTITION_BY (__month), OVERWRITE_OR_IGNORE)"""
+    )
+    os.replace(staging, directory)
+
+
+def _create_partition_views(conn: duckdb.DuckDBPyConnection, table_name: str, directory: str):
+    """Register the Parquet dataset as `table_name` (what SQL sees) and `<table>__partitions` (with `__month`)"""
+    partitions = f"{table_name}__partitions"
+    _replace_relation(conn, partitions, "VIEW")
+    conn.execute(
+        f"CREATE OR REPLACE VIEW {partitions} AS SELECT * FROM read_parquet("
+        f"'{directory}/*/*.parquet', hive_partitioning = true, hive_types = {{'__month': DATE}})"
+    )
+    _replace_relation(conn, table_name, "VIEW")
+    conn.execute(f"CREATE OR REPLACE VIEW {table_name} AS SELECT * EXCLUDE (__month) FROM {partitions}")
+
+
+def _month_of(node: Dict[str, Any]) -> Optional[pd.Timestamp]:
+    """First of the month of a date/timestamp literal (optionally CAST), or None"""
+    if node["class"] == "CAST" and node["cast_type"]["id"] in _DATE_TYPES:
+        node = node["child"]
+    if node["class"] != "CONSTANT" or node["value"]["is_null"] or node["value"]["type"]["id"] != "VARCHAR":
+        return None
+    try:
+        stamp = pd.Timestamp(node["value"]["value"])
+    except (ValueError, TypeError):
+        return None
+    return None if pd.isna(stamp) else pd.Timestamp(stamp.year, stamp.month, 1)
+
+
+def _month_bounds(where: Optional[Dict[str, Any]], date_column: str) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+    """Earliest and latest month the WHERE clause can match, from its top-level AND-ed date predicates"""
+    low = high = None
+    if not where:
+        return low, high
+
+    conjuncts = where["children"] if where["class"] == "CONJUNCTION" and where["type"] == "CONJUNCTION_AND" else [where]
+    date = date_column.lower()
+
+    def is_date(node):
+        if node["class"] == "CAST" and node["cast_type"]["id"] in _DATE_TYPES:
+            node = node["child"]
+        return node["class"] == "COLUMN_REF" and node["column_names"][-1].lower() == date
+
+    def is_year(node):
+        return node["class"] == "FUNCTION" and node["function_name"].lower() == "year" and len(node["children"]) == 1 and is_date(node["children"][0])
+
+    for node in conjuncts:
+        bounds = (None, None)
+        if node["class"] == "COMPARISON":
+            left, right, op = node["left"], node["right"], node["type"]
+            if is_date(right) and not is_date(left):
+                left, right = right, left
+                op = {"COMPARE_GREATERTHAN": "COMPARE_LESSTHAN", "COMPARE_LESSTHAN": "COMPARE_GREATERTHAN",
+                      "COMPARE_GREATERTHANOREQUALTO": "COMPARE_LESSTHANOREQUALTO",
+                      "COMPARE_LESSTHANOREQUALTO": "COMPARE_GREATERTHANOREQUALTO"}.get(op, op)
+            if is_year(left) and right["class"] == "CONSTANT" and op == "COMPARE_EQUAL":
+                try:
+                    year = int(right["value"]["value"])
+                    bounds = (pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 1))
+                except (TypeError, ValueError):
+                    pass
+            elif is_date(left):
+                month = _month_of(right)
+                if month is not None:
+                    if op in ("COMPARE_GREATERTHAN", "COMPARE_GREATERTHANOREQUALTO"):
+                        bounds = (month, None)
+                    elif op in ("COMPARE_LESSTHAN", "COMPARE_LESSTHANOREQUALTO"):
+                        bounds = (None, month)
+                    elif op == "COMPARE_EQUAL":
+                        bounds = (month, month)
+        elif node["class"] == "BETWEEN" and is_date(node["input"]):
+            bounds = (_month_of(node["lower"]), _month_of(node["upper"]))
+
+        if bounds[0] is not None:
+            low = bounds[0] if low is None else max(low, bounds[0])
+        if bounds[1] is not None:
+            high = bounds[1] if high is None else min(high, bounds[1])
+
+    return low, high
+
+
+def _prune_partitions(conn: duckdb.DuckDBPyConnection, table_name: str, sql_query: str, date_column: str) -> Optional[Dict[str, Any]]:
+    """Rewrite a query over a partitioned table so its date predicates skip whole months.
+
+    DuckDB only prunes hive partitions on filters over the partition column,
+    and generated SQL filters on the date column. The table reference is
+    swapped for a subquery over `<table>__partitions` restricted to the
+    months the WHERE clause can match. Returns the SQL and the month range,
+    or None when the query has no usable date bound.
+    """
+    tree = json.loads(conn.execute("SELECT json_serialize_sql(?)", [sql_query]).fetchone()[0])
+    if tree.get("error") or len(tree["statements"]) != 1:
+        return None
+
+    node = tree["statements"][0]["node"]
+    source = node.get("from_table") or {}
+    if node["type"] != "SELECT_NODE" or source.get("type") != "BASE_TABLE" or source["table_name"].lower() != table_name.lower():
+        return None
+
+    low, high = _month_bounds(node.get("where_clause"), date_column)
+    if low is None and high is None:
+        return None
+
+    filters = []
+    if low is not None:
+        filters.append(f"__month >= DATE '{low.date()}'")
+    if high is not None:
+        filters.append(f"__month <= DATE '{high.date()}'")
+    pruned = json.loads(conn.execute(
+        "SELECT json_serialize_sql(?)",
+        [f"SELECT * FROM (SELECT * EXCLUDE (__month) FROM {table_name}__partitions WHERE {' AND '.join(filters)}) AS {source['alias'] or source['table_name']}"]
+    ).fetchone()[0])
+    node["from_table"] = pruned["statements"][0]["node"]["from_table"]
+    return {
+        "sql": conn.execute("SELECT json_deserialize_sql(?::JSON)", [json.dumps(tree)]).fetchone()[0],
+        "months": (low, high),
+    }
+
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "at", "between", "by", "do", "does", "for", "from", "how", "in", "is", "many", "much",
+    "of", "on", "or", "per", "the", "to", "vs", "was", "were", "what", "when", "which", "with",
+    "al", "con", "cual", "cuál", "cuanto", "cuánto", "cómo", "de", "del", "el", "en", "entre", "es", "la", "las",
+    "los", "para", "por", "que", "qué", "se", "un", "una", "y",
+}
+
+
+def _words(text: str) -> List[str]:
+    """Lowercase words, with identifiers split on _ and camelCase"""
+    words = []
+    for token in re.findall(r"[^\W_]+", text):
+        words.extend(re.sub(r"([a-z])([A-Z][a-z])", r"\1 \2", token).lower().split())
+    return words
+
+
+def _embedding_terms(text: str) -> List[Tuple[str, float]]:
+    """Weighted features: words plus their character trigrams"""
+    terms = []
+    for word in _words(text):
+        if word in _STOPWORDS:
+            continue
+        terms.append((f"w:{word}", 1.0))
+        # Trigrams match across plurals and languages: yields/yield, temperatura/temperature
+        padded = f"#{word}#"
+        terms.extend((f"t:{padded[i:i + 3]}", 0.2) for i in range(len(padded) - 2))
+    return terms
+
+
+def _residual_question(question: str, description: str) -> str:
+    """The question minus words the uploaded table already covers; what is left points at other tables"""
+    def stem(word):
+        return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+    covered = {stem(word) for word in _words(description)}
+    return " ".join(word for word in _words(question) if stem(word) not in covered and word not in _STOPWORDS)
+
+
+class _HashingEmbedding:
+    """Deterministic offline embedding: signed feature hashing of words and trigrams.
+
+    Needs no model or network and gives the same vector in every process,
+    so persisted vectors stay comparable. Good enough to rank a catalog of
+    table descriptions against a question by shared vocabulary.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            vector = np.zeros(self.dimensions)
+            for term, weight in _embedding_terms(text):
+                digest = int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little")
+                vector[digest % self.dimensions] += weight if digest >> 63 else -weight
+            norm = np.linalg.norm(vector)
+            vectors.append((vector / norm if norm else vector).tolist())
+        return vectors
+
+
+class _OpenAIEmbedding:
+    """OpenAI embeddings through LlamaIndex, created once per process instead of on every miss"""
+
+    def __init__(self, api_key: str, model: str = "text-embedding-3-small"):
+        from llama_index.embeddings.openai import OpenAIEmbedding
+
+        self.name = f"openai:{model}"
+        self.model = OpenAIEmbedding(api_key=api_key, model=model)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.model.get_text_embedding_batch(texts)
+
+
+# Embedding providers by EMBEDDING_PROVIDER valve; each factory takes the OpenAI key
+EMBEDDING_PROVIDERS: Dict[str, Callable[[str], Any]] = {
+    "hashing": lambda api_key: _HashingEmbedding(),
+    "openai": lambda api_key: _OpenAIEmbedding(api_key),
+}
+
+_EMBEDDERS: Dict[Tuple[str, str], Any] = {}
+_EMBEDDERS_LOCK = threading.Lock()
+
+
+def _get_embedder(provider: str, api_key: str = ""):
+    """Shared embedder per provider and key"""
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}' (choose from {', '.join(EMBEDDING_PROVIDERS)})")
+    with _EMBEDDERS_LOCK:
+        key = (provider, api_key)
+        if key not in _EMBEDDERS:
+            _EMBEDDERS[key] = EMBEDDING_PROVIDERS[provider](api_key)
+        return _EMBEDDERS[key]
+
+
+def _is_internal_table(name: str) -> bool:
+    """Rollups, partition views and bookkeeping tables never go to the LLM"""
+    return name.startswith("_smartfarm") or "__rollup_" in name or name.endswith("__partitions")
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token)"""
+    return (len(text) + 3) // 4
+
+
+def _table_schema_text(conn: duckdb.DuckDBPyConnection, table_name: str) -> str:
+    """The per-table schema line LlamaIndex puts in the text-to-SQL prompt"""
+    columns = ", ".join(f"{name} ({column_type})" for name, column_type, *_ in conn.execute(f"DESCRIBE {table_name}").fetchall())
+    return f"Table '{table_name}' has columns: {columns}, and foreign keys: ."
+
+
+def _table_description(
+    conn: duckdb.DuckDBPyConnection,
+    table_name: str,
+    df: Optional[pd.DataFrame] = None,
+    max_values: int = 12
+) -> str:
+    """What a table is about, for retrieval: its name and columns, plus sample labels when the data is at hand"""
+    columns = [row[0] for row in conn.execute(f"DESCRIBE {table_name}").fetchall()]
+    lines = [table_name, " ".join(columns)]
+    if df is not None:
+        for col in df.columns:
+            series = df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                values = list(series.cat.categories[:max_values])
+            elif pd.api.types.is_string_dtype(series) and not pd.api.types.is_datetime64_any_dtype(series):
+                values = list(series.dropna().unique()[:max_values])
+            else:
+                continue
+            lines.append(f"{col}: {' '.join(str(value) for value in values)}")
+    return "\n".join(lines)
+
+
+def _create_schema_index(conn: duckdb.DuckDBPyConnection):
+    """Persisted table descriptions and their embeddings, one row per table"""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS _smartfarm_schema_index "
+        "(table_name VARCHAR PRIMARY KEY, version VARCHAR, provider VARCHAR, description VARCHAR, tokens INTEGER, embedding DOUBLE[])"
+    )
+
+
+def _adaptive_ttl(
+    base_ttl: int,
+    hits: int,
+    cost: float,
+    size: int,
+    reference: float,
+    min_factor: float = 0.25,
+    max_factor: float = 24.0
+) -> int:
+    """GreedyDual-Size-Frequency style TTL for a cache entry.
+
+    The entry's value is frequency × recompute cost (seconds) / size (KB);
+    an entry worth exactly `reference` gets `base_ttl`.
+    """
+    value = (1 + hits) * cost / max(size / 1024, 1.0)
+    factor = min(max(value / reference, min_factor), max_factor)
+    return max(int(base_ttl * factor), 1)
+
+
+def _gdsf_priority(inflation: float, hits: int, cost: float, size: int) -> float:
+    """GDSF eviction priority: inflation + frequency × cost / size"""
+    return inflation + (1 + hits) * cost / max(size / 1024, 1.0)
+
+
+# Two-sided 95% Student t critical values by degrees of freedom (normal beyond 30)
+_T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+        9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+
+
+def _latency_stats(samples: List[float]) -> Dict[str, float]:
+    """Mean with 95% confidence half-width and percentiles of latency samples (seconds)"""
+    values = np.asarray(samples, dtype=float)
+    n = len(values)
+    if n == 0:
+        return {"n": 0}
+
+    stdev = float(values.std(ddof=1)) if n > 1 else 0.0
+    dof = n - 1
+    # Round degrees of freedom down to the nearest tabulated value (conservative)
+    t = 1.96 if dof > 30 else (_T95[max(d for d in _T95 if d <= dof)] if dof else 0.0)
+    return {
+        "n": n,
+        "mean": float(values.mean()),
+        "stdev": stdev,
+        "ci95": t * stdev / n ** 0.5,
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+
+
+class Tools:
+    def __init__(self):
+        self.valves = self.Valves()
+        self.citation = False
+        self._refresh_futures = set()
+
+        # Redis comes from the shared pool (runs uncached while Redis is down)
+        self._redis_client = None
+        self.redis_client  # Connect eagerly so an unreachable Redis is reported at startup
+
+    @property
+    def redis_client(self) -> Optional[redis.Redis]:
+        """Pooled Redis client, or None while Redis is unreachable"""
+        if getattr(self, "_redis_client", None) is not None:
+            return self._redis_client
+        return self._redis_pool().client()
+
+    @redis_client.setter
+    def redis_client(self, client):
+        """Pin an explicit client (scripts and tests) instead of the shared pool"""
+        self._redis_client = client
+
+    async def _aredis(self):
+        """redis.asyncio client for the running loop, or None while Redis is unreachable"""
+        if getattr(self, "_redis_client", None) is not None:
+            return _AwaitableRedis(self._redis_client)
+        return await self._redis_pool().aclient()
+
+    async def _aclose_redis(self):
+        """Close the running loop's pooled async client; pinned clients stay open"""
+        if getattr(self, "_redis_client", None) is None:
+            await self._redis_pool().aclose_loop_client()
+
+    class Valves(BaseModel):
+        GROQ_API_KEY: str = Field(
+            default="",
+            description="Groq API Key for SQL generation"
+        )
+        GROQ_API_BASE: str = Field(
+            default="https://api.groq.com/openai/v1",
+            description="Groq API base URL"
+        )
+        OPENAI_API_KEY: str = Field(
+            default="",
+            description="OpenAI API Key (only for EMBEDDING_PROVIDER='openai')"
+        )
+        DATABASE_PATH: str = Field(
+            default="/tmp/smartfarm_persistent.duckdb",
+            description="DuckDB database path"
+        )
+        CACHE_TTL: int = Field(
+            default=3600,
+            description="Cache TTL in seconds (default: 1 hour)"
+        )
+        ENABLE_CACHE: bool = Field(
+            default=True,
+            description="Enable/disable caching"
+        )
+        OPTIMIZE_DTYPES: bool = Field(
+            default=True,
+            description="Profile a sample and load with categorical/narrow dtypes to cut memory"
+        )
+        PROFILE_SAMPLE_ROWS: int = Field(
+            default=10000,
+            description="Rows sampled to choose column dtypes before the full load"
+        )
+        MAX_RESULT_ROWS: int = Field(
+            default=200,
+            description="Maximum result rows rendered in the markdown table"
+        )
+        MAX_RESULT_BYTES: int = Field(
+            default=65536,
+            description="Maximum size in bytes of the rendered markdown table"
+        )
+        ADAPTIVE_TTL: bool = Field(
+            default=True,
+            description="Scale each entry's TTL by its recompute cost, hit count and size (GDSF)"
+        )
+        ADAPTIVE_TTL_REFERENCE: float = Field(
+            default=0.5,
+            description="Recompute seconds per KB that earn exactly CACHE_TTL"
+        )
+        MIN_TTL_FACTOR: float = Field(
+            default=0.25,
+            description="Lower bound for adaptive TTL as a multiple of CACHE_TTL"
+        )
+        MAX_TTL_FACTOR: float = Field(
+            default=24.0,
+            description="Upper bound for adaptive TTL as a multiple of CACHE_TTL"
+        )
+        SWEEP_THRESHOLD: float = Field(
+            default=0.85,
+            description="Start evicting low-value entries above this fraction of Redis maxmemory"
+        )
+        SWEEP_TARGET: float = Field(
+            default=0.75,
+            description="Evict until Redis memory falls below this fraction of maxmemory"
+        )
+        SWEEP_INTERVAL: int = Field(
+            default=60,
+            description="Minimum seconds between automatic cache sweeps"
+        )
+        STALE_WHILE_REVALIDATE: bool = Field(
+            default=True,
+            description="Serve expired entries instantly while refreshing them in the background"
+        )
+        STALE_GRACE: int = Field(
+            default=3600,
+            description="Seconds past the soft TTL during which stale results may be served (hard TTL = soft TTL + grace)"
+        )
+        ENABLE_SQL_TEMPLATES: bool = Field(
+            default=True,
+            description="Reuse generated SQL for questions that differ only in literals (e.g. crop or year)"
+        )
+        SQL_TEMPLATE_TTL: int = Field(
+            default=604800,
+            description="Seconds a parameterized SQL template is kept (default 7 days)"
+        )
+        STORAGE_MODE: str = Field(
+            default="table",
+            description="'table' imports uploads into the DuckDB file; 'parquet' stores time-series uploads as month-partitioned Parquet so date filters skip whole months"
+        )
+        PARQUET_DIRECTORY: str = Field(
+            default="/tmp/smartfarm_parquet",
+            description="Where partitioned Parquet datasets are written in 'parquet' storage mode"
+        )
+        EMBEDDING_PROVIDER: str = Field(
+            default="hashing",
+            description="Embeddings for the schema index: 'hashing' (deterministic, offline) or 'openai' (needs OPENAI_API_KEY)"
+        )
+        SCHEMA_TOP_K: int = Field(
+            default=3,
+            description="Tables whose schema goes to the LLM per question: the uploaded one plus the most relevant others (1 = only the uploaded table)"
+        )
+        SCHEMA_MIN_SCORE: float = Field(
+            default=0.1,
+            description="Minimum similarity between another table and the part of the question the uploaded table does not cover"
+        )
+        ENABLE_ROLLUPS: bool = Field(
+            default=True,
+            description="Pre-aggregate large tables per day/week and label columns (field, crop, sensor) and answer eligible SQL from them"
+        )
+        ROLLUP_MIN_ROWS: int = Field(
+            default=100000,
+            description="Rows from which rollup tables are built"
+        )
+        ROLLUP_MAX_RATIO: float = Field(
+            default=0.1,
+            description="Largest rollup kept, as a fraction of the table's rows"
+        )
+        APPROX_PREVIEW: bool = Field(
+            default=True,
+            description="On large tables, show a sampled approximate answer while the exact query runs"
+        )
+        APPROX_MIN_ROWS: int = Field(
+            default=1000000,
+            description="Rows from which the approximate preview is shown"
+        )
+        APPROX_SAMPLE_ROWS: int = Field(
+            default=50000,
+            description="Sample size behind the approximate preview (bounds its latency)"
+        )
+        HOT_TIER_SIZE: int = Field(
+            default=0,
+            description="Pin the N most-looked-up cache entries in process memory (0 = off)"
+        )
+        HOT_TIER_REFRESH: float = Field(
+            default=30.0,
+            description="Seconds between hot-tier refreshes from the Redis lookup ranking"
+        )
+        REFRESH_LOCK_TTL: int = Field(
+            default=120,
+            description="Seconds a background refresh holds the single-flight lock"
+        )
+        NEGATIVE_CACHE_TTL: int = Field(
+            default=300,
+            description="Seconds to remember deterministic failures (bad file, invalid SQL); 0 disables"
+        )
+        REDIS_MAX_CONNECTIONS: int = Field(
+            default=20,
+            description="Connections in the shared Redis pool (callers wait when all are busy)"
+        )
+        REDIS_HEALTH_CHECK_INTERVAL: float = Field(
+            default=5.0,
+            description="Seconds between Redis health checks on the shared pool"
+        )
+        REDIS_RECONNECT_BACKOFF_MAX: float = Field(
+            default=5.0,
+            description="Maximum seconds between reconnect attempts while Redis is down"
+        )
+        DUCKDB_MEMORY_LIMIT: str = Field(
+            default="1GB",
+            description="DuckDB memory limit per process; larger queries spill to DUCKDB_TEMP_DIRECTORY (empty = DuckDB default of 80% of RAM)"
+        )
+        DUCKDB_THREADS: int = Field(
+            default=2,
+            description="DuckDB worker threads (0 = every core)"
+        )
+        DUCKDB_TEMP_DIRECTORY: str = Field(
+            default="/tmp/smartfarm_duckdb_spill",
+            description="Directory DuckDB spills to when a query exceeds the memory limit"
+        )
+        DUCKDB_MAX_TEMP_DIRECTORY_SIZE: str = Field(
+            default="4GB",
+            description="Maximum disk space DuckDB may spill to"
+        )
+        QUERY_TIMEOUT: float = Field(
+            default=60.0,
+            description="Seconds before a DuckDB import or query is interrupted (0 = no limit)"
+        )
+        PARSE_WORKERS: int = Field(
+            default=2,
+            description="Worker processes that parse CSV/Excel uploads off the GIL, so one big upload does not stall other requests (0 = parse in-process)"
+        )
+        PARSE_WORKER_MAX_JOBS: int = Field(
+            default=50,
+            description="Parses after which a worker process is replaced, capping memory growth (0 = never)"
+        )
+        PARSE_MIN_BYTES: int = Field(
+            default=1000000,
+            description="Uploads smaller than this are parsed in-process (the handoff costs more than it saves)"
+        )
+        PARSE_HANDOFF_DIRECTORY: str = Field(
+            default="",
+            description="Where workers leave parsed uploads as DuckDB files for the request to map back (empty = the temp directory; /dev/shm keeps them in memory but Docker gives it only 64MB unless shm_size is raised). Falls back to the temp directory when missing or short of space"
+        )
+        SPECULATIVE_PIPELINE: bool = Field(
+            default=True,
+            description="Read the upload while the cache is checked, and generate SQL while it is imported (miss latency ≈ max(import, LLM) instead of their sum)"
+        )
+        DEBUG_TIMINGS: bool = Field(
+            default=False,
+            description="Append the per-stage latency breakdown to every response"
+        )
+        LLM_TIMEOUT: float = Field(
+            default=30.0,
+            description="Seconds to wait for a single Groq call"
+        )
+        LLM_MAX_CONCURRENCY: int = Field(
+            default=8,
+            description="Upper bound for concurrent Groq calls (adapted down under overload)"
+        )
+        LLM_MAX_RETRIES: int = Field(
+            default=3,
+            description="Retries with jittered backoff on 429/5xx/timeouts"
+        )
+        BREAKER_FAILURE_THRESHOLD: int = Field(
+            default=5,
+            description="Consecutive Groq failures that open the circuit breaker"
+        )
+        BREAKER_RESET_TIMEOUT: int = Field(
+            default=30,
+            description="Seconds the circuit stays open before a trial call"
+        )
+
+    def _redis_pool(self) -> _RedisPool:
+        """Shared Redis pool for the configured server"""
+        return _get_redis_pool(
+            os.getenv("REDIS_HOST", "redis"),
+            int(os.getenv("REDIS_PORT", 6379)),
+            max_connections=self.valves.REDIS_MAX_CONNECTIONS,
+            health_check_interval=self.valves.REDIS_HEALTH_CHECK_INTERVAL,
+            backoff_cap=self.valves.REDIS_RECONNECT_BACKOFF_MAX
+        )
+
+    def _duckdb_connect(self) -> duckdb.DuckDBPyConnection:
+        """DuckDB connection with the configured resource limits"""
+        if self.valves.DUCKDB_TEMP_DIRECTORY:
+            os.makedirs(self.valves.DUCKDB_TEMP_DIRECTORY, exist_ok=True)
+        return _duckdb_connect(
+            self.valves.DATABASE_PATH,
+            memory_limit=self.valves.DUCKDB_MEMORY_LIMIT,
+            threads=self.valves.DUCKDB_THREADS,
+            temp_directory=self.valves.DUCKDB_TEMP_DIRECTORY,
+            max_temp_directory_size=self.valves.DUCKDB_MAX_TEMP_DIRECTORY_SIZE
+        )
+
+    @contextmanager
+    def _watchdog(self, conn: duckdb.DuckDBPyConnection):
+        """Run a statement under QUERY_TIMEOUT and record its spill and timeout metrics"""
+        watchdog = _DuckDBWatchdog(conn, timeout=self.valves.QUERY_TIMEOUT)
+        try:
+            with watchdog:
+                yield watchdog
+        finally:
+            self._record_duckdb_usage(watchdog.spill_bytes, watchdog.timed_out)
+
+    def _record_duckdb_usage(self, spill_bytes: int, timed_out: bool):
+        """Count DuckDB statements, spills and timeouts in Redis"""
+        if not self.redis_client:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hincrby("excel:duckdb", "statements", 1)
+            if spill_bytes:
+                pipe.hincrby("excel:duckdb", "spilled_statements", 1)
+                pipe.hincrby("excel:duckdb", "spilled_bytes", spill_bytes)
+                pipe.zadd("excel:duckdb:peak", {"spill_bytes": spill_bytes}, gt=True)
+            if timed_out:
+                pipe.hincrby("excel:duckdb", "timeouts", 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
+
+    def _gateway(self) -> _LLMGateway:
+        """Shared LLM gateway for the configured Groq endpoint"""
+        return _get_gateway(
+            self.valves.GROQ_API_BASE,
+            max_concurrency=self.valves.LLM_MAX_CONCURRENCY,
+            max_retries=self.valves.LLM_MAX_RETRIES,
+            slow_call_seconds=self.valves.LLM_TIMEOUT / 2,
+            failure_threshold=self.valves.BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=self.valves.BREAKER_RESET_TIMEOUT
+        )
+
+    def _get_file_hash(self, file_path: str) -> str:
+        """Generate hash of file content for cache key"""
+        try:
+            with open(file_path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except:
+            return hashlib.sha256(file_path.encode()).hexdigest()
+
+    def _generate_cache_key(self, file_hash: str, query: str, model: str) -> str:
+        """Generate cache key from file hash, query, and model"""
+        combined = f"{file_hash}:{query.lower().strip()}:{model}"
+        return f"sql_cache:{hashlib.sha256(combined.encode()).hexdigest()}"
+
+    async def _aget_from_cache(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Retrieve cached result, flagged with `stale` once past its soft TTL"""
+        if not self.valves.ENABLE_CACHE:
+            return None
+        client = await self._aredis()
+        if not client:
+            return None
+
+        if self.valves.HOT_TIER_SIZE > 0:
+            await self._arefresh_hot_tier(client)
+            result = self._hot_tier().get(cache_key)
+            if result is not None:
+                return result
+
+        try:
+            pipe = client.pipeline()
+            pipe.get(cache_key)
+            pipe.ttl(cache_key)
+            pipe.zincrby("excel:cache:hot", 1, cache_key)
+            cached, remaining, _ = await pipe.execute()
+            result = json.loads(cached) if cached else None
+            if result and "result_key" in result:
+                shared = await client.get(result["result_key"])
+                # A dangling pointer (shared result evicted) is a miss
+                result = _merge_shared_result(result, shared) if shared else None
+            if result is not None:
+                await self._arecord_metric("cache_hit")
+
+                # Within the grace window the soft TTL has passed
+                result["stale"] = self.valves.STALE_WHILE_REVALIDATE and 0 <= remaining <= self.valves.STALE_GRACE
+                if result["stale"]:
+                    await self._arecord_metric("cache_stale")
+
+                if self.valves.ADAPTIVE_TTL:
+                    await self._atouch_entry(cache_key, extend=not result["stale"], result_key=result.get("result_key"))
+                return result
+            else:
+                await self._arecord_metric("cache_miss")
+                return None
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            return None
+
+    def _hot_tier(self) -> _HotTier:
+        """This instance's in-process hot tier"""
+        if getattr(self, "_hot", None) is None:
+            self._hot = _HotTier()
+        return self._hot
+
+    async def _arefresh_hot_tier(self, client):
+        """Flush buffered hot-tier hits and re-pin the top HOT_TIER_SIZE entries when due"""
+        tier = self._hot_tier()
+        if not tier.claim_refresh(self.valves.HOT_TIER_REFRESH):
+            return
+
+        try:
+            pending = tier.drain()
+            if pending:
+                await self._aflush_hot_hits(client, pending)
+            top = await client.zrevrange("excel:cache:hot", 0, self.valves.HOT_TIER_SIZE - 1)
+
+            pipe = client.pipeline()
+            for key in top:
+                pipe.get(key)
+                pipe.ttl(key)
+            values = await pipe.execute() if top else []
+
+            # Pin pointer entries with their shared result filled in
+            pointers = {}
+            for key, payload in zip(top, values[::2]):
+                if payload and payload.startswith('{"result_key"'):
+                    pointers[key] = json.loads(payload)
+            if pointers:
+                pipe = client.pipeline()
+                for entry in pointers.values():
+                    pipe.get(entry["result_key"])
+                for (key, entry), shared in zip(pointers.items(), await pipe.execute()):
+                    pointers[key] = json.dumps(_merge_shared_result(entry, shared)) if shared else None
+
+            now = time.monotonic()
+            grace = self.valves.STALE_GRACE if self.valves.STALE_WHILE_REVALIDATE else 0
+            entries = {}
+            for key, payload, remaining in zip(top, values[::2], values[1::2]):
+                payload = pointers.get(key, payload)
+                fresh_for = remaining - grace
+                if payload and fresh_for > 0:
+                    # Stale entries stay on the Redis path so they get refreshed
+                    entries[key] = (payload, now + min(fresh_for, self.valves.HOT_TIER_REFRESH))
+            tier.replace(entries)
+        except Exception as e:
+            print(f"Hot tier refresh error: {e}")
+
+    async def _aflush_hot_hits(self, client, pending: Dict[str, int]):
+        """Record buffered hot-tier hits like Redis-path hits (ranking, metrics and, with ADAPTIVE_TTL, the entry touch)"""
+        pipe = client.pipeline()
+        for key, count in pending.items():
+            pipe.zincrby("excel:cache:hot", count, key)
+        hits = sum(pending.values())
+        for metric in ("total", "cache_hit", "hot_tier_hit"):
+            pipe.incrby(f"excel:queries:{metric}", hits)
+        await pipe.execute()
+        if not self.valves.ADAPTIVE_TTL:
+            return
+
+        keys = list(pending)
+        pipe = client.pipeline()
+        for key in keys:
+            pipe.hincrby("excel:cache:hits", key, pending[key])
+        pipe.hmget("excel:cache:cost", keys)
+        pipe.hmget("excel:cache:size", keys)
+        pipe.hmget("excel:cache:result", keys)
+        pipe.get("excel:cache:inflation")
+        *counts, costs, sizes, result_keys, inflation = await pipe.execute()
+
+        # Pinned entries are never stale, so every hit may extend its TTL
+        pipe = client.pipeline()
+        for key, count, cost, size, result_key in zip(keys, counts, costs, sizes, result_keys):
+            if cost is not None and size is not None:
+                self._queue_extend(pipe, key, count, float(cost), int(size), float(inflation or 0), result_key)
+        await pipe.execute()
+
+    async def _ahot_queries(self, client, limit: int = 10) -> List[Dict[str, Any]]:
+        """Top cached entries by lookup count, with their SQL and remaining TTL"""
+        ranked = await client.zrevrange("excel:cache:hot", 0, limit * 2 - 1, withscores=True)
+        pipe = client.pipeline()
+        for key, _ in ranked:
+            pipe.get(key)
+            pipe.ttl(key)
+        values = await pipe.execute() if ranked else []
+
+        hot = []
+        for (key, lookups), payload, ttl in zip(ranked, values[::2], values[1::2]):
+            if not payload:
+                continue
+            data = json.loads(payload)
+            hot.append({
+                "key": key,
+                "lookups": int(lookups),
+                "ttl": ttl,
+                "sql_query": data.get("sql_query"),
+                "table_name": data.get("table_name"),
+            })
+        return hot[:limit]
+
+    def _save_to_cache(self, cache_key: str, data: Dict[str, Any], cost: float = 0.0, data_hash: Optional[str] = None):
+        """Save result to cache with TTL (adaptive to recompute cost when enabled).
+
+        With `data_hash`, the result body is stored once under a
+        `sql_result:` key for (data hash, normalized SQL) and the question's
+        entry only points at it, so the same SQL from any model or phrasing
+        shares one stored result.
+        """
+        if not self.redis_client or not self.valves.ENABLE_CACHE:
+            return
+
+        try:
+            payload, shared = self._split_entry(data, data_hash)
+
+            if not self.valves.ADAPTIVE_TTL:
+                pipe = self.redis_client.pipeline()
+                self._queue_plain_write(pipe, cache_key, payload, shared)
+                self._queue_template_link(pipe, cache_key, data.get("template_key"))
+                created = pipe.execute()[0]
+            else:
+                inflation = float(self.redis_client.get("excel:cache:inflation") or 0)
+
+                pipe = self.redis_client.pipeline()
+                self._queue_entry_write(pipe, cache_key, payload, cost, inflation, shared)
+                self._queue_template_link(pipe, cache_key, data.get("template_key"))
+                created = pipe.execute()[0]
+
+            if shared:
+                pipe = self.redis_client.pipeline()
+                self._queue_result_metric(pipe, bool(created), len(shared[1].encode()))
+                pipe.execute()
+        except Exception as e:
+            print(f"Cache write error: {e}")
+            return
+
+        if not self.valves.ADAPTIVE_TTL:
+            return
+
+        # At most one sweep per interval across all workers
+        try:
+            if self.redis_client.set("excel:cache:sweep_lock", 1, nx=True, ex=self.valves.SWEEP_INTERVAL):
+                self._sweep_cache()
+        except Exception as e:
+            print(f"Cache sweep error: {e}")
+
+    async def _asave_to_cache(self, cache_key: str, data: Dict[str, Any], cost: float = 0.0, data_hash: Optional[str] = None):
+        """Async _save_to_cache; the occasional sweep runs in a worker thread"""
+        if not self.valves.ENABLE_CACHE:
+            return
+        client = await self._aredis()
+        if not client:
+            return
+
+        try:
+            # Canonicalizing the SQL runs DuckDB's parser; keep it off the event loop
+            payload, shared = await asyncio.get_running_loop().run_in_executor(None, self._split_entry, data, data_hash)
+
+            if not self.valves.ADAPTIVE_TTL:
+                pipe = client.pipeline()
+                self._queue_plain_write(pipe, cache_key, payload, shared)
+                self._queue_template_link(pipe, cache_key, data.get("template_key"))
+                created = (await pipe.execute())[0]
+            else:
+                inflation = float(await client.get("excel:cache:inflation") or 0)
+
+                pipe = client.pipeline()
+                self._queue_entry_write(pipe, cache_key, payload, cost, inflation, shared)
+                self._queue_template_link(pipe, cache_key, data.get("template_key"))
+                created = (await pipe.execute())[0]
+
+            if shared:
+                pipe = client.pipeline()
+                self._queue_result_metric(pipe, bool(created), len(shared[1].encode()))
+                await pipe.execute()
+        except Exception as e:
+            print(f"Cache write error: {e}")
+            return
+
+        if not self.valves.ADAPTIVE_TTL:
+            return
+
+        # At most one sweep per interval across all workers
+        try:
+            if await client.set("excel:cache:sweep_lock", 1, nx=True, ex=self.valves.SWEEP_INTERVAL):
+                await asyncio.get_running_loop().run_in_executor(None, self._sweep_cache)
+        except Exception as e:
+            print(f"Cache sweep error: {e}")
+
+    def _result_key(self, data_hash: str, sql_query: str) -> str:
+        """Shared result key for a query over one version of the data"""
+        combined = f"{data_hash}:{_normalize_sql(sql_query)}"
+        return f"sql_result:{hashlib.sha256(combined.encode()).hexdigest()}"
+
+    def _split_entry(self, data: Dict[str, Any], data_hash: Optional[str]) -> Tuple[str, Optional[Tuple[str, str]]]:
+        """Question payload plus (result key, result payload) when the body can be shared"""
+        data = {key: value for key, value in data.items() if key != "template_key"}
+        payload = json.dumps(data, default=str)  # Parsed date columns yield Timestamps
+        if not data_hash or not data.get("sql_query"):
+            return payload, None
+
+        result_key = self._result_key(data_hash, data["sql_query"])
+        pointer = json.dumps({
+            "result_key": result_key,
+            "sql_query": data["sql_query"],
+            "table_name": data.get("table_name"),
+            "row_count": data.get("row_count"),
+        }, default=str)
+        return pointer, (result_key, payload)
+
+    def _queue_shared_result(self, pipe, shared: Tuple[str, str], ttl: int):
+        """Queue the shared result write first: its SET NX reply says whether it was new"""
+        result_key, result_payload = shared
+        pipe.set(result_key, result_payload, ex=ttl, nx=True)
+        pipe.expire(result_key, ttl, gt=True)  # Outlive every question pointing at it
+
+    def _queue_plain_write(self, pipe, cache_key: str, payload: str, shared: Optional[Tuple[str, str]]):
+        """Queue a fixed-TTL entry write (adaptive TTL off)"""
+        ttl = self._hard_ttl(self.valves.CACHE_TTL)
+        if shared:
+            self._queue_shared_result(pipe, shared, ttl)
+        pipe.setex(cache_key, ttl, payload)
+
+    def _queue_template_link(self, pipe, cache_key: str, template_key: Optional[str]):
+        """Queue the question -> SQL template link, so evicting the entry also drops its template"""
+        if template_key:
+            pipe.hset("excel:cache:template", cache_key, template_key)
+        else:
+            pipe.hdel("excel:cache:template", cache_key)
+
+    def _queue_result_metric(self, pipe, created: bool, size: int):
+        """Count stored vs shared result bodies and the bytes sharing saved"""
+        pipe.hincrby("excel:results", "stored" if created else "shared", 1)
+        if not created:
+            pipe.hincrby("excel:results", "bytes_saved", size)
+
+    def _entry_ttl(self, hits: int, cost: float, size: int) -> int:
+        """Adaptive soft TTL for an entry under the current valves"""
+        return _adaptive_ttl(
+            self.valves.CACHE_TTL, hits, cost, size,
+            self.valves.ADAPTIVE_TTL_REFERENCE,
+            self.valves.MIN_TTL_FACTOR,
+            self.valves.MAX_TTL_FACTOR
+        )
+
+    def _queue_entry_write(
+        self,
+        pipe,
+        cache_key: str,
+        payload: str,
+        cost: float,
+        inflation: float,
+        shared: Optional[Tuple[str, str]] = None
+    ):
+        """Queue an entry write with its cost/size/hit metadata and GDSF priority.
+
+        A pointer entry is sized by the result it stands for, and the
+        question -> result link is kept so sweeps can release results no
+        entry points at any more.
+        """
+        size = len((shared[1] if shared else payload).encode())
+        ttl = self._hard_ttl(self._entry_ttl(0, cost, size))
+        if shared:
+            self._queue_shared_result(pipe, shared, ttl)
+            pipe.hset("excel:cache:result", cache_key, shared[0])
+        else:
+            pipe.hdel("excel:cache:result", cache_key)
+        pipe.setex(cache_key, ttl, payload)
+        pipe.hset("excel:cache:cost", cache_key, cost)
+        pipe.hset("excel:cache:size", cache_key, size)
+        pipe.hset("excel:cache:hits", cache_key, 0)
+        pipe.zadd("excel:cache:priority", {cache_key: _gdsf_priority(inflation, 0, cost, size)})
+
+    def _negative_cache_key(self, cache_key: str) -> str:
+        """Key for the failure recorded against a cache entry"""
+        return cache_key.replace("sql_cache:", "sql_cache_neg:", 1)
+
+    async def _aget_negative(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Retrieve a cached failure for this file and question"""
+        if not self.valves.ENABLE_CACHE or not self.valves.NEGATIVE_CACHE_TTL:
+            return None
+        client = await self._aredis()
+        if not client:
+            return None
+
+        try:
+            cached = await client.get(self._negative_cache_key(cache_key))
+            if cached:
+                await self._arecord_metric("negative_hit")
+                return json.loads(cached)
+            return None
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            return None
+
+    async def _asave_negative(self, cache_key: str, error: Exception) -> Optional[str]:
+        """Cache a deterministic failure under the negative namespace.
+
+        Returns the error classification.
+        """
+        error_class = _classify_error(error)
+        if error_class not in ("invalid_file", "invalid_sql"):
+            return error_class
+        if not self.valves.ENABLE_CACHE or not self.valves.NEGATIVE_CACHE_TTL:
+            return error_class
+        client = await self._aredis()
+        if not client:
+            return error_class
+
+        try:
+            await client.setex(
+                self._negative_cache_key(cache_key),
+                self.valves.NEGATIVE_CACHE_TTL,
+                json.dumps({"error": str(error), "error_class": error_class, "failed_at": int(time.time())})
+            )
+        except Exception as e:
+            print(f"Cache write error: {e}")
+        return error_class
+
+    def _hard_ttl(self, soft_ttl: int) -> int:
+        """Redis expiry for an entry: soft TTL plus the stale grace window"""
+        if self.valves.STALE_WHILE_REVALIDATE:
+            return soft_ttl + self.valves.STALE_GRACE
+        return soft_ttl
+
+    async def _atouch_entry(self, cache_key: str, extend: bool = True, result_key: Optional[str] = None):
+        """Count a hit and extend the entry's TTL and eviction priority"""
+        try:
+            client = await self._aredis()
+            pipe = client.pipeline()
+            pipe.hincrby("excel:cache:hits", cache_key, 1)
+            pipe.hget("excel:cache:cost", cache_key)
+            pipe.hget("excel:cache:size", cache_key)
+            pipe.get("excel:cache:inflation")
+            hits, cost, size, inflation = await pipe.execute()
+
+            # Entries cached before adaptive TTL carry no cost metadata, and
+            # stale entries must be refreshed rather than kept alive
+            if cost is None or size is None or not extend:
+                return
+
+            pipe = client.pipeline()
+            self._queue_extend(pipe, cache_key, hits, float(cost), int(size), float(inflation or 0), result_key)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Cache touch error: {e}")
+
+    def _queue_extend(
+        self,
+        pipe,
+        cache_key: str,
+        hits: int,
+        cost: float,
+        size: int,
+        inflation: float,
+        result_key: Optional[str] = None
+    ):
+        """Queue a TTL extension and priority update after a hit (the shared result lives at least as long)"""
+        ttl = self._hard_ttl(self._entry_ttl(hits, cost, size))
+        pipe.expire(cache_key, ttl, gt=True)  # Only ever extend
+        if result_key:
+            pipe.expire(result_key, ttl, gt=True)
+        pipe.zadd("excel:cache:priority", {cache_key: _gdsf_priority(inflation, hits, cost, size)})
+
+    def _drop_entry_metadata(self, pipe, cache_keys: List[str]):
+        """Queue removal of cost/size/hit metadata for cache keys"""
+        if not cache_keys:
+            return
+        for meta_key in ("excel:cache:cost", "excel:cache:size", "excel:cache:hits", "excel:cache:result", "excel:cache:template"):
+            pipe.hdel(meta_key, *cache_keys)
+        pipe.zrem("excel:cache:priority", *cache_keys)
+        pipe.zrem("excel:cache:hot", *cache_keys)
+
+    def _sweep_cache(self, force: bool = False) -> Dict[str, int]:
+        """Evict lowest-value entries first when Redis memory nears maxmemory.
+
+        Entries are taken in GDSF priority order (cheap, rarely hit, large
+        entries first) and the inflation value is raised to the last evicted
+        priority, so survivors age relative to new entries.
+        """
+        stats = {"evicted": 0, "freed_bytes": 0, "pruned": 0}
+
+        # Drop metadata of entries that already expired
+        tracked = [key for key, _ in self.redis_client.zscan_iter("excel:cache:priority", count=500)]
+        pipe = self.redis_client.pipeline()
+        for key in tracked:
+            pipe.exists(key)
+        stale = [key for key, exists in zip(tracked, pipe.execute()) if not exists]
+        if stale:
+            targets = self.redis_client.hmget("excel:cache:result", stale)
+            pipe = self.redis_client.pipeline()
+            self._drop_entry_metadata(pipe, stale)
+            pipe.execute()
+            self._release_results(targets)
+            stats["pruned"] = len(stale)
+
+        # Forget lookup counts of questions that are no longer cached
+        counted = [key for key, _ in self.redis_client.zscan_iter("excel:cache:hot", count=500)]
+        pipe = self.redis_client.pipeline()
+        for key in counted:
+            pipe.exists(key)
+        gone = [key for key, exists in zip(counted, pipe.execute()) if not exists]
+        if gone:
+            self.redis_client.zrem("excel:cache:hot", *gone)
+
+        info = self.redis_client.info("memory")
+        max_memory = info.get("maxmemory", 0)
+        used_memory = info.get("used_memory", 0)
+        if not max_memory:
+            return stats
+        if not force and used_memory < max_memory * self.valves.SWEEP_THRESHOLD:
+            return stats
+
+        to_free = used_memory - max_memory * self.valves.SWEEP_TARGET
+        inflation = None
+
+        while stats["freed_bytes"] < to_free:
+            lowest = self.redis_client.zrange("excel:cache:priority", 0, 49, withscores=True)
+            if not lowest:
+                break
+
+            sizes = self.redis_client.hmget("excel:cache:size", [key for key, _ in lowest])
+
+            # Take victims in priority order until enough bytes would be freed
+            victims = []
+            planned = stats["freed_bytes"]
+            for (key, priority), size in zip(lowest, sizes):
+                victims.append((key, priority, int(size or 0)))
+                planned += int(size or 0)
+                if planned >= to_free:
+                    break
+
+            keys = [key for key, _, _ in victims]
+            targets = self.redis_client.hmget("excel:cache:result", keys)
+            pipe = self.redis_client.pipeline()
+            for key in keys:
+                pipe.delete(key)
+            self._drop_entry_metadata(pipe, keys)
+            deleted = pipe.execute()[:len(keys)]
+
+            for (key, priority, size), was_deleted, target in zip(victims, deleted, targets):
+                inflation = priority
+                if was_deleted:
+                    stats["evicted"] += 1
+                    # A pointer frees its result only once nothing else shares it
+                    stats["freed_bytes"] += 0 if target else size
+            stats["freed_bytes"] += self._release_results(targets)
+
+        if inflation is not None:
+            self.redis_client.set("excel:cache:inflation", inflation)
+        if stats["evicted"]:
+            self.redis_client.incrby("excel:cache:evicted", stats["evicted"])
+
+        return stats
+
+    def _release_results(self, result_keys: List[Optional[str]]) -> int:
+        """Delete shared results no cached question points at any more; returns the bytes freed"""
+        candidates = {key for key in result_keys if key}
+        if not candidates:
+            return 0
+        orphans = list(candidates - set(self.redis_client.hvals("excel:cache:result")))
+        if not orphans:
+            return 0
+
+        pipe = self.redis_client.pipeline()
+        for key in orphans:
+            pipe.strlen(key)
+        pipe.delete(*orphans)
+        return sum(pipe.execute()[:len(orphans)])
+
+    def _acquire_flight_lock(self, cache_key: str) -> bool:
+        """Single-flight lock so only one worker recomputes a given entry"""
+        try:
+            return bool(self.redis_client.set(
+                f"excel:lock:{cache_key}", 1, nx=True, ex=self.valves.REFRESH_LOCK_TTL
+            ))
+        except Exception as e:
+            print(f"Cache lock error: {e}")
+            return False
+
+    async def _aacquire_flight_lock(self, cache_key: str) -> bool:
+        """Async _acquire_flight_lock"""
+        try:
+            client = await self._aredis()
+            return bool(client and await client.set(
+                f"excel:lock:{cache_key}", 1, nx=True, ex=self.valves.REFRESH_LOCK_TTL
+            ))
+        except Exception as e:
+            print(f"Cache lock error: {e}")
+            return False
+
+    def _release_flight_lock(self, cache_key: str):
+        """Release the single-flight lock for an entry"""
+        try:
+            self.redis_client.delete(f"excel:lock:{cache_key}")
+        except Exception as e:
+            print(f"Cache lock error: {e}")
+
+    def _refresh_entry(self, cache_key: str, file_path: str, query: str, model: str):
+        """Recompute a stale entry and write it back (runs in a worker thread)"""
+        try:
+            compute_start = time.time()
+            result = self._execute_sql_query(file_path, query, model)
+            self._save_to_cache(cache_key, result, cost=time.time() - compute_start, data_hash=self._get_file_hash(file_path))
+            self._record_metric("cache_refresh")
+        except Exception as e:
+            print(f"Cache refresh error: {e}")
+        finally:
+            self._release_flight_lock(cache_key)
+
+    async def _schedule_refresh(self, cache_key: str, file_path: str, query: str, model: str) -> bool:
+        """Start a background refresh unless another worker already holds the lock"""
+        if not await self._aacquire_flight_lock(cache_key):
+            return False
+
+        future = asyncio.get_running_loop().run_in_executor(
+            None, self._refresh_entry, cache_key, file_path, query, model
+        )
+        # Keep a reference so the refresh is not garbage collected mid-flight
+        self._refresh_futures.add(future)
+        future.add_done_callback(self._refresh_futures.discard)
+        return True
+
+    def _record_metric(self, metric_type: str, value: float = 1):
+        """Record metrics in Redis"""
+        if not self.redis_client:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline()
+            self._queue_metric(pipe, metric_type, value)
+            pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
+
+    async def _arecord_metric(self, metric_type: str, value: float = 1):
+        """Async _record_metric"""
+        client = await self._aredis()
+        if not client:
+            return
+
+        try:
+            pipe = client.pipeline()
+            self._queue_metric(pipe, metric_type, value)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
+
+    def _queue_metric(self, pipe, metric_type: str, value: float = 1):
+        """Queue counter, response-time and last-query updates for one metric"""
+        # Increment counters
+        pipe.incr("excel:queries:total")
+        pipe.incr(f"excel:queries:{metric_type}")
+
+        # Store response time if provided
+        if metric_type == "response_time":
+            pipe.lpush("excel:response_times", value)
+            pipe.ltrim("excel:response_times", 0, 999)  # Keep last 1000
+
+        # Store timestamp for session tracking
+        pipe.set("excel:last_query", int(time.time()))
+
+    async def _emit_stage_events(self, __event_emitter__, timer: _StageTimer, stages: List[str]):
+        """Stream completed stage timings as status events"""
+        if not __event_emitter__:
+            return
+        for stage in stages:
+            if stage in timer.timings:
+                await __event_emitter__(
+                    {
+                        "type": "status",
+                        "data": {"description": f"⏱️ {STAGES[stage]}: {timer.timings[stage]:.2f}s", "done": False},
+                    }
+                )
+
+    def _record_stage_timings(self, timings: Dict[str, float]):
+        """Add stage durations to the per-stage histograms in Redis"""
+        if not self.redis_client or not timings:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline()
+            self._queue_stage_timings(pipe, timings)
+            pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
+
+    async def _arecord_stage_timings(self, timings: Dict[str, float]):
+        """Async _record_stage_timings"""
+        if not timings:
+            return
+        client = await self._aredis()
+        if not client:
+            return
+
+        try:
+            pipe = client.pipeline()
+            self._queue_stage_timings(pipe, timings)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
+
+    def _queue_stage_timings(self, pipe, timings: Dict[str, float]):
+        """Queue histogram updates for stage durations"""
+        for stage, seconds in timings.items():
+            key = f"excel:stages:{stage}"
+            pipe.hincrby(key, "count", 1)
+            pipe.hincrbyfloat(key, "sum", seconds)
+            bucket = next((b for b in STAGE_BUCKETS if seconds <= b), "inf")
+            pipe.hincrby(key, f"le_{bucket}", 1)
+
+    async def _aevict_entry(self, cache_key: str):
+        """Remove one entry, its metadata, any cached failure, its SQL template and its result unless shared.
+
+        Dropping the template matters for cold-miss timing: otherwise the
+        next run binds the stored SQL and never reaches the LLM.
+        """
+        self._hot_tier().invalidate([cache_key])
+        client = await self._aredis()
+        target = await client.hget("excel:cache:result", cache_key)
+        template_key = await client.hget("excel:cache:template", cache_key)
+        pipe = client.pipeline()
+        pipe.delete(cache_key, self._negative_cache_key(cache_key))
+        if template_key:
+            pipe.delete(template_key)
+        self._drop_entry_metadata(pipe, [cache_key])
+        await pipe.execute()
+        if target and target not in await client.hvals("excel:cache:result"):
+            await client.delete(target)
+
+    def _run_virtual_users(self, file_path: str, query: str, model: str, users: int, requests_per_user: int):
+        """Issue the same query from `users` threads; return latencies, non-hits and wall time"""
+        async def requests():
+            latencies, misses = [], 0
+            try:
+                for _ in range(requests_per_user):
+                    start = time.perf_counter()
+                    output = await self.analyze_excel_with_cache(file_path, query, model)
+                    latencies.append(time.perf_counter() - start)
+                    misses += "Cache: HIT" not in output
+            finally:
+                # The loop ends with this user; its pooled Redis client would otherwise leak
+                await self._aclose_redis()
+            return latencies, misses
+
+        def user(_):
+            # One event loop per virtual user, so each keeps its async Redis connections
+            return asyncio.run(requests())
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            results = list(pool.map(user, range(users)))
+        elapsed = time.perf_counter() - start
+
+        return [lat for latencies, _ in results for lat in latencies], sum(m for _, m in results), elapsed
+
+    def _generate_sql(self, conn, table_name: str, query: str, model: str) -> str:
+        """Translate a natural language question into SQL with LlamaIndex + Groq"""
+        from llama_index.core import SQLDatabase
+
+        # Create SQL database wrapper
+        sql_database = SQLDatabase.from_duckdb_connection(conn)
+
+        # Only the schemas relevant to the question go into the prompt
+        query_engine = self._sql_query_engine(sql_database, self._select_tables(conn, table_name, query), model)
+
+        response = query_engine.query(query)
+        return response.metadata.get("sql_query", "")
+
+    def _sql_query_engine(self, sql_database, tables: List[str], model: str):
+        """NL-to-SQL engine over the given tables with its own Groq LLM.
+
+        Nothing goes through llama_index's global Settings: misses run
+        concurrently in executor threads (analyses, refreshes, speculative
+        reads), possibly with different models, so a shared Settings.llm
+        could answer with the wrong model. The engine only embeds for
+        row/column retrievers, which are not used, but without an explicit
+        embed model it resolves Settings.embed_model (OpenAI) and fails when
+        no OPENAI_API_KEY is set. Table selection uses EMBEDDING_PROVIDER instead.
+        """
+        from llama_index.llms.groq import Groq
+        from llama_index.core import MockEmbedding
+        from llama_index.core.indices.struct_store import NLSQLTableQueryEngine
+
+        llm = Groq(
+            api_key=self.valves.GROQ_API_KEY or os.getenv("GROQ_API_KEY", ""),
+            model=model,
+            temperature=0.1,
+            api_base=self.valves.GROQ_API_BASE,
+            timeout=self.valves.LLM_TIMEOUT,
+            max_retries=0,  # Retries are owned by the LLM gateway
+        )
+        return NLSQLTableQueryEngine(
+            sql_database=sql_database,
+            tables=tables,
+            llm=llm,
+            embed_model=MockEmbedding(embed_dim=1),
+        )
+
+    def _read_upload(
+        self,
+        file_path: str,
+        timer: _StageTimer,
+        cancelled: Optional[threading.Event] = None,
+        looked_up: Optional[threading.Event] = None
+    ) -> Optional[pd.DataFrame]:
+        """Read an upload with SQL-safe column names (None when `cancelled` stopped it)"""
+        with timer.stage("read"):
+            df = self._parse_upload(file_path, cancelled, looked_up)
+
+        # Sanitize column names
+        if df is not None:
+            df.columns = [col.replace(' ', '_').replace('-', '_') for col in df.columns]
+        return df
+
+    def _parse_upload(
+        self,
+        file_path: str,
+        cancelled: Optional[threading.Event] = None,
+        looked_up: Optional[threading.Event] = None
+    ) -> Optional[pd.DataFrame]:
+        """Parse an upload in a worker process when it is big enough, otherwise in this thread.
+
+        A speculative read (`looked_up` given) only takes a worker once the
+        cache lookup is done and missed: a running worker parse cannot be
+        stopped, so starting one before a hit would tie it up for nothing.
+        """
+        if self.valves.PARSE_WORKERS > 0 and os.path.getsize(file_path) >= self.valves.PARSE_MIN_BYTES:
+            if looked_up is not None:
+                looked_up.wait()
+            if cancelled is not None and cancelled.is_set():
+                return None
+
+            directory = self.valves.PARSE_HANDOFF_DIRECTORY
+            if not directory or not _has_room(directory, os.path.getsize(file_path)):
+                directory = tempfile.gettempdir()
+
+            # A crashed worker or a full handoff directory must not fail the upload
+            try:
+                pool = _get_parse_pool(self.valves.PARSE_WORKERS, self.valves.PARSE_WORKER_MAX_JOBS)
+                df, size = pool.parse(
+                    file_path, self.valves.OPTIMIZE_DTYPES, self.valves.PROFILE_SAMPLE_ROWS, directory, cancelled
+                )
+                self._record_parse_usage(pooled=1, handoff_bytes=size)
+                return df
+            except BrokenProcessPool as e:
+                print(f"Parse worker error: {e}")
+                _reset_parse_pool(pool)
+                self._record_parse_usage(fallbacks=1)
+            except (RuntimeError, duckdb.Error) as e:
+                print(f"Parse worker error: {e}")
+                self._record_parse_usage(fallbacks=1)
+
+        df = _read_dataframe(
+            file_path,
+            optimize=self.valves.OPTIMIZE_DTYPES,
+            sample_rows=self.valves.PROFILE_SAMPLE_ROWS,
+            cancelled=cancelled
+        )
+        self._record_parse_usage(inline=1)
+        return df
+
+    def _record_parse_usage(self, **counts: int):
+        """Count uploads parsed in workers vs in-process, and bytes handed back"""
+        if not self.redis_client:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline()
+            for field, value in counts.items():
+                pipe.hincrby("excel:parse", field, value)
+            pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
+
+    def _execute_sql_query(
+        self,
+        file_path: str,
+        query: str,
+        model: str = "llama-3.3-70b-versatile",
+        timer: Optional[_StageTimer] = None,
+        preview: Optional[Callable[[Dict[str, Any]], None]] = None,
+        frame: Optional[pd.DataFrame] = None
+    ) -> Dict[str, Any]:
+        """Execute SQL query using LlamaIndex + Groq (original logic).
+
+        `preview`, when given, receives an approximate answer from a sample
+        before the exact query runs on large tables. `frame` is the upload
+        when it was already read (speculatively, during the cache lookup).
 
-        # Initialize Redis connection (with fallback)
-        self.redis_client = None
-        try:
-            redis_host = os.getenv("REDIS_HOST", "redis")
-            redis_port = int(os.getenv("REDIS_PORT", 6379))
-            self.redis_client = redis.Redis(
-                host=redis_host,
-                port=redis_port,
-                decode_responses=True,
-                socket_connect_timeout=2,
-                socket_timeout=2
-            )
-            # Test connection
-            self.redis_client.ping()
+        With SPECULATIVE_PIPELINE the LLM writes SQL against an empty copy
+        of the table on a second connection while the rows are imported,
+        so a miss costs about max(import, LLM) rather than their sum.
+        """
+        # Get API keys (OpenAI only backs the 'openai' embedding provider)
+        groq_key = self.valves.GROQ_API_KEY or os.getenv("GROQ_API_KEY", "")
+        openai_key = self.valves.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY", "")
+
+        if not groq_key:
+            raise ValueError("GROQ_API_KEY not configured")
+        if self.valves.EMBEDDING_PROVIDER == "openai" and not openai_key:
+            raise ValueError("OPENAI_API_KEY not configured")
+
+        timer = timer or _StageTimer()
+
+        # Read file
+        df = frame if frame is not None else self._read_upload(file_path, timer)
+
+        # Generate table name from file
+        table_name = os.path.splitext(os.path.basename(file_path))[0].replace(' ', '_').replace('-', '_')
+
+        conn = self._duckdb_connect()
+        sketch = None
+        try:
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                generation = None
+                if self.valves.SPECULATIVE_PIPELINE:
+                    # A temp table shadows the real one on this connection only, so the
+                    # LLM sees the new schema while other readers keep the old rows
+                    sketch = conn.cursor()
+                    sketch.execute(f"CREATE OR REPLACE TEMP TABLE {table_name} AS SELECT {_duckdb_select_list(df)} FROM df LIMIT 0")
+                    with timer.stage("schema_index"):
+                        self._index_table(sketch, table_name, df, file_path)
+                    with timer.stage("llm_sql"):
+                        template = self._match_sql_template(df, table_name, query, model)
+                    if not (template and template["sql"]):
+                        generation = pool.submit(self._timed_generate_sql, sketch, table_name, query, model, timer)
+                        overlap_start = time.perf_counter()
+
+                # Import to DuckDB (or register the partitioned Parquet copy)
+                ingest_start = time.perf_counter()
+                with timer.stage("import"):
+                    storage = self._load_table(conn, table_name, df, file_path)
+                with timer.stage("rollup"):
+                    rollups = self._ensure_rollups(conn, table_name, df, file_path)
+                ingest_seconds = time.perf_counter() - ingest_start
+
+                if not sketch:
+                    with timer.stage("schema_index"):
+                        self._index_table(conn, table_name, df, file_path)
+
+                    # Same question shape, other literals: bind the stored SQL instead of asking the LLM
+                    with timer.stage("llm_sql"):
+                        template = self._match_sql_template(df, table_name, query, model)
+
+                result_df = None
+                if template and template["sql"]:
+                    try:
+                        result_df = self._answer(conn, table_name, df, template["sql"], rollups, storage, preview, timer)
+                        sql_query = template["sql"]
+                    except duckdb.Error as e:
+                        print(f"SQL template error: {e}")
+                        self._reject_sql_template(template["key"])
+
+                if result_df is None:
+                    if generation:
+                        sql_query, llm_seconds = generation.result()
+                        self._record_pipeline_usage(
+                            overlapped=1, saved=max(ingest_seconds + llm_seconds - (time.perf_counter() - overlap_start), 0.0)
+                        )
+                    else:
+                        sql_query, _ = self._timed_generate_sql(conn, table_name, query, model, timer)
+
+                    # Execute the generated SQL
+                    result_df = self._answer(conn, table_name, df, sql_query, rollups, storage, preview, timer)
+
+                    if template:
+                        self._save_sql_template(template, sql_query)
+        finally:
+            if sketch:
+                sketch.close()
+            conn.close()
+
+        with timer.stage("render"):
+            return {
+                "sql_query": sql_query,
+                "results": result_df.to_dict('records'),
+                "results_markdown": _render_markdown(
+                    result_df,
+                    max_rows=self.valves.MAX_RESULT_ROWS,
+                    max_bytes=self.valves.MAX_RESULT_BYTES
+                ),
+                "row_count": len(result_df),
+                "table_name": table_name,
+                # Kept as entry metadata (excel:cache:template), not in the cached payload
+                "template_key": template["key"] if template else None,
+            }
+
+    def _timed_generate_sql(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        query: str,
+        model: str,
+        timer: _StageTimer
+    ) -> Tuple[str, float]:
+        """Generate SQL through the shared gateway (breaker, backoff, AIMD); returns the SQL and seconds taken"""
+        start = time.perf_counter()
+        with timer.stage("llm_sql"):
+            sql_query = self._gateway().call(lambda: self._generate_sql(conn, table_name, query, model))
+        return sql_query, time.perf_counter() - start
+
+    def _record_pipeline_usage(self, **counts: float):
+        """Count speculative reads used or wasted, and import/LLM overlap on misses"""
+        if not self.redis_client:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline()
+            for field, value in counts.items():
+                if isinstance(value, float):
+                    pipe.hincrbyfloat("excel:pipeline", field, value)
+                else:
+                    pipe.hincrby("excel:pipeline", field, value)
+            pipe.execute()
         except Exception as e:
-            print(f"Warning: Redis unavailable ({e}), running without cache")
-            self.redis_client = None
+            print(f"Metric recording error: {e}")
 
-    class Valves(BaseModel):
-        GROQ_API_KEY: str = Field(
-            default="",
-            description="Groq API Key for SQL generation"
-        )
-        OPENAI_API_KEY: str = Field(
-            default="",
-            description="OpenAI API Key for embeddings"
-        )
-        DATABASE_PATH: str = Field(
-            default="/tmp/smartfarm_persistent.duckdb",
-            description="DuckDB database path"
-        )
-        CACHE_TTL: int = Field(
-            default=3600,
-            description="Cache TTL in seconds (default: 1 hour)"
-        )
-        ENABLE_CACHE: bool = Field(
-            default=True,
-            description="Enable/disable caching"
-        )
+    async def _arecord_pipeline_usage(self, **counts: int):
+        """Async _record_pipeline_usage"""
+        client = await self._aredis()
+        if not client:
+            return
 
-    def _get_file_hash(self, file_path: str) -> str:
-        """Generate hash of file content for cache key"""
         try:
-            with open(file_path, 'rb') as f:
-                return hashlib.sha256(f.read()).hexdigest()
-        except:
-            return hashlib.sha256(file_path.encode()).hexdigest()
+            pipe = client.pipeline()
+            for field, value in counts.items():
+                pipe.hincrby("excel:pipeline", field, value)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
 
-    def _generate_cache_key(self, file_hash: str, query: str, model: str) -> str:
-        """Generate cache key from file hash, query, and model"""
-        combined = f"{file_hash}:{query.lower().strip()}:{model}"
-        return f"sql_cache:{hashlib.sha256(combined.encode()).hexdigest()}"
+    def _preview_emitter(self, __event_emitter__):
+        """Callback that shows an approximate answer from the worker thread running the query"""
+        loop = asyncio.get_running_loop()
 
-    def _get_from_cache(self, cache_key: str) -> Optional[Dict[str, Any]]:
-        """Retrieve cached result"""
-        if not self.redis_client or not self.valves.ENABLE_CACHE:
+        def emit(estimate: Dict[str, Any]):
+            share = estimate["sample_rows"] / estimate["population"] * 100
+            error = f"±{estimate['error'] * 100:.1f}% (95%)" if estimate["error"] is not None else "desconocido"
+            content = f"""
+⏳ **[VISTA PREVIA · APROXIMADA]** muestra de {estimate['sample_rows']:,} de {estimate['population']:,} filas ({share:.1f}%) · error estimado {error}
+
+📊 **Tabla:** `{estimate['table_name']}`
+📝 **Consulta SQL:**
+```sql
+{estimate['sql_query']}
+```
+
+{_render_markdown(estimate['result'], max_rows=self.valves.MAX_RESULT_ROWS, max_bytes=self.valves.MAX_RESULT_BYTES)}
+
+_Calculando el resultado exacto..._
+"""
+            future = asyncio.run_coroutine_threadsafe(
+                __event_emitter__({"type": "replace", "data": {"content": content}}), loop
+            )
+            future.result(timeout=5)
+            emit.shown = True
+
+        emit.shown = False
+        return emit
+
+    def _preview_estimate(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        df: pd.DataFrame,
+        sql_query: str,
+        preview: Optional[Callable[[Dict[str, Any]], None]],
+        timer: _StageTimer
+    ):
+        """Hand `preview` a sampled answer when the table is large enough to need one"""
+        if not preview or not sql_query or len(df) < self.valves.APPROX_MIN_ROWS:
+            return
+
+        try:
+            with timer.stage("approx"):
+                # Generator.choice draws without replacement in O(sample), not O(table)
+                rows = np.random.default_rng(0).choice(len(df), size=min(self.valves.APPROX_SAMPLE_ROWS, len(df)), replace=False)
+                sample = df.iloc[np.sort(rows)]
+                estimate = _approximate_answer(conn, table_name, sample, len(df), sql_query)
+            if estimate:
+                estimate["sql_query"] = sql_query
+                estimate["table_name"] = table_name
+                preview(estimate)
+        except Exception as e:
+            print(f"Approximate preview error: {e}")
+
+    def _run_sql(self, conn: duckdb.DuckDBPyConnection, sql_query: str) -> pd.DataFrame:
+        """Execute SQL under the query watchdog"""
+        if not sql_query:
+            return pd.DataFrame()
+        with self._watchdog(conn):
+            return conn.execute(sql_query).fetchdf()
+
+    def _answer(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        df: pd.DataFrame,
+        sql_query: str,
+        rollups: List[Dict[str, Any]],
+        storage: Optional[Dict[str, Any]],
+        preview: Optional[Callable[[Dict[str, Any]], None]],
+        timer: _StageTimer
+    ) -> pd.DataFrame:
+        """Answer from a rollup when one can; otherwise preview and scan the raw table (only the months it needs)"""
+        if rollups and sql_query:
+            with timer.stage("execute"):
+                route = self._route_sql(conn, table_name, sql_query, rollups)
+                if route:
+                    try:
+                        result_df = self._run_sql(conn, route["sql"])
+                        result_df.columns = route["columns"]
+                        self._record_rollup_usage(route["rollup"])
+                        return result_df
+                    except duckdb.Error as e:
+                        print(f"Rollup query error: {e}")
+
+        self._preview_estimate(conn, table_name, df, sql_query, preview, timer)
+        with timer.stage("execute"):
+            pruned = self._prune_sql(conn, table_name, sql_query, storage) if storage and sql_query else None
+            try:
+                result_df = self._run_sql(conn, pruned["sql"] if pruned else sql_query)
+            except duckdb.Error as e:
+                if not pruned:
+                    raise
+                print(f"Partition pruning error: {e}")
+                pruned = None
+                result_df = self._run_sql(conn, sql_query)
+        if rollups:
+            self._record_rollup_usage(None)
+        if storage:
+            self._record_partition_usage(storage, pruned)
+        return result_df
+
+    def _dataset_version(self, table_name: str, df: pd.DataFrame, file_path: str) -> str:
+        """Identity of one version of an upload: schema, row count, file size and mtime"""
+        stat = os.stat(file_path)
+        return f"{_schema_fingerprint(table_name, df)}:{len(df)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _load_table(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        df: pd.DataFrame,
+        file_path: str
+    ) -> Optional[Dict[str, Any]]:
+        """Make `df` queryable as `table_name`.
+
+        In 'parquet' storage mode a time series is written once per file
+        version to `PARQUET_DIRECTORY/<table>/<version>/__month=.../` and
+        registered as views; older versions are removed. Everything else is
+        imported into the DuckDB file. Returns the partition layout, or
+        None for plain tables.
+        """
+        date_column = _partition_column(df) if self.valves.STORAGE_MODE == "parquet" else None
+        if not date_column:
+            _replace_relation(conn, table_name, "BASE TABLE")
+            with self._watchdog(conn):
+                conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT {_duckdb_select_list(df)} FROM df")
             return None
 
+        root = os.path.join(self.valves.PARQUET_DIRECTORY, table_name)
+        version = hashlib.sha256(self._dataset_version(table_name, df, file_path).encode()).hexdigest()[:16]
+        directory = os.path.join(root, version)
+        if not os.path.isdir(directory):
+            os.makedirs(root, exist_ok=True)
+            with self._watchdog(conn):
+                _write_partitioned(conn, df, directory, date_column)
+        _create_partition_views(conn, table_name, directory)
+
+        for entry in os.listdir(root):
+            if entry != version and not entry.startswith(f"{version}.tmp-"):
+                shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+        months = sorted(entry for entry in os.listdir(directory) if entry.startswith("__month="))
+        return {"date_column": date_column, "directory": directory, "months": months}
+
+    def _prune_sql(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        sql_query: str,
+        storage: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """Restrict a query over partitioned storage to the months its date predicates allow"""
         try:
-            cached = self.redis_client.get(cache_key)
-            if cached:
-                self._record_metric("cache_hit")
-                return json.loads(cached)
-            else:
-                self._record_metric("cache_miss")
-                return None
+            pruned = _prune_partitions(conn, table_name, sql_query, storage["date_column"])
         except Exception as e:
-            print(f"Cache read error: {e}")
+            print(f"Partition pruning error: {e}")
             return None
+        if pruned:
+            low, high = pruned["months"]
+            pruned["partitions"] = sum(
+                1 for entry in storage["months"]
+                if entry != "__month=__HIVE_DEFAULT_PARTITION__"
+                and (low is None or entry >= f"__month={low.date()}")
+                and (high is None or entry <= f"__month={high.date()}")
+            )
+        return pruned
 
-    def _save_to_cache(self, cache_key: str, data: Dict[str, Any]):
-        """Save result to cache with TTL"""
-        if not self.redis_client or not self.valves.ENABLE_CACHE:
+    def _record_partition_usage(self, storage: Dict[str, Any], pruned: Optional[Dict[str, Any]]):
+        """Count queries on partitioned storage and the month partitions they read"""
+        if not self.redis_client:
             return
 
+        total = len(storage["months"])
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hincrby("excel:parquet", "queries", 1)
+            pipe.hincrby("excel:parquet", "partitions_total", total)
+            pipe.hincrby("excel:parquet", "partitions_read", pruned["partitions"] if pruned else total)
+            if pruned:
+                pipe.hincrby("excel:parquet", "pruned", 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
+
+    def _ensure_rollups(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        df: pd.DataFrame,
+        file_path: str
+    ) -> List[Dict[str, Any]]:
+        """Rollups for this version of the file, built on its first miss.
+
+        The table is re-imported on every miss, but rollups are only rebuilt
+        when the file's size, mtime or schema change; their specs live next
+        to them in DuckDB.
+        """
+        if not self.valves.ENABLE_ROLLUPS or len(df) < self.valves.ROLLUP_MIN_ROWS:
+            return []
+
         try:
-            self.redis_client.setex(
-                cache_key,
-                self.valves.CACHE_TTL,
-                json.dumps(data)
+            version = self._dataset_version(table_name, df, file_path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _smartfarm_rollups (table_name VARCHAR PRIMARY KEY, version VARCHAR, rollups VARCHAR)"
+            )
+            stored = conn.execute(
+                "SELECT version, rollups FROM _smartfarm_rollups WHERE table_name = ?", [table_name]
+            ).fetchone()
+            if stored and stored[0] == version:
+                return json.loads(stored[1])
+
+            with self._watchdog(conn):
+                rollups = _build_rollups(conn, table_name, df, max_ratio=self.valves.ROLLUP_MAX_RATIO)
+            conn.execute(
+                "INSERT OR REPLACE INTO _smartfarm_rollups VALUES (?, ?, ?)",
+                [table_name, version, json.dumps(rollups)]
             )
+            if self.redis_client:
+                self.redis_client.hincrby("excel:rollups", "builds", 1)
+            return rollups
         except Exception as e:
-            print(f"Cache write error: {e}")
+            print(f"Rollup build error: {e}")
+            return []
 
-    def _record_metric(self, metric_type: str, value: float = 1):
-        """Record metrics in Redis"""
+    def _route_sql(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        sql_query: str,
+        rollups: List[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """Rewrite SQL onto the smallest rollup that answers it exactly, with the raw query's column names"""
+        try:
+            for rollup in sorted(rollups, key=lambda r: r["rows"]):
+                sql = _rewrite_for_rollup(conn, table_name, sql_query, rollup)
+                if sql:
+                    columns = [row[0] for row in conn.execute(f"DESCRIBE {sql_query}").fetchall()]
+                    return {"sql": sql, "columns": columns, "rollup": rollup}
+        except Exception as e:
+            print(f"Rollup routing error: {e}")
+        return None
+
+    def _record_rollup_usage(self, rollup: Optional[Dict[str, Any]]):
+        """Count queries answered from rollups (and the rows they skipped) vs full scans"""
         if not self.redis_client:
             return
 
         try:
-            timestamp = int(time.time())
+            pipe = self.redis_client.pipeline()
+            if rollup:
+                pipe.hincrby("excel:rollups", "routed", 1)
+                pipe.hincrby("excel:rollups", "scanned_rows", rollup["rows"])
+                pipe.hincrby("excel:rollups", "table_rows", rollup["table_rows"])
+            else:
+                pipe.hincrby("excel:rollups", "unrouted", 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
+
+    def _embedder(self):
+        """The configured embedding provider, shared across requests"""
+        return _get_embedder(
+            self.valves.EMBEDDING_PROVIDER,
+            self.valves.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY", "") if self.valves.EMBEDDING_PROVIDER == "openai" else ""
+        )
+
+    def _index_table(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        df: pd.DataFrame,
+        file_path: str
+    ):
+        """Describe and embed this version of the table in the schema index, on its first miss.
 
-            # Increment counters
-            self.redis_client.incr(f"excel:queries:total")
-            self.redis_client.incr(f"excel:queries:{metric_type}")
+        Entries live in DuckDB next to the tables they describe, so every
+        upload stays retrievable for later questions without re-embedding.
+        """
+        if self.valves.SCHEMA_TOP_K <= 1:
+            return
 
-            # Store response time if provided
-            if metric_type == "response_time":
-                self.redis_client.lpush("excel:response_times", value)
-                self.redis_client.ltrim("excel:response_times", 0, 999)  # Keep last 1000
+        try:
+            version = self._dataset_version(table_name, df, file_path)
+            embedder = self._embedder()
+            _create_schema_index(conn)
+            stored = conn.execute(
+                "SELECT version, provider FROM _smartfarm_schema_index WHERE table_name = ?", [table_name]
+            ).fetchone()
+            if stored == (version, embedder.name):
+                return
 
-            # Store timestamp for session tracking
-            self.redis_client.set("excel:last_query", timestamp)
+            description = _table_description(conn, table_name, df)
+            conn.execute(
+                "INSERT OR REPLACE INTO _smartfarm_schema_index VALUES (?, ?, ?, ?, ?, ?)",
+                [table_name, version, embedder.name, description,
+                 _estimate_tokens(_table_schema_text(conn, table_name)), embedder.embed([description])[0]]
+            )
+            if self.redis_client:
+                self.redis_client.hincrby("excel:schema", "builds", 1)
         except Exception as e:
-            print(f"Metric recording error: {e}")
+            print(f"Schema index error: {e}")
 
-    def _execute_sql_query(self, file_path: str, query: str, model: str = "llama-3.3-70b-versatile") -> Dict[str, Any]:
-        """Execute SQL query using LlamaIndex + Groq (original logic)"""
-        from llama_index.llms.groq import Groq
-        from llama_index.embeddings.openai import OpenAIEmbedding
-        from llama_index.core import SQLDatabase, Settings
-        from llama_index.core.indices.struct_store import NLSQLTableQueryEngine
+    def _select_tables(self, conn: duckdb.DuckDBPyConnection, table_name: str, query: str) -> List[str]:
+        """The uploaded table plus up to SCHEMA_TOP_K - 1 catalog tables relevant to the question.
 
-        # Get API keys
-        groq_key = self.valves.GROQ_API_KEY or os.getenv("GROQ_API_KEY", "")
-        openai_key = self.valves.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY", "")
+        Other tables are ranked against the words of the question the
+        uploaded table's columns and labels do not already cover, so a
+        question about the upload alone sends only its schema. Tables
+        imported before the index existed (or embedded by another provider)
+        are described from the catalog and indexed on the way.
+        """
+        if self.valves.SCHEMA_TOP_K <= 1:
+            return [table_name]
 
-        if not groq_key:
-            raise ValueError("GROQ_API_KEY not configured")
-        if not openai_key:
-            raise ValueError("OPENAI_API_KEY not configured")
+        try:
+            embedder = self._embedder()
+            # DISTINCT: on the pipeline's connection a temp copy of the upload shadows its table
+            catalog = [
+                row[0] for row in conn.execute(
+                    "SELECT DISTINCT table_name FROM information_schema.tables WHERE table_schema = 'main' ORDER BY table_name"
+                ).fetchall()
+                if not _is_internal_table(row[0])
+            ]
+            _create_schema_index(conn)
+            index = {
+                name: {"version": version, "provider": provider, "description": description, "tokens": tokens, "embedding": embedding}
+                for name, version, provider, description, tokens, embedding in conn.execute(
+                    "SELECT table_name, version, provider, description, tokens, embedding FROM _smartfarm_schema_index"
+                ).fetchall()
+            }
 
-        # Read file
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        elif file_path.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file_path)
-        else:
-            raise ValueError("File must be CSV or Excel format")
+            stale = [name for name in catalog if name not in index or index[name]["provider"] != embedder.name]
+            if stale:
+                descriptions = [_table_description(conn, name) for name in stale]
+                for name, description, embedding in zip(stale, descriptions, embedder.embed(descriptions)):
+                    tokens = _estimate_tokens(_table_schema_text(conn, name))
+                    version = index.get(name, {}).get("version", "")
+                    conn.execute(
+                        "INSERT OR REPLACE INTO _smartfarm_schema_index VALUES (?, ?, ?, ?, ?, ?)",
+                        [name, version, embedder.name, description, tokens, embedding]
+                    )
+                    index[name] = {
+                        "version": version, "provider": embedder.name, "description": description,
+                        "tokens": tokens, "embedding": embedding
+                    }
 
-        # Sanitize column names
-        df.columns = [col.replace(' ', '_').replace('-', '_') for col in df.columns]
+            # Score the rest of the catalog on what the uploaded table cannot answer
+            residual = _residual_question(query, index[table_name]["description"]) if table_name in index else query
+            others = [name for name in catalog if name != table_name] if residual else []
+            if others:
+                scores = np.array([index[name]["embedding"] for name in others]) @ np.array(embedder.embed([residual])[0])
+                ranked = sorted(
+                    ((score, name) for score, name in zip(scores, others) if score >= self.valves.SCHEMA_MIN_SCORE),
+                    key=lambda pair: -pair[0]
+                )
+                others = [name for _, name in ranked[:self.valves.SCHEMA_TOP_K - 1]]
+            selected = [table_name] + others
 
-        # Generate table name from file
-        table_name = os.path.splitext(os.path.basename(file_path))[0].replace(' ', '_').replace('-', '_')
+            self._record_schema_usage(
+                sum(index[name]["tokens"] for name in selected if name in index),
+                sum(index[name]["tokens"] for name in catalog),
+                len(selected),
+                len(catalog)
+            )
+            return selected
+        except Exception as e:
+            print(f"Schema retrieval error: {e}")
+            return [table_name]
 
-        # Import to DuckDB
-        conn = duckdb.connect(self.valves.DATABASE_PATH)
-        conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df")
+    def _record_schema_usage(self, tokens_sent: int, catalog_tokens: int, tables_sent: int, catalog_tables: int):
+        """Count schema tokens sent to the LLM vs what the whole catalog would have cost"""
+        if not self.redis_client:
+            return
 
-        # Configure LlamaIndex
-        Settings.llm = Groq(
-            api_key=groq_key,
-            model=model,
-            temperature=0.1,
-        )
-        Settings.embed_model = OpenAIEmbedding(
-            api_key=openai_key,
-            model="text-embedding-3-small"
-        )
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hincrby("excel:schema", "questions", 1)
+            pipe.hincrby("excel:schema", "tokens_sent", tokens_sent)
+            pipe.hincrby("excel:schema", "catalog_tokens", catalog_tokens)
+            pipe.hincrby("excel:schema", "tables_sent", tables_sent)
+            pipe.hincrby("excel:schema", "catalog_tables", catalog_tables)
+            pipe.execute()
+        except Exception as e:
+            print(f"Metric recording error: {e}")
 
-        # Create SQL database wrapper
-        sql_database = SQLDatabase.from_duckdb_connection(conn)
+    def _match_sql_template(self, df: pd.DataFrame, table_name: str, query: str, model: str) -> Optional[Dict[str, Any]]:
+        """Look up the template for this question's skeleton and schema.
 
-        # Create query engine
-        query_engine = NLSQLTableQueryEngine(
-            sql_database=sql_database,
-            tables=[table_name],
-        )
+        Returns the template key and literals, plus the bound SQL on a hit
+        (`sql` is None on a miss). None when templates are off.
+        """
+        if not self.valves.ENABLE_SQL_TEMPLATES or not self.redis_client:
+            return None
 
-        # Execute query
-        response = query_engine.query(query)
+        try:
+            skeleton, literals = _question_skeleton(
+                query, _literal_vocabulary(df, sample_rows=self.valves.PROFILE_SAMPLE_ROWS)
+            )
+            combined = f"{_schema_fingerprint(table_name, df)}:{model}:{skeleton}"
+            key = f"excel:sqltpl:{hashlib.sha256(combined.encode()).hexdigest()}"
+            template = {"key": key, "skeleton": skeleton, "literals": literals, "sql": None}
+
+            stored = self.redis_client.get(key)
+            if stored:
+                template["sql"] = _bind_sql_template(json.loads(stored)["segments"], literals)
+            self.redis_client.hincrby("excel:templates", "hits" if stored else "misses", 1)
+            return template
+        except Exception as e:
+            print(f"SQL template lookup error: {e}")
+            return None
 
-        # Extract SQL and results
-        sql_query = response.metadata.get("sql_query", "")
-        result_df = conn.execute(sql_query).fetchdf() if sql_query else pd.DataFrame()
+    def _save_sql_template(self, template: Dict[str, Any], sql_query: str):
+        """Store LLM-generated SQL as a template when every literal can be rebound"""
+        segments = _sql_template(sql_query or "", template["literals"])
+        if not segments:
+            return
 
-        return {
-            "sql_query": sql_query,
-            "results": result_df.to_dict('records'),
-            "results_markdown": result_df.to_markdown() if not result_df.empty else "No results",
-            "row_count": len(result_df),
-            "table_name": table_name
-        }
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.setex(
+                template["key"],
+                self.valves.SQL_TEMPLATE_TTL,
+                json.dumps({"skeleton": template["skeleton"], "segments": segments, "created_at": int(time.time())})
+            )
+            pipe.hincrby("excel:templates", "stored", 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"SQL template write error: {e}")
+
+    def _reject_sql_template(self, key: str):
+        """Drop a template whose bound SQL failed; the LLM answers instead"""
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.delete(key)
+            pipe.hincrby("excel:templates", "rejected", 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"SQL template write error: {e}")
 
     async def analyze_excel_with_cache(
         self,
@@ -220,6 +3599,13 @@ class Tools:
 
         start_time = time.time()
         cache_hit = False
+        stale = False
+        cache_key = None
+        timer = _StageTimer()
+        preview = None
+        prefetch = None
+        cancelled = threading.Event()
+        looked_up = threading.Event()
 
         try:
             # Emit status
@@ -231,25 +3617,57 @@ class Tools:
                     }
                 )
 
+            # Read the upload alongside hashing and lookup; a hit stops it after profiling
+            if self.valves.SPECULATIVE_PIPELINE:
+                prefetch = asyncio.get_running_loop().run_in_executor(
+                    None, self._read_upload, file_path, timer, cancelled, looked_up
+                )
+
             # Generate cache key
-            file_hash = self._get_file_hash(file_path)
-            cache_key = self._generate_cache_key(file_hash, query, model)
+            with timer.stage("hash"):
+                file_hash = self._get_file_hash(file_path)
+                cache_key = self._generate_cache_key(file_hash, query, model)
 
             # Check cache
-            cached_result = self._get_from_cache(cache_key)
+            with timer.stage("cache_lookup"):
+                cached_result = await self._aget_from_cache(cache_key)
+                failure = None if cached_result else await self._aget_negative(cache_key)
+            await self._emit_stage_events(__event_emitter__, timer, ["hash", "cache_lookup"])
+
+            if prefetch and (cached_result or failure):
+                cancelled.set()
+                prefetch.cancel()
+                await self._arecord_pipeline_usage(wasted=1)
+            looked_up.set()
 
             if cached_result:
                 cache_hit = True
                 result = cached_result
+                stale = result.get("stale", False)
+
+                # Past the soft TTL: answer now, recompute behind the scenes
+                if stale:
+                    await self._schedule_refresh(cache_key, file_path, query, model)
 
                 if __event_emitter__:
                     await __event_emitter__(
                         {
                             "type": "status",
-                            "data": {"description": "✅ Retrieved from cache (instant!)", "done": False},
+                            "data": {
+                                "description": "♻️ Retrieved from cache (refreshing in background)" if stale else "✅ Retrieved from cache (instant!)",
+                                "done": False
+                            },
                         }
                     )
             else:
+                # Fail fast on a question that just failed deterministically
+                if failure:
+                    return (
+                        f"❌ Error: {failure['error']}\n\n"
+                        f"_Cached {failure['error_class']} failure; retried after {self.valves.NEGATIVE_CACHE_TTL}s "
+                        f"or when the file changes._"
+                    )
+
                 # Execute query
                 if __event_emitter__:
                     await __event_emitter__(
@@ -259,14 +3677,25 @@ class Tools:
                         }
                     )
 
-                result = self._execute_sql_query(file_path, query, model)
+                compute_start = time.time()
+                execute = functools.partial(self._execute_sql_query, file_path, query, model, timer=timer)
+                if prefetch:
+                    execute = functools.partial(execute, frame=await prefetch)
+                    await self._arecord_pipeline_usage(prefetched=1)
+                if self.valves.APPROX_PREVIEW and __event_emitter__:
+                    preview = self._preview_emitter(__event_emitter__)
+                    execute = functools.partial(execute, preview=preview)
+                result = await asyncio.get_running_loop().run_in_executor(None, execute)
+                await self._emit_stage_events(__event_emitter__, timer, ["read", "import", "llm_sql", "approx", "execute", "render"])
 
-                # Save to cache
-                self._save_to_cache(cache_key, result)
+                # Save to cache, weighted by what it cost to compute
+                with timer.stage("cache_write"):
+                    await self._asave_to_cache(cache_key, result, cost=time.time() - compute_start, data_hash=file_hash)
 
             # Record metrics
             response_time = time.time() - start_time
-            self._record_metric("response_time", response_time)
+            await self._arecord_metric("response_time", response_time)
+            await self._arecord_stage_timings(timer.timings)
 
             # Emit done
             if __event_emitter__:
@@ -278,9 +3707,13 @@ class Tools:
                 )
 
             # Format response
-            cache_indicator = "🚀 **[CACHED]**" if cache_hit else "⚡ **[NEW QUERY]**"
+            if stale:
+                cache_indicator = "♻️ **[CACHED · STALE]**"
+            else:
+                cache_indicator = "🚀 **[CACHED]**" if cache_hit else "⚡ **[NEW QUERY]**"
+            cache_status = "STALE (refreshing)" if stale else ("HIT" if cache_hit else "MISS")
 
-            return f"""
+            response = f"""
 {cache_indicator} Análisis completado en {response_time:.2f}s
 
 📊 **Tabla:** `{result['table_name']}`
@@ -294,13 +3727,31 @@ class Tools:
 {result['results_markdown']}
 
 ---
-💾 Cache: {"HIT" if cache_hit else "MISS"} | ⏱️ {response_time:.2f}s
-"""
+💾 Cache: {cache_status} | ⏱️ {response_time:.2f}s
+""" + (f"🔬 {timer.footer()}\n" if self.valves.DEBUG_TIMINGS else "")
+
+            # The exact answer takes the place of the approximate preview
+            if preview and preview.shown:
+                await __event_emitter__({"type": "replace", "data": {"content": response}})
+            return response
 
         except Exception as e:
-            # Record error
-            self._record_metric("error")
+            # Record error, remembering deterministic failures briefly
+            if prefetch:
+                cancelled.set()
+                prefetch.cancel()
+            await self._arecord_metric("error")
+            await self._arecord_stage_timings(timer.timings)
+            if cache_key:
+                await self._asave_negative(cache_key, e)
+            if preview and preview.shown:
+                await __event_emitter__({"type": "replace", "data": {"content": f"❌ Error: {str(e)}"}})
             return f"❌ Error: {str(e)}"
+        finally:
+            # A speculative read must never wait on a lookup that did not finish (errors, cancellation)
+            if not looked_up.is_set():
+                cancelled.set()
+                looked_up.set()
 
     async def get_cache_stats(
         self,
@@ -313,35 +3764,117 @@ class Tools:
         :return: Formatted cache statistics
         """
 
-        if not self.redis_client:
+        client = await self._aredis()
+        if not client:
             return "❌ Redis is not available. Cache statistics unavailable."
 
         try:
             # Get metrics
-            total = int(self.redis_client.get("excel:queries:total") or 0)
-            hits = int(self.redis_client.get("excel:queries:cache_hit") or 0)
-            misses = int(self.redis_client.get("excel:queries:cache_miss") or 0)
-            errors = int(self.redis_client.get("excel:queries:error") or 0)
+            total = int(await client.get("excel:queries:total") or 0)
+            hits = int(await client.get("excel:queries:cache_hit") or 0)
+            misses = int(await client.get("excel:queries:cache_miss") or 0)
+            errors = int(await client.get("excel:queries:error") or 0)
+            stale_hits = int(await client.get("excel:queries:cache_stale") or 0)
+            refreshes = int(await client.get("excel:queries:cache_refresh") or 0)
+            negative_hits = int(await client.get("excel:queries:negative_hit") or 0)
 
             # Calculate hit rate
             hit_rate = (hits / total * 100) if total > 0 else 0
 
             # Get response times
-            response_times = [float(t) for t in self.redis_client.lrange("excel:response_times", 0, -1)]
+            response_times = [float(t) for t in await client.lrange("excel:response_times", 0, -1)]
             avg_response = sum(response_times) / len(response_times) if response_times else 0
             min_response = min(response_times) if response_times else 0
             max_response = max(response_times) if response_times else 0
 
             # Get cache size
-            cache_keys = self.redis_client.keys("sql_cache:*")
+            cache_keys = await client.keys("sql_cache:*")
             cache_size = len(cache_keys)
+            stored_results = len(await client.keys("sql_result:*"))
+            sharing = await client.hgetall("excel:results")
+            results_written = int(sharing.get("stored", 0))
+            results_shared = int(sharing.get("shared", 0))
+            dedupe_ratio = (results_written + results_shared) / results_written if results_written else 0
 
             # Get Redis memory info
-            info = self.redis_client.info("memory")
+            info = await client.info("memory")
             used_memory_mb = info.get("used_memory", 0) / 1024 / 1024
 
+            evicted = int(await client.get("excel:cache:evicted") or 0)
+            gateway = self._gateway().stats()
+            pool = self._redis_pool().stats()
+            stages = await _astage_summary(client)
+            if stages:
+                top = stages[0]
+                stage_lines = f"- Top Stage: {top['label']} ({top['share']:.0f}% of pipeline time)\n" + "\n".join(
+                    f"- {row['label']}: mean {row['mean'] * 1000:.0f}ms, p95 ≤ {row['p95'] * 1000:.0f}ms ({row['count']} samples)"
+                    for row in stages
+                )
+            else:
+                stage_lines = "- No stage timings recorded yet"
+
+            duckdb_usage = await client.hgetall("excel:duckdb")
+            statements = int(duckdb_usage.get("statements", 0))
+            spilled = int(duckdb_usage.get("spilled_statements", 0))
+            spilled_mb = int(duckdb_usage.get("spilled_bytes", 0)) / 1024 / 1024
+            peak_spill_mb = (await client.zscore("excel:duckdb:peak", "spill_bytes") or 0) / 1024 / 1024
+
+            rollup_usage = await client.hgetall("excel:rollups")
+            routed = int(rollup_usage.get("routed", 0))
+            rollup_queries = routed + int(rollup_usage.get("unrouted", 0))
+            routed_rate = (routed / rollup_queries * 100) if rollup_queries else 0
+            scanned_rows = int(rollup_usage.get("scanned_rows", 0))
+            skipped_rows = int(rollup_usage.get("table_rows", 0))
+
+            parquet_usage = await client.hgetall("excel:parquet")
+            parquet_queries = int(parquet_usage.get("queries", 0))
+            partitions_total = int(parquet_usage.get("partitions_total", 0))
+            partitions_read = int(parquet_usage.get("partitions_read", 0))
+            partitions_share = (partitions_read / partitions_total * 100) if partitions_total else 0
+
+            schema_usage = await client.hgetall("excel:schema")
+            schema_questions = int(schema_usage.get("questions", 0))
+            tokens_sent = int(schema_usage.get("tokens_sent", 0))
+            catalog_tokens = int(schema_usage.get("catalog_tokens", 0))
+            token_saving = (1 - tokens_sent / catalog_tokens) * 100 if catalog_tokens else 0
+            per_question = max(schema_questions, 1)
+            llm_sql = next((row for row in stages if row["stage"] == "llm_sql"), None)
+
+            parse_usage = await client.hgetall("excel:parse")
+            parsed_in_workers = int(parse_usage.get("pooled", 0))
+            if self.valves.PARSE_WORKERS > 0:
+                workers_line = (
+                    f"{self.valves.PARSE_WORKERS} processes, recycled every {self.valves.PARSE_WORKER_MAX_JOBS or '∞'} parses, "
+                    f"uploads from {self.valves.PARSE_MIN_BYTES / 1024 / 1024:.1f} MB"
+                )
+            else:
+                workers_line = "off (uploads parsed in-process)"
+
+            pipeline_usage = await client.hgetall("excel:pipeline")
+            overlapped = int(pipeline_usage.get("overlapped", 0))
+            overlap_saved = float(pipeline_usage.get("saved", 0))
+
+            hot = await self._ahot_queries(client, limit=5)
+            if hot:
+                hot_lines = "\n".join(
+                    f"{i}. `...{row['key'][-8:]}` {row['lookups']} lookups · {row['table_name']} · `{(row['sql_query'] or 'N/A')[:60]}`"
+                    for i, row in enumerate(hot, 1)
+                )
+            else:
+                hot_lines = "- No lookups recorded yet"
+            tier = self._hot_tier().stats()
+            templates = await client.hgetall("excel:templates")
+            template_hits = int(templates.get("hits", 0))
+            template_lookups = template_hits + int(templates.get("misses", 0))
+            template_rate = (template_hits / template_lookups * 100) if template_lookups else 0
+            hot_tier_hits = int(await client.get("excel:queries:hot_tier_hit") or 0)
+            if self.valves.HOT_TIER_SIZE > 0:
+                tier_line = f"- Hot Tier: {tier['size']}/{self.valves.HOT_TIER_SIZE} pinned, {hot_tier_hits} hits served in-process"
+            else:
+                tier_line = "- Hot Tier: off (set HOT_TIER_SIZE to pin the hottest entries in memory)"
+
             # Last query time
-            last_query = self.redis_client.get("excel:last_query")
+            last_query = await client.get("excel:last_query")
             if last_query:
                 last_query_str = datetime.fromtimestamp(int(last_query)).strftime("%Y-%m-%d %H:%M:%S")
             else:
@@ -353,8 +3886,9 @@ class Tools:
 **Query Performance:**
 - Total Queries: {total}
 - Cache Hits: {hits} ({hit_rate:.1f}%)
+- Stale Hits: {stale_hits} (background refreshes: {refreshes})
 - Cache Misses: {misses}
-- Errors: {errors}
+- Errors: {errors} (served from negative cache: {negative_hits})
 
 **Response Times:**
 - Average: {avg_response:.2f}s
@@ -363,9 +3897,61 @@ class Tools:
 
 **Cache Status:**
 - Cached Queries: {cache_size}
+- Shared Results: {stored_results} stored · dedupe ratio {dedupe_ratio:.2f}x ({results_shared} of {results_written + results_shared} writes reused an identical SQL result, {int(sharing.get("bytes_saved", 0)) / 1024:.1f} KB not duplicated)
 - Memory Used: {used_memory_mb:.2f} MB / 256 MB
-- TTL: {self.valves.CACHE_TTL}s ({self.valves.CACHE_TTL // 60} min)
-- Eviction Policy: allkeys-lru
+- TTL: {self.valves.CACHE_TTL}s ({self.valves.CACHE_TTL // 60} min){" base, adaptive by recompute cost" if self.valves.ADAPTIVE_TTL else ""}
+- Eviction Policy: allkeys-lru{" + cost-aware sweeps" if self.valves.ADAPTIVE_TTL else ""}
+- Cost-Aware Evictions: {evicted}
+
+**SQL Templates:**
+- Template Hit Rate: {template_rate:.1f}% ({template_hits} of {template_lookups} SQL generations skipped the LLM)
+- Stored: {int(templates.get("stored", 0))} | Rejected on bind: {int(templates.get("rejected", 0))}
+
+**Hot Queries:**
+{hot_lines}
+{tier_line}
+
+**Stage Breakdown:**
+{stage_lines}
+
+**Upload Parsing:**
+- Workers: {workers_line}
+- Parsed: {parsed_in_workers} in workers ({int(parse_usage.get("handoff_bytes", 0)) / 1024 / 1024:.1f} MB handed back), {int(parse_usage.get("inline", 0))} in-process, {int(parse_usage.get("fallbacks", 0))} fallbacks after worker errors
+
+**Miss Pipeline:**
+- Speculative Reads: {int(pipeline_usage.get("prefetched", 0))} used on misses, {int(pipeline_usage.get("wasted", 0))} stopped by hits{"" if self.valves.SPECULATIVE_PIPELINE else " · disabled"}
+- SQL Generated During Import: {overlapped} misses, {overlap_saved:.2f}s saved ({overlap_saved / max(overlapped, 1) * 1000:.0f}ms per miss)
+
+**DuckDB Resources:**
+- Limits: {self.valves.DUCKDB_MEMORY_LIMIT or "default"} memory, {self.valves.DUCKDB_THREADS or "all"} threads, {self.valves.QUERY_TIMEOUT:g}s timeout
+- Spilled Statements: {spilled} / {statements} ({spilled_mb:.1f} MB total, peak {peak_spill_mb:.1f} MB)
+- Timeouts: {int(duckdb_usage.get("timeouts", 0))}
+
+**Rollups:**
+- Routed: {routed} / {rollup_queries} queries on rollup tables ({routed_rate:.1f}%){"" if self.valves.ENABLE_ROLLUPS else " · disabled"}
+- Rows Scanned When Routed: {scanned_rows:,} instead of {skipped_rows:,}
+- Builds: {int(rollup_usage.get("builds", 0))}
+
+**Storage:**
+- Mode: {self.valves.STORAGE_MODE}{f" (month-partitioned Parquet in {self.valves.PARQUET_DIRECTORY})" if self.valves.STORAGE_MODE == "parquet" else ""}
+- Pruned Queries: {int(parquet_usage.get("pruned", 0))} / {parquet_queries} on partitioned tables
+- Partitions Read: {partitions_read:,} of {partitions_total:,} ({partitions_share:.1f}%)
+
+**Schema Context:**
+- Index: {self.valves.EMBEDDING_PROVIDER} embeddings, top {self.valves.SCHEMA_TOP_K} tables per question, {int(schema_usage.get("builds", 0))} tables indexed
+- Tables Sent: {int(schema_usage.get("tables_sent", 0)) / per_question:.1f} of {int(schema_usage.get("catalog_tables", 0)) / per_question:.1f} per question ({schema_questions} questions)
+- Schema Tokens Sent: ≈{tokens_sent / per_question:,.0f} per question instead of ≈{catalog_tokens / per_question:,.0f} for the whole catalog ({token_saving:.1f}% fewer)
+- LLM SQL Latency: {f"mean {llm_sql['mean'] * 1000:.0f}ms, p95 ≤ {llm_sql['p95'] * 1000:.0f}ms" if llm_sql else "no samples yet"}
+
+**Redis Pool (this worker):**
+- State: {pool['state']}{f" (retry in {pool['retry_in']:.1f}s)" if pool['state'] == "down" else ""}
+- Connections: {pool['in_use']} in use, {pool['idle']} idle / {pool['max_connections']} max
+- Reconnects: {pool['reconnects']} | Failed Checks: {pool['failures']}
+
+**LLM Gateway (this worker):**
+- Circuit: {gateway['state']}
+- Concurrency Limit: {gateway['limit']} ({gateway['in_flight']} in flight)
+- Calls: {gateway['calls']} | Retries: {gateway['retries']} | Rejected: {gateway['rejected']} | Breaker Trips: {gateway['trips']}
 
 **Session Info:**
 - Last Query: {last_query_str}
@@ -390,118 +3976,229 @@ class Tools:
         :return: Confirmation message
         """
 
-        if not self.redis_client:
+        client = await self._aredis()
+        if not client:
             return "❌ Redis is not available. Cannot clear cache."
 
         try:
             if scope == "all":
                 # Clear all cache keys
-                cache_keys = self.redis_client.keys("sql_cache:*")
+                cache_keys = await client.keys("sql_cache:*")
                 if cache_keys:
-                    self.redis_client.delete(*cache_keys)
+                    await client.delete(*cache_keys)
+                result_keys = await client.keys("sql_result:*")
+                if result_keys:
+                    await client.delete(*result_keys)
 
                 # Reset metrics
-                self.redis_client.delete("excel:queries:total")
-                self.redis_client.delete("excel:queries:cache_hit")
-                self.redis_client.delete("excel:queries:cache_miss")
-                self.redis_client.delete("excel:queries:error")
-                self.redis_client.delete("excel:response_times")
-                self.redis_client.delete("excel:last_query")
+                await client.delete("excel:queries:total")
+                await client.delete("excel:queries:cache_hit")
+                await client.delete("excel:queries:cache_miss")
+                await client.delete("excel:queries:error")
+                await client.delete("excel:queries:cache_stale")
+                await client.delete("excel:queries:cache_refresh")
+                await client.delete("excel:queries:negative_hit")
+                negative_keys = await client.keys("sql_cache_neg:*")
+                if negative_keys:
+                    await client.delete(*negative_keys)
+                await client.delete("excel:response_times")
+                await client.delete(*[f"excel:stages:{stage}" for stage in STAGES])
+                await client.delete("excel:duckdb", "excel:duckdb:peak", "excel:rollups", "excel:parquet", "excel:schema", "excel:pipeline", "excel:parse")
+                template_keys = await client.keys("excel:sqltpl:*")
+                await client.delete("excel:templates", *template_keys)
+                await client.delete("excel:last_query")
+                await client.delete(
+                    "excel:cache:cost", "excel:cache:size", "excel:cache:hits",
+                    "excel:cache:priority", "excel:cache:inflation", "excel:cache:evicted",
+                    "excel:cache:hot", "excel:queries:hot_tier_hit", "excel:cache:result", "excel:cache:template", "excel:results"
+                )
+                self._hot_tier().invalidate()
 
                 return f"✅ Cache cleared successfully ({len(cache_keys)} entries deleted)"
             else:
                 # Clear cache for specific file hash
                 pattern = f"sql_cache:{scope}*"
-                keys = self.redis_client.keys(pattern)
+                keys = await client.keys(pattern)
                 if keys:
-                    self.redis_client.delete(*keys)
+                    await client.delete(*keys)
+                    self._hot_tier().invalidate(keys)
                 return f"✅ Cleared {len(keys)} cache entries for file hash: {scope}"
 
         except Exception as e:
             return f"❌ Error clearing cache: {str(e)}"
 
+    async def sweep_cache(
+        self,
+        __user__: Optional[dict] = None,
+        __event_emitter__=None,
+    ) -> str:
+        """
+        Run a cost-aware sweep now instead of waiting for the automatic interval.
+
+        :return: Sweep summary
+        """
+
+        if not await self._aredis():
+            return "❌ Redis is not available. Cannot sweep cache."
+
+        try:
+            stats = await asyncio.get_running_loop().run_in_executor(None, self._sweep_cache, True)
+            return (
+                f"✅ Cache sweep complete: {stats['evicted']} entries evicted "
+                f"({stats['freed_bytes'] / 1024:.1f} KB), {stats['pruned']} expired entries pruned"
+            )
+        except Exception as e:
+            return f"❌ Error sweeping cache: {str(e)}"
+
     async def test_cache_performance(
         self,
         file_path: str,
         query: str,
-        iterations: int = 3,
+        iterations: int = 20,
+        concurrency: int = 4,
+        warmup: int = 2,
+        miss_iterations: int = 3,
+        model: str = "llama-3.3-70b-versatile",
         __user__: Optional[dict] = None,
         __event_emitter__=None,
     ) -> str:
         """
-        Test cache performance by running same query multiple times.
+        Load-test the cache: cold-miss and hit latency distributions with
+        95% confidence intervals, and hit throughput as virtual users are added.
 
         :param file_path: Path to test file
         :param query: Test query
-        :param iterations: Number of test iterations
-        :return: Performance comparison
+        :param iterations: Cached requests per virtual user at each load level
+        :param concurrency: Maximum concurrent virtual users (load doubles from 1 up to this)
+        :param warmup: Untimed runs before measuring (warms file cache, DuckDB and Groq connection)
+        :param miss_iterations: Timed cold runs, each after evicting the entry
+        :param model: Groq model to use
+        :return: Performance report (also stored for the cache dashboard)
         """
 
-        results = []
-
-        # First run (cache miss expected)
-        if __event_emitter__:
-            await __event_emitter__(
-                {
-                    "type": "status",
-                    "data": {"description": f"Test 1/{iterations} - First run (cache miss)...", "done": False},
-                }
-            )
+        client = await self._aredis()
+        if not client:
+            return "❌ Redis is not available. Cache performance cannot be measured."
 
-        start = time.time()
-        await self.analyze_excel_with_cache(file_path, query, __user__=__user__, __event_emitter__=None)
-        first_run = time.time() - start
-        results.append(("First run (miss)", first_run, False))
+        iterations = max(iterations, 1)
+        concurrency = max(concurrency, 1)
 
-        # Subsequent runs (cache hits expected)
-        for i in range(iterations - 1):
+        async def status(description: str, done: bool = False):
             if __event_emitter__:
                 await __event_emitter__(
-                    {
-                        "type": "status",
-                        "data": {"description": f"Test {i+2}/{iterations} - Cached run...", "done": False},
-                    }
+                    {"type": "status", "data": {"description": description, "done": done}}
                 )
 
-            start = time.time()
-            await self.analyze_excel_with_cache(file_path, query, __user__=__user__, __event_emitter__=None)
-            cached_run = time.time() - start
-            results.append((f"Run {i+2} (hit)", cached_run, True))
+        cache_key = self._generate_cache_key(self._get_file_hash(file_path), query, model)
 
-        # Calculate speedup
-        avg_cached = sum(r[1] for r in results[1:]) / (iterations - 1) if iterations > 1 else 0
-        speedup = first_run / avg_cached if avg_cached > 0 else 0
+        # Warm-up runs are not measured
+        for i in range(warmup):
+            await status(f"Warm-up {i + 1}/{warmup}...")
+            output = await self.analyze_excel_with_cache(file_path, query, model, __user__=__user__)
+            if output.startswith("❌"):
+                return output
+
+        # Cold misses: evict the entry before every run
+        miss_latencies = []
+        for i in range(miss_iterations):
+            await status(f"Cache miss {i + 1}/{miss_iterations}...")
+            await self._aevict_entry(cache_key)
+            start = time.perf_counter()
+            output = await self.analyze_excel_with_cache(file_path, query, model, __user__=__user__)
+            miss_latencies.append(time.perf_counter() - start)
+            if output.startswith("❌"):
+                return output
+
+        if not await self._aget_from_cache(cache_key):
+            await self.analyze_excel_with_cache(file_path, query, model, __user__=__user__)
+
+        # Hits under increasing load until the configured concurrency
+        levels = []
+        users = 1
+        while True:
+            levels.append(min(users, concurrency))
+            if users >= concurrency:
+                break
+            users *= 2
+
+        loop = asyncio.get_running_loop()
+        curve = []
+        hit_latencies = {}
+        non_hits = 0
+        for users in levels:
+            await status(f"Cache hits with {users} virtual user(s)...")
+            latencies, misses, elapsed = await loop.run_in_executor(
+                None, self._run_virtual_users, file_path, query, model, users, iterations
+            )
+            hit_latencies[users] = latencies
+            non_hits += misses
+            curve.append({"users": users, "throughput": len(latencies) / elapsed if elapsed else 0.0})
+
+        miss_stats = _latency_stats(miss_latencies)
+        single_stats = _latency_stats(hit_latencies[1])
+        loaded_stats = _latency_stats(hit_latencies[levels[-1]])
+        peak = max(curve, key=lambda point: point["throughput"])
+        speedup = miss_stats["mean"] / single_stats["mean"] if miss_latencies and single_stats["mean"] else 0
+
+        run = {
+            "timestamp": int(time.time()),
+            "file": os.path.basename(file_path),
+            "query": query,
+            "concurrency": concurrency,
+            "warmup": warmup,
+            "iterations": iterations,
+            "miss": miss_stats,
+            "hit": single_stats,
+            "hit_loaded": loaded_stats,
+            "curve": curve,
+            "peak_throughput": peak["throughput"],
+            "peak_users": peak["users"],
+            "speedup": speedup,
+            "non_hits": non_hits,
+        }
+        try:
+            await client.set("excel:benchmark:last", json.dumps(run))
+        except Exception as e:
+            print(f"Benchmark save error: {e}")
+
+        def row(name, stats):
+            if not stats["n"]:
+                return f"| {name} | 0 | - | - | - | - |"
+            return (f"| {name} | {stats['n']} | {stats['mean'] * 1000:.1f}ms ± {stats['ci95'] * 1000:.1f}ms "
+                    f"| {stats['p50'] * 1000:.1f}ms | {stats['p95'] * 1000:.1f}ms | {stats['p99'] * 1000:.1f}ms |")
+
+        curve_rows = "\n".join(
+            f"| {point['users']} | {point['throughput']:.1f} req/s |" for point in curve
+        )
 
-        # Format results
         output = f"""
 🧪 **Cache Performance Test**
 
 **Test Configuration:**
 - File: {os.path.basename(file_path)}
 - Query: "{query}"
-- Iterations: {iterations}
+- Warm-up runs: {warmup}
+- Virtual users: up to {concurrency} × {iterations} cached requests
 
-**Results:**
-"""
-        for name, duration, cached in results:
-            output += f"\n- {name}: {duration:.3f}s {'✅' if cached else '❌'}"
+**Latency** (mean ± 95% CI):
+| Path | Samples | Mean | p50 | p95 | p99 |
+|------|---------|------|-----|-----|-----|
+{row("Miss (cold)", miss_stats)}
+{row("Hit (1 user)", single_stats)}
+{row(f"Hit ({levels[-1]} users)", loaded_stats)}
 
-        output += f"""
+**Hit Throughput:**
+| Users | Throughput |
+|-------|------------|
+{curve_rows}
 
 **Performance Summary:**
-- First run (uncached): {first_run:.3f}s
-- Average cached: {avg_cached:.3f}s
-- Speedup: {speedup:.1f}x faster
+- Peak throughput: {peak['throughput']:.1f} req/s at {peak['users']} user(s)
+- Speedup: {speedup:.1f}x faster than a cold miss
+- Unexpected non-hits under load: {non_hits}
 
-**Status:** {'✅ Cache working perfectly!' if speedup > 5 else '⚠️ Check cache configuration'}
+**Status:** {'✅ Cache working perfectly!' if speedup > 5 and not non_hits else '⚠️ Check cache configuration'}
 """
 
-        if __event_emitter__:
-            await __event_emitter__(
-                {
-                    "type": "status",
-                    "data": {"description": "Test complete!", "done": True},
-                }
-            )
-
+        await status("Test complete!", done=True)
         return output
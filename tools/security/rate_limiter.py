@@ -11,7 +11,22 @@ Date: 2025-10-17
 from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, Literal
+import asyncio
 import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+try:
+    import redis
+    from redis import asyncio as aioredis
+    from redis.asyncio.retry import Retry as AsyncRetry
+    from redis.backoff import ExponentialBackoff
+    from redis.retry import Retry
+except ImportError:  # Only needed for the Redis backend
+    redis = None
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +36,183 @@ class RateLimitExceeded(Exception):
     pass
 
 
+class _RedisPool:
+    """
+    Shared, self-healing Redis connection pool.
+
+    - One bounded BlockingConnectionPool per server, shared by every rate
+      limiter, plus a redis.asyncio pool per event loop for AsyncRateLimiter
+    - Idle connections are health-checked before reuse, and the server is
+      pinged every `health_check_interval` seconds
+    - While Redis is unreachable client()/aclient() return None (limits fail
+      open) and reconnects are attempted lazily with jittered exponential backoff
+    """
+
+    def __init__(self, host: str, port: int, db: int = 0, **connection_kwargs):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.max_connections = 20
+        self.pool_timeout = 2.0
+        self.socket_timeout = 2.0
+        self.health_check_interval = 5.0
+        self.backoff_base = 0.5
+        self.backoff_cap = 5.0
+
+        self.healthy = False
+        self.consecutive_failures = 0
+        self.next_attempt = 0.0
+        self.last_check = 0.0
+        self.counters = {"connects": 0, "reconnects": 0, "failures": 0}
+        self._async_connection_class = connection_kwargs.pop("async_connection_class", None)
+        self._connection_kwargs = connection_kwargs
+        self._pool = None
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> redis.asyncio client
+        self._lock = threading.Lock()
+
+    def configure(self, **settings):
+        """Apply valve settings; pool size and timeouts take effect when a pool is built"""
+        with self._lock:
+            for name, value in settings.items():
+                setattr(self, name, value)
+
+    def _pool_kwargs(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "db": self.db,
+            "max_connections": self.max_connections,
+            "timeout": self.pool_timeout,
+            "health_check_interval": self.health_check_interval,
+            "socket_connect_timeout": self.socket_timeout,
+            "socket_timeout": self.socket_timeout,
+            "decode_responses": True,
+        }
+
+    def _build(self):
+        self._pool = redis.BlockingConnectionPool(
+            retry=Retry(ExponentialBackoff(cap=0.5, base=0.05), 1),
+            **self._pool_kwargs(),
+            **self._connection_kwargs
+        )
+        self._client = redis.Redis(connection_pool=self._pool)
+
+    def _build_async(self):
+        kwargs = dict(self._connection_kwargs)
+        if self._async_connection_class:
+            kwargs["connection_class"] = self._async_connection_class
+        pool = aioredis.BlockingConnectionPool(
+            retry=AsyncRetry(ExponentialBackoff(cap=0.5, base=0.05), 1),
+            **self._pool_kwargs(),
+            **kwargs
+        )
+        return aioredis.Redis(connection_pool=pool)
+
+    def _check_due(self, now: float) -> Optional[bool]:
+        """True if the last check still holds, False while backing off, None if a check is due"""
+        if self.healthy and now - self.last_check < self.health_check_interval:
+            return True
+        if not self.healthy and now < self.next_attempt:
+            return False
+        return None
+
+    def _mark_up(self, now: float):
+        if not self.healthy:
+            self.counters["reconnects" if self.counters["connects"] else "connects"] += 1
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_check = now
+
+    def _mark_down(self, now: float, error: Exception):
+        if self.healthy or not self.consecutive_failures:
+            logger.warning(f"Redis unavailable ({error}), rate limits fail open until it returns")
+        self.healthy = False
+        self.consecutive_failures += 1
+        self.counters["failures"] += 1
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** (self.consecutive_failures - 1))
+        self.next_attempt = now + random.uniform(delay / 2, delay)
+
+    def client(self):
+        """Pooled client, or None while Redis is down and the next reconnect is not due"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._check_due(now)
+            if state is not None:
+                return self._client if state else None
+
+            try:
+                if self._pool is None:
+                    self._build()
+                self._client.ping()
+            except Exception as e:
+                self._mark_down(now, e)
+                if self._pool is not None:
+                    self._pool.disconnect()  # Drop dead sockets so the next attempt dials fresh
+                return None
+
+            self._mark_up(now)
+            return self._client
+
+    async def aclient(self):
+        """Async client for the running event loop, or None while Redis is down"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            now = time.monotonic()
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = self._async_clients[loop] = self._build_async()
+            state = self._check_due(now)
+            if state is not None:
+                return client if state else None
+            # One probe at a time; concurrent callers keep the current state
+            if self.healthy:
+                self.last_check = now
+            else:
+                self.next_attempt = now + self.socket_timeout
+
+        try:
+            await client.ping()
+        except Exception as e:
+            with self._lock:
+                self._mark_down(time.monotonic(), e)
+            await client.connection_pool.disconnect()
+            return None
+
+        with self._lock:
+            self._mark_up(time.monotonic())
+        return client
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool usage and connection health"""
+        with self._lock:
+            pool = self._pool
+            created = len(getattr(pool, "_connections", [])) if pool else 0
+            idle = sum(1 for conn in pool.pool.queue if conn is not None) if pool else 0
+            return {
+                "state": "up" if self.healthy else "down",
+                "max_connections": self.max_connections,
+                "created": created,
+                "in_use": created - idle,
+                "idle": idle,
+                "async_pools": len(self._async_clients),
+                "retry_in": max(0.0, self.next_attempt - time.monotonic()) if not self.healthy else 0.0,
+                **self.counters,
+            }
+
+
+_REDIS_POOLS: Dict[tuple, _RedisPool] = {}
+_REDIS_POOLS_LOCK = threading.Lock()
+
+
+def _get_redis_pool(host: str, port: int, db: int = 0, **settings) -> _RedisPool:
+    """Process-wide Redis pool per server, shared by every rate limiter"""
+    with _REDIS_POOLS_LOCK:
+        pool = _REDIS_POOLS.setdefault((host, port, db), _RedisPool(host, port, db))
+    pool.configure(**settings)
+    return pool
+
+
 class RateLimiter:
     """
     Rate limiter with role-based quotas
@@ -62,14 +254,21 @@ class RateLimiter:
 
         Args:
             backend: 'memory' for development, 'redis' for production
-            redis_client: Redis client instance (required if backend='redis')
+            redis_client: Redis client instance (default for backend='redis':
+                the shared pool for REDIS_HOST/REDIS_PORT)
             custom_quotas: Override default quotas
         """
         self.backend = backend
         self.redis_client = redis_client
+        self._redis_pool = None
 
         if backend == 'redis' and not redis_client:
-            raise ValueError("Redis client required for Redis backend")
+            if redis is None:
+                raise ValueError("Redis client required for Redis backend (redis package not installed)")
+            self._redis_pool = _get_redis_pool(
+                os.getenv("REDIS_HOST", "redis"),
+                int(os.getenv("REDIS_PORT", 6379))
+            )
 
         # In-memory storage (development only)
         self._memory_store = defaultdict(list)
@@ -77,6 +276,24 @@ class RateLimiter:
         # Load quotas
         self.quotas = custom_quotas or self.DEFAULT_QUOTAS
 
+    @property
+    def redis_client(self):
+        """Explicit Redis client, else the shared pool's (None while Redis is down)"""
+        if self._redis_client is not None or self._redis_pool is None:
+            return self._redis_client
+        return self._redis_pool.client()
+
+    @redis_client.setter
+    def redis_client(self, client):
+        self._redis_client = client
+
+    def _redis(self):
+        """Current Redis client, raising ConnectionError while Redis is unreachable"""
+        client = self.redis_client
+        if client is None:
+            raise ConnectionError("Redis unavailable")
+        return client
+
     def check_limit(
         self,
         identifier: str,
@@ -114,14 +331,17 @@ class RateLimiter:
             )
 
         if not allowed:
-            raise RateLimitExceeded(
-                f"Rate limit exceeded for {role}. "
-                f"Limit: {max_uploads} uploads per {window_minutes} minutes. "
-                f"Try again later."
-            )
+            raise self._exceeded(role, max_uploads, window_minutes)
 
         return True
 
+    def _exceeded(self, role: str, max_uploads: int, window_minutes: int) -> RateLimitExceeded:
+        return RateLimitExceeded(
+            f"Rate limit exceeded for {role}. "
+            f"Limit: {max_uploads} uploads per {window_minutes} minutes. "
+            f"Try again later."
+        )
+
     def _check_memory_limit(
         self,
         identifier: str,
@@ -177,17 +397,19 @@ class RateLimiter:
         timestamp = now.timestamp()
 
         try:
+            client = self._redis()
+
             # Add current timestamp
-            self.redis_client.zadd(key, {timestamp: timestamp})
+            client.zadd(key, {timestamp: timestamp})
 
             # Remove old entries
-            self.redis_client.zremrangebyscore(key, 0, cutoff.timestamp())
+            client.zremrangebyscore(key, 0, cutoff.timestamp())
 
             # Set expiration (cleanup)
-            self.redis_client.expire(key, window_minutes * 60)
+            client.expire(key, window_minutes * 60)
 
             # Count current entries
-            current_count = self.redis_client.zcard(key)
+            current_count = client.zcard(key)
 
             if current_count > max_uploads:
                 logger.warning(
@@ -195,7 +417,7 @@ class RateLimiter:
                     f"{current_count}/{max_uploads} in {window_minutes}min"
                 )
                 # Remove the entry we just added since it exceeded
-                self.redis_client.zrem(key, timestamp)
+                client.zrem(key, timestamp)
                 return False
 
             logger.info(
@@ -253,15 +475,17 @@ class RateLimiter:
             cutoff = now - timedelta(minutes=window_minutes)
 
             try:
+                client = self._redis()
+
                 # Clean old entries
-                self.redis_client.zremrangebyscore(key, 0, cutoff.timestamp())
+                client.zremrangebyscore(key, 0, cutoff.timestamp())
 
                 # Count current
-                current_count = self.redis_client.zcard(key)
+                current_count = client.zcard(key)
                 remaining = max(0, max_uploads - current_count)
 
                 # Get oldest entry
-                oldest_entries = self.redis_client.zrange(key, 0, 0, withscores=True)
+                oldest_entries = client.zrange(key, 0, 0, withscores=True)
                 if oldest_entries:
                     oldest_ts = oldest_entries[0][1]
                     reset_at = datetime.fromtimestamp(oldest_ts) + timedelta(minutes=window_minutes)
@@ -291,7 +515,8 @@ class RateLimiter:
                 logger.info(f"Rate limit reset (memory) for {identifier}")
         else:
             try:
-                self.redis_client.delete(key)
+                client = self._redis()
+                client.delete(key)
                 logger.info(f"Rate limit reset (Redis) for {identifier}")
             except Exception as e:
                 logger.error(f"Redis reset failed: {e}")
@@ -304,23 +529,203 @@ class RateLimiter:
             total_actions = sum(len(v) for v in self._memory_store.values())
         else:
             try:
+                client = self._redis()
+
                 # Redis: count all upload keys
-                keys = self.redis_client.keys('uploads:*')
+                keys = client.keys('uploads:*')
                 total_users = len(keys)
                 total_actions = sum(
-                    self.redis_client.zcard(key) for key in keys
+                    client.zcard(key) for key in keys
                 )
             except Exception as e:
                 logger.error(f"Redis stats failed: {e}")
                 total_users = 0
                 total_actions = 0
 
+        stats = {
+            'backend': self.backend,
+            'total_users_tracked': total_users,
+            'total_actions_tracked': total_actions,
+            'quotas': self.quotas,
+        }
+        if self._redis_pool:
+            stats['redis_pool'] = self._redis_pool.stats()
+        return stats
+
+
+class AsyncRateLimiter(RateLimiter):
+    """
+    Rate limiter for async request handlers
+
+    Same quotas, keys and fail-open policy as RateLimiter, but the Redis
+    backend uses redis.asyncio so checks never block the event loop.
+    A pinned redis_client must be a redis.asyncio client.
+    """
+
+    async def _aredis(self):
+        """Async Redis client, raising ConnectionError while Redis is unreachable"""
+        client = self._redis_client
+        if client is None and self._redis_pool is not None:
+            client = await self._redis_pool.aclient()
+        if client is None:
+            raise ConnectionError("Redis unavailable")
+        return client
+
+    async def check_limit(
+        self,
+        identifier: str,
+        role: str = 'user',
+        action: str = 'upload'
+    ) -> bool:
+        """
+        Check if action is allowed within rate limit
+
+        Raises:
+            RateLimitExceeded: If limit is exceeded
+        """
+
+        quota = self.quotas.get(role, self.quotas['user'])
+        max_uploads = quota['max_uploads']
+        window_minutes = quota['window_minutes']
+
+        if self.backend == 'memory':
+            allowed = self._check_memory_limit(
+                identifier, max_uploads, window_minutes
+            )
+        else:
+            allowed = await self._acheck_redis_limit(
+                identifier, max_uploads, window_minutes
+            )
+
+        if not allowed:
+            raise self._exceeded(role, max_uploads, window_minutes)
+
+        return True
+
+    async def _acheck_redis_limit(
+        self,
+        identifier: str,
+        max_uploads: int,
+        window_minutes: int
+    ) -> bool:
+        """Check rate limit using redis.asyncio (one round trip when allowed)"""
+
+        key = f"uploads:{identifier}"
+        now = datetime.now()
+        cutoff = now - timedelta(minutes=window_minutes)
+        timestamp = now.timestamp()
+
+        try:
+            client = await self._aredis()
+
+            pipe = client.pipeline()
+            pipe.zadd(key, {timestamp: timestamp})
+            pipe.zremrangebyscore(key, 0, cutoff.timestamp())
+            pipe.expire(key, window_minutes * 60)
+            pipe.zcard(key)
+            current_count = (await pipe.execute())[-1]
+
+            if current_count > max_uploads:
+                logger.warning(
+                    f"Rate limit exceeded (Redis) for {identifier}: "
+                    f"{current_count}/{max_uploads} in {window_minutes}min"
+                )
+                await client.zrem(key, timestamp)
+                return False
+
+            return True
+
+        except Exception as e:
+            logger.error(f"Redis rate limit check failed: {e}")
+            # Fail open (allow) on Redis errors to prevent service disruption
+            return True
+
+    async def get_remaining(
+        self,
+        identifier: str,
+        role: str = 'user'
+    ) -> Dict[str, Any]:
+        """Get remaining quota for identifier"""
+
+        if self.backend == 'memory':
+            return super().get_remaining(identifier, role)
+
+        quota = self.quotas.get(role, self.quotas['user'])
+        max_uploads = quota['max_uploads']
+        window_minutes = quota['window_minutes']
+
+        key = f"uploads:{identifier}"
+        now = datetime.now()
+        cutoff = now - timedelta(minutes=window_minutes)
+
+        try:
+            client = await self._aredis()
+
+            pipe = client.pipeline()
+            pipe.zremrangebyscore(key, 0, cutoff.timestamp())
+            pipe.zcard(key)
+            pipe.zrange(key, 0, 0, withscores=True)
+            _, current_count, oldest_entries = await pipe.execute()
+
+            remaining = max(0, max_uploads - current_count)
+            if oldest_entries:
+                reset_at = datetime.fromtimestamp(oldest_entries[0][1]) + timedelta(minutes=window_minutes)
+            else:
+                reset_at = now
+
+        except Exception as e:
+            logger.error(f"Redis get_remaining failed: {e}")
+            remaining = max_uploads
+            reset_at = now
+
         return {
+            'remaining': remaining,
+            'limit': max_uploads,
+            'window_minutes': window_minutes,
+            'reset_at': reset_at.isoformat(),
+        }
+
+    async def reset(self, identifier: str) -> None:
+        """Reset rate limit for identifier (admin override)"""
+
+        if self.backend == 'memory':
+            return super().reset(identifier)
+
+        try:
+            client = await self._aredis()
+            await client.delete(f"uploads:{identifier}")
+            logger.info(f"Rate limit reset (Redis) for {identifier}")
+        except Exception as e:
+            logger.error(f"Redis reset failed: {e}")
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get rate limiter statistics"""
+
+        if self.backend == 'memory':
+            return super().get_stats()
+
+        try:
+            client = await self._aredis()
+            keys = await client.keys('uploads:*')
+            pipe = client.pipeline()
+            for key in keys:
+                pipe.zcard(key)
+            counts = await pipe.execute() if keys else []
+            total_users, total_actions = len(keys), sum(counts)
+        except Exception as e:
+            logger.error(f"Redis stats failed: {e}")
+            total_users = 0
+            total_actions = 0
+
+        stats = {
             'backend': self.backend,
             'total_users_tracked': total_users,
             'total_actions_tracked': total_actions,
             'quotas': self.quotas,
         }
+        if self._redis_pool:
+            stats['redis_pool'] = self._redis_pool.stats()
+        return stats
 
 
 # Convenience functions